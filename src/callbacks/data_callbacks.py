@@ -0,0 +1,48 @@
+import logging
+from typing import Optional
+
+import pytorch_lightning as pl
+from pytorch_lightning import Callback
+from torch.utils.data import Dataset
+
+from src.datamodules.utils.lru_cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+class LogCacheStatistics(Callback):
+    """
+    Logs the hit rate and the number of evictions of the caches of the train and validation datasets (e.g. the tile
+    cache of class: `TiledCroppedDatasetRGB`) at the end of each epoch. The statistics are summed up over all the
+    DataLoader workers and reset after logging, so every value covers one epoch.
+
+    :param cache_attribute: Name of the dataset attribute which holds the class: `LRUCache`
+    :type cache_attribute: str
+    """
+
+    def __init__(self, cache_attribute: str = 'tile_cache'):
+        self.cache_attribute = cache_attribute
+
+    def on_train_epoch_end(self, trainer: "pl.Trainer", pl_module: "pl.LightningModule") -> None:
+        self._log_statistics(trainer=trainer, pl_module=pl_module, split='train')
+
+    def on_validation_epoch_end(self, trainer: "pl.Trainer", pl_module: "pl.LightningModule") -> None:
+        if trainer.sanity_checking:
+            return
+        self._log_statistics(trainer=trainer, pl_module=pl_module, split='val')
+
+    def _log_statistics(self, trainer: "pl.Trainer", pl_module: "pl.LightningModule", split: str):
+        cache = self._get_cache(dataset=getattr(trainer.datamodule, split, None))
+        if cache is None:
+            return
+
+        stats = cache.get_stats()
+        pl_module.log(f'{split}/{self.cache_attribute}_hit_rate', stats['hit_rate'], sync_dist=True)
+        pl_module.log(f'{split}/{self.cache_attribute}_evictions', float(stats['evictions']), sync_dist=True)
+        cache.reset_stats()
+
+    def _get_cache(self, dataset: Optional[Dataset]) -> Optional[LRUCache]:
+        # datasets which wrap another dataset (e.g. MultiCropDataset)
+        while dataset is not None and not hasattr(dataset, self.cache_attribute) and hasattr(dataset, 'dataset'):
+            dataset = dataset.dataset
+        return getattr(dataset, self.cache_attribute, None)
@@ -2,7 +2,7 @@ import logging
 import os
 import sys
 import traceback
-from typing import Optional, OrderedDict
+from typing import Optional, OrderedDict, Tuple
 
 import pytorch_lightning as pl
 import torch
@@ -98,6 +98,7 @@ class CheckBackboneHeaderCompatibility(Callback):
     Checks if the backbone and the header are compatible.
     This is checked by passing a random tensor through the backbone and the header.
     If the backbone and the header are not compatible, the program is terminated.
+    If the datamodule trains on several input sizes (e.g. with a crop size schedule), every size is checked.
 
     """
 
@@ -107,8 +108,18 @@ class CheckBackboneHeaderCompatibility(Callback):
     def setup(self, trainer: "pl.Trainer", pl_module: "pl.LightningModule", stage: Optional[str] = None) -> None:
         if self.checked:
             return
-        # get the datamodule and the dim of the input
-        dim = (trainer.datamodule.batch_size, *trainer.datamodule.dims)
+        # get the datamodule and the dims of the inputs
+        if hasattr(trainer.datamodule, 'get_input_shapes'):
+            input_shapes = trainer.datamodule.get_input_shapes()
+        else:
+            input_shapes = [(trainer.datamodule.batch_size, *trainer.datamodule.dims)]
+        for dim in input_shapes:
+            self._check_input_shape(pl_module=pl_module, dim=dim)
+
+        self.checked = True
+
+    @staticmethod
+    def _check_input_shape(pl_module: "pl.LightningModule", dim: Tuple[int, ...]) -> None:
         # test if backbone works
         try:
             b_output = pl_module.model.backbone(torch.rand(*dim, device=pl_module.device))
@@ -116,7 +127,7 @@ class CheckBackboneHeaderCompatibility(Callback):
                 b_output = b_output['out']
             log.info(f"Backbone has an output of {b_output.shape}")
         except RuntimeError as e:
-            log.error(f"Problem in the backbone! Your image dimension is {trainer.datamodule.dims}")
+            log.error(f"Problem in the backbone! Your image dimension is {tuple(dim[1:])}")
             log.error(e)
             log.error(traceback.format_exc())
             sys.exit(1)
@@ -131,5 +142,3 @@ class CheckBackboneHeaderCompatibility(Callback):
             log.error(e)
             log.error(traceback.format_exc())
             sys.exit(1)
-
-        self.checked = True
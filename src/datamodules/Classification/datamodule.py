@@ -7,7 +7,7 @@ from torchvision.datasets import ImageFolder
 
 from src.datamodules.Classification.utils.image_analytics import get_analytics_data_image_folder
 from src.datamodules.Classification.utils.misc import validate_path_for_classification
-from src.datamodules.base_datamodule import AbstractDatamodule
+from src.datamodules.base_datamodule import AbstractDatamodule, AnalyticsAttribute
 from src.datamodules.utils.misc import get_image_dims
 from src.utils import utils
 
@@ -68,26 +68,23 @@ class ClassificationDatamodule(AbstractDatamodule):
     :type shuffle: bool
     :param drop_last: Whether to drop the last batch if it is smaller than the batch size.
     :type drop_last: bool
+    :param uint8_batches: If True, the samples contain uint8 image tensors which are normalized by the task after
+        the transfer to the device, instead of normalized float tensors (a quarter of the bytes per batch).
+    :type uint8_batches: bool
     """
+    image_transform = AnalyticsAttribute()
+
     def __init__(self, data_dir: str,
                  selection_train: Optional[Union[int, List[str]]] = None,
                  selection_val: Optional[Union[int, List[str]]] = None,
                  num_workers: int = 4, batch_size: int = 8,
-                 shuffle: bool = True, drop_last: bool = True):
+                 shuffle: bool = True, drop_last: bool = True, uint8_batches: bool = False):
         """
         Constructor method for the ClassificationDatamodule class.
         """
         super().__init__()
 
-        analytics_data = get_analytics_data_image_folder(input_path=Path(data_dir))
-
-        self.mean = analytics_data['mean']
-        self.std = analytics_data['std']
-        # error
-
-        self.image_transform = transforms.Compose([transforms.ToTensor(),
-                                                   transforms.Normalize(mean=self.mean, std=self.std),
-                                                   ])
+        self.uint8_batches = uint8_batches
 
         self.num_workers = num_workers
         self.batch_size = batch_size
@@ -100,7 +97,8 @@ class ClassificationDatamodule(AbstractDatamodule):
         self.selection_train = selection_train
         self.selection_val = selection_val
 
-        train_set = ImageFolder(**self._create_dataset_parameters('train'))
+        # the listing of the classes and images does not need the transformation (nor the analytics)
+        train_set = ImageFolder(root=self.data_dir / 'train')
         self.classes = train_set.classes
         self.num_classes = len(self.classes)
 
@@ -115,6 +113,15 @@ class ClassificationDatamodule(AbstractDatamodule):
         self.train_loader = None
         self.val_loader = None
 
+    def _load_analytics(self):
+        analytics_data = get_analytics_data_image_folder(input_path=Path(self.data_dir))
+
+        self.mean = analytics_data['mean']
+        self.std = analytics_data['std']
+
+        self.image_transform = transforms.Compose([*self.get_image_to_tensor_transforms(),
+                                                   ])
+
     def setup(self, stage: Optional[str] = None):
         super().setup()
         if stage == 'fit' or stage is None:
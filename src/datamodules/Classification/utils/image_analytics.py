@@ -1,10 +1,12 @@
 from pathlib import Path
 from typing import Any, Dict
 
+from src.datamodules.utils.distributed import synchronize_analytics
 from src.datamodules.utils.misc import check_missing_analytics, save_json
-from src.datamodules.utils.image_analytics import compute_mean_std
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed
 
 
+@synchronize_analytics
 def get_analytics_data_image_folder(input_path: Path) -> Dict[str, Any]:
     """
     Computes mean and std of the images in the input_path folder.
@@ -26,9 +28,9 @@ def get_analytics_data_image_folder(input_path: Path) -> Dict[str, Any]:
     train_path = input_path / 'train'
     gt_data_path_list = list(train_path.glob('**/*.png'))
 
-    mean, std = compute_mean_std(file_names=gt_data_path_list)
-    analytics_data = {'mean': mean.tolist(),
-                      'std': std.tolist()}
+    statistics = compute_image_statistics_indexed(root=input_path, file_names_data=gt_data_path_list)
+    analytics_data = {'mean': statistics.mean.tolist(),
+                      'std': statistics.std.tolist()}
     # save json
     save_json(analytics_data, analytics_path_data)
 
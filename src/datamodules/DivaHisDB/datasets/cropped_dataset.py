@@ -11,6 +11,7 @@ from torch import is_tensor
 from torchvision.transforms import ToTensor
 
 from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.utils.single_transforms import ToUint8Tensor
 from src.utils import utils
 
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm')
@@ -103,7 +104,8 @@ class CroppedHisDBDataset(CroppedDatasetRGB):
         if not is_tensor(img):
             img = ToTensor()(img)
         if not is_tensor(gt):
-            gt = ToTensor()(gt)
+            # the ground truth encodings take the uint8 colors directly
+            gt = ToUint8Tensor()(gt) if self.target_transform is not None else ToTensor()(gt)
 
         border_mask = gt[0, :, :] != 0
         if self.target_transform is not None:
@@ -0,0 +1,102 @@
+"""
+Load a cropped DivaHisDB dataset from packed shard files.
+"""
+
+from pathlib import Path
+from typing import List, Tuple, Union, Optional
+
+import numpy as np
+import torch
+from torch import is_tensor, Tensor
+from torchvision.transforms import ToTensor
+
+from src.datamodules.RGB.datasets.packed_cropped_dataset import PackedCroppedDatasetRGB
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+
+class PackedCroppedHisDBDataset(PackedCroppedDatasetRGB):
+    """
+    Packed version of :class:`CroppedHisDBDataset`. Additionally, to the crops and the encoded ground truth the shards
+    contain the boundary mask of every crop, which is returned like in the file based dataset.
+
+    :param path: Path to the packed split folder (train / val / test)
+    :type path: Path
+    :param selection: filtering of the dataset, can be an integer or a list of strings
+    :type selection: Union[int, List[str], None]
+    :param is_test: if True, :meth:`__getitem__` will return the index of the image
+    :type is_test: bool
+    :param image_transform: transformation that is applied to the image
+    :type image_transform: callable
+    :param target_transform: not used, the ground truth is already encoded
+    :type target_transform: callable
+    :param twin_transform: twin transformation, it needs to provide `get_params` like :class:`TwinRandomCrop`
+    :type twin_transform: callable
+    :param return_index: if True, :meth:`__getitem__` also returns the index of the crop for the train and val samples
+    :type return_index: bool
+    """
+
+    def __init__(self, path: Path, selection: Optional[Union[int, List[str]]] = None,
+                 is_test=False, image_transform=None, target_transform=None, twin_transform=None,
+                 return_index=False):
+        """
+        Constructor method for the PackedCroppedHisDBDataset class.
+        """
+        super().__init__(path, selection, is_test, image_transform, target_transform, twin_transform,
+                         return_index)
+
+        if not self.reader.has_mask:
+            raise ValueError(f'The packed split {path} does not contain boundary masks')
+
+    def _get_train_val_items(self, index):
+        data_img, gt_img, mask = self._load_data_gt_and_mask(index=index)
+        img, gt, boundary_mask = self._apply_transformation_with_mask(data_img, gt_img, mask)
+        return img, gt, boundary_mask
+
+    def _get_test_items(self, index):
+        data_img, gt_img, mask = self._load_data_gt_and_mask(index=index)
+        img, gt, boundary_mask = self._apply_transformation_with_mask(data_img, gt_img, mask)
+        return img, gt, boundary_mask, index
+
+    def _load_data_gt_and_mask(self, index: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns read-only views of the image crop, the encoded ground truth and the boundary mask.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image (H x W x 3), the ground truth (H x W) and the boundary mask (H x W)
+        :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        return data_img, gt_img, self.reader.get_mask(sample_id=self.sample_ids[index])
+
+    def _apply_transformation_with_mask(self, img: np.ndarray, gt: np.ndarray, mask: np.ndarray) \
+            -> Tuple[Tensor, Tensor, Tensor]:
+        """
+        Same as :meth:`PackedCroppedDatasetRGB._apply_transformation` but the boundary mask is cropped with the
+        same window as the image and the ground truth.
+
+        :param img: The memory mapped image crop
+        :type img: np.ndarray
+        :param gt: The memory mapped ground truth
+        :type gt: np.ndarray
+        :param mask: The memory mapped boundary mask
+        :type mask: np.ndarray
+        :return: transformed image, gt and boundary mask
+        :rtype: Tuple[Tensor, Tensor, Tensor]
+        """
+        window = self._get_crop_window(*gt.shape)
+
+        img = np.array(img[window])
+        gt = torch.from_numpy(gt[window].astype(np.int64))
+        border_mask = torch.from_numpy(np.array(mask[window]))
+
+        if self.image_transform is not None:
+            # perform transformations
+            img, gt = self.image_transform(img, gt)
+
+        if not is_tensor(img):
+            img = ToTensor()(img)
+
+        return img, gt, border_mask
@@ -0,0 +1,107 @@
+"""
+Load a cropped DivaHisDB dataset from a tiled page store.
+"""
+
+from pathlib import Path
+from typing import List, Tuple, Union, Optional
+
+import numpy as np
+import torch
+from torch import is_tensor, Tensor
+from torchvision.transforms import ToTensor
+
+from src.datamodules.RGB.datasets.tiled_cropped_dataset import TiledCroppedDatasetRGB
+from src.datamodules.utils.lru_cache import LRUCache
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+
+class TiledCroppedHisDBDataset(TiledCroppedDatasetRGB):
+    """
+    Tiled version of :class:`CroppedHisDBDataset`. Additionally, to the image and the encoded ground truth the store
+    contains the boundary mask of every page, which is returned like in the file based dataset.
+
+    :param path: Path to the tiled split folder (train / val / test)
+    :type path: Path
+    :param crop_size: size of the virtual crops, defaults to the crop size the store was written with
+    :type crop_size: Optional[int]
+    :param overlap: overlap of the virtual crops (between 0-1), defaults to the overlap the store was written with
+    :type overlap: Optional[float]
+    :param selection: filtering of the dataset, can be an integer or a list of strings
+    :type selection: Union[int, List[str], None]
+    :param is_test: if True, :meth:`__getitem__` will return the index of the image
+    :type is_test: bool
+    :param image_transform: transformation that is applied to the image
+    :type image_transform: callable
+    :param target_transform: not used, the ground truth is already encoded
+    :type target_transform: callable
+    :param twin_transform: twin transformation, it needs to provide `get_params` like :class:`TwinRandomCrop`
+    :type twin_transform: callable
+    :param tile_cache: cache for the decompressed tiles, works best with :class:`PageLocalitySampler`
+    :type tile_cache: Optional[LRUCache]
+    :param return_index: if True, :meth:`__getitem__` also returns the index of the crop for the train and val samples
+    :type return_index: bool
+    """
+
+    def __init__(self, path: Path, crop_size: Optional[int] = None, overlap: Optional[float] = None,
+                 selection: Optional[Union[int, List[str]]] = None,
+                 is_test=False, image_transform=None, target_transform=None, twin_transform=None,
+                 tile_cache: Optional[LRUCache] = None, return_index=False):
+        """
+        Constructor method for the TiledCroppedHisDBDataset class.
+        """
+        super().__init__(path, crop_size, overlap, selection, is_test, image_transform, target_transform,
+                         twin_transform, tile_cache, return_index)
+
+        if not self.reader.has_mask:
+            raise ValueError(f'The tiled split {path} does not contain boundary masks')
+
+    def _get_train_val_items(self, index):
+        data_img, gt_img, mask = self._load_data_gt_and_mask(index=index)
+        img, gt, boundary_mask = self._apply_transformation_with_mask(data_img, gt_img, mask)
+        return img, gt, boundary_mask
+
+    def _get_test_items(self, index):
+        data_img, gt_img, mask = self._load_data_gt_and_mask(index=index)
+        img, gt, boundary_mask = self._apply_transformation_with_mask(data_img, gt_img, mask)
+        return img, gt, boundary_mask, index
+
+    def _load_data_gt_and_mask(self, index: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Reads the window of the twin transform (or the whole crop) out of the store, including the boundary mask.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image (H x W x 3), the ground truth (H x W) and the boundary mask (H x W)
+        :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        """
+        page_id, x, y, width, height = self._get_crop_window(index=index)
+        return tuple(self.reader.read_window(page_id=page_id, kind=kind, x=x, y=y, width=width, height=height)
+                     for kind in ('data', 'gt', 'mask'))
+
+    def _apply_transformation_with_mask(self, img: np.ndarray, gt: np.ndarray, mask: np.ndarray) \
+            -> Tuple[Tensor, Tensor, Tensor]:
+        """
+        Same as :meth:`TiledCroppedDatasetRGB._apply_transformation` but the boundary mask is returned as well.
+
+        :param img: The image window
+        :type img: np.ndarray
+        :param gt: The ground truth window
+        :type gt: np.ndarray
+        :param mask: The boundary mask window
+        :type mask: np.ndarray
+        :return: transformed image, gt and boundary mask
+        :rtype: Tuple[Tensor, Tensor, Tensor]
+        """
+        gt = torch.from_numpy(gt.astype(np.int64))
+        border_mask = torch.from_numpy(mask)
+
+        if self.image_transform is not None:
+            # perform transformations
+            img, gt = self.image_transform(img, gt)
+
+        if not is_tensor(img):
+            img = ToTensor()(img)
+
+        return img, gt, border_mask
@@ -1,74 +1,107 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-import numpy as np
 import torch
+from torch.nn.functional import one_hot
 
-from sklearn.preprocessing import OneHotEncoder
+from src.datamodules.utils.functional import to_color_values
 
 
-def gt_to_int_encoding(matrix: torch.Tensor, class_encodings: List[int]) -> torch.Tensor:
+def _get_blue_lookup_table(class_encodings: List[int]) -> torch.Tensor:
     """
-    Convert ground truth tensor to integer encoded matrix
+    Creates the lookup table from the blue channel values (0-255) to the classes, unknown values are -1.
 
-    :param matrix: Image as a tensor of size [C x H x W] (BGR)
-    :type matrix: torch.Tensor
-    :param class_encodings: class encoding so which class (index) has what value (element)
+    :param class_encodings: Blue channel values that encode the different classes
     :type class_encodings: List[int]
-    :return: integer encoded matrix
+    :return: lookup table with 256 entries
     :rtype: torch.Tensor
     """
-    matrix = (matrix * 255)
+    lookup_table = torch.full(size=(256,), fill_value=-1, dtype=torch.long)
+    for index, encoding in enumerate(class_encodings):
+        lookup_table[int(encoding)] = index
+    return lookup_table
 
-    # take only blue channel
-    img_blue = matrix[2, :, :]
+
+def _get_blue_values(matrix: torch.Tensor) -> torch.Tensor:
+    """
+    Returns the blue channel values (0-255) of the ground truth with the border pixels changed to background.
+
+    :param matrix: Image as a tensor of size [C x H x W] (BGR), float in the range [0.0, 1.0] or integer
+    :type matrix: torch.Tensor
+    :return: blue channel values of size [H x W]
+    :rtype: torch.Tensor
+    """
+    if matrix.dtype != torch.uint8:
+        matrix = to_color_values(matrix[:3])
 
     # change border pixels to background
-    border_mask = torch.where(matrix[0, :, :] != 0, True, False)
-    img_blue[border_mask] = 1
+    border_mask = matrix[0] != 0
+    return torch.where(border_mask, 1, matrix[2])
 
-    integer_encoded = torch.full(size=img_blue.shape, fill_value=-1, dtype=torch.long)
-    for index, encoding in enumerate(class_encodings):
-        mask = torch.where(img_blue == encoding, True, False)
-        integer_encoded[mask] = index
 
-    return integer_encoded
+def _lookup_blue_values(img_blue: torch.Tensor, class_encodings: List[int]) -> torch.Tensor:
+    lookup_table = _get_blue_lookup_table(class_encodings=class_encodings)
+    if img_blue.dtype == torch.uint8:
+        return lookup_table[img_blue.long()]
+    valid = (img_blue >= 0) & (img_blue <= 255)
+    return torch.where(valid, lookup_table[img_blue.clamp(0, 255).long()], -1)
+
+
+def color_to_class_id(color: Tuple[int, int, int], class_encodings: List[int]) -> Optional[int]:
+    """
+    Returns the class of a ground truth color in the same way as :func:`gt_to_int_encoding` (border pixels are
+    background).
+
+    :param color: RGB color of the ground truth pixel
+    :type color: Tuple[int, int, int]
+    :param class_encodings: Blue channel values that encode the different classes
+    :type class_encodings: List[int]
+    :return: the index of the class, None if the blue channel value is not a class encoding
+    :rtype: Optional[int]
+    """
+    blue = 1 if color[0] != 0 else color[2]
+    return class_encodings.index(blue) if blue in class_encodings else None
+
+
+def gt_to_int_encoding(matrix: torch.Tensor, class_encodings: List[int]) -> torch.Tensor:
+    """
+    Convert ground truth tensor to integer encoded matrix. The blue channel values are mapped to the classes with a
+    lookup table, values which are not a class encoding are encoded with -1.
+
+    :param matrix: Image as a tensor of size [C x H x W] (BGR), float in the range [0.0, 1.0] (`ToTensor`) or
+        integer in the range [0, 255] (e.g. uint8)
+    :type matrix: torch.Tensor
+    :param class_encodings: class encoding so which class (index) has what value (element)
+    :type class_encodings: List[int]
+    :return: integer encoded matrix
+    :rtype: torch.Tensor
+    """
+    return _lookup_blue_values(img_blue=_get_blue_values(matrix), class_encodings=class_encodings)
 
 
 def gt_to_one_hot(matrix: torch.Tensor, class_encodings: List[int]):
     """
-    Convert ground truth tensor or numpy matrix to one-hot encoded matrix
+    Convert ground truth tensor to one-hot encoded matrix
 
-    :param matrix: float tensor from to_tensor() or numpy array
-        shape (C x H x W) in the range [0.0, 1.0] or shape (H x W x C) BGR
-    :type matrix: torch.Tensor or np.ndarray
+    :param matrix: float tensor from to_tensor() of shape (C x H x W) in the range [0.0, 1.0] or integer tensor
+        in the range [0, 255] (e.g. uint8), BGR
+    :type matrix: torch.Tensor
     :param class_encodings: List of int
         Blue channel values that encode the different classes
     :type class_encodings: List[int]
     :return: Tensor of size [#C x H x W]
         sparse one-hot encoded multi-class matrix, where #C is the number of classes
     :rtype: torch.LongTensor
+    :raises KeyError: if a blue channel value is not a class encoding
     """
-    num_classes = len(class_encodings)
-
-    np_array = (matrix * 255).numpy().astype(np.uint8)
-    im_np = np_array[2, :, :].astype(np.uint8)
-    border_mask = np_array[0, :, :].astype(np.uint8) != 0
-    im_np[border_mask] = 1
-
-    integer_encoded = np.array([i for i in range(num_classes)])
-    onehot_encoder = OneHotEncoder(sparse=False, categories='auto')
-    integer_encoded = integer_encoded.reshape(len(integer_encoded), 1)
-    onehot_encoded = onehot_encoder.fit_transform(integer_encoded).astype(np.int8)
-
-    np.place(im_np, im_np == 0,
-             1)  # needed to deal with 0 fillers at the borders during testing (replace with background)
-    replace_dict = {k: v for k, v in zip(class_encodings, onehot_encoded)}
-
-    # create the one hot matrix
-    one_hot_matrix = np.asanyarray(
-        [[replace_dict[im_np[i, j]] for j in range(im_np.shape[1])] for i in range(im_np.shape[0])]).astype(
-        np.uint8)
+    img_blue = _get_blue_values(matrix)
+    # needed to deal with 0 fillers at the borders during testing (replace with background)
+    img_blue[img_blue == 0] = 1
 
-    return torch.LongTensor(one_hot_matrix.transpose((2, 0, 1)))
+    integer_encoded = _lookup_blue_values(img_blue=img_blue, class_encodings=class_encodings)
+    unknown = integer_encoded < 0
+    if torch.any(unknown):
+        raise KeyError(f'Unknown class encoding(s) {torch.unique(img_blue[unknown]).tolist()}')
 
+    onehot_encoded = one_hot(input=integer_encoded, num_classes=len(class_encodings))
 
+    return onehot_encoded.permute(2, 0, 1)
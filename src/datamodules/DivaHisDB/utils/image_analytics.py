@@ -2,24 +2,28 @@
 import logging
 import os
 from pathlib import Path
-from typing import Tuple, Any, Dict, List, Union
+from typing import Tuple, Any, Dict, List, Union, Optional
 
 import numpy as np
 # Torch related stuff
 import torch
 import torchvision.datasets as datasets
 import torchvision.transforms as transforms
-from PIL import Image
-from numpy import ndarray, dtype
+from torchvision.datasets.folder import pil_loader
 
-from src.datamodules.utils.misc import save_json, check_missing_analytics
-from src.datamodules.utils.image_analytics import compute_mean_std
+from src.datamodules.utils.distributed import synchronize_analytics
+from src.datamodules.utils.misc import save_json, check_missing_analytics, read_analytics
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed
 
 
-def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str, get_gt_data_paths_func) \
+@synchronize_analytics
+def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str, get_gt_data_paths_func,
+                  workers: int = 8, selection: Optional[Union[int, List[str]]] = None) \
         -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Get the analytics for the dataset. If the analytics file is not present, it will be computed and saved.
+    The statistics of the single files are taken from the statistics index of the dataset (see
+    :func:`compute_image_statistics_indexed`), so only files which have not been indexed before are read.
 
     :param input_path: Path to the root of the dataset
     :type input_path: Path
@@ -29,6 +33,11 @@ def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str,
     :type gt_folder_name: str
     :param get_gt_data_paths_func: Function to get the paths to the data and ground truth
     :type get_gt_data_paths_func: Callable
+    :param workers: Number of workers to compute the analytics
+    :type workers: int
+    :param selection: analytics of the selected pages of the training split (computed from the statistics index, the
+        analytics files are neither read nor written)
+    :type selection: Optional[Union[int, List[str]]]
     :return: Tuple of analytics for the data and ground truth
     :rtype: Tuple[Dict[str, Any], Dict[str, Any]]
     """
@@ -39,39 +48,64 @@ def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str,
     analytics_path_data = input_path / f'analytics.data.{data_folder_name}.json'
     analytics_path_gt = input_path / f'analytics.gt.hisDB.{gt_folder_name}.json'
 
-    analytics_data, missing_analytics_data = check_missing_analytics(analytics_path_data, expected_keys_data)
-
-    analytics_gt, missing_analytics_gt = check_missing_analytics(analytics_path_gt, expected_keys_gt)
+    if selection:
+        analytics_data, analytics_gt, missing_analytics_data, missing_analytics_gt = None, None, True, True
+    else:
+        analytics_data, missing_analytics_data = check_missing_analytics(analytics_path_data, expected_keys_data)
+        analytics_gt, missing_analytics_gt = check_missing_analytics(analytics_path_gt, expected_keys_gt)
 
     if not (missing_analytics_data or missing_analytics_gt):
         return analytics_data, analytics_gt
 
     train_path = input_path / 'train'
     gt_data_path_list = get_gt_data_paths_func(train_path, data_folder_name=data_folder_name,
-                                               gt_folder_name=gt_folder_name)
+                                               gt_folder_name=gt_folder_name, selection=selection)
     file_names_data = np.asarray([str(item[0]) for item in gt_data_path_list])
     file_names_gt = np.asarray([str(item[1]) for item in gt_data_path_list])
 
+    # single pass over the data and the gt files which are not yet indexed
+    statistics = compute_image_statistics_indexed(root=input_path,
+                                                  file_names_data=file_names_data if missing_analytics_data else None,
+                                                  file_names_gt=file_names_gt if missing_analytics_gt else None,
+                                                  gt_format='hisdb', get_class_counts_func=get_class_counts_hisdb,
+                                                  workers=workers)
+
     if missing_analytics_data:
-        mean, std = compute_mean_std(file_names=file_names_data)
-        analytics_data = {'mean': mean.tolist(),
-                          'std': std.tolist()}
+        analytics_data = {'mean': statistics.mean.tolist(),
+                          'std': statistics.std.tolist()}
         # save json
-        save_json(analytics_data, analytics_path_data)
+        if not selection:
+            save_json(analytics_data, analytics_path_data)
 
     if missing_analytics_gt:
         # Measure weights for class balancing
-        logging.info('Measuring class weights')
-        # create a list with all gt file paths
-        class_weights, class_encodings = _get_class_frequencies_weights_segmentation_hisdb(gt_images=file_names_gt)
+        class_weights, class_encodings = get_class_weights_encodings_hisdb(class_counts=statistics.class_counts)
         analytics_gt = {'class_weights': class_weights.tolist(),
                         'class_encodings': class_encodings.tolist()}
         # save json
-        save_json(analytics_gt, analytics_path_gt)
+        if not selection:
+            save_json(analytics_gt, analytics_path_gt)
 
     return analytics_data, analytics_gt
 
 
+def read_analytics_gt(input_path: Path, gt_folder_name: str) -> Dict[str, Any]:
+    """
+    Reads the analytics of the ground truth (class weights and encodings) from the analytics file of the dataset
+    without opening any image (e.g. for the tools which merge or evaluate predictions).
+
+    :param input_path: Path to the root of the dataset
+    :type input_path: Path
+    :param gt_folder_name: Name of the ground truth folder
+    :type gt_folder_name: str
+    :return: class weights and encodings
+    :rtype: Dict[str, Any]
+    :raises FileNotFoundError: if the analytics file is missing or incomplete
+    """
+    return read_analytics(input_path / f'analytics.gt.hisDB.{gt_folder_name}.json',
+                          expected_keys=['class_weights', 'class_encodings'])
+
+
 def get_class_weights(input_folder, workers=4) -> List[float]:
     """
     Get the weights proportional to the inverse of their class frequencies.
@@ -120,31 +154,32 @@ def get_class_weights(input_folder, workers=4) -> List[float]:
     return class_weights
 
 
-def _get_class_frequencies_weights_segmentation_hisdb(gt_images: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+def get_class_counts_hisdb(gt_path: Union[str, Path]) -> Dict[int, int]:
     """
-    Get the weights proportional to the inverse of their class frequencies.
-    The vector sums up to 1
+    Counts the pixels of every blue channel value of a ground truth image.
 
-    :param gt_images: Path to all ground truth images, which contain the pixel-wise label
-    :type gt_images: np.ndarray
-    :return: The weights vector as a 1D array normalized (sum up to 1)
-    :rtype: Tuple[Union[Union[ndarray[Any, dtype[floating[Any]]], ndarray[Any, dtype[complexfloating[Any, Any]]]], Any], ndarray]
+    :param gt_path: Path to the ground truth image, which contains the pixel-wise label
+    :type gt_path: Union[str, Path]
+    :return: number of pixels per blue channel value
+    :rtype: Dict[int, int]
     """
-    logging.info('Begin computing class frequencies weights')
+    counts = np.bincount(np.asarray(pil_loader(gt_path))[:, :, 2].ravel(), minlength=256)
+    return {int(value): int(counts[value]) for value in np.flatnonzero(counts)}
 
-    total_num_pixels = 0
-    label_counter = {}
 
-    for path in gt_images:
-        img = np.array(Image.open(path))[:, :, 2].flatten()
-        total_num_pixels += len(img)
-        for i, j in zip(*np.unique(img, return_counts=True)):
-            label_counter[i] = label_counter.get(i, 0) + j
+def get_class_weights_encodings_hisdb(class_counts: Dict[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the weights proportional to the inverse of their class frequencies.
+    The vector sums up to 1
 
-    classes = np.array(sorted(label_counter.keys()))
-    num_samples_per_class = np.array([label_counter[k] for k in classes])
-    class_frequencies = (num_samples_per_class / total_num_pixels)
-    logging.info('Finished computing class frequencies weights')
+    :param class_counts: number of pixels per blue channel value of all the ground truth images
+    :type class_counts: Dict[int, int]
+    :return: The normalized weights and the blue channel values of the classes (sorted)
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    classes = np.array(sorted(class_counts.keys()))
+    num_samples_per_class = np.array([class_counts[k] for k in classes])
+    class_frequencies = (num_samples_per_class / num_samples_per_class.sum())
     logging.info(f'Class frequencies (rounded): {np.around(class_frequencies * 100, decimals=2)}')
     # Normalize vector to sum up to 1.0 (in case the Loss function does not do it)
     return (1 / num_samples_per_class) / ((1 / num_samples_per_class).sum()), classes
@@ -1,10 +1,11 @@
 from pathlib import Path
 
-import numpy as np
 from PIL import Image
 
+from src.datamodules.utils.output_tools import output_to_class_indices, get_palette, decode_palette
 
-def save_output_page_image(image_name, output_image, output_folder: Path, class_encoding):
+
+def save_output_page_image(image_name, output_image, output_folder: Path, class_encoding, perform_argmax=True):
     """
     Helper function to save the output during testing in the DIVAHisDB format
 
@@ -16,19 +17,21 @@ def save_output_page_image(image_name, output_image, output_folder: Path, class_
     :type output_folder: Path
     :param class_encoding: list with the class encodings
     :type class_encoding: list
+    :param perform_argmax: perform argmax on the output image, False if it contains the class indices [H x W]
+    :type perform_argmax: bool
 
     :return: mean iou of this image
     :rtype: float
     """
 
-    output_encoded = output_to_class_encodings(output_image, class_encoding)
+    output_encoded = output_to_class_encodings(output_image, class_encoding, perform_argmax=perform_argmax)
 
     dest_folder = output_folder
     dest_folder.mkdir(parents=True, exist_ok=True)
     dest_filename = dest_folder / image_name
 
     # Save the output
-    Image.fromarray(output_encoded.astype(np.uint8)).save(str(dest_filename))
+    Image.fromarray(output_encoded).save(str(dest_filename))
 
 
 def output_to_class_encodings(output, class_encodings, perform_argmax=True):
@@ -41,18 +44,9 @@ def output_to_class_encodings(output, class_encodings, perform_argmax=True):
     :type class_encodings: list
     :param perform_argmax: perform argmax on input data
     :type perform_argmax: bool
-    :return: np.array of size [H x W] (BGR)
+    :return: uint8 np.array of size [H x W x C] (BGR)
     """
 
-    b_argmax = np.argmax(output, axis=0) if perform_argmax else output
-
-    class_to_color = {i: j for i, j in enumerate(class_encodings)}
-
-    masks = [b_argmax == old for old in class_to_color.keys()]
-
-    for mask, (old, new) in zip(masks, class_to_color.items()):
-        b_argmax = np.where(mask, new, b_argmax)
-
-    rgb = np.dstack((np.zeros(shape=(b_argmax.shape[0], b_argmax.shape[1], 2), dtype=np.int8), b_argmax))
+    class_indices = output_to_class_indices(output, perform_argmax=perform_argmax)
 
-    return rgb
+    return decode_palette(class_indices=class_indices, palette=get_palette(class_encodings))
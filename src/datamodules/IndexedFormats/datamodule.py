@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Union, List, Optional
+from typing import Union, List, Optional, Dict
 
 import torch
 from torch.utils.data import DataLoader
@@ -7,9 +7,10 @@ from torchvision import transforms
 
 from src.datamodules.IndexedFormats.datasets.full_page_dataset import DatasetIndexed
 from src.datamodules.IndexedFormats.utils.image_analytics import get_analytics
-from src.datamodules.base_datamodule import AbstractDatamodule
+from src.datamodules.base_datamodule import AbstractDatamodule, AnalyticsAttribute
 from src.datamodules.utils.dataset_predict import DatasetPredict
 from src.datamodules.utils.misc import validate_path_for_segmentation, ImageDimensions
+from src.datamodules.utils.page_cache import PageCacheSpecs
 from src.datamodules.utils.wrapper_transforms import OnlyImage
 from src.utils import utils
 
@@ -79,7 +80,21 @@ class DataModuleIndexed(AbstractDatamodule):
     :type shuffle: bool
     :param drop_last: drop the last batch if it is smaller than the batch size
     :type drop_last: bool
+    :param page_cache: settings of the cache for the decoded pages (keys of class: `PageCacheSpecs`),
+        no pages are cached if None
+    :type page_cache: Optional[Dict]
+    :param decode_backend: backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+        `numpy`), None loads PIL images with `pil_loader`
+    :type decode_backend: Optional[str]
+    :param uint8_batches: if True, the samples contain uint8 image tensors which are normalized by the task after
+        the transfer to the device, instead of normalized float tensors (a quarter of the bytes per batch)
+    :type uint8_batches: bool
     """
+    image_dims = AnalyticsAttribute()
+    dims = AnalyticsAttribute()
+    class_encodings_tensor = AnalyticsAttribute()
+    image_transform = AnalyticsAttribute()
+
     def __init__(self, data_dir: str, data_folder_name: str, gt_folder_name: str,
                  train_folder_name: str = 'train', val_folder_name: str = 'val', test_folder_name: str = 'test',
                  pred_file_path_list: List[str] = None,
@@ -87,7 +102,9 @@ class DataModuleIndexed(AbstractDatamodule):
                  selection_val: Optional[Union[int, List[str]]] = None,
                  selection_test: Optional[Union[int, List[str]]] = None,
                  num_workers: int = 4, batch_size: int = 8,
-                 shuffle: bool = True, drop_last: bool = True) -> None:
+                 shuffle: bool = True, drop_last: bool = True, page_cache: Optional[Dict] = None,
+                 decode_backend: Optional[str] = None,
+                 uint8_batches: bool = False) -> None:
         """
         Constructor method for the DataModuleIndexed class.
         """
@@ -102,7 +119,25 @@ class DataModuleIndexed(AbstractDatamodule):
         if pred_file_path_list is not None:
             self.pred_file_path_list = pred_file_path_list
 
-        analytics_data, analytics_gt = get_analytics(input_path=Path(data_dir),
+        self.uint8_batches = uint8_batches
+
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        self.data_dir = Path(data_dir)
+
+        self.selection_train = selection_train
+        self.selection_val = selection_val
+        self.selection_test = selection_test
+
+        self.page_cache = PageCacheSpecs(**page_cache) if page_cache is not None else None
+        self.decode_backend = decode_backend
+
+    def _load_analytics(self):
+        analytics_data, analytics_gt = get_analytics(input_path=self.data_dir,
                                                      data_folder_name=self.data_folder_name,
                                                      gt_folder_name=self.gt_folder_name,
                                                      train_folder_name=self.train_folder_name,
@@ -118,32 +153,18 @@ class DataModuleIndexed(AbstractDatamodule):
         self.num_classes = len(self.class_encodings)
         self.class_weights = torch.as_tensor(analytics_gt['class_weights'])
 
-        self.image_transform = OnlyImage(transforms.Compose([transforms.ToTensor(),
-                                                             transforms.Normalize(mean=self.mean, std=self.std)]))
-
-        self.num_workers = num_workers
-        self.batch_size = batch_size
-
-        self.shuffle = shuffle
-        self.drop_last = drop_last
-
-        self.data_dir = Path(data_dir)
-
-        self.selection_train = selection_train
-        self.selection_val = selection_val
-        self.selection_test = selection_test
-
-        # Check default attributes using base_datamodule function
-        self._check_attributes()
+        self.image_transform = OnlyImage(transforms.Compose([*self.get_image_to_tensor_transforms()]))
 
     def setup(self, stage: Optional[str] = None) -> None:
         super().setup()
 
         common_kwargs = {'image_dims': self.image_dims,
-                         'image_transform': self.image_transform}
+                         'image_transform': self.image_transform,
+                         'decode_backend': self.decode_backend}
 
         dataset_kwargs = {'data_folder_name': self.data_folder_name,
-                          'gt_folder_name': self.gt_folder_name}
+                          'gt_folder_name': self.gt_folder_name,
+                          'page_cache': self.page_cache}
 
         if stage == 'fit' or stage is None:
             self.data_dir = validate_path_for_segmentation(data_dir=self.data_dir,
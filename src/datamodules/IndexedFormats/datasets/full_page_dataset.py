@@ -12,10 +12,12 @@ import torch.utils.data as data
 from PIL import Image
 from omegaconf import ListConfig
 from torch import is_tensor
-from torchvision.datasets.folder import pil_loader, has_file_allowed_extension
+from torchvision.datasets.folder import has_file_allowed_extension
 from torchvision.transforms import ToTensor
 
-from src.datamodules.utils.misc import ImageDimensions, selection_validation, pil_loader_gif, get_output_file_list
+from src.datamodules.utils.decoders import get_decoder, get_image_size, load_image
+from src.datamodules.utils.misc import ImageDimensions, selection_validation, get_output_file_list
+from src.datamodules.utils.page_cache import PageCache, PageCacheSpecs
 from src.utils import utils
 
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
@@ -43,20 +45,26 @@ class DatasetIndexed(data.Dataset):
         :type data_folder_name: str
         :param gt_folder_name: Name of the folder where the ground truth is located
         :type gt_folder_name: str
-        :param image_dims: Image dimensions of the dataset
-        :type image_dims: ImageDimensions
+        :param image_dims: Image dimensions of the dataset, if None the pages can have any size
+        :type image_dims: Optional[ImageDimensions]
         :param is_test: Flag to indicate if the dataset is used for testing
         :type is_test: bool
         :param selection: Selection of the dataset, can be an integer or a list of strings
         :type selection: Optional[Union[int, List[str]]]
         :param image_transform: Transformations that are applied to the image
         :type image_transform: Optional[Callable]
+        :param page_cache: Specification of the cache for the decoded pages and their label maps
+        :type page_cache: Optional[PageCacheSpecs]
+        :param decode_backend: Backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+            `numpy`, see :func:`get_decoder`), None loads PIL images with `pil_loader`
+        :type decode_backend: Optional[str]
     """
 
     def __init__(self, path: Path, data_folder_name: str, gt_folder_name: str,
-                 image_dims: ImageDimensions, is_test=False,
+                 image_dims: Optional[ImageDimensions], is_test=False,
                  selection: Optional[Union[int, List[str]]] = None,
-                 image_transform=None) -> None:
+                 image_transform=None, page_cache: Optional[PageCacheSpecs] = None,
+                 decode_backend: Optional[str] = None) -> None:
         """
          Constructor method for the DatasetIndexed class.
         """
@@ -65,6 +73,7 @@ class DatasetIndexed(data.Dataset):
         self.data_folder_name = data_folder_name
         self.gt_folder_name = gt_folder_name
         self.selection = selection
+        self.decoder = get_decoder(decode_backend=decode_backend)
 
         self.image_dims = image_dims
 
@@ -86,6 +95,13 @@ class DatasetIndexed(data.Dataset):
                                f"Supported image extensions are: {' '.join(IMG_EXTENSIONS)}\n"
                                f"Supported ground truth extensions are: {' '.join(GT_EXTENSION)}")
 
+        self.page_cache = None
+        if page_cache is not None:
+            if self.image_dims is None:
+                raise ValueError('The page cache needs the image dimensions')
+            self.page_cache = PageCache(specs=page_cache, page_paths=self.img_gt_path_list,
+                                        image_dims=self.image_dims)
+
     def __len__(self):
         """
         This function returns the length of an epoch so the data loader knows when to stop.
@@ -96,7 +112,11 @@ class DatasetIndexed(data.Dataset):
 
     def __getitem__(self, index: int) -> Union[
         Tuple[torch.Tensor, torch.Tensor], Tuple[torch.Tensor, torch.Tensor, int]]:
-        data_img, gt_img = self._load_data_and_gt(index=index)
+        if self.page_cache is None:
+            data_img, gt_img = self._load_data_and_gt(index=index)
+        else:
+            data_img, gt_img = self.page_cache.load(index=index, decode_func=self._decode_page)
+            data_img = Image.fromarray(data_img)
         img, gt = self._apply_transformation(data_img, gt_img)
         assert img.shape[-2:] == gt.shape[-2:]
         if self.is_test:
@@ -104,6 +124,19 @@ class DatasetIndexed(data.Dataset):
         else:
             return img, gt
 
+    def _decode_page(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes the page into an uint8 image and its label map (the palette indices of the ground truth)
+        for the page cache.
+
+        :param index: Index of the image
+        :type index: int
+        :return: Image (HxWx3) and label map (HxW)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        return np.asarray(data_img), np.asarray(gt_img)
+
     def _load_data_and_gt(self, index: int) -> Tuple[Image.Image, Image.Image]:
         """
         Load the data and the ground truth.
@@ -113,11 +146,12 @@ class DatasetIndexed(data.Dataset):
         :return: Data and ground truth as PIL Image
         :rtype: Tuple[Image.Image, Image.Image]
         """
-        data_img = pil_loader(str(self.img_gt_path_list[index][0]))
-        gt_img = pil_loader_gif(self.img_gt_path_list[index][1])
+        data_img = load_image(self.img_gt_path_list[index][0], decoder=self.decoder)
+        gt_img = load_image(self.img_gt_path_list[index][1], decoder=self.decoder, mode='P')
 
-        assert data_img.height == self.image_dims.height and data_img.width == self.image_dims.width
-        assert gt_img.height == self.image_dims.height and gt_img.width == self.image_dims.width
+        if self.image_dims is not None:
+            assert get_image_size(data_img) == (self.image_dims.width, self.image_dims.height)
+            assert get_image_size(gt_img) == (self.image_dims.width, self.image_dims.height)
 
         return data_img, gt_img
 
@@ -127,8 +161,8 @@ class DatasetIndexed(data.Dataset):
 
         :param img: Original image
         :type img: Image
-        :param gt: Ground truth as an image
-        :type gt: Image
+        :param gt: Ground truth as an image or label map
+        :type gt: Union[Image, np.ndarray]
         :return: Original and ground Truth as Tensor with applied transformations
         :rtype: Tuple[torch.Tensor, torch.Tensor]
         """
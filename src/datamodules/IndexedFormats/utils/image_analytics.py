@@ -3,24 +3,28 @@ import errno
 import json
 import logging
 from pathlib import Path
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, List, Union, Optional
 
 import numpy as np
-# Torch related stuff
-from PIL import Image
 
-from src.datamodules.utils.image_analytics import compute_mean_std
-from src.datamodules.utils.misc import pil_loader_gif, save_json
+from src.datamodules.utils.distributed import synchronize_analytics
+from src.datamodules.utils.image_analytics import ImageStatistics
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed
+from src.datamodules.utils.misc import pil_loader_gif, save_json, read_analytics
 
 
+@synchronize_analytics
 def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str, train_folder_name: str,
-                  get_img_gt_path_list_func: callable, inmem: bool = False, workers: int = 8) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+                  get_img_gt_path_list_func: callable, inmem: bool = False, workers: int = 8,
+                  selection: Optional[Union[int, List[str]]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Get the analytics for the dataset. If the analytics file is not present, it will be computed and saved.
+    The statistics of the single files are taken from the statistics index of the dataset (see
+    :func:`compute_image_statistics_indexed`), so only files which have not been indexed before are read.
 
     :param workers:  Number of workers to calculate the mean and std
     :type workers: int
-    :param inmem:  Load the images in memory or load them separately
+    :param inmem:  not used anymore, the images are never loaded at once (kept for compatibility)
     :type inmem: bool
     :param input_path: Path to the root of the dataset
     :type input_path: Path
@@ -32,6 +36,9 @@ def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str,
     :type train_folder_name: str
     :param get_img_gt_path_list_func: Function to get the list of image and ground truth paths
     :type get_img_gt_path_list_func: Callable[[Path, str, str], List[Tuple[Path, Path]]]
+    :param selection: analytics of the selected pages of the training split (computed from the statistics index, the
+        analytics files are neither read nor written)
+    :type selection: Optional[Union[int, List[str]]]
     :return: Tuple of analytics for the data and ground truth
     :rtype: Tuple[Dict[str, Any], Dict[str, Any]]
     """
@@ -47,14 +54,15 @@ def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str,
     missing_analytics_data = True
     missing_analytics_gt = True
 
-    if analytics_path_data.exists():
+    # the analytics files describe the whole split
+    if not selection and analytics_path_data.exists():
         with analytics_path_data.open(mode='r') as f:
             analytics_data = json.load(fp=f)
         # check if analytics file is complete
         if all(k in analytics_data for k in expected_keys_data):
             missing_analytics_data = False
 
-    if analytics_path_gt.exists():
+    if not selection and analytics_path_gt.exists():
         with analytics_path_gt.open(mode='r') as f:
             analytics_gt = json.load(fp=f)
         # check if analytics file is complete
@@ -64,57 +72,85 @@ def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str,
     if missing_analytics_data or missing_analytics_gt:
         train_path = input_path / train_folder_name
         img_gt_path_list = get_img_gt_path_list_func(train_path, data_folder_name=data_folder_name,
-                                                     gt_folder_name=gt_folder_name)
+                                                     gt_folder_name=gt_folder_name, selection=selection)
         file_names_data = np.asarray([str(item[0]) for item in img_gt_path_list])
         file_names_gt = np.asarray([str(item[1]) for item in img_gt_path_list])
 
+        # single pass over the data and the gt files which are not yet indexed
+        statistics = compute_image_statistics_indexed(
+            root=input_path, file_names_data=file_names_data if missing_analytics_data else None,
+            file_names_gt=file_names_gt if missing_analytics_gt else None, gt_format='indexed',
+            get_class_counts_func=get_class_counts_indexed, workers=workers)
+
+        # the analytics of a selection are not saved
         if missing_analytics_data:
-            analytics_data = _get_and_save_data_analytics(analytics_path_data, file_names_data, inmem=inmem, workers=workers)
+            analytics_data = _get_and_save_data_analytics(None if selection else analytics_path_data, statistics)
 
         if missing_analytics_gt:
-            analytics_gt = _get_and_save_gt_analytics(analytics_path_gt, file_names_gt)
+            analytics_gt = _get_and_save_gt_analytics(None if selection else analytics_path_gt, statistics)
 
     return analytics_data, analytics_gt
 
 
-def _get_and_save_gt_analytics(analytics_path_gt: Path, file_names_gt: np.ndarray) -> Dict[str, Any]:
+def read_analytics_gt(input_path: Path, gt_folder_name: str, train_folder_name: str) -> Dict[str, Any]:
+    """
+    Reads the analytics of the ground truth (class weights and encodings) from the analytics file of the dataset
+    without opening any image (e.g. for the tools which merge or evaluate predictions).
+
+    :param input_path: Path to the dataset folder
+    :type input_path: Path
+    :param gt_folder_name: Name of the folder that contains the ground truth
+    :type gt_folder_name: str
+    :param train_folder_name: Name of the folder that contains the training data
+    :type train_folder_name: str
+    :return: class weights and encodings
+    :rtype: Dict[str, Any]
+    :raises FileNotFoundError: if the analytics file is missing or incomplete
+    """
+    return read_analytics(input_path / f'analytics.gt.{gt_folder_name}.{train_folder_name}.json',
+                          expected_keys=['class_weights', 'class_encodings'])
+
+
+def _get_and_save_gt_analytics(analytics_path_gt: Optional[Path], statistics: ImageStatistics) -> Dict[str, Any]:
     """
-    Get the analytics for the ground truth. If the analytics file is not present, it will be computed and saved.
+    Get the analytics for the ground truth from the statistics of the training set and save them.
 
-    :param analytics_path_gt: Path to the analytics file
-    :type analytics_path_gt: Path
-    :param file_names_gt: names of the files in the training set
-    :type file_names_gt: np.ndarray
+    :param analytics_path_gt: Path to the analytics file (None to not save them)
+    :type analytics_path_gt: Optional[Path]
+    :param statistics: statistics of the gt files in the training set
+    :type statistics: ImageStatistics
     :return: The analytics for the ground truth
     :rtype: Dict[str, Any]
     """
     # Measure weights for class balancing
-    logging.info('Measuring class weights')
-    # create a list with all gt file paths
-    class_weights, class_encodings = _get_class_frequencies_weights_segmentation_indexed(gt_images=file_names_gt)
+    class_weights, class_encodings = get_class_weights_encodings_indexed(class_counts=statistics.class_counts)
     analytics_gt = {'class_weights': class_weights,
                     'class_encodings': class_encodings}
     # save json
-    save_json(analytics_gt, analytics_path_gt)
+    if analytics_path_gt is not None:
+        save_json(analytics_gt, analytics_path_gt)
 
     return analytics_gt
 
 
-def _get_and_save_data_analytics(analytics_path_data: Path, file_names_data: np.ndarray, inmem: bool, workers: int) -> Dict[str, Any]:
+def _get_and_save_data_analytics(analytics_path_data: Optional[Path], statistics: ImageStatistics) -> Dict[str, Any]:
     """
-    Get the analytics for the data. If the analytics file is not present, it will be computed and saved.
+    Get the analytics for the data from the statistics of the training set and save them.
 
-    :param analytics_path_data: Path to the analytics file
-    :param file_names_data: names of the files in the training set
+    :param analytics_path_data: Path to the analytics file (None to not save them)
+    :type analytics_path_data: Optional[Path]
+    :param statistics: statistics of the data files in the training set
+    :type statistics: ImageStatistics
     :return: The analytics for the data
     :rtype: Dict[str, Any]
     """
-    mean, std = compute_mean_std(file_names=file_names_data, inmem=inmem, workers=workers)
-    img = Image.open(file_names_data[0]).convert('RGB')
-    analytics_data = {'mean': mean.tolist(),
-                      'std': std.tolist(),
-                      'width': img.width,
-                      'height': img.height}
+    width, height = statistics.sizes[0]
+    analytics_data = {'mean': statistics.mean.tolist(),
+                      'std': statistics.std.tolist(),
+                      'width': width,
+                      'height': height}
+    if analytics_path_data is None:
+        return analytics_data
     # save json
     try:
         with analytics_path_data.open(mode='w') as f:
@@ -127,36 +163,33 @@ def _get_and_save_data_analytics(analytics_path_data: Path, file_names_data: np.
     return analytics_data
 
 
-def _get_class_frequencies_weights_segmentation_indexed(gt_images: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+def get_class_counts_indexed(gt_path: Union[str, Path]) -> Dict[Tuple[int, Tuple[int, int, int]], int]:
     """
-    Get the weights proportional to the inverse of their class frequencies.
-    The vector sums up to 1
+    Counts the pixels of every palette index of a ground truth image.
 
-    :param gt_images: Path to all ground truth images, which contain the pixel-wise label
-    :type gt_images: np.ndarray
-    :return: The weights vector as a 1D array normalized (sum up to 1)
-    :rtype: np.ndarray
+    :param gt_path: Path to the ground truth image, which contains the pixel-wise label
+    :type gt_path: Union[str, Path]
+    :return: number of pixels per palette index and its color
+    :rtype: Dict[Tuple[int, Tuple[int, int, int]], int]
     """
-    logging.info('Begin computing class frequencies weights')
-
-    label_counter = {}
-    color_table = []
-    unique_colors = 0
+    img_raw = pil_loader_gif(gt_path)
+    palette = img_raw.getpalette()
+    return {(index, tuple(palette[3 * index:3 * index + 3])): count for count, index in img_raw.getcolors()}
 
-    for path in gt_images:
-        img_raw = pil_loader_gif(path)
-        colors = img_raw.getcolors()
 
-        if len(colors) > unique_colors:
-            color_table = img_raw.getpalette()
-            unique_colors = len(colors)
-
-        for count, index in colors:
-            label_counter[index] = label_counter.get(index, 0) + count
+def get_class_weights_encodings_indexed(class_counts: Dict[Tuple[int, Tuple[int, int, int]], int]) \
+        -> Tuple[List[float], List[List[int]]]:
+    """
+    Get the weights proportional to the inverse of their class frequencies.
 
-    classes = np.asarray(color_table).reshape(256, 3)[:unique_colors]
-    num_samples_per_class = np.asarray(list(label_counter.values()))
-    logging.info('Finished computing class frequencies weights')
-    # Normalize vector to sum up to 1.0 (in case the Loss function does not do it)
+    :param class_counts: number of pixels per palette index and its color of all the ground truth images
+    :type class_counts: Dict[Tuple[int, Tuple[int, int, int]], int]
+    :return: The weights and the colors of the classes (in the order of the palette indices)
+    :rtype: Tuple[List[float], List[List[int]]]
+    """
+    classes = sorted(class_counts.keys())
+    num_samples_per_class = np.asarray([class_counts[k] for k in classes])
+    class_frequencies = num_samples_per_class / num_samples_per_class.sum()
+    logging.info(f'Class frequencies (rounded): {np.around(class_frequencies * 100, decimals=2)}')
     class_weights = (1 / num_samples_per_class)  # / ((1 / num_samples_per_class).sum())
-    return class_weights.tolist(), classes.tolist()
+    return class_weights.tolist(), [list(color) for _, color in classes]
@@ -2,14 +2,14 @@ from pathlib import Path
 from typing import Tuple, List
 
 import numpy as np
-from PIL import Image
 
-from src.datamodules.RGB.utils.output_tools import output_to_class_encodings
+from src.datamodules.utils.output_tools import output_to_class_indices, get_palette, save_paletted_image
 
 
 def save_output_page_image(image_name, output_image, output_folder: Path, class_encoding: List[Tuple[int]]):
     """
-    Helper function to save the output during testing in the DIVAHisDB format
+    Helper function to save the output during testing in the indexed format (class indices with the class encodings
+    as palette)
 
     :param image_name: name of the image that is saved
     :type image_name: str
@@ -21,17 +21,11 @@ def save_output_page_image(image_name, output_image, output_folder: Path, class_
     :type class_encoding: List[Tuple[int]]
     """
 
-    output_encoded = output_to_class_encodings(output_image, class_encoding)
+    class_indices = output_to_class_indices(output_image)
 
     dest_folder = output_folder
     dest_folder.mkdir(parents=True, exist_ok=True)
     dest_filename = dest_folder / image_name
 
-    # create output image and put palette
-    img = Image.fromarray(output_encoded.astype(np.uint8))
-    palette = np.zeros(768)
-    class_encoding_np = np.asarray(class_encoding)
-    palette[0:len(class_encoding_np.flatten())] = class_encoding_np.flatten()
-    img.putpalette(palette.tolist())
     # Save the output
-    img.save(dest_filename)
+    save_paletted_image(class_indices=class_indices, palette=get_palette(class_encoding), file_path=dest_filename)
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Union, List, Optional
+from typing import Union, List, Optional, Dict
 
 import torch
 from torch.utils.data import DataLoader
@@ -8,9 +8,13 @@ from torchvision import transforms
 from src.datamodules.RGB.datasets.full_page_dataset import DatasetRGB
 from src.datamodules.RGB.utils.image_analytics import get_analytics
 from src.datamodules.RGB.utils.single_transform import IntegerEncoding
-from src.datamodules.base_datamodule import AbstractDatamodule
+from src.datamodules.base_datamodule import AbstractDatamodule, AnalyticsAttribute
+from src.datamodules.utils.bucketing import AspectRatioBucketSampler, get_page_sizes, pad_collate
 from src.datamodules.utils.dataset_predict import DatasetPredict
 from src.datamodules.utils.misc import validate_path_for_segmentation, ImageDimensions
+from src.datamodules.utils.multi_crop import MultiCropDataset, multi_crop_collate
+from src.datamodules.utils.page_cache import PageCacheSpecs
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
 from src.datamodules.utils.wrapper_transforms import OnlyImage, OnlyTarget
 from src.utils import utils
 
@@ -82,7 +86,36 @@ class DataModuleRGB(AbstractDatamodule):
     :type shuffle: bool
     :param drop_last: drop the last batch if it is smaller than the batch size
     :type drop_last: bool
+    :param page_cache: settings of the cache for the decoded pages (keys of class: `PageCacheSpecs`),
+        no pages are cached if None
+    :type page_cache: Optional[Dict]
+    :param train_crop_size: if set, the training samples are random crops of this size instead of full pages
+    :type train_crop_size: Optional[int]
+    :param crops_per_page: number of random training crops which are cut out of each decoded page. The crops are
+        flattened into the batch, so `batch_size` (which has to be divisible by `crops_per_page`) stays the number
+        of crops in a batch. Needs `train_crop_size`.
+    :type crops_per_page: int
+    :param use_manifest: if True, the listing of every split is stored in a manifest file in the split folder and
+        reused as long as the folders are unchanged
+    :type use_manifest: bool
+    :param decode_backend: backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+        `numpy`), None loads PIL images with `pil_loader`
+    :type decode_backend: Optional[str]
+    :param uint8_batches: if True, the samples contain uint8 image tensors which are normalized by the task after
+        the transfer to the device, instead of normalized float tensors (a quarter of the bytes per batch)
+    :type uint8_batches: bool
+    :param bucketing: if set, the pages can have different sizes. The training and validation batches are drawn
+        from buckets of pages with a similar aspect ratio (arguments of class: `AspectRatioBucketSampler`, e.g.
+        `num_buckets` and `pool_batches`) and the pages of every batch are padded to the largest one, the batches
+        contain the mask of the valid pixels after the gt (see `src/datamodules/utils/bucketing.py`). `image_dims`
+        and `dims` are the size of the first training page. Can not be used with `train_crop_size` and `page_cache`.
+    :type bucketing: Optional[Dict]
     """
+    image_dims = AnalyticsAttribute()
+    dims = AnalyticsAttribute()
+    class_encodings_tensor = AnalyticsAttribute()
+    image_transform = AnalyticsAttribute()
+    target_transform = AnalyticsAttribute()
 
     def __init__(self, data_dir: str, data_folder_name: str, gt_folder_name: str,
                  train_folder_name: str = 'train', val_folder_name: str = 'val', test_folder_name: str = 'test',
@@ -91,12 +124,22 @@ class DataModuleRGB(AbstractDatamodule):
                  selection_val: Optional[Union[int, List[str]]] = None,
                  selection_test: Optional[Union[int, List[str]]] = None,
                  num_workers: int = 4, batch_size: int = 8,
-                 shuffle: bool = True, drop_last: bool = True):
+                 shuffle: bool = True, drop_last: bool = True, page_cache: Optional[Dict] = None,
+                 train_crop_size: Optional[int] = None, crops_per_page: int = 1, use_manifest: bool = False,
+                 decode_backend: Optional[str] = None,
+                 uint8_batches: bool = False, bucketing: Optional[Dict] = None):
         """
         Constructor of the class: `DataModuleRGB`.
         """
         super().__init__()
 
+        if crops_per_page > 1 and train_crop_size is None:
+            raise ValueError('crops_per_page needs a train_crop_size')
+        if batch_size % crops_per_page != 0:
+            raise ValueError(f'The batch size ({batch_size}) has to be divisible by crops_per_page ({crops_per_page})')
+        if bucketing is not None and (train_crop_size is not None or page_cache is not None):
+            raise ValueError('The bucketing can not be used with train_crop_size or the page cache')
+
         self.train_folder_name = train_folder_name
         self.val_folder_name = val_folder_name
         self.test_folder_name = test_folder_name
@@ -106,7 +149,30 @@ class DataModuleRGB(AbstractDatamodule):
         if pred_file_path_list is not None:
             self.pred_file_path_list = pred_file_path_list
 
-        analytics_data, analytics_gt = get_analytics(input_path=Path(data_dir),
+        self.uint8_batches = uint8_batches
+        self.twin_transform = None
+        self.train_twin_transform = TwinRandomCrop(crop_size=train_crop_size) if train_crop_size is not None else None
+
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        self.data_dir = data_dir
+
+        self.selection_train = selection_train
+        self.selection_val = selection_val
+        self.selection_test = selection_test
+
+        self.page_cache = PageCacheSpecs(**page_cache) if page_cache is not None else None
+        self.crops_per_page = crops_per_page
+        self.use_manifest = use_manifest
+        self.decode_backend = decode_backend
+        self.bucketing = bucketing
+
+    def _load_analytics(self):
+        analytics_data, analytics_gt = get_analytics(input_path=Path(self.data_dir),
                                                      data_folder_name=self.data_folder_name,
                                                      gt_folder_name=self.gt_folder_name,
                                                      train_folder_name=self.train_folder_name,
@@ -122,36 +188,22 @@ class DataModuleRGB(AbstractDatamodule):
         self.num_classes = len(self.class_encodings)
         self.class_weights = torch.as_tensor(analytics_gt['class_weights'])
 
-        self.twin_transform = None
-        self.image_transform = OnlyImage(transforms.Compose([transforms.ToTensor(),
-                                                             transforms.Normalize(mean=self.mean, std=self.std)]))
+        self.image_transform = OnlyImage(transforms.Compose([*self.get_image_to_tensor_transforms()]))
         self.target_transform = OnlyTarget(IntegerEncoding(class_encodings=self.class_encodings_tensor))
 
-        self.num_workers = num_workers
-        self.batch_size = batch_size
-
-        self.shuffle = shuffle
-        self.drop_last = drop_last
-
-        self.data_dir = data_dir
-
-        self.selection_train = selection_train
-        self.selection_val = selection_val
-        self.selection_test = selection_test
-
-        # Check default attributes using base_datamodule function
-        self._check_attributes()
-
     def setup(self, stage: Optional[str] = None):
         super().setup()
 
-        common_kwargs = {'image_dims': self.image_dims,
+        common_kwargs = {'image_dims': self.image_dims if self.bucketing is None else None,
                          'image_transform': self.image_transform,
                          'target_transform': self.target_transform,
-                         'twin_transform': self.twin_transform}
+                         'twin_transform': self.twin_transform,
+                         'decode_backend': self.decode_backend}
 
         dataset_kwargs = {'data_folder_name': self.data_folder_name,
-                          'gt_folder_name': self.gt_folder_name}
+                          'gt_folder_name': self.gt_folder_name,
+                          'page_cache': self.page_cache,
+                          'use_manifest': self.use_manifest}
 
         if stage == 'fit' or stage is None:
             self.data_dir = validate_path_for_segmentation(data_dir=self.data_dir,
@@ -162,9 +214,12 @@ class DataModuleRGB(AbstractDatamodule):
                                     selection=self.selection_train,
                                     is_test=False,
                                     **dataset_kwargs,
-                                    **common_kwargs)
+                                    **{**common_kwargs, 'twin_transform': self.train_twin_transform})
+            if self.crops_per_page > 1:
+                self.train = MultiCropDataset(dataset=self.train, crops_per_page=self.crops_per_page)
             log.info(f'Initialized train dataset with {len(self.train)} samples.')
-            self.check_min_num_samples(self.trainer.num_devices, self.batch_size, num_samples=len(self.train),
+            self.check_min_num_samples(self.trainer.num_devices, self.batch_size // self.crops_per_page,
+                                       num_samples=len(self.train),
                                        data_split=self.train_folder_name,
                                        drop_last=self.drop_last)
 
@@ -200,14 +255,19 @@ class DataModuleRGB(AbstractDatamodule):
             log.info(f'Initialized predict dataset with {len(self.predict)} samples.')
 
     def train_dataloader(self, *args, **kwargs) -> DataLoader:
+        if self.bucketing is not None:
+            return self._get_bucket_dataloader(dataset=self.train)
         return DataLoader(self.train,
-                          batch_size=self.batch_size,
+                          batch_size=self.batch_size // self.crops_per_page,
                           num_workers=self.num_workers,
                           shuffle=self.shuffle,
                           drop_last=self.drop_last,
-                          pin_memory=True)
+                          pin_memory=True,
+                          collate_fn=multi_crop_collate if self.crops_per_page > 1 else None)
 
     def val_dataloader(self, *args, **kwargs) -> Union[DataLoader, List[DataLoader]]:
+        if self.bucketing is not None:
+            return self._get_bucket_dataloader(dataset=self.val)
         return DataLoader(self.val,
                           batch_size=self.batch_size,
                           num_workers=self.num_workers,
@@ -221,7 +281,8 @@ class DataModuleRGB(AbstractDatamodule):
                           num_workers=self.num_workers,
                           shuffle=False,
                           drop_last=False,
-                          pin_memory=True)
+                          pin_memory=True,
+                          collate_fn=pad_collate if self.bucketing is not None else None)
 
     def predict_dataloader(self) -> Union[DataLoader, List[DataLoader]]:
         return DataLoader(self.predict,
@@ -229,7 +290,33 @@ class DataModuleRGB(AbstractDatamodule):
                           num_workers=self.num_workers,
                           shuffle=False,
                           drop_last=False,
-                          pin_memory=True)
+                          pin_memory=True,
+                          collate_fn=pad_collate if self.bucketing is not None else None)
+
+    def _get_bucket_dataloader(self, dataset: DatasetRGB) -> DataLoader:
+        """
+        Returns a dataloader whose batches are drawn from the aspect ratio buckets of the pages of the dataset.
+
+        :param dataset: the training or validation dataset
+        :type dataset: DatasetRGB
+        :return: the dataloader
+        :rtype: DataLoader
+        """
+        page_sizes = get_page_sizes(root=Path(self.data_dir),
+                                    file_names_data=[img_gt_path[0] for img_gt_path in dataset.img_gt_path_list])
+        sampler = AspectRatioBucketSampler(page_sizes=page_sizes, batch_size=self.batch_size,
+                                           num_replicas=self.trainer.world_size, rank=self.trainer.global_rank,
+                                           shuffle=self.shuffle, drop_last=self.drop_last, **self.bucketing)
+        log.info(f'The pages of the {"train" if dataset is self.train else "val"} dataset are sorted into '
+                 f'{len(sampler.buckets)} aspect ratio buckets, {sampler.get_padding_fraction():.1%} of the pixels '
+                 f'of the batches are padding.')
+        return DataLoader(dataset,
+                          batch_size=self.batch_size,
+                          sampler=sampler,
+                          num_workers=self.num_workers,
+                          drop_last=False,
+                          pin_memory=True,
+                          collate_fn=pad_collate)
 
     def get_output_filename_test(self, index: int) -> str:
         """
@@ -1,21 +1,34 @@
 from pathlib import Path
-from typing import Union, List, Optional
+from typing import Union, List, Optional, Dict
 
+import numpy as np
 import torch
 from torch.utils.data import DataLoader
 from torchvision import transforms
 
 from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
-from src.datamodules.RGB.utils.image_analytics import get_analytics
+from src.datamodules.RGB.datasets.packed_cropped_dataset import PackedCroppedDatasetRGB
+from src.datamodules.RGB.datasets.tiled_cropped_dataset import TiledCroppedDatasetRGB
+from src.datamodules.RGB.utils.image_analytics import get_analytics, get_class_counts_rgb
 from src.datamodules.RGB.utils.single_transform import IntegerEncoding
-from src.datamodules.base_datamodule import AbstractDatamodule
+from src.datamodules.base_datamodule import AbstractDatamodule, AnalyticsAttribute
+from src.datamodules.utils.class_histograms import get_class_histograms_indexed, get_class_histograms_encoded
+from src.datamodules.utils.crop_size_schedule import CropSizeSchedule
+from src.datamodules.utils.lru_cache import LRUCache
 from src.datamodules.utils.misc import validate_path_for_segmentation
+from src.datamodules.utils.packed_shards import validate_path_for_packed_segmentation, missing_packed_analytics
+from src.datamodules.utils.samplers import PageLocalitySampler, ClassAwareSampler
+from src.datamodules.utils.tiled_store import STORE_INDEX_FILE_NAME
 from src.datamodules.utils.twin_transforms import TwinRandomCrop
 from src.datamodules.utils.wrapper_transforms import OnlyImage, OnlyTarget
 from src.utils import utils
 
 log = utils.get_logger(__name__)
 
+DATASET_CLASSES = {'files': CroppedDatasetRGB,
+                   'packed': PackedCroppedDatasetRGB,
+                   'tiled': TiledCroppedDatasetRGB}
+
 
 class DataModuleCroppedRGB(AbstractDatamodule):
     """
@@ -24,6 +37,9 @@ class DataModuleCroppedRGB(AbstractDatamodule):
     class: `tools/generate_cropped_dataset.py`. If you do not use the script, make sure that the images are cropped
     and named in the same way as the script does.
     If you want to work with un-cropped images use class: `DataModuleRGB`.
+    With `dataset_format: packed` the splits are read from the shard files of `tools/generate_packed_dataset.py`
+    instead (class: `PackedCroppedDatasetRGB`). With `dataset_format: tiled` the crops are cut on demand out of a
+    tiled page store of the same tool (class: `TiledCroppedDatasetRGB`).
 
     The structure of the folder should be as follows::
 
@@ -93,42 +109,98 @@ class DataModuleCroppedRGB(AbstractDatamodule):
     :type shuffle: bool
     :param drop_last: drop the last batch if it is smaller than the batch size
     :type drop_last: bool
+    :param dataset_format: format of the splits, either `files` (one image per crop), `packed` (shard files) or
+        `tiled` (tiled page store with virtual crops)
+    :type dataset_format: str
+    :param virtual_crops: crop settings of the `tiled` format (crop_size_train, crop_size_val, crop_size_test and
+        overlap), missing settings are taken from the tiled store
+    :type virtual_crops: Optional[Dict]
+    :param page_window_size: if set, the training crops are shuffled with a class: `PageLocalitySampler` which
+        shuffles the pages and then the crops within windows of this many pages
+    :type page_window_size: Optional[int]
+    :param class_sampling_temperature: if set, the training crops are drawn with a class: `ClassAwareSampler` with
+        this temperature, which oversamples the crops with rare classes (1 balances the classes, higher values get
+        closer to uniform sampling)
+    :type class_sampling_temperature: Optional[float]
+    :param hard_example_mining: if set, the training crops are drawn with a class: `HardExampleSampler` with these
+        arguments (`uniform_fraction` and `momentum`), which oversamples the crops with a high recent loss
+    :type hard_example_mining: Optional[Dict]
+    :param blank_crops: if set, the near-uniform training crops are skipped with a class: `BlankCropSampler` with
+        these arguments (`threshold`, the minimal share of the most frequent class of a blank crop, and
+        `keep_fraction`, the share of the blank crops in every epoch), the validation and test crops are unchanged
+    :type blank_crops: Optional[Dict]
+    :param crop_size_schedule: if set, the training starts with the stages of this crop size curriculum (see
+        class: `CropSizeSchedule`), every stage trains `epochs` epochs on random crops of `crop_size` with
+        `batch_size` (default: the same pixels per batch) before the training continues with the full crop size. The
+        dataloaders are reloaded every epoch and the validation and test crops keep the full size.
+    :type crop_size_schedule: Optional[List[Dict]]
+    :param tile_cache_bytes: memory budget (per worker) of the LRU cache for the decompressed tiles of the `tiled`
+        format, no tiles are cached if None
+    :type tile_cache_bytes: Optional[int]
+    :param use_manifest: if True, the listing of every split of the `files` format is stored in a manifest file in
+        the split folder and reused as long as the folders are unchanged
+    :type use_manifest: bool
+    :param decode_backend: backend which decodes the image files of the `files` format into uint8 arrays (`pil`,
+        `torchvision` or `numpy`), None loads PIL images with `pil_loader`
+    :type decode_backend: Optional[str]
+    :param uint8_batches: if True, the samples contain uint8 image tensors which are normalized by the task after
+        the transfer to the device, instead of normalized float tensors (a quarter of the bytes per batch)
+    :type uint8_batches: bool
     """
+    class_encodings_tensor = AnalyticsAttribute()
+    image_transform = AnalyticsAttribute()
+    target_transform = AnalyticsAttribute()
+
     def __init__(self, data_dir: str, data_folder_name: str, gt_folder_name: str,
                  train_folder_name: str = 'train', val_folder_name: str = 'val', test_folder_name: str = 'test',
                  selection_train: Optional[Union[int, List[str]]] = None,
                  selection_val: Optional[Union[int, List[str]]] = None,
                  selection_test: Optional[Union[int, List[str]]] = None,
                  crop_size: int = 256, num_workers: int = 4, batch_size: int = 8,
-                 shuffle: bool = True, drop_last: bool = True):
+                 shuffle: bool = True, drop_last: bool = True, dataset_format: str = 'files',
+                 virtual_crops: Optional[Dict] = None, page_window_size: Optional[int] = None,
+                 tile_cache_bytes: Optional[int] = None, use_manifest: bool = False,
+                 decode_backend: Optional[str] = None,
+                 uint8_batches: bool = False, class_sampling_temperature: Optional[float] = None,
+                 hard_example_mining: Optional[Dict] = None, blank_crops: Optional[Dict] = None,
+                 crop_size_schedule: Optional[List[Dict]] = None):
         """
         Constructor method for the class: `DataModuleCroppedRGB`.
         """
         super().__init__()
 
+        if dataset_format not in DATASET_CLASSES:
+            raise ValueError(f'Unknown dataset format "{dataset_format}" '
+                             f'(supported: {", ".join(DATASET_CLASSES.keys())})')
+        self.dataset_format = dataset_format
+        self.dataset_class = DATASET_CLASSES[dataset_format]
+        self.virtual_crops = dict(virtual_crops) if virtual_crops is not None else {}
+        self.page_window_size = page_window_size
+        if sum(option is not None for option in [page_window_size, class_sampling_temperature,
+                                                 hard_example_mining, blank_crops]) > 1:
+            raise ValueError('Just one of the page locality, the class aware sampling, the hard example mining and '
+                             'the blank crop skipping can be used')
+        self.class_sampling_temperature = class_sampling_temperature
+        self.hard_example_mining = dict(hard_example_mining) if hard_example_mining is not None else None
+        self.blank_crops = dict(blank_crops) if blank_crops is not None else None
+        if tile_cache_bytes is not None and dataset_format != 'tiled':
+            raise ValueError('The tile cache can just be used with the dataset format "tiled"')
+        self.tile_cache_bytes = tile_cache_bytes
+        if use_manifest and dataset_format != 'files':
+            raise ValueError('The dataset manifest can just be used with the dataset format "files"')
+        self.use_manifest = use_manifest
+        if decode_backend is not None and dataset_format != 'files':
+            raise ValueError('The decode backend can just be changed for the dataset format "files"')
+        self.decode_backend = decode_backend
+
         self.train_folder_name = train_folder_name
         self.val_folder_name = val_folder_name
         self.test_folder_name = test_folder_name
         self.data_folder_name = data_folder_name
         self.gt_folder_name = gt_folder_name
 
-        analytics_data, analytics_gt = get_analytics(input_path=Path(data_dir),
-                                                     data_folder_name=self.data_folder_name,
-                                                     gt_folder_name=self.gt_folder_name,
-                                                     train_folder_name=self.train_folder_name,
-                                                     get_img_gt_path_list_func=CroppedDatasetRGB.get_gt_data_paths)
-
-        self.mean = analytics_data['mean']
-        self.std = analytics_data['std']
-        self.class_encodings = analytics_gt['class_encodings']
-        self.class_encodings_tensor = torch.tensor(self.class_encodings) / 255
-        self.num_classes = len(self.class_encodings)
-        self.class_weights = torch.as_tensor(analytics_gt['class_weights'])
-
+        self.uint8_batches = uint8_batches
         self.twin_transform = TwinRandomCrop(crop_size=crop_size)
-        self.image_transform = OnlyImage(transforms.Compose([transforms.ToTensor(),
-                                                             transforms.Normalize(mean=self.mean, std=self.std)]))
-        self.target_transform = OnlyTarget(IntegerEncoding(class_encodings=self.class_encodings_tensor))
 
         self.num_workers = num_workers
         self.batch_size = batch_size
@@ -143,51 +215,93 @@ class DataModuleCroppedRGB(AbstractDatamodule):
         self.selection_test = selection_test
 
         self.dims = (3, crop_size, crop_size)
+        if crop_size_schedule is not None:
+            self.crop_size_schedule = CropSizeSchedule(stages=crop_size_schedule, crop_size=crop_size,
+                                                       batch_size=batch_size)
+
+    def _load_analytics(self):
+        analytics_data, analytics_gt = get_analytics(input_path=Path(self.data_dir),
+                                                     data_folder_name=self.data_folder_name,
+                                                     gt_folder_name=self.gt_folder_name,
+                                                     train_folder_name=self.train_folder_name,
+                                                     get_img_gt_path_list_func=self._get_img_gt_path_list_func())
+
+        self.mean = analytics_data['mean']
+        self.std = analytics_data['std']
+        self.class_encodings = analytics_gt['class_encodings']
+        self.class_encodings_tensor = torch.tensor(self.class_encodings) / 255
+        self.num_classes = len(self.class_encodings)
+        self.class_weights = torch.as_tensor(analytics_gt['class_weights'])
 
-        # Check default attributes using base_datamodule function
-        self._check_attributes()
+        self.image_transform = OnlyImage(transforms.Compose([*self.get_image_to_tensor_transforms()]))
+        self.target_transform = OnlyTarget(IntegerEncoding(class_encodings=self.class_encodings_tensor))
 
     def setup(self, stage: Optional[str] = None):
         super().setup()
         if stage == 'fit' or stage is None:
-            self.data_dir = validate_path_for_segmentation(data_dir=self.data_dir,
-                                                           data_folder_name=self.data_folder_name,
-                                                           gt_folder_name=self.gt_folder_name,
-                                                           split_name=self.train_folder_name)
-            self.train = CroppedDatasetRGB(**self._create_dataset_parameters(self.train_folder_name),
-                                           selection=self.selection_train)
+            if self.crop_size_schedule is not None and not self.trainer.reload_dataloaders_every_n_epochs:
+                log.info('Reloading the dataloaders every epoch for the crop size schedule.')
+                self.trainer.reload_dataloaders_every_n_epochs = 1
+            self.data_dir = self._validate_path(split_name=self.train_folder_name)
+            # the hard example mining needs the index of every training crop to report its loss
+            self.train = self.dataset_class(**self._create_dataset_parameters(self.train_folder_name),
+                                            selection=self.selection_train,
+                                            return_index=self.hard_example_mining is not None)
             log.info(f'Initialized train dataset with {len(self.train)} samples.')
             self.check_min_num_samples(self.trainer.num_devices, self.batch_size, num_samples=len(self.train),
                                        data_split=self.train_folder_name,
                                        drop_last=self.drop_last)
 
-            self.data_dir = validate_path_for_segmentation(data_dir=self.data_dir,
-                                                           data_folder_name=self.data_folder_name,
-                                                           gt_folder_name=self.gt_folder_name,
-                                                           split_name=self.val_folder_name)
-            self.val = CroppedDatasetRGB(**self._create_dataset_parameters(self.val_folder_name),
-                                         selection=self.selection_val)
+            self.data_dir = self._validate_path(split_name=self.val_folder_name)
+            self.val = self.dataset_class(**self._create_dataset_parameters(self.val_folder_name),
+                                          selection=self.selection_val)
             log.info(f'Initialized val dataset with {len(self.val)} samples.')
             self.check_min_num_samples(self.trainer.num_devices, self.batch_size, num_samples=len(self.val),
                                        data_split=self.val_folder_name,
                                        drop_last=self.drop_last)
 
         if stage == 'test':
-            self.data_dir = validate_path_for_segmentation(data_dir=self.data_dir,
-                                                           data_folder_name=self.data_folder_name,
-                                                           gt_folder_name=self.gt_folder_name,
-                                                           split_name=self.test_folder_name)
-            self.test = CroppedDatasetRGB(**self._create_dataset_parameters(self.test_folder_name),
-                                          selection=self.selection_test)
+            self.data_dir = self._validate_path(split_name=self.test_folder_name)
+            self.test = self.dataset_class(**self._create_dataset_parameters(self.test_folder_name),
+                                           selection=self.selection_test)
             log.info(f'Initialized test dataset with {len(self.test)} samples.')
             # self._check_min_num_samples(num_samples=len(self.test), data_split='test',
             #                             drop_last=False)
 
     def train_dataloader(self, *args, **kwargs) -> DataLoader:
+        if self.crop_size_schedule is not None:
+            self._apply_crop_size_stage()
+
+        if self.class_sampling_temperature is not None:
+            sampler = ClassAwareSampler(class_histograms=self._get_class_histograms(),
+                                        temperature=self.class_sampling_temperature,
+                                        num_replicas=self.trainer.world_size,
+                                        rank=self.trainer.global_rank,
+                                        drop_last=self.drop_last)
+        elif self.hard_example_mining is not None:
+            sampler = self.get_hard_example_sampler(num_crops=len(self.train),
+                                                    hard_example_mining=self.hard_example_mining)
+        elif self.blank_crops is not None:
+            sampler = self.get_blank_crop_sampler(class_histograms=self._get_class_histograms(), **self.blank_crops)
+        elif self.page_window_size is not None:
+            sampler = PageLocalitySampler(page_ids=self.train.img_paths_per_page.page_ids,
+                                          window_size=self.page_window_size,
+                                          num_replicas=self.trainer.world_size,
+                                          rank=self.trainer.global_rank,
+                                          shuffle=self.shuffle,
+                                          drop_last=self.drop_last)
+        else:
+            return DataLoader(self.train,
+                              batch_size=self.get_train_batch_size(),
+                              num_workers=self.num_workers,
+                              shuffle=self.shuffle,
+                              drop_last=self.drop_last,
+                              pin_memory=True)
+
         return DataLoader(self.train,
-                          batch_size=self.batch_size,
+                          batch_size=self.get_train_batch_size(),
                           num_workers=self.num_workers,
-                          shuffle=self.shuffle,
+                          sampler=sampler,
                           drop_last=self.drop_last,
                           pin_memory=True)
 
@@ -200,22 +314,99 @@ class DataModuleCroppedRGB(AbstractDatamodule):
                           pin_memory=True)
 
     def test_dataloader(self, *args, **kwargs) -> Union[DataLoader, List[DataLoader]]:
+        # page by page with a contiguous share of the pages for every rank, so the task can stitch the pages online
+        sampler = PageLocalitySampler(page_ids=self.test.img_paths_per_page.page_ids,
+                                      window_size=1,
+                                      num_replicas=self.trainer.world_size,
+                                      rank=self.trainer.global_rank,
+                                      shuffle=False,
+                                      drop_last=False)
         return DataLoader(self.test,
                           batch_size=self.batch_size,
                           num_workers=self.num_workers,
-                          shuffle=False,
+                          sampler=sampler,
                           drop_last=False,
                           pin_memory=True)
 
     def _create_dataset_parameters(self, dataset_type: str = 'train'):
         is_test = dataset_type == 'test'
-        return {'path': self.data_dir / dataset_type,
-                'data_folder_name': self.data_folder_name,
-                'gt_folder_name': self.gt_folder_name,
-                'image_transform': self.image_transform,
-                'target_transform': self.target_transform,
-                'twin_transform': self.twin_transform,
-                'is_test': is_test}
+        parameters = {'path': self.data_dir / dataset_type,
+                      'image_transform': self.image_transform,
+                      'target_transform': self.target_transform,
+                      'twin_transform': self.twin_transform,
+                      'is_test': is_test}
+        if self.dataset_format == 'files':
+            parameters['data_folder_name'] = self.data_folder_name
+            parameters['gt_folder_name'] = self.gt_folder_name
+            parameters['use_manifest'] = self.use_manifest
+            parameters['decode_backend'] = self.decode_backend
+        if self.dataset_format == 'tiled':
+            split = {self.train_folder_name: 'train',
+                     self.val_folder_name: 'val',
+                     self.test_folder_name: 'test'}[dataset_type]
+            parameters['crop_size'] = self.virtual_crops.get(f'crop_size_{split}')
+            parameters['overlap'] = self.virtual_crops.get('overlap')
+            if self.tile_cache_bytes is not None:
+                parameters['tile_cache'] = LRUCache(max_bytes=self.tile_cache_bytes, num_workers=self.num_workers)
+        return parameters
+
+    def _apply_crop_size_stage(self):
+        """
+        Sets the crop size of the training crops to the one of the crop size schedule for the current epoch. The
+        training dataset gets its own crop transformation, so the validation crops keep the full size.
+        """
+        crop_size, batch_size = self.crop_size_schedule.get_stage(epoch=self.trainer.current_epoch)
+        if self.train.twin_transform.crop_size != crop_size:
+            log.info(f'Training on crops of size {crop_size} with a batch size of {batch_size} '
+                     f'from epoch {self.trainer.current_epoch} on.')
+            self.train.twin_transform = TwinRandomCrop(crop_size=crop_size)
+
+    def _get_class_histograms(self) -> np.ndarray:
+        """
+        Returns the pixels per class of every training crop (for the class aware sampling and the blank crops).
+        """
+        if self.dataset_format == 'files':
+            class_ids = {tuple(color): class_id for class_id, color in enumerate(self.class_encodings)}
+            return get_class_histograms_indexed(root=Path(self.data_dir),
+                                                file_names_gt=[gt_path for _, gt_path, _, _
+                                                               in self.train.img_paths_per_page],
+                                                gt_format='rgb', get_class_counts_func=get_class_counts_rgb,
+                                                num_classes=self.num_classes, get_class_id_func=class_ids.get)
+        reader = self.train.reader
+        if self.dataset_format == 'packed':
+            gts = (reader.get_gt(sample_id=sample_id) for sample_id in self.train.sample_ids)
+        else:
+            gts = (reader.read_window(page_id=page_id, kind='gt', x=x, y=y, width=self.train.crop_size,
+                                      height=self.train.crop_size) for page_id, x, y in self.train.crops.tolist())
+        return get_class_histograms_encoded(gts=gts, num_classes=self.num_classes)
+
+    def _get_img_gt_path_list_func(self) -> callable:
+        """
+        Returns the function which lists the training files for the analytics.
+        Packed and tiled datasets get their analytics files from the packing tool.
+        """
+        if self.dataset_format in ['packed', 'tiled']:
+            return missing_packed_analytics
+        return CroppedDatasetRGB.get_gt_data_paths
+
+    def _validate_path(self, split_name: str) -> Path:
+        """
+        Checks the structure of the split folder depending on the dataset format.
+
+        :param split_name: name of the split folder
+        :type split_name: str
+        :return: Path to the data_dir
+        :rtype: Path
+        """
+        if self.dataset_format == 'packed':
+            return validate_path_for_packed_segmentation(data_dir=self.data_dir, split_name=split_name)
+        if self.dataset_format == 'tiled':
+            return validate_path_for_packed_segmentation(data_dir=self.data_dir, split_name=split_name,
+                                                         index_file_name=STORE_INDEX_FILE_NAME)
+        return validate_path_for_segmentation(data_dir=self.data_dir,
+                                              data_folder_name=self.data_folder_name,
+                                              gt_folder_name=self.gt_folder_name,
+                                              split_name=split_name)
 
     def get_img_name_coordinates(self, index: int):
         """
@@ -11,10 +11,14 @@ import torch.utils.data as data
 from PIL import Image
 from omegaconf import ListConfig
 from torch import is_tensor, Tensor
-from torchvision.datasets.folder import pil_loader, has_file_allowed_extension
+from torchvision.datasets.folder import has_file_allowed_extension
 from torchvision.transforms import ToTensor
 
+from src.datamodules.utils.decoders import get_decoder, load_image
+from src.datamodules.utils.manifest import load_or_create_manifest
 from src.datamodules.utils.misc import selection_validation
+from src.datamodules.utils.sample_index import CropSampleIndex
+from src.datamodules.utils.single_transforms import ToUint8Tensor
 from src.utils import utils
 
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.gif')
@@ -63,13 +67,23 @@ class CroppedDatasetRGB(data.Dataset):
         :type target_transform: callable, optional
         :param twin_transform: twin transformation, defaults to None
         :type twin_transform: callable, optional
+        :param use_manifest: if True, the listing of the split is stored in a manifest file and reused as long as the
+            folders are unchanged (see :func:`load_or_create_manifest`), defaults to False
+        :type use_manifest: bool, optional
+        :param decode_backend: backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+            `numpy`, see :func:`get_decoder`), defaults to None (PIL images from `pil_loader`)
+        :type decode_backend: Optional[str], optional
+        :param return_index: if True, :meth:`__getitem__` also returns the index of the crop for the train and val
+            samples (e.g. for the hard example mining), defaults to False
+        :type return_index: bool, optional
 
     """
 
     def __init__(self, path: Path, data_folder_name: str, gt_folder_name: str,
                  selection: Optional[Union[int, List[str]]] = None,
                  is_test: bool = False, image_transform: callable = None, target_transform: callable = None,
-                 twin_transform: callable = None):
+                 twin_transform: callable = None, use_manifest: bool = False,
+                 decode_backend: Optional[str] = None, return_index: bool = False):
         """
         Constructor method for the class: `CroppedDatasetRGB`.
         """
@@ -78,6 +92,8 @@ class CroppedDatasetRGB(data.Dataset):
         self.data_folder_name = data_folder_name
         self.gt_folder_name = gt_folder_name
         self.selection = selection
+        self.use_manifest = use_manifest
+        self.decoder = get_decoder(decode_backend=decode_backend)
 
         # transformations
         self.image_transform = image_transform
@@ -85,10 +101,13 @@ class CroppedDatasetRGB(data.Dataset):
         self.twin_transform = twin_transform
 
         self.is_test = is_test
+        self.return_index = return_index
 
-        # List of tuples that contain the path to the gt and image that belong together
-        self.img_paths_per_page = self.get_gt_data_paths(path, data_folder_name=self.data_folder_name,
-                                                         gt_folder_name=self.gt_folder_name, selection=self.selection)
+        # Sequence of tuples that contain the path to the gt and image that belong together
+        self.img_paths_per_page = self._create_sample_index(
+            self.get_gt_data_paths(path, data_folder_name=self.data_folder_name,
+                                   gt_folder_name=self.gt_folder_name, selection=self.selection,
+                                   use_manifest=self.use_manifest))
 
         self.num_samples = len(self.img_paths_per_page)
         if self.num_samples == 0:
@@ -106,6 +125,8 @@ class CroppedDatasetRGB(data.Dataset):
     def __getitem__(self, index: int) -> Union[Tuple[Tensor, Tensor, int], Tuple[Tensor, Tensor]]:
         if self.is_test:
             return self._get_test_items(index=index)
+        elif self.return_index:
+            return (*self._get_train_val_items(index=index), index)
         else:
             return self._get_train_val_items(index=index)
 
@@ -137,6 +158,18 @@ class CroppedDatasetRGB(data.Dataset):
         img, gt = self._apply_transformation(data_img, gt_img)
         return img, gt, index
 
+    @staticmethod
+    def _create_sample_index(paths: List[Tuple[Any, Any, str, Any]]) -> CropSampleIndex:
+        """
+        Stores the list of paths in a compact index which the DataLoader workers can share without copying it.
+
+        :param paths: the list of :meth:`get_gt_data_paths`
+        :type paths: List[Tuple[Any, Any, str, Any]]
+        :return: the compact index
+        :rtype: CropSampleIndex
+        """
+        return CropSampleIndex(entries=paths)
+
     def _load_data_and_gt(self, index: int) -> Tuple[Image.Image, Image.Image]:
         """
         Loads the image and the ground truth image at the given index.
@@ -146,8 +179,9 @@ class CroppedDatasetRGB(data.Dataset):
         :return: The image and the corresponding ground truth image
         :rtype: Tuple[Image.Image, Image.Image]
         """
-        data_img = pil_loader(self.img_paths_per_page[index][0])
-        gt_img = pil_loader(self.img_paths_per_page[index][1])
+        data_path, gt_path, _, _ = self.img_paths_per_page[index]
+        data_img = load_image(data_path, decoder=self.decoder)
+        gt_img = load_image(gt_path, decoder=self.decoder)
 
         return data_img, gt_img
 
@@ -174,7 +208,8 @@ class CroppedDatasetRGB(data.Dataset):
         if not is_tensor(img):
             img = ToTensor()(img)
         if not is_tensor(gt):
-            gt = ToTensor()(gt)
+            # the ground truth encodings take the uint8 colors directly
+            gt = ToUint8Tensor()(gt) if self.target_transform is not None else ToTensor()(gt)
 
         if self.target_transform is not None:
             img, gt = self.target_transform(img, gt)
@@ -183,7 +218,7 @@ class CroppedDatasetRGB(data.Dataset):
 
     @staticmethod
     def get_gt_data_paths(directory: Path, data_folder_name: str, gt_folder_name: str,
-                          selection: Optional[Union[int, List[str]]] = None) \
+                          selection: Optional[Union[int, List[str]]] = None, use_manifest: bool = False) \
             -> List[Tuple[Any, Any, str, Any]]:
         """
         Returns a list of tuples that contain the path to the gt and image that belong together.
@@ -201,12 +236,21 @@ class CroppedDatasetRGB(data.Dataset):
         :type gt_folder_name: str
         :param selection: selection of the data, defaults to None
         :type selection: Optional[Union[int, List[str]]], optional
+        :param use_manifest: if True, the listing is read from the manifest of the split, defaults to False
+        :type use_manifest: bool, optional
         :return: List of tuples that contain the path to the gt and image that belong together
         :rtype: List[Tuple[Any, Any, str, Any]]
         """
         paths = []
         directory = directory.expanduser()
 
+        if use_manifest:
+            manifest = load_or_create_manifest(
+                directory=directory, data_folder_name=data_folder_name, gt_folder_name=gt_folder_name, cropped=True,
+                list_split=lambda: CroppedDatasetRGB.get_gt_data_paths(directory, data_folder_name=data_folder_name,
+                                                                       gt_folder_name=gt_folder_name))
+            return manifest.get_paths(selection=selection)
+
         path_data_root = directory / data_folder_name
         path_gt_root = directory / gt_folder_name
 
@@ -219,6 +263,8 @@ class CroppedDatasetRGB(data.Dataset):
         # check the selection parameter
         if selection:
             selection = selection_validation(subitems, selection, full_page=False)
+            if isinstance(selection, ListConfig) or isinstance(selection, list):
+                selection = set(selection)
 
         counter = 0  # Counter for subdirectories, needed for selection parameter
 
@@ -235,7 +281,7 @@ class CroppedDatasetRGB(data.Dataset):
                     if counter > selection:
                         break
 
-                elif isinstance(selection, ListConfig) or isinstance(selection, list):
+                elif isinstance(selection, set):
                     if path_data_subdir.name not in selection:
                         continue
 
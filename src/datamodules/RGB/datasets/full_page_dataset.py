@@ -7,14 +7,20 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Tuple, Union, Optional, Any
 
+import numpy as np
+import torch
 import torch.utils.data as data
 from omegaconf import ListConfig
 from PIL import Image
 from torch import is_tensor, Tensor
-from torchvision.datasets.folder import pil_loader, has_file_allowed_extension
+from torchvision.datasets.folder import has_file_allowed_extension
 from torchvision.transforms import ToTensor
 
+from src.datamodules.utils.decoders import get_decoder, get_image_size, load_image
+from src.datamodules.utils.manifest import load_or_create_manifest
 from src.datamodules.utils.misc import ImageDimensions, get_output_file_list, selection_validation
+from src.datamodules.utils.page_cache import PageCache, PageCacheSpecs
+from src.datamodules.utils.single_transforms import ToUint8Tensor
 from src.utils import utils
 
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.gif')
@@ -39,8 +45,9 @@ class DatasetRGB(data.Dataset):
         :type data_folder_name: str
         :param gt_folder_name: name of the folder where the ground truth is located
         :type gt_folder_name: str
-        :param image_dims: dimensions of the image
-        :type image_dims: ImageDimensions
+        :param image_dims: dimensions of the image, if None the pages can have any size (e.g. for the aspect ratio
+            bucketing of `src/datamodules/utils/bucketing.py`)
+        :type image_dims: Optional[ImageDimensions]
         :param selection: selection of the data, can be an int or a list of strings
         :type selection: Optional[Union[int, List[str]]]
         :param is_test: flag to indicate if the dataset is used for testing
@@ -51,14 +58,23 @@ class DatasetRGB(data.Dataset):
         :type target_transform: callable, optional
         :param twin_transform: twin transformation
         :type twin_transform: callable, optional
+        :param page_cache: specification of the cache for the decoded pages and their label maps. The cache needs
+            a target transformation which encodes the ground truth and can not be used with a twin transformation.
+        :type page_cache: Optional[PageCacheSpecs]
+        :param use_manifest: if True, the listing of the split is stored in a manifest file and reused as long as
+            the folders are unchanged (see :func:`load_or_create_manifest`)
+        :type use_manifest: bool
+        :param decode_backend: backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+            `numpy`, see :func:`get_decoder`), None loads PIL images with `pil_loader`
+        :type decode_backend: Optional[str]
     """
 
     def __init__(self, path: Path, data_folder_name: str, gt_folder_name: str,
-                 image_dims: ImageDimensions,
+                 image_dims: Optional[ImageDimensions],
                  selection: Optional[Union[int, List[str]]] = None,
                  is_test: bool = False, image_transform: callable = None, target_transform: callable = None,
-                 twin_transform: callable = None,
-                 **kwargs):
+                 twin_transform: callable = None, page_cache: Optional[PageCacheSpecs] = None,
+                 use_manifest: bool = False, decode_backend: Optional[str] = None, **kwargs):
         """
 
 
@@ -68,6 +84,8 @@ class DatasetRGB(data.Dataset):
         self.data_folder_name = data_folder_name
         self.gt_folder_name = gt_folder_name
         self.selection = selection
+        self.use_manifest = use_manifest
+        self.decoder = get_decoder(decode_backend=decode_backend)
 
         self.image_dims = image_dims
 
@@ -80,7 +98,8 @@ class DatasetRGB(data.Dataset):
 
         # List of tuples that contain the path to the gt and image that belong together
         self.img_gt_path_list = self.get_img_gt_path_list(path, data_folder_name=self.data_folder_name,
-                                                          gt_folder_name=self.gt_folder_name, selection=self.selection)
+                                                          gt_folder_name=self.gt_folder_name, selection=self.selection,
+                                                          use_manifest=self.use_manifest)
 
         if is_test:
             self.image_path_list = [img_gt_path[0] for img_gt_path in self.img_gt_path_list]
@@ -91,6 +110,16 @@ class DatasetRGB(data.Dataset):
             raise RuntimeError("Found 0 images in: {} \n Supported image extensions are: {}".format(
                 path, ",".join(IMG_EXTENSIONS)))
 
+        self.page_cache = None
+        if page_cache is not None:
+            if self.twin_transform is not None or self.target_transform is None:
+                raise ValueError('The page cache needs a target transform and can not be used with a twin transform')
+            if self.image_dims is None:
+                raise ValueError('The page cache needs the image dimensions')
+            self.page_cache = PageCache(specs=page_cache,
+                                        page_paths=[img_gt_path[:2] for img_gt_path in self.img_gt_path_list],
+                                        image_dims=self.image_dims)
+
     def __len__(self):
         """
         This function returns the length of an epoch so the data loader knows when to stop.
@@ -125,8 +154,7 @@ class DatasetRGB(data.Dataset):
         :rtype: Tuple[Tensor, Tensor]
         """
 
-        data_img, gt_img = self._load_data_and_gt(index=index)
-        img, gt = self._apply_transformation(data_img, gt_img)
+        img, gt = self._get_img_and_gt(index=index)
         assert img.shape[-2:] == gt.shape[-2:]
         return img, gt
 
@@ -139,12 +167,42 @@ class DatasetRGB(data.Dataset):
         :return: the item at the given index
         :rtype: Tuple[Tensor, Tensor, str]
         """
-        data_img, gt_img = self._load_data_and_gt(index=index)
-        img, gt = self._apply_transformation(data_img, gt_img)
+        img, gt = self._get_img_and_gt(index=index)
         assert img.shape[-2:] == gt.shape[-2:]
 
         return img, gt, index
 
+    def _get_img_and_gt(self, index: int) -> Tuple[Tensor, Tensor]:
+        """
+        Loads the page at the given index and applies the transformations. With a page cache the decoded page and
+        its label map are taken from the cache.
+
+        :param index: index of the image
+        :type index: int
+        :return: the transformed image and ground truth
+        :rtype: Tuple[Tensor, Tensor]
+        """
+        if self.page_cache is None:
+            data_img, gt_img = self._load_data_and_gt(index=index)
+            return self._apply_transformation(data_img, gt_img)
+
+        data_img, label_map = self.page_cache.load(index=index, decode_func=self._decode_page)
+        return self._apply_image_transformation(Image.fromarray(data_img),
+                                                torch.from_numpy(label_map.astype(np.int64)))
+
+    def _decode_page(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes the page at the given index into an uint8 image and its label map for the page cache.
+
+        :param index: index of the image
+        :type index: int
+        :return: the image (HxWx3) and the label map (HxW)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        _, gt = self.target_transform(None, ToUint8Tensor()(gt_img))
+        return np.asarray(data_img), gt.numpy()
+
     def _load_data_and_gt(self, index: int) -> Tuple[Image.Image, Image.Image]:
         """
         This function loads the data and the ground truth for a given index.
@@ -154,11 +212,12 @@ class DatasetRGB(data.Dataset):
         :return: the item at the given index
         :rtype: Tuple[Image.Image, Image.Image]
         """
-        data_img = pil_loader(self.img_gt_path_list[index][0])
-        gt_img = pil_loader(self.img_gt_path_list[index][1])
+        data_img = load_image(self.img_gt_path_list[index][0], decoder=self.decoder)
+        gt_img = load_image(self.img_gt_path_list[index][1], decoder=self.decoder)
 
-        assert data_img.height == self.image_dims.height and data_img.width == self.image_dims.width
-        assert gt_img.height == self.image_dims.height and gt_img.width == self.image_dims.width
+        if self.image_dims is not None:
+            assert get_image_size(data_img) == (self.image_dims.width, self.image_dims.height)
+            assert get_image_size(gt_img) == (self.image_dims.width, self.image_dims.height)
 
         return data_img, gt_img
 
@@ -185,16 +244,36 @@ class DatasetRGB(data.Dataset):
         if not is_tensor(img):
             img = ToTensor()(img)
         if not is_tensor(gt) and gt is not None:
-            gt = ToTensor()(gt)
+            # the ground truth encodings take the uint8 colors directly
+            gt = ToUint8Tensor()(gt) if self.target_transform is not None else ToTensor()(gt)
 
         if self.target_transform is not None:
             img, gt = self.target_transform(img, gt)
 
         return img, gt
 
+    def _apply_image_transformation(self, img: Image.Image, gt: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        Applies the image transformation to a page from the page cache. The ground truth is already encoded.
+
+        :param img: Original image
+        :type img: Image.Image
+        :param gt: Label map of the page
+        :type gt: Tensor
+        :return: Transformed image and ground truth
+        :rtype: Tuple[Tensor, Tensor]
+        """
+        if self.image_transform is not None:
+            img, gt = self.image_transform(img, gt)
+
+        if not is_tensor(img):
+            img = ToTensor()(img)
+
+        return img, gt
+
     @staticmethod
     def get_img_gt_path_list(directory: Path, data_folder_name: str, gt_folder_name: str,
-                             selection: Optional[Union[int, List[str]]] = None) \
+                             selection: Optional[Union[int, List[str]]] = None, use_manifest: bool = False) \
             -> List[Tuple[Any, Any, Any]]:
         """
         Returns a list of tuples that contain the path to the gt and image that belong together.
@@ -212,12 +291,21 @@ class DatasetRGB(data.Dataset):
         :type gt_folder_name: str
         :param selection: selection of the data, defaults to None
         :type selection: Optional[Union[int, List[str]]], optional
+        :param use_manifest: if True, the listing is read from the manifest of the split, defaults to False
+        :type use_manifest: bool, optional
         :return: List of tuples that contain the path to the gt and image that belong together
         :rtype: List[Tuple[Any, Any, str, Any]]
         """
         paths = []
         directory = directory.expanduser()
 
+        if use_manifest:
+            manifest = load_or_create_manifest(
+                directory=directory, data_folder_name=data_folder_name, gt_folder_name=gt_folder_name, cropped=False,
+                list_split=lambda: DatasetRGB.get_img_gt_path_list(directory, data_folder_name=data_folder_name,
+                                                                   gt_folder_name=gt_folder_name))
+            return manifest.get_paths(selection=selection)
+
         path_data_root = directory / data_folder_name
         path_gt_root = directory / gt_folder_name
 
@@ -230,6 +318,8 @@ class DatasetRGB(data.Dataset):
         # check the selection parameter
         if selection:
             selection = selection_validation(files_in_data_root, selection, full_page=True)
+            if isinstance(selection, ListConfig) or isinstance(selection, list):
+                selection = set(selection)
 
         counter = 0  # Counter for subdirectories, needed for selection parameter
 
@@ -241,7 +331,7 @@ class DatasetRGB(data.Dataset):
                     if counter > selection:
                         break
 
-                elif isinstance(selection, ListConfig) or isinstance(selection, list):
+                elif isinstance(selection, set):
                     if path_data_file.stem not in selection:
                         continue
 
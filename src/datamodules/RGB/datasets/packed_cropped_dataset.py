@@ -0,0 +1,178 @@
+"""
+Load a cropped dataset of historic documents from packed shard files.
+"""
+
+from pathlib import Path
+from typing import List, Tuple, Union, Optional
+
+import numpy as np
+import torch
+import torch.utils.data as data
+from torch import is_tensor, Tensor
+from torchvision.transforms import ToTensor
+
+from src.datamodules.utils.packed_shards import PackedShardReader
+from src.datamodules.utils.sample_index import CropSampleIndex
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+
+class PackedCroppedDatasetRGB(data.Dataset):
+    """
+    Cropped dataset which reads the crops from the shard files written by `tools/generate_packed_dataset.py`.
+    The crops are memory mapped, so a sample is read straight from the page cache of the operating system
+    without opening a file or decoding a PNG. The ground truth is stored already integer encoded,
+    therefore the `target_transform` is not applied.
+
+    The structure of the folder should be as follows::
+
+        path
+        ├── index.json
+        ├── shard_0000.data.npy
+        ├── shard_0000.gt.npy
+        ├── ...
+        └── shard_XXXX.gt.npy
+
+    :param path: Path to the packed split folder (train / val / test)
+    :type path: Path
+    :param selection: selection of the data, defaults to None
+    :type selection: Optional[Union[int, List[str]]], optional
+    :param is_test: flag to indicate if the dataset is used for testing, defaults to False
+    :type is_test: bool, optional
+    :param image_transform: image transformation, defaults to None
+    :type image_transform: callable, optional
+    :param target_transform: not used, the ground truth is already encoded
+    :type target_transform: callable, optional
+    :param twin_transform: twin transformation, it needs to provide `get_params` like :class:`TwinRandomCrop`
+    :type twin_transform: callable, optional
+    :param return_index: if True, :meth:`__getitem__` also returns the index of the crop for the train and val samples
+        (e.g. for the hard example mining), defaults to False
+    :type return_index: bool, optional
+    """
+
+    def __init__(self, path: Path, selection: Optional[Union[int, List[str]]] = None,
+                 is_test: bool = False, image_transform: callable = None, target_transform: callable = None,
+                 twin_transform: callable = None, return_index: bool = False):
+        """
+        Constructor method for the class: `PackedCroppedDatasetRGB`.
+        """
+        self.path = Path(path)
+        self.selection = selection
+
+        # transformations
+        self.image_transform = image_transform
+        self.target_transform = target_transform
+        self.twin_transform = twin_transform
+
+        self.is_test = is_test
+        self.return_index = return_index
+
+        self.reader = PackedShardReader(path=self.path)
+        self.sample_ids = self.reader.get_sample_ids(selection=self.selection)
+
+        # Sequence of tuples (shard data path, shard gt path, page name, crop name) like in `CroppedDatasetRGB`
+        self.img_paths_per_page = CropSampleIndex(entries=[(self.reader.get_shard_path(sample_id=i, kind='data'),
+                                                            self.reader.get_shard_path(sample_id=i, kind='gt'),
+                                                            *self.reader.get_sample(sample_id=i)[:2])
+                                                           for i in self.sample_ids])
+
+        self.num_samples = len(self.sample_ids)
+        if self.num_samples == 0:
+            raise RuntimeError(f'Found 0 crops in the packed split: {path}')
+
+    def __len__(self):
+        """
+        This function returns the length of an epoch so the data loader knows when to stop.
+        """
+        return self.num_samples
+
+    def __getitem__(self, index: int) -> Union[Tuple[Tensor, Tensor, int], Tuple[Tensor, Tensor]]:
+        if self.is_test:
+            return self._get_test_items(index=index)
+        elif self.return_index:
+            return (*self._get_train_val_items(index=index), index)
+        else:
+            return self._get_train_val_items(index=index)
+
+    def _get_train_val_items(self, index: int) -> Tuple[Tensor, Tensor]:
+        """
+        Returns the image and the ground truth at the given index. If transformations have been defined,
+        they are applied here.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image and the corresponding ground truth with transformations applied
+        :rtype: Tuple[Tensor, Tensor]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        img, gt = self._apply_transformation(data_img, gt_img)
+        return img, gt
+
+    def _get_test_items(self, index: int) -> Tuple[Tensor, Tensor, int]:
+        """
+        Returns the image and the ground truth at the given index together with the index.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image and the corresponding ground truth with transformations applied
+        :rtype: Tuple[Tensor, Tensor, int]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        img, gt = self._apply_transformation(data_img, gt_img)
+        return img, gt, index
+
+    def _load_data_and_gt(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns read-only views of the image crop and the encoded ground truth at the given index.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image (H x W x 3) and the ground truth (H x W)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        sample_id = self.sample_ids[index]
+        return self.reader.get_data(sample_id=sample_id), self.reader.get_gt(sample_id=sample_id)
+
+    def _get_crop_window(self, height: int, width: int) -> Tuple[slice, slice]:
+        """
+        Returns the window of the twin transform. During testing or without twin transform the full crop is used.
+
+        :param height: height of the stored crop
+        :type height: int
+        :param width: width of the stored crop
+        :type width: int
+        :return: The slices of the window in y and x direction
+        :rtype: Tuple[slice, slice]
+        """
+        if self.twin_transform is None or self.is_test:
+            return slice(0, height), slice(0, width)
+
+        i, j, h, w = self.twin_transform.get_params((width, height))
+        return slice(i, i + h), slice(j, j + w)
+
+    def _apply_transformation(self, img: np.ndarray, gt: np.ndarray) -> Tuple[Tensor, Tensor]:
+        """
+        Cuts the window of the twin transform out of the memory mapped crop (this is the only copy of the data)
+        and applies the image transformation.
+
+        :param img: The memory mapped image crop
+        :type img: np.ndarray
+        :param gt: The memory mapped ground truth
+        :type gt: np.ndarray
+        :return: The transformed image and the ground truth as long tensor
+        :rtype: Tuple[Tensor, Tensor]
+        """
+        window = self._get_crop_window(*gt.shape)
+
+        img = np.array(img[window])
+        gt = torch.from_numpy(gt[window].astype(np.int64))
+
+        if self.image_transform is not None:
+            # perform transformations
+            img, gt = self.image_transform(img, gt)
+
+        if not is_tensor(img):
+            img = ToTensor()(img)
+
+        return img, gt
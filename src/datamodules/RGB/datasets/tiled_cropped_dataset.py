@@ -0,0 +1,203 @@
+"""
+Load a cropped dataset of historic documents from a tiled page store.
+"""
+
+from pathlib import Path
+from typing import List, Tuple, Union, Optional
+
+import numpy as np
+import torch
+import torch.utils.data as data
+from torch import is_tensor, Tensor
+from torchvision.transforms import ToTensor
+
+from src.datamodules.utils.lru_cache import LRUCache
+from src.datamodules.utils.misc import get_crop_coordinates
+from src.datamodules.utils.sample_index import CropSampleIndex
+from src.datamodules.utils.tiled_store import TiledPageStoreReader
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+
+class TiledCroppedDatasetRGB(data.Dataset):
+    """
+    Cropped dataset which cuts the crops on demand out of the tiled page store written by
+    `tools/generate_packed_dataset.py`. The crops are virtual: their coordinates and names are computed in the same
+    way as `tools/generate_cropped_dataset.py` does, so the crop size and the overlap can be changed without
+    generating the dataset again. Only the tiles a crop touches are decompressed. The ground truth is stored already
+    integer encoded, therefore the `target_transform` is not applied.
+
+    The structure of the folder should be as follows::
+
+        path
+        ├── store.json
+        └── tiles.bin
+
+    :param path: Path to the tiled split folder (train / val / test)
+    :type path: Path
+    :param crop_size: size of the virtual crops, defaults to the crop size the store was written with
+    :type crop_size: Optional[int]
+    :param overlap: overlap of the virtual crops (between 0-1), defaults to the overlap the store was written with
+    :type overlap: Optional[float]
+    :param selection: selection of the data, defaults to None
+    :type selection: Optional[Union[int, List[str]]], optional
+    :param is_test: flag to indicate if the dataset is used for testing, defaults to False
+    :type is_test: bool, optional
+    :param image_transform: image transformation, defaults to None
+    :type image_transform: callable, optional
+    :param target_transform: not used, the ground truth is already encoded
+    :type target_transform: callable, optional
+    :param twin_transform: twin transformation, it needs to provide `get_params` like :class:`TwinRandomCrop`
+    :type twin_transform: callable, optional
+    :param tile_cache: cache for the decompressed tiles, works best with :class:`PageLocalitySampler`
+    :type tile_cache: Optional[LRUCache]
+    :param return_index: if True, :meth:`__getitem__` also returns the index of the crop for the train and val samples
+        (e.g. for the hard example mining), defaults to False
+    :type return_index: bool, optional
+    """
+
+    def __init__(self, path: Path, crop_size: Optional[int] = None, overlap: Optional[float] = None,
+                 selection: Optional[Union[int, List[str]]] = None,
+                 is_test: bool = False, image_transform: callable = None, target_transform: callable = None,
+                 twin_transform: callable = None, tile_cache: Optional[LRUCache] = None,
+                 return_index: bool = False):
+        """
+        Constructor method for the class: `TiledCroppedDatasetRGB`.
+        """
+        self.path = Path(path)
+        self.selection = selection
+
+        # transformations
+        self.image_transform = image_transform
+        self.target_transform = target_transform
+        self.twin_transform = twin_transform
+
+        self.is_test = is_test
+        self.return_index = return_index
+
+        self.tile_cache = tile_cache
+        self.reader = TiledPageStoreReader(path=self.path, tile_cache=self.tile_cache)
+        self.crop_size = crop_size if crop_size is not None else self.reader.crop_defaults.get('crop_size')
+        self.overlap = overlap if overlap is not None else self.reader.crop_defaults.get('overlap', 0.5)
+        self.leading_zeros_length = self.reader.crop_defaults.get('leading_zeros_length', 4)
+        if self.crop_size is None:
+            raise ValueError(f'The tiled split {path} has no default crop size, please provide one')
+
+        # Array with a row (page id, x, y) per crop
+        self.crops = self._get_crops(page_ids=self.reader.get_page_ids(selection=self.selection))
+
+        # Sequence of tuples (tile file path, tile file path, page name, crop name) like in `CroppedDatasetRGB`
+        self.img_paths_per_page = CropSampleIndex(
+            entries=[(self.reader.tiles_path, self.reader.tiles_path, self.reader.page_names[page_id],
+                      self._get_crop_name(page_name=self.reader.page_names[page_id], x=x, y=y))
+                     for page_id, x, y in self.crops.tolist()])
+
+        self.num_samples = len(self.crops)
+        if self.num_samples == 0:
+            raise RuntimeError(f'Found 0 crops of size {self.crop_size} in the tiled split: {path}')
+
+    def __len__(self):
+        """
+        This function returns the length of an epoch so the data loader knows when to stop.
+        """
+        return self.num_samples
+
+    def __getitem__(self, index: int) -> Union[Tuple[Tensor, Tensor, int], Tuple[Tensor, Tensor]]:
+        if self.is_test:
+            return self._get_test_items(index=index)
+        elif self.return_index:
+            return (*self._get_train_val_items(index=index), index)
+        else:
+            return self._get_train_val_items(index=index)
+
+    def _get_train_val_items(self, index: int) -> Tuple[Tensor, Tensor]:
+        """
+        Returns the image and the ground truth at the given index. If transformations have been defined,
+        they are applied here.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image and the corresponding ground truth with transformations applied
+        :rtype: Tuple[Tensor, Tensor]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        img, gt = self._apply_transformation(data_img, gt_img)
+        return img, gt
+
+    def _get_test_items(self, index: int) -> Tuple[Tensor, Tensor, int]:
+        """
+        Returns the image and the ground truth at the given index together with the index.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image and the corresponding ground truth with transformations applied
+        :rtype: Tuple[Tensor, Tensor, int]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        img, gt = self._apply_transformation(data_img, gt_img)
+        return img, gt, index
+
+    def _load_data_and_gt(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reads the window of the twin transform (or the whole crop) out of the store.
+
+        :param index: index of the crop to return
+        :type index: int
+        :return: The image (H x W x 3) and the ground truth (H x W)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        page_id, x, y, width, height = self._get_crop_window(index=index)
+        return (self.reader.read_window(page_id=page_id, kind='data', x=x, y=y, width=width, height=height),
+                self.reader.read_window(page_id=page_id, kind='gt', x=x, y=y, width=width, height=height))
+
+    def _get_crop_window(self, index: int) -> Tuple[int, int, int, int, int]:
+        """
+        Returns the window of the twin transform in page coordinates. During testing or without twin transform
+        the full crop is used.
+
+        :param index: index of the crop
+        :type index: int
+        :return: page id, x, y, width and height of the window
+        :rtype: Tuple[int, int, int, int, int]
+        """
+        page_id, x, y = self.crops[index].tolist()
+        if self.twin_transform is None or self.is_test:
+            return page_id, x, y, self.crop_size, self.crop_size
+
+        i, j, h, w = self.twin_transform.get_params((self.crop_size, self.crop_size))
+        return page_id, x + j, y + i, w, h
+
+    def _apply_transformation(self, img: np.ndarray, gt: np.ndarray) -> Tuple[Tensor, Tensor]:
+        """
+        Applies the image transformation. The twin transform was already applied when the window was read.
+
+        :param img: The image window
+        :type img: np.ndarray
+        :param gt: The ground truth window
+        :type gt: np.ndarray
+        :return: The transformed image and the ground truth as long tensor
+        :rtype: Tuple[Tensor, Tensor]
+        """
+        gt = torch.from_numpy(gt.astype(np.int64))
+
+        if self.image_transform is not None:
+            # perform transformations
+            img, gt = self.image_transform(img, gt)
+
+        if not is_tensor(img):
+            img = ToTensor()(img)
+
+        return img, gt
+
+    def _get_crops(self, page_ids: List[int]) -> np.ndarray:
+        crops = []
+        for page_id in page_ids:
+            width, height = self.reader.get_page_size(page_id=page_id)
+            crops.extend((page_id, x, y) for x, y in get_crop_coordinates(img_width=width, img_height=height,
+                                                                          crop_size=self.crop_size,
+                                                                          overlap=self.overlap))
+        return np.asarray(crops, dtype=np.int32).reshape(-1, 3)
+
+    def _get_crop_name(self, page_name: str, x: int, y: int) -> str:
+        return f'{page_name}_x{x:0{self.leading_zeros_length}d}_y{y:0{self.leading_zeros_length}d}'
@@ -1,29 +1,26 @@
-from typing import List
-
 import torch
 from torch.nn.functional import one_hot
 
+from src.datamodules.utils.functional import lookup_packed_colors, pack_colors
+
 
 def gt_to_int_encoding(matrix: torch.Tensor, class_encodings: torch.Tensor):
     """
-    Convert ground truth tensor or numpy matrix to one-hot encoded matrix
+    Convert ground truth tensor to integer encoded matrix. The colors of the pixels and the class encodings are packed
+    into 24-bit integers and the pixels are looked up in the sorted packed encodings. Pixels with a color which is
+    not a class encoding are encoded with -1.
 
-    :param matrix: Image as a tensor of size [C x H x W] (BGR)
+    :param matrix: Image as a tensor of size [C x H x W] (BGR), float in the range [0.0, 1.0] (`ToTensor`) or
+        integer in the range [0, 255] (e.g. uint8)
     :type matrix: torch.Tensor
-    :param class_encodings: class encoding so which class (index) has what value (element)
-    :type class_encodings: List[int]
-    :return: integer encoded matrix of size [#C x H x W]
+    :param class_encodings: class encoding so which class (index) has what value (element), float in the range
+        [0.0, 1.0] or integer in the range [0, 255]
+    :type class_encodings: torch.Tensor
+    :return: integer encoded matrix of size [H x W]
     :rtype: torch.Tensor
     """
-    integer_encoded = torch.full(size=matrix[0].shape, fill_value=-1, dtype=torch.long)
-    for index, encoding in enumerate(class_encodings):
-        mask = torch.logical_and(torch.logical_and(
-            torch.where(matrix[0] == encoding[0], True, False),
-            torch.where(matrix[1] == encoding[1], True, False)),
-            torch.where(matrix[2] == encoding[2], True, False))
-        integer_encoded[mask] = index
-
-    return integer_encoded
+    packed_encodings = pack_colors(torch.as_tensor(class_encodings).T)
+    return lookup_packed_colors(packed=pack_colors(matrix), packed_encodings=packed_encodings)
 
 
 def gt_to_one_hot(matrix: torch.Tensor, class_encodings: torch.Tensor):
@@ -33,9 +30,8 @@ def gt_to_one_hot(matrix: torch.Tensor, class_encodings: torch.Tensor):
     :param matrix: float tensor from to_tensor() or numpy array
         shape (C x H x W) in the range [0.0, 1.0] or shape (H x W x C) BGR
     :type matrix: torch.Tensor or np.ndarray
-    :param class_encodings: List of int
-        Blue channel values that encode the different classes
-    :type class_encodings: List[int]
+    :param class_encodings: class encoding so which class (index) has what value (element)
+    :type class_encodings: torch.Tensor
     :return: Tensor of size [#C x H x W]
         sparse one-hot encoded multi-class matrix, where #C is the number of classes
     :rtype: torch.LongTensor
@@ -2,29 +2,32 @@
 import logging
 import os
 from pathlib import Path
-from typing import Tuple, Dict, Any, List, Union
+from typing import Tuple, Dict, Any, List, Union, Optional
 
 import numpy as np
 # Torch related stuff
 import torch
 import torchvision.datasets as datasets
 import torchvision.transforms as transforms
-from PIL import Image
 from torchvision.datasets.folder import pil_loader
 
-from src.datamodules.utils.misc import check_missing_analytics, save_json
-from src.datamodules.utils.image_analytics import compute_mean_std
+from src.datamodules.utils.distributed import synchronize_analytics
+from src.datamodules.utils.misc import check_missing_analytics, save_json, read_analytics
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed
 
 
+@synchronize_analytics
 def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str, train_folder_name: str,
-                  get_img_gt_path_list_func: callable, inmem: bool = False, workers: int = 8) \
-        -> Tuple[Dict[str, Any], Dict[str, Any]]:
+                  get_img_gt_path_list_func: callable, inmem: bool = False, workers: int = 8,
+                  selection: Optional[Union[int, List[str]]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Get the analytics for the dataset. If the analytics file is not complete, it will be computed and saved.
+    The statistics of the single files are taken from the statistics index of the dataset (see
+    :func:`compute_image_statistics_indexed`), so only files which have not been indexed before are read.
 
-    :param workers: The amount of workers to use for the mean/std computation
+    :param workers: The amount of workers to use for the computation of the analytics
     :type workers: int
-    :param inmem: If the dataset should be loaded fully into memory
+    :param inmem: not used anymore, the images are never loaded at once (kept for compatibility)
     :type inmem: bool
     :param input_path: Path to the dataset folder
     :type input_path: Path
@@ -36,7 +39,11 @@ def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str,
     :type train_folder_name: str
     :param get_img_gt_path_list_func: Function that returns a list of tuples with the image and gt path
     :type get_img_gt_path_list_func: callable
-    :return:
+    :param selection: analytics of the selected pages of the training split (computed from the statistics index, the
+        analytics files of the split are neither read nor written)
+    :type selection: Optional[Union[int, List[str]]]
+    :return: Tuple of analytics for the data and ground truth
+    :rtype: Tuple[Dict[str, Any], Dict[str, Any]]
     """
 
     expected_keys_data = ['mean', 'std', 'width', 'height']
@@ -45,42 +52,69 @@ def get_analytics(input_path: Path, data_folder_name: str, gt_folder_name: str,
     analytics_path_data = input_path / f'analytics.data.{data_folder_name}.{train_folder_name}.json'
     analytics_path_gt = input_path / f'analytics.gt.{gt_folder_name}.{train_folder_name}.json'
 
-    analytics_data, missing_analytics_data = check_missing_analytics(analytics_path_data, expected_keys_data)
-    analytics_gt, missing_analytics_gt = check_missing_analytics(analytics_path_gt, expected_keys_gt)
+    if selection:
+        analytics_data, analytics_gt, missing_analytics_data, missing_analytics_gt = None, None, True, True
+    else:
+        analytics_data, missing_analytics_data = check_missing_analytics(analytics_path_data, expected_keys_data)
+        analytics_gt, missing_analytics_gt = check_missing_analytics(analytics_path_gt, expected_keys_gt)
 
     if not (missing_analytics_data or missing_analytics_gt):
         return analytics_data, analytics_gt
 
     train_path = input_path / train_folder_name
     img_gt_path_list = get_img_gt_path_list_func(train_path, data_folder_name=data_folder_name,
-                                                 gt_folder_name=gt_folder_name)
+                                                 gt_folder_name=gt_folder_name, selection=selection)
     file_names_data = np.asarray([str(item[0]) for item in img_gt_path_list])
     file_names_gt = np.asarray([str(item[1]) for item in img_gt_path_list])
 
-    if missing_analytics_data:
-        mean, std = compute_mean_std(file_names=file_names_data, inmem=inmem, workers=workers)
-        img = Image.open(file_names_data[0]).convert('RGB')
+    # single pass over the data and the gt files which are not yet indexed
+    statistics = compute_image_statistics_indexed(root=input_path,
+                                                  file_names_data=file_names_data if missing_analytics_data else None,
+                                                  file_names_gt=file_names_gt if missing_analytics_gt else None,
+                                                  gt_format='rgb', get_class_counts_func=get_class_counts_rgb,
+                                                  workers=workers)
 
-        analytics_data = {'mean': mean.tolist(),
-                          'std': std.tolist(),
-                          'width': img.width,
-                          'height': img.height}
+    if missing_analytics_data:
+        width, height = statistics.sizes[0]
+        analytics_data = {'mean': statistics.mean.tolist(),
+                          'std': statistics.std.tolist(),
+                          'width': width,
+                          'height': height}
         # save json
-        save_json(analytics_data, analytics_path_data)
+        if not selection:
+            save_json(analytics_data, analytics_path_data)
 
     if missing_analytics_gt:
         # Measure weights for class balancing
-        logging.info('Measuring class weights')
-        # create a list with all gt file paths
-        class_weights, class_encodings = _get_class_frequencies_weights_segmentation(gt_images=file_names_gt)
+        class_weights, class_encodings = get_class_weights_encodings_rgb(class_counts=statistics.class_counts)
         analytics_gt = {'class_weights': class_weights,
                         'class_encodings': class_encodings}
         # save json
-        save_json(analytics_gt, analytics_path_gt)
+        if not selection:
+            save_json(analytics_gt, analytics_path_gt)
 
     return analytics_data, analytics_gt
 
 
+def read_analytics_gt(input_path: Path, gt_folder_name: str, train_folder_name: str) -> Dict[str, Any]:
+    """
+    Reads the analytics of the ground truth (class weights and encodings) from the analytics file of the dataset
+    without opening any image (e.g. for the tools which merge or evaluate predictions).
+
+    :param input_path: Path to the dataset folder
+    :type input_path: Path
+    :param gt_folder_name: Name of the folder that contains the ground truth
+    :type gt_folder_name: str
+    :param train_folder_name: Name of the folder that contains the training data
+    :type train_folder_name: str
+    :return: class weights and encodings
+    :rtype: Dict[str, Any]
+    :raises FileNotFoundError: if the analytics file is missing or incomplete
+    """
+    return read_analytics(input_path / f'analytics.gt.{gt_folder_name}.{train_folder_name}.json',
+                          expected_keys=['class_weights', 'class_encodings'])
+
+
 def get_class_weights(input_folder: Path, workers=4) -> np.ndarray:
     """
     Get the weights proportional to the inverse of their class frequencies.
@@ -130,30 +164,32 @@ def get_class_weights(input_folder: Path, workers=4) -> np.ndarray:
     return class_weights
 
 
-def _get_class_frequencies_weights_segmentation(gt_images: Union[np.ndarray, List[str]]) -> Tuple[np.ndarray, List[int]]:
+def get_class_counts_rgb(gt_path: Union[str, Path]) -> Dict[Tuple[int, int, int], int]:
     """
-    Get the weights proportional to the inverse of their class frequencies.
-    The vector sums up to 1
+    Counts the pixels of every color of a ground truth image.
 
-    :param gt_images: Path to all ground truth images, which contain the pixel-wise label
-    :type gt_images: List[str]
-    :return: The weights vector as a 1D array normalized (sum up to 1)
-    :rtype: Tuple[np.ndarray, List[int]]
+    :param gt_path: Path to the ground truth image, which contains the pixel-wise label
+    :type gt_path: Union[str, Path]
+    :return: number of pixels per color
+    :rtype: Dict[Tuple[int, int, int], int]
     """
-    logging.info('Begin computing class frequencies weights')
+    img_raw = pil_loader(gt_path)
+    return {color: count for count, color in img_raw.getcolors(maxcolors=img_raw.width * img_raw.height)}
 
-    label_counter = {}
 
-    for path in gt_images:
-        img_raw = pil_loader(path)
-        colors = img_raw.getcolors()
-
-        for count, color in colors:
-            label_counter[color] = label_counter.get(color, 0) + count
+def get_class_weights_encodings_rgb(class_counts: Dict[Tuple[int, int, int], int]) \
+        -> Tuple[List[float], List[Tuple[int, int, int]]]:
+    """
+    Get the weights proportional to the inverse of their class frequencies.
 
-    classes = sorted(label_counter.keys())
-    num_samples_per_class = np.asarray([label_counter[k] for k in classes])
-    logging.info('Finished computing class frequencies weights')
-    # Normalize vector to sum up to 1.0 (in case the Loss function does not do it)
+    :param class_counts: number of pixels per color of all the ground truth images
+    :type class_counts: Dict[Tuple[int, int, int], int]
+    :return: The weights and the colors of the classes (sorted by color)
+    :rtype: Tuple[List[float], List[Tuple[int, int, int]]]
+    """
+    classes = sorted(class_counts.keys())
+    num_samples_per_class = np.asarray([class_counts[k] for k in classes])
+    class_frequencies = num_samples_per_class / num_samples_per_class.sum()
+    logging.info(f'Class frequencies (rounded): {np.around(class_frequencies * 100, decimals=2)}')
     class_weights = (1 / num_samples_per_class)  # / ((1 / num_samples_per_class).sum())
     return class_weights.tolist(), classes
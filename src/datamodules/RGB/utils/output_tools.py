@@ -1,14 +1,18 @@
 from pathlib import Path
-from typing import Tuple, List
+from typing import Optional, Tuple, List
 
 import numpy as np
-from PIL import Image
+
+from src.datamodules.utils.output_tools import output_to_class_indices, get_palette, decode_palette, \
+    save_paletted_image
 
 
 def save_output_page_image(image_name: str, output_image: np.ndarray, output_folder: Path,
-                           class_encoding: List[Tuple[int]]) -> None:
+                           class_encoding: List[Tuple[int]], perform_argmax: bool = True,
+                           compress_level: Optional[int] = None) -> None:
     """
-    Helper function to save the output during testing in the DIVAHisDB format
+    Helper function to save the output during testing in the RGB format. The class indices are written as paletted
+    image with the class encodings as palette.
 
     :param image_name: name of the image that is saved
     :type image_name: str
@@ -18,17 +22,22 @@ def save_output_page_image(image_name: str, output_image: np.ndarray, output_fol
     :type output_folder: Path
     :param class_encoding: list with the class encodings
     :type class_encoding: List[Tuple[int]]
+    :param perform_argmax: perform argmax on the output image, False if it contains the class indices [H x W]
+    :type perform_argmax: bool
+    :param compress_level: zlib compression level of PNG files (0-9), the default of PIL if None
+    :type compress_level: Optional[int]
 
     """
 
-    output_encoded = output_to_class_encodings(output_image, class_encoding)
+    class_indices = output_to_class_indices(output_image, perform_argmax=perform_argmax)
 
     dest_folder = output_folder
     dest_folder.mkdir(parents=True, exist_ok=True)
     dest_filename = dest_folder / image_name
 
     # Save the output
-    Image.fromarray(output_encoded.astype(np.uint8)).save(str(dest_filename))
+    save_paletted_image(class_indices=class_indices, palette=get_palette(class_encoding), file_path=dest_filename,
+                        compress_level=compress_level)
 
 
 def output_to_class_encodings(output: np.ndarray, class_encodings: List[Tuple[int]]) -> np.ndarray:
@@ -40,20 +49,8 @@ def output_to_class_encodings(output: np.ndarray, class_encodings: List[Tuple[in
     :param class_encodings: Contains the range of encoded classes
     :type class_encodings: List[Tuple[int]]
 
-    :return: numpy array of size [C x H x W] (BGR) with the classes encoded as in the ground truth
+    :return: uint8 numpy array of size [H x W x C] (RGB) with the classes encoded as in the ground truth
     :rtype: np.ndarray
     """
 
-    integer_encoded = np.argmax(output, axis=0)
-
-    num_classes = len(class_encodings)
-
-    masks = [integer_encoded == class_index for class_index in range(num_classes)]
-
-    rgb = np.full((*integer_encoded.shape, 3), -1)
-    for mask, color in zip(masks, class_encodings):
-        rgb[:, :, 0] = np.where(mask, color[0], rgb[:, :, 0])
-        rgb[:, :, 1] = np.where(mask, color[1], rgb[:, :, 1])
-        rgb[:, :, 2] = np.where(mask, color[2], rgb[:, :, 2])
-
-    return rgb
+    return decode_palette(class_indices=output_to_class_indices(output), palette=get_palette(class_encodings))
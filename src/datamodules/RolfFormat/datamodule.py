@@ -1,3 +1,4 @@
+from pathlib import Path
 from typing import Union, List, Optional, Dict
 
 import torch
@@ -6,10 +7,13 @@ from torchvision import transforms
 
 from src.datamodules.RGB.utils.single_transform import IntegerEncoding
 from src.datamodules.RolfFormat.datasets.dataset import DatasetRolfFormat, DatasetSpecs
-from src.datamodules.RolfFormat.utils.image_analytics import get_analytics_data, get_analytics_gt
-from src.datamodules.base_datamodule import AbstractDatamodule
+from src.datamodules.RolfFormat.utils.image_analytics import get_analytics
+from src.datamodules.base_datamodule import AbstractDatamodule, AnalyticsAttribute
 from src.datamodules.utils.dataset_predict import DatasetPredict
 from src.datamodules.utils.misc import ImageDimensions, get_image_dims
+from src.datamodules.utils.multi_crop import MultiCropDataset, multi_crop_collate
+from src.datamodules.utils.page_cache import PageCacheSpecs
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
 from src.datamodules.utils.wrapper_transforms import OnlyImage, OnlyTarget
 from src.utils import utils
 
@@ -45,19 +49,47 @@ class DataModuleRolfFormat(AbstractDatamodule):
     :type shuffle: bool
     :param drop_last: Whether to drop the last batch if it is smaller than the batch size.
     :type drop_last: bool
+    :param page_cache: Settings of the cache for the decoded pages (keys of class: `PageCacheSpecs`).
+        No pages are cached if None.
+    :type page_cache: Optional[Dict]
+    :param train_crop_size: If set, the training samples are random crops of this size instead of full pages.
+    :type train_crop_size: Optional[int]
+    :param crops_per_page: Number of random training crops which are cut out of each decoded page. The crops are
+        flattened into the batch, so `batch_size` (which has to be divisible by `crops_per_page`) stays the number
+        of crops in a batch. Needs `train_crop_size`.
+    :type crops_per_page: int
+    :param decode_backend: Backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+        `numpy`). None loads PIL images with `pil_loader`.
+    :type decode_backend: Optional[str]
+    :param uint8_batches: If True, the samples contain uint8 image tensors which are normalized by the task after
+        the transfer to the device, instead of normalized float tensors (a quarter of the bytes per batch).
+    :type uint8_batches: bool
     """
+    image_dims = AnalyticsAttribute()
+    dims = AnalyticsAttribute()
+    class_encodings_tensor = AnalyticsAttribute()
+    image_transform = AnalyticsAttribute()
+    target_transform = AnalyticsAttribute()
 
     def __init__(self, data_root: str,
                  train_specs: Dict = None, val_specs: Dict = None, test_specs: Dict = None,
                  pred_file_path_list: List[str] = None,
                  image_analytics: Dict = None, classes: Dict = None, image_dims: ImageDimensions = None,
                  num_workers: int = 4, batch_size: int = 8,
-                 shuffle: bool = True, drop_last: bool = True):
+                 shuffle: bool = True, drop_last: bool = True, page_cache: Optional[Dict] = None,
+                 train_crop_size: Optional[int] = None, crops_per_page: int = 1,
+                 decode_backend: Optional[str] = None,
+                 uint8_batches: bool = False):
         """
         Constructor method for the `DataModuleRolfFormat` class.
         """
         super().__init__()
 
+        if crops_per_page > 1 and train_crop_size is None:
+            raise ValueError('crops_per_page needs a train_crop_size')
+        if batch_size % crops_per_page != 0:
+            raise ValueError(f'The batch size ({batch_size}) has to be divisible by crops_per_page ({crops_per_page})')
+
         if train_specs is not None:
             self.train_dataset_specs = [DatasetSpecs(data_root=data_root, **v) for k, v in train_specs.items()]
         if val_specs is not None:
@@ -67,31 +99,56 @@ class DataModuleRolfFormat(AbstractDatamodule):
         if pred_file_path_list is not None:
             self.pred_file_path_list = pred_file_path_list
 
-        if image_analytics is None or classes is None or image_dims is None:
+        self.data_root = data_root
+        self._image_analytics = image_analytics
+        self._classes = classes
+        self._image_dims = image_dims
+
+        self.uint8_batches = uint8_batches
+        self.twin_transform = None
+        self.train_twin_transform = TwinRandomCrop(crop_size=train_crop_size) if train_crop_size is not None else None
+
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        self.page_cache = PageCacheSpecs(**page_cache) if page_cache is not None else None
+        self.crops_per_page = crops_per_page
+        self.decode_backend = decode_backend
+
+    def _load_analytics(self):
+        if self._image_analytics is None or self._classes is None or self._image_dims is None:
             train_paths_data_gt = DatasetRolfFormat.get_img_gt_path_list(list_specs=self.train_dataset_specs)
 
+        image_dims = self._image_dims
         if image_dims is None:
             image_dims = get_image_dims(data_gt_path_list=train_paths_data_gt)
             self._print_image_dims(image_dims=image_dims)
 
-        if image_analytics is None:
-            analytics_data = get_analytics_data(img_gt_path_list=train_paths_data_gt)
+        if self._image_analytics is None or self._classes is None:
+            # single pass over the files for the missing analytics
+            analytics_data, analytics_gt = get_analytics(img_gt_path_list=train_paths_data_gt,
+                                                         data=self._image_analytics is None, gt=self._classes is None,
+                                                         index_root=Path(self.data_root))
+
+        if self._image_analytics is None:
             self._print_analytics_data(analytics_data=analytics_data)
         else:
-            analytics_data = {'mean': [image_analytics['mean']['R'],
-                                       image_analytics['mean']['G'],
-                                       image_analytics['mean']['B']],
-                              'std': [image_analytics['std']['R'],
-                                      image_analytics['std']['G'],
-                                      image_analytics['std']['B']]}
-
-        if classes is None:
-            analytics_gt = get_analytics_gt(img_gt_path_list=train_paths_data_gt)
+            analytics_data = {'mean': [self._image_analytics['mean']['R'],
+                                       self._image_analytics['mean']['G'],
+                                       self._image_analytics['mean']['B']],
+                              'std': [self._image_analytics['std']['R'],
+                                      self._image_analytics['std']['G'],
+                                      self._image_analytics['std']['B']]}
+
+        if self._classes is None:
             self._print_analytics_gt(analytics_gt=analytics_gt)
         else:
             analytics_gt = {'class_encodings': [],
                             'class_weights': []}
-            for _, class_specs in classes.items():
+            for _, class_specs in self._classes.items():
                 analytics_gt['class_encodings'].append([class_specs['color']['R'],
                                                         class_specs['color']['G'],
                                                         class_specs['color']['B']])
@@ -117,20 +174,9 @@ class DataModuleRolfFormat(AbstractDatamodule):
         self.num_classes = len(self.class_encodings)
         self.class_weights = torch.as_tensor(analytics_gt['class_weights'])
 
-        self.twin_transform = None
-        self.image_transform = OnlyImage(transforms.Compose([transforms.ToTensor(),
-                                                             transforms.Normalize(mean=self.mean, std=self.std)]))
+        self.image_transform = OnlyImage(transforms.Compose([*self.get_image_to_tensor_transforms()]))
         self.target_transform = OnlyTarget(IntegerEncoding(class_encodings=self.class_encodings_tensor))
 
-        self.num_workers = num_workers
-        self.batch_size = batch_size
-
-        self.shuffle = shuffle
-        self.drop_last = drop_last
-
-        # Check default attributes using base_datamodule function
-        self._check_attributes()
-
     def _print_analytics_data(self, analytics_data):
         indent = 4 * ' '
         lines = ['']
@@ -178,18 +224,23 @@ class DataModuleRolfFormat(AbstractDatamodule):
         common_kwargs = {'image_dims': self.image_dims,
                          'image_transform': self.image_transform,
                          'target_transform': self.target_transform,
-                         'twin_transform': self.twin_transform}
+                         'twin_transform': self.twin_transform,
+                         'decode_backend': self.decode_backend}
 
         if stage == 'fit' or stage is None:
             self.train = DatasetRolfFormat(dataset_specs=self.train_dataset_specs,
                                            is_test=False,
-                                           **common_kwargs)
+                                           page_cache=self.page_cache,
+                                           **{**common_kwargs, 'twin_transform': self.train_twin_transform})
+            if self.crops_per_page > 1:
+                self.train = MultiCropDataset(dataset=self.train, crops_per_page=self.crops_per_page)
             log.info(f'Initialized train dataset with {len(self.train)} samples.')
-            self.check_min_num_samples(self.trainer.num_devices, self.batch_size, num_samples=len(self.train),
-                                       data_split='train', drop_last=self.drop_last)
+            self.check_min_num_samples(self.trainer.num_devices, self.batch_size // self.crops_per_page,
+                                       num_samples=len(self.train), data_split='train', drop_last=self.drop_last)
 
             self.val = DatasetRolfFormat(dataset_specs=self.val_dataset_specs,
                                          is_test=False,
+                                         page_cache=self.page_cache,
                                          **common_kwargs)
             log.info(f'Initialized val dataset with {len(self.val)} samples.')
             self.check_min_num_samples(self.trainer.num_devices, self.batch_size, num_samples=len(self.val),
@@ -198,6 +249,7 @@ class DataModuleRolfFormat(AbstractDatamodule):
         if stage == 'test':
             self.test = DatasetRolfFormat(dataset_specs=self.test_dataset_specs,
                                           is_test=True,
+                                          page_cache=self.page_cache,
                                           **common_kwargs)
             log.info(f'Initialized test dataset with {len(self.test)} samples.')
             # self._check_min_num_samples(num_samples=len(self.test), data_split='test', drop_last=False)
@@ -210,11 +262,12 @@ class DataModuleRolfFormat(AbstractDatamodule):
 
     def train_dataloader(self, *args, **kwargs) -> DataLoader:
         return DataLoader(self.train,
-                          batch_size=self.batch_size,
+                          batch_size=self.batch_size // self.crops_per_page,
                           num_workers=self.num_workers,
                           shuffle=self.shuffle,
                           drop_last=self.drop_last,
-                          pin_memory=True)
+                          pin_memory=True,
+                          collate_fn=multi_crop_collate if self.crops_per_page > 1 else None)
 
     def val_dataloader(self, *args, **kwargs) -> Union[DataLoader, List[DataLoader]]:
         return DataLoader(self.val,
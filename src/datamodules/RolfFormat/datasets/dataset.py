@@ -6,15 +6,19 @@ Load a dataset of historic documents by specifying the folder where its located.
 import re
 from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import List, Tuple, Union
+from typing import List, Tuple, Union, Optional
 
+import numpy as np
+import torch
 import torch.utils.data as data
 from torch import is_tensor
 from PIL import Image
-from torchvision.datasets.folder import pil_loader
 from torchvision.transforms import ToTensor
 
+from src.datamodules.utils.decoders import get_decoder, get_image_size, load_image
 from src.datamodules.utils.misc import ImageDimensions, get_output_file_list
+from src.datamodules.utils.page_cache import PageCache, PageCacheSpecs
+from src.datamodules.utils.single_transforms import ToUint8Tensor
 from src.utils import utils
 
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.gif')
@@ -46,8 +50,8 @@ class DatasetRolfFormat(data.Dataset):
 
     :param dataset_specs: The dataset specs that specify the location of the data and ground truth files.
     :type dataset_specs: List[DatasetSpecs]
-    :param image_dims: The dimensions of the images.
-    :type image_dims: ImageDimensions
+    :param image_dims: The dimensions of the images. If None, the pages can have any size.
+    :type image_dims: Optional[ImageDimensions]
     :param is_test: Is it the test dataset?
     :type is_test: bool
     :param image_transform: Transformations that should be applied to the image.
@@ -56,16 +60,24 @@ class DatasetRolfFormat(data.Dataset):
     :type target_transform: callable
     :param twin_transform: Transformations that should be applied to both the image and the ground truth.
     :type twin_transform: callable
+    :param page_cache: Specification of the cache for the decoded pages and their label maps. The cache needs a
+        target transformation which encodes the ground truth and can not be used with a twin transformation.
+    :type page_cache: Optional[PageCacheSpecs]
+    :param decode_backend: Backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+        `numpy`, see :func:`get_decoder`). None loads PIL images with `pil_loader`.
+    :type decode_backend: Optional[str]
     """
 
-    def __init__(self, dataset_specs: List[DatasetSpecs], image_dims: ImageDimensions,
+    def __init__(self, dataset_specs: List[DatasetSpecs], image_dims: Optional[ImageDimensions],
                  is_test: bool = False, image_transform: callable = None, target_transform: callable = None,
-                 twin_transform: callable = None):
+                 twin_transform: callable = None, page_cache: Optional[PageCacheSpecs] = None,
+                 decode_backend: Optional[str] = None):
         """
         Constructor method for the DatasetRolfFormat class.
         """
 
         self.dataset_specs = dataset_specs
+        self.decoder = get_decoder(decode_backend=decode_backend)
 
         self.image_dims = image_dims
 
@@ -87,6 +99,15 @@ class DatasetRolfFormat(data.Dataset):
 
         assert self.num_samples > 0
 
+        self.page_cache = None
+        if page_cache is not None:
+            if self.twin_transform is not None or self.target_transform is None:
+                raise ValueError('The page cache needs a target transform and can not be used with a twin transform')
+            if self.image_dims is None:
+                raise ValueError('The page cache needs the image dimensions')
+            self.page_cache = PageCache(specs=page_cache, page_paths=self.img_gt_path_list,
+                                        image_dims=self.image_dims)
+
     def __len__(self):
         """
         This function returns the length of an epoch so the data loader knows when to stop.
@@ -118,8 +139,7 @@ class DatasetRolfFormat(data.Dataset):
         :return: The image and the ground truth for the given index.
         :rtype: tuple
         """
-        data_img, gt_img = self._load_data_and_gt(index=index)
-        img, gt = self._apply_transformation(data_img, gt_img)
+        img, gt = self._get_img_and_gt(index=index)
         return img, gt
 
     def _get_test_items(self, index: int) -> Tuple[Image.Image, Image.Image, int]:
@@ -132,10 +152,40 @@ class DatasetRolfFormat(data.Dataset):
         :rtype: tuple
         :return:
         """
-        data_img, gt_img = self._load_data_and_gt(index=index)
-        img, gt = self._apply_transformation(data_img, gt_img)
+        img, gt = self._get_img_and_gt(index=index)
         return img, gt, index
 
+    def _get_img_and_gt(self, index: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        This function loads the page for a given index and applies the transformations. With a page cache the
+        decoded page and its label map are taken from the cache.
+
+        :param index: The index of the sample that should be returned.
+        :type index: int
+        :return: The transformed image and ground truth.
+        :rtype: tuple
+        """
+        if self.page_cache is None:
+            data_img, gt_img = self._load_data_and_gt(index=index)
+            return self._apply_transformation(data_img, gt_img)
+
+        data_img, label_map = self.page_cache.load(index=index, decode_func=self._decode_page)
+        return self._apply_image_transformation(Image.fromarray(data_img),
+                                                torch.from_numpy(label_map.astype(np.int64)))
+
+    def _decode_page(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        This function decodes the page for a given index into an uint8 image and its label map for the page cache.
+
+        :param index: The index of the page.
+        :type index: int
+        :return: The image (HxWx3) and the label map (HxW).
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        data_img, gt_img = self._load_data_and_gt(index=index)
+        _, gt = self.target_transform(None, ToUint8Tensor()(gt_img))
+        return np.asarray(data_img), gt.numpy()
+
     def _load_data_and_gt(self, index: int) -> Tuple[Image.Image, Image.Image]:
         """
         This function loads the image and the ground truth for a given index.
@@ -145,11 +195,12 @@ class DatasetRolfFormat(data.Dataset):
         :return: The image and the ground truth for the given index.
         :rtype: tuple
         """
-        data_img = pil_loader(str(self.img_gt_path_list[index][0]))
-        gt_img = pil_loader(str(self.img_gt_path_list[index][1]))
+        data_img = load_image(self.img_gt_path_list[index][0], decoder=self.decoder)
+        gt_img = load_image(self.img_gt_path_list[index][1], decoder=self.decoder)
 
-        assert data_img.height == self.image_dims.height and data_img.width == self.image_dims.width
-        assert gt_img.height == self.image_dims.height and gt_img.width == self.image_dims.width
+        if self.image_dims is not None:
+            assert get_image_size(data_img) == (self.image_dims.width, self.image_dims.height)
+            assert get_image_size(gt_img) == (self.image_dims.width, self.image_dims.height)
 
         return data_img, gt_img
 
@@ -175,13 +226,33 @@ class DatasetRolfFormat(data.Dataset):
         if not is_tensor(img):
             img = ToTensor()(img)
         if not is_tensor(gt):
-            gt = ToTensor()(gt)
+            # the ground truth encodings take the uint8 colors directly
+            gt = ToUint8Tensor()(gt) if self.target_transform is not None else ToTensor()(gt)
 
         if self.target_transform is not None:
             img, gt = self.target_transform(img, gt)
 
         return img, gt
 
+    def _apply_image_transformation(self, img: Image.Image, gt: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Applies the image transformation to a page from the page cache. The ground truth is already encoded.
+
+        :param img: The original image onto which the transformations should be applied.
+        :type img: Image.Image
+        :param gt: The label map of the page.
+        :type gt: torch.Tensor
+        :return: The transformed image and ground truth.
+        :rtype: Tuple[torch.Tensor, torch.Tensor]
+        """
+        if self.image_transform is not None:
+            img, gt = self.image_transform(img, gt)
+
+        if not is_tensor(img):
+            img = ToTensor()(img)
+
+        return img, gt
+
     @staticmethod
     def _get_paths_from_specs(data_root: str,
                               doc_dir: str, doc_names: str,
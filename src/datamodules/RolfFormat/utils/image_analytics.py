@@ -1,13 +1,61 @@
 # Utils
-import logging
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 
 import numpy as np
 # Torch related stuff
 
-from src.datamodules.RGB.utils.image_analytics import _get_class_frequencies_weights_segmentation
-from src.datamodules.utils.image_analytics import compute_mean_std
+from src.datamodules.RGB.utils.image_analytics import get_class_counts_rgb, get_class_weights_encodings_rgb
+from src.datamodules.utils.image_analytics import compute_image_statistics
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed
+
+
+def get_analytics(img_gt_path_list: List[Tuple[Path, Path]], data: bool = True, gt: bool = True, workers: int = 8,
+                  index_root: Optional[Path] = None) -> Tuple[Optional[Dict[str, List]], Optional[Dict[str, Any]]]:
+    """
+    Computes the analytics of the data (mean and std) and of the ground truth (class weights and encodings) in a
+    single pass over the files.
+
+    :param img_gt_path_list: Images and their corresponding ground truth paths
+    :type img_gt_path_list: List[Tuple[Path, Path]]
+    :param data: compute the analytics of the data
+    :type data: bool
+    :param gt: compute the analytics of the ground truth
+    :type gt: bool
+    :param workers: Number of workers to use for loading the files
+    :type workers: int
+    :param index_root: root folder of the statistics index to take the statistics of the files from (see
+        :func:`compute_image_statistics_indexed`), no index is used if None
+    :type index_root: Optional[Path]
+    :return: analytics of the data and of the ground truth (None if not computed)
+    :rtype: Tuple[Optional[Dict[str, List]], Optional[Dict[str, Any]]]
+    """
+    file_names_data = np.asarray([str(item[0]) for item in img_gt_path_list])
+    file_names_gt = np.asarray([str(item[1]) for item in img_gt_path_list])
+
+    if index_root is None:
+        statistics = compute_image_statistics(file_names_data=file_names_data if data else None,
+                                              file_names_gt=file_names_gt if gt else None,
+                                              get_class_counts_func=get_class_counts_rgb, workers=workers)
+    else:
+        statistics = compute_image_statistics_indexed(root=index_root,
+                                                      file_names_data=file_names_data if data else None,
+                                                      file_names_gt=file_names_gt if gt else None, gt_format='rgb',
+                                                      get_class_counts_func=get_class_counts_rgb, workers=workers)
+
+    analytics_data = None
+    if data:
+        analytics_data = {'mean': statistics.mean.tolist(),
+                          'std': statistics.std.tolist()}
+
+    analytics_gt = None
+    if gt:
+        # Measure weights for class balancing
+        class_weights, class_encodings = get_class_weights_encodings_rgb(class_counts=statistics.class_counts)
+        analytics_gt = {'class_weights': class_weights,
+                        'class_encodings': class_encodings}
+
+    return analytics_data, analytics_gt
 
 
 def get_analytics_data(img_gt_path_list: List[Tuple[Path, Path]], inmem: bool = False, workers: int = 8)\
@@ -17,38 +65,27 @@ def get_analytics_data(img_gt_path_list: List[Tuple[Path, Path]], inmem: bool =
 
     :param img_gt_path_list: Images and their corresponding ground truth paths to be used for computing mean and std
     :type img_gt_path_list: List[Tuple[Path, Path]]
-    :param inmem: Whether to load the images in memory or not
+    :param inmem: not used anymore, the images are never loaded at once (kept for compatibility)
     :type inmem: bool
     :param workers: Number of workers to use for loading and calculating mean and std
     :type workers: int
     :return: Dictionary containing mean and std
     :rtype: dict
     """
-    file_names_data = np.asarray([str(item[0]) for item in img_gt_path_list])
-
-    mean, std = compute_mean_std(file_names=file_names_data, inmem=inmem, workers=workers)
-    analytics_data = {'mean': mean.tolist(),
-                      'std': std.tolist()}
-
+    analytics_data, _ = get_analytics(img_gt_path_list=img_gt_path_list, data=True, gt=False, workers=workers)
     return analytics_data
 
 
-def get_analytics_gt(img_gt_path_list: List[Tuple[Path, Path]]) -> Dict[str, Any]:
+def get_analytics_gt(img_gt_path_list: List[Tuple[Path, Path]], workers: int = 8) -> Dict[str, Any]:
     """
     Computes class weights and encodings of the dataset based on the ground truth
 
     :param img_gt_path_list: Images and their corresponding ground truth paths to be used for computing class weights
     :type img_gt_path_list: List[Tuple[Path, Path]]
+    :param workers: Number of workers to use for loading the ground truth
+    :type workers: int
     :return: Dictionary containing class weights and encodings
     :rtype: Dict[str, float]
     """
-    file_names_gt = np.asarray([str(item[1]) for item in img_gt_path_list])
-
-    # Measure weights for class balancing
-    logging.info('Measuring class weights')
-    # create a list with all gt file paths
-    class_weights, class_encodings = _get_class_frequencies_weights_segmentation(gt_images=file_names_gt)
-    analytics_gt = {'class_weights': class_weights,
-                    'class_encodings': class_encodings}
-
+    _, analytics_gt = get_analytics(img_gt_path_list=img_gt_path_list, data=False, gt=True, workers=workers)
     return analytics_gt
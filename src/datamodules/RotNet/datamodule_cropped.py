@@ -10,7 +10,7 @@ from src.datamodules.RotNet.utils.image_analytics import get_analytics_data
 from src.datamodules.RotNet.datasets.cropped_dataset import CroppedRotNet
 from src.datamodules.RotNet.utils.misc import validate_path_for_self_supervised
 from src.datamodules.utils.wrapper_transforms import OnlyImage
-from src.datamodules.base_datamodule import AbstractDatamodule
+from src.datamodules.base_datamodule import AbstractDatamodule, AnalyticsAttribute
 from src.utils import utils
 
 log = utils.get_logger(__name__)
@@ -108,31 +108,29 @@ class RotNetDivaHisDBDataModuleCropped(AbstractDatamodule):
     :type shuffle: bool
     :param drop_last: Whether to drop the last batch
     :type drop_last: bool
+    :param uint8_batches: If True, the samples contain uint8 image tensors which are normalized by the task after
+        the transfer to the device, instead of normalized float tensors (a quarter of the bytes per batch).
+    :type uint8_batches: bool
     """
+    image_transform = AnalyticsAttribute()
+
     def __init__(self, data_dir: str, data_folder_name: str,
                  selection_train: Optional[Union[int, List[str]]] = None,
                  selection_val: Optional[Union[int, List[str]]] = None,
                  selection_test: Optional[Union[int, List[str]]] = None,
                  crop_size: int = 256, num_workers: int = 4, batch_size: int = 8,
-                 shuffle: bool = True, drop_last: bool = True, ):
+                 shuffle: bool = True, drop_last: bool = True, uint8_batches: bool = False):
         """
         Constructor method for the RotNetDivaHisDBDataModuleCropped class.
         """
         super().__init__()
 
         self.data_folder_name = data_folder_name
-        analytics_data = get_analytics_data(input_path=Path(data_dir), data_folder_name=self.data_folder_name,
-                                            get_gt_data_paths_func=CroppedRotNet.get_gt_data_paths)
-
-        self.mean = analytics_data['mean']
-        self.std = analytics_data['std']
+        self.uint8_batches = uint8_batches
         self.class_encodings = np.array([0, 90, 180, 270])
         self.num_classes = len(self.class_encodings)
         self.class_weights = torch.as_tensor([1 / self.num_classes for _ in range(self.num_classes)])
-
-        self.image_transform = OnlyImage(transforms.Compose([transforms.ToTensor(),
-                                                             transforms.Normalize(mean=self.mean, std=self.std),
-                                                             transforms.RandomCrop(size=crop_size)]))
+        self.crop_size = crop_size
 
         self.num_workers = num_workers
         self.batch_size = batch_size
@@ -148,8 +146,15 @@ class RotNetDivaHisDBDataModuleCropped(AbstractDatamodule):
 
         self.dims = (3, crop_size, crop_size)
 
-        # Check default attributes using base_datamodule function
-        self._check_attributes()
+    def _load_analytics(self):
+        analytics_data = get_analytics_data(input_path=Path(self.data_dir), data_folder_name=self.data_folder_name,
+                                            get_gt_data_paths_func=CroppedRotNet.get_gt_data_paths)
+
+        self.mean = analytics_data['mean']
+        self.std = analytics_data['std']
+
+        self.image_transform = OnlyImage(transforms.Compose([*self.get_image_to_tensor_transforms(),
+                                                             transforms.RandomCrop(size=self.crop_size)]))
 
     def setup(self, stage: Optional[str] = None):
         super().setup()
@@ -14,6 +14,7 @@ from torchvision.transforms import ToTensor
 
 from src.datamodules.DivaHisDB.datasets.cropped_dataset import CroppedHisDBDataset
 from src.datamodules.utils.misc import selection_validation
+from src.datamodules.utils.sample_index import StringArray
 from src.datamodules.utils.single_transforms import RightAngleRotation
 from src.utils import utils
 
@@ -134,6 +135,18 @@ class CroppedRotNet(CroppedHisDBDataset):
         """
         return self.num_samples
 
+    @staticmethod
+    def _create_sample_index(paths: List[Path]) -> StringArray:
+        """
+        Stores the list of image paths in a compact array which the DataLoader workers can share without copying it.
+
+        :param paths: the list of :meth:`get_gt_data_paths`
+        :type paths: List[Path]
+        :return: the paths as strings
+        :rtype: StringArray
+        """
+        return StringArray(strings=[str(path) for path in paths])
+
     def _load_data_and_gt(self, index: int) -> Image.Image:
         """
         Loads the image for a given index.
@@ -174,7 +187,7 @@ class CroppedRotNet(CroppedHisDBDataset):
 
     @staticmethod
     def get_gt_data_paths(directory: Path, data_folder_name: str, gt_folder_name: str = None,
-                          selection: Optional[Union[int, List[str]]] = None) \
+                          selection: Optional[Union[int, List[str]]] = None, use_manifest: bool = False) \
             -> List[Path]:
         """
         Creates the list of paths to the original images.
@@ -210,9 +223,14 @@ class CroppedRotNet(CroppedHisDBDataset):
         :param selection: If you only want to use a subset of the dataset, you can specify the name of the files
             (without the file extension) in a list. If you want to use all files, set this parameter to None.
         :type selection: Union[int, List[str]]
+        :param use_manifest: the manifest is not supported for RotNet, has to be False
+        :type use_manifest: bool
         :return: List of paths to the original images
         :rtype: List[Path]
         """
+        if use_manifest:
+            raise ValueError('The dataset manifest is not supported for RotNet')
+
         paths = []
         directory = directory.expanduser()
 
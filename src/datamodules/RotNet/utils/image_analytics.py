@@ -2,12 +2,12 @@
 from pathlib import Path
 from typing import Any, Dict
 
-import numpy as np
-
+from src.datamodules.utils.distributed import synchronize_analytics
 from src.datamodules.utils.misc import check_missing_analytics, save_json
-from src.datamodules.utils.image_analytics import compute_mean_std
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed
 
 
+@synchronize_analytics
 def get_analytics_data(input_path: Path, data_folder_name: str, get_gt_data_paths_func: callable, inmem=False,
                        workers=8) -> Dict[str, Any]:
     """
@@ -19,7 +19,7 @@ def get_analytics_data(input_path: Path, data_folder_name: str, get_gt_data_path
     :type data_folder_name: str
     :param get_gt_data_paths_func: function to get the paths to the gt data
     :type get_gt_data_paths_func: callable
-    :param inmem: Should the data be loaded fully into memory
+    :param inmem: not used anymore, the images are never loaded at once (kept for compatibility)
     :type inmem: bool
     :param workers: Number of workers to be used for calculating the mean and std
     :type workers: int
@@ -38,9 +38,9 @@ def get_analytics_data(input_path: Path, data_folder_name: str, get_gt_data_path
     train_path = input_path / 'train'
     gt_data_path_list = get_gt_data_paths_func(train_path, data_folder_name=data_folder_name, gt_folder_name=None)
 
-    mean, std = compute_mean_std(file_names=gt_data_path_list, inmem=inmem, workers=workers)
-    analytics_data = {'mean': mean.tolist(),
-                      'std': std.tolist()}
+    statistics = compute_image_statistics_indexed(root=input_path, file_names_data=gt_data_path_list, workers=workers)
+    analytics_data = {'mean': statistics.mean.tolist(),
+                      'std': statistics.std.tolist()}
     # save json
     save_json(analytics_data, analytics_path_data)
 
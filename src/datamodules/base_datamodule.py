@@ -1,13 +1,55 @@
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 import pytorch_lightning as pl
 import torch
 from omegaconf import OmegaConf
+from torchvision import transforms
+
+from src.datamodules.utils.class_histograms import get_blank_crops
+from src.datamodules.utils.crop_size_schedule import CropSizeSchedule
+from src.datamodules.utils.samplers import HardExampleSampler, BlankCropSampler
+from src.datamodules.utils.single_transforms import ToUint8Tensor
 
 from src.utils import utils
 
 log = utils.get_logger(__name__)
 
+_NO_DEFAULT = object()
+
+
+class AnalyticsAttribute:
+    """
+    Attribute of a datamodule which depends on the analytics of the dataset (e.g. `mean` or `class_encodings`). The
+    analytics are loaded (and computed if they are missing) on the first access of any of these attributes with
+    :meth:`AbstractDatamodule.load_analytics`, so creating a datamodule does not read the training split.
+    An assigned value is returned without loading the analytics.
+
+    :param default: value if the analytics do not set the attribute, an AttributeError is raised if not given
+    :type default: Any
+    """
+
+    def __init__(self, default: Any = _NO_DEFAULT):
+        self.default = default
+        self.name = None
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if self.name not in instance.__dict__:
+            instance.load_analytics()
+        if self.name in instance.__dict__:
+            return instance.__dict__[self.name]
+        if self.default is _NO_DEFAULT:
+            raise AttributeError(f"'{type(instance).__name__}' object has no attribute '{self.name}'")
+        return self.default
+
+    def __set__(self, instance, value: Any):
+        instance.__dict__[self.name] = value
+
 
 class AbstractDatamodule(pl.LightningDataModule):
     """
@@ -15,12 +57,37 @@ class AbstractDatamodule(pl.LightningDataModule):
     It provides some basic functionality like checking the number of samples and the number of classes.
     Also, it provides a resolver for the datamodule object itself, so that it can be used in the config.
     The class variable `dims` must be set in the subclass.
+
+    If `uint8_batches` is set, the datasets return uint8 image tensors instead of normalized float tensors and the
+    task normalizes the batch with `mean` and `std` on the device (see :meth:`AbstractTask.on_after_batch_transfer`).
+
+    The attributes which depend on the analytics of the dataset are resolved lazily (see class: `AnalyticsAttribute`),
+    the subclasses set them in :meth:`_load_analytics`.
+
+    Datamodules which support hard example mining draw the training crops with the `hard_example_sampler` (see
+    :meth:`get_hard_example_sampler`) and their training datasets return the index of every crop with the sample, so
+    the task can report the loss of the crop. The loss table is stored in the checkpoints (:meth:`state_dict`).
+    Datamodules which support skipping the blank crops draw the training crops with the sampler of
+    :meth:`get_blank_crop_sampler`.
+
+    With a `crop_size_schedule` (class: `CropSizeSchedule`) the crop size and the batch size of the training change
+    over the epochs. `dims` and `batch_size` keep the full size (of the validation and test samples), the training
+    batch size of the current epoch is returned by :meth:`get_train_batch_size`.
     """
+    mean = AnalyticsAttribute()
+    std = AnalyticsAttribute()
+    class_encodings = AnalyticsAttribute()
+    class_weights = AnalyticsAttribute(default=None)
+    num_classes = AnalyticsAttribute(default=-1)
 
     def __init__(self):
         super().__init__()
-        self.num_classes = -1
-        self.class_weights = None
+        self._analytics_loaded = False
+        self._analytics_loading = False
+        self.uint8_batches = False
+        self.hard_example_sampler = None
+        self._hard_example_state = None
+        self.crop_size_schedule: Optional[CropSizeSchedule] = None
         resolver_name = 'datamodule'
         if not OmegaConf.has_resolver(resolver_name):
             OmegaConf.register_new_resolver(
@@ -33,6 +100,137 @@ class AbstractDatamodule(pl.LightningDataModule):
         if not self.dims:
             raise ValueError("the dimensions of the data needs to be set! self.dims")
 
+    def load_analytics(self):
+        """
+        Loads (or computes) the analytics of the dataset and sets the attributes which depend on them. This happens
+        once, on the first access of an analytics attribute, and can be called to load them eagerly. If loading fails,
+        the error is raised and the next access tries again.
+        """
+        # attributes which are accessed while loading must not start loading again
+        if self._analytics_loaded or self._analytics_loading:
+            return
+        self._analytics_loading = True
+        try:
+            self._load_analytics()
+            self._check_attributes()
+        finally:
+            self._analytics_loading = False
+        self._analytics_loaded = True
+
+    def _load_analytics(self):
+        """
+        Sets the attributes which depend on the analytics of the dataset (`mean`, `std`, `class_encodings`, ...).
+        """
+        pass
+
+    def get_train_batch_size(self) -> int:
+        """
+        :return: the batch size of the training dataloader of the current epoch
+        :rtype: int
+        """
+        if self.crop_size_schedule is None:
+            return self.batch_size
+        return self.crop_size_schedule.get_stage(epoch=self.trainer.current_epoch)[1]
+
+    def get_input_shapes(self) -> List[Tuple[int, ...]]:
+        """
+        Returns the shapes of the input batches of the model (batch size and `dims`), with a crop size schedule the
+        shape of every stage.
+
+        :return: the shapes of the input batches
+        :rtype: List[Tuple[int, ...]]
+        """
+        if self.crop_size_schedule is None:
+            return [(self.batch_size, *self.dims)]
+        return [(batch_size, self.dims[0], crop_size, crop_size)
+                for crop_size, batch_size in self.crop_size_schedule.get_sizes()]
+
+    def get_hard_example_sampler(self, num_crops: int, hard_example_mining: Dict[str, Any]) -> HardExampleSampler:
+        """
+        Returns the sampler of the hard example mining. It is created on the first call (with the loss table of a
+        restored checkpoint) and then kept, so the loss table survives the recreation of the training dataloader.
+
+        :param num_crops: number of crops of the training dataset
+        :type num_crops: int
+        :param hard_example_mining: arguments of the class: `HardExampleSampler` (e.g. `uniform_fraction`)
+        :type hard_example_mining: Dict[str, Any]
+        :return: the sampler
+        :rtype: HardExampleSampler
+        """
+        if self.hard_example_sampler is None:
+            self.hard_example_sampler = HardExampleSampler(num_crops=num_crops,
+                                                           num_replicas=self.trainer.world_size,
+                                                           rank=self.trainer.global_rank,
+                                                           drop_last=self.drop_last,
+                                                           **hard_example_mining)
+            if self._hard_example_state is not None:
+                self.hard_example_sampler.load_state_dict(self._hard_example_state)
+                self._hard_example_state = None
+        return self.hard_example_sampler
+
+    def get_blank_crop_sampler(self, class_histograms: np.ndarray, threshold: float = 0.98,
+                               keep_fraction: float = 0.0) -> BlankCropSampler:
+        """
+        Returns a sampler which skips the blank training crops (see class: `BlankCropSampler`).
+
+        :param class_histograms: the pixels per class of every training crop (N x num_classes)
+        :type class_histograms: np.ndarray
+        :param threshold: minimal share of the most frequent class of a blank crop
+        :type threshold: float
+        :param keep_fraction: share of the blank crops in every epoch
+        :type keep_fraction: float
+        :return: the sampler
+        :rtype: BlankCropSampler
+        """
+        blank_crops = get_blank_crops(class_histograms=class_histograms, threshold=threshold)
+        sampler = BlankCropSampler(blank_crops=blank_crops, keep_fraction=keep_fraction,
+                                   num_replicas=self.trainer.world_size, rank=self.trainer.global_rank,
+                                   shuffle=self.shuffle, drop_last=self.drop_last)
+        log.info(f'{blank_crops.sum()} of {len(blank_crops)} training crops are blank, '
+                 f'an epoch contains {sampler.num_kept_blank} of them ({len(sampler.dataset)} crops).')
+        self.check_min_num_samples(self.trainer.num_devices, self.get_train_batch_size(),
+                                   num_samples=len(sampler.dataset),
+                                   data_split='train (without the blank crops)', drop_last=self.drop_last)
+        return sampler
+
+    def state_dict(self) -> Dict[str, Any]:
+        """
+        Called when saving a checkpoint, returns the loss table of the hard example mining.
+
+        :return: the state of the datamodule
+        :rtype: Dict[str, Any]
+        """
+        if self.hard_example_sampler is None:
+            return {}
+        return {'hard_example_sampler': self.hard_example_sampler.state_dict()}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        """
+        Called when loading a checkpoint, restores the loss table of the hard example mining.
+
+        :param state_dict: the state of :meth:`state_dict`
+        :type state_dict: Dict[str, Any]
+        """
+        if 'hard_example_sampler' not in state_dict:
+            return
+        if self.hard_example_sampler is None:
+            self._hard_example_state = state_dict['hard_example_sampler']
+        else:
+            self.hard_example_sampler.load_state_dict(state_dict['hard_example_sampler'])
+
+    def get_image_to_tensor_transforms(self) -> List[Callable]:
+        """
+        Returns the transformations which convert an image into the tensor of a sample. Without `uint8_batches`
+        these are `ToTensor` and `Normalize` with the `mean` and `std` of the datamodule, otherwise the image is
+        converted into an uint8 tensor and normalized by the task.
+
+        :return: the transformations
+        :rtype: List[Callable]
+        """
+        if self.uint8_batches:
+            return [ToUint8Tensor()]
+        return [transforms.ToTensor(), transforms.Normalize(mean=self.mean, std=self.std)]
+
     def _check_attributes(self):
         """
         Checks if all attributes are set correctly.
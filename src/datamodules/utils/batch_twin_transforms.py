@@ -0,0 +1,128 @@
+"""
+Twin transforms for whole batches. They are applied by the task to the (image, gt) batches after the transfer to
+the device (see :meth:`AbstractTask.on_after_batch_transfer`) instead of per sample in the DataLoader workers, so the
+augmentation runs with the intra-op threads of torch (or on the GPU) and does not scale with the number of workers.
+
+The transforms are called with the normalized float image batch (NxCxHxW) and the other elements of the batch.
+Geometric transforms are applied with the same random parameters to the image and to every target which has the
+spatial size of the image (e.g. the gt NxHxW and the mask of DivaHisDB), other targets (e.g. class labels) are
+returned unchanged. Every sample of the batch draws its own parameters. The batch tensors are modified in place.
+"""
+from typing import Callable, List, Optional, Tuple
+
+import torch
+from torch import Tensor
+
+
+class BatchTwinCompose(object):
+    """
+    Composes several batch twin transforms together.
+
+    :param transforms: List of batch twin transforms to compose.
+    :type transforms: List[Callable]
+    """
+
+    def __init__(self, transforms: List[Callable]):
+        self.transforms = transforms
+
+    def __call__(self, img: Tensor, *targets: Tensor) -> Tuple[Tensor, ...]:
+        for t in self.transforms:
+            img, *targets = t(img, *targets)
+        return (img, *targets)
+
+
+def _is_spatial_target(img: Tensor, target) -> bool:
+    return torch.is_tensor(target) and target.dim() >= 3 and target.shape[-2:] == img.shape[-2:]
+
+
+def _transform_samples(tensor: Tensor, indices: Tensor, transform: Callable[[Tensor], Tensor]) -> None:
+    if len(indices) > 0:
+        tensor[indices] = transform(tensor[indices])
+
+
+class BatchRandomFlip(object):
+    """
+    Flips every sample of the batch horizontally and/or vertically with the given probabilities.
+
+    :param horizontal: probability of a horizontal flip
+    :type horizontal: float
+    :param vertical: probability of a vertical flip
+    :type vertical: float
+    """
+
+    def __init__(self, horizontal: float = 0.5, vertical: float = 0.0):
+        self.horizontal = horizontal
+        self.vertical = vertical
+
+    def __call__(self, img: Tensor, *targets: Tensor) -> Tuple[Tensor, ...]:
+        spatial_targets = [t for t in targets if _is_spatial_target(img, t)]
+        for probability, dim in [(self.horizontal, -1), (self.vertical, -2)]:
+            if probability <= 0:
+                continue
+            indices = torch.nonzero(torch.rand(img.shape[0], device=img.device) < probability).flatten()
+            for tensor in [img, *spatial_targets]:
+                _transform_samples(tensor, indices.to(tensor.device), lambda x: x.flip(dim))
+        return (img, *targets)
+
+
+class BatchRandomRightAngleRotation(object):
+    """
+    Rotates every sample of the batch by an angle drawn from the list of angles (multiples of 90 degrees, counter
+    clockwise). Angles of 90 and 270 degrees need square samples.
+
+    :param angle_list: the angles to choose from, defaults to [0, 90, 180, 270]
+    :type angle_list: Optional[List[int]]
+    """
+
+    def __init__(self, angle_list: Optional[List[int]] = None):
+        if angle_list is None:
+            angle_list = [0, 90, 180, 270]
+        if any(angle % 90 != 0 for angle in angle_list):
+            raise ValueError(f'The angles have to be multiples of 90 degrees ({angle_list})')
+        self.angles = angle_list
+
+    def __call__(self, img: Tensor, *targets: Tensor) -> Tuple[Tensor, ...]:
+        rotations = [(angle // 90) % 4 for angle in self.angles]
+        if img.shape[-1] != img.shape[-2] and any(k % 2 == 1 for k in rotations):
+            raise ValueError(f'Rotations by 90 or 270 degrees need square samples (got {tuple(img.shape[-2:])})')
+
+        spatial_targets = [t for t in targets if _is_spatial_target(img, t)]
+        choices = torch.randint(low=0, high=len(rotations), size=(img.shape[0],), device=img.device)
+        for i, k in enumerate(rotations):
+            if k == 0:
+                continue
+            indices = torch.nonzero(choices == i).flatten()
+            for tensor in [img, *spatial_targets]:
+                _transform_samples(tensor, indices.to(tensor.device), lambda x: torch.rot90(x, k=k, dims=(-2, -1)))
+        return (img, *targets)
+
+
+class BatchColorJitter(object):
+    """
+    Randomly changes the brightness and the contrast of every sample of the batch. Only the image is changed.
+
+    As the images are normalized, the brightness is shifted by a value from [-brightness, brightness] (in standard
+    deviations of the dataset) and the contrast is scaled around the mean of every channel of the sample by a factor
+    from [1 - contrast, 1 + contrast].
+
+    :param brightness: maximal shift of the brightness
+    :type brightness: float
+    :param contrast: maximal change of the contrast factor
+    :type contrast: float
+    """
+
+    def __init__(self, brightness: float = 0.0, contrast: float = 0.0):
+        if brightness < 0 or not 0 <= contrast <= 1:
+            raise ValueError(f'brightness has to be >= 0 and contrast in [0, 1] (got {brightness}, {contrast})')
+        self.brightness = brightness
+        self.contrast = contrast
+
+    def __call__(self, img: Tensor, *targets: Tensor) -> Tuple[Tensor, ...]:
+        shape = (img.shape[0],) + (1,) * (img.dim() - 1)
+        if self.contrast > 0:
+            factors = 1 + (torch.rand(shape, device=img.device, dtype=img.dtype) * 2 - 1) * self.contrast
+            mean = img.mean(dim=(-2, -1), keepdim=True)
+            img.sub_(mean).mul_(factors).add_(mean)
+        if self.brightness > 0:
+            img.add_((torch.rand(shape, device=img.device, dtype=img.dtype) * 2 - 1) * self.brightness)
+        return (img, *targets)
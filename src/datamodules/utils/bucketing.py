@@ -0,0 +1,205 @@
+"""
+Training on pages of different sizes. The pages are grouped into buckets of a similar aspect ratio and every batch
+is drawn from one bucket (see :class:`AspectRatioBucketSampler`), so :func:`pad_collate` just pads the pages of a
+batch to the largest page of the batch. The collated batch contains a mask of the valid (not padded) pixels which the
+tasks use to leave the padding out of the loss and the metrics.
+"""
+import math
+from pathlib import Path
+from typing import Any, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch import Tensor
+from torch.utils.data import DistributedSampler
+from torch.utils.data.dataloader import default_collate
+
+from src.datamodules.utils.statistics_index import update_statistics_index
+
+
+def get_page_sizes(root: Path, file_names_data: Sequence[Union[str, Path]], workers: int = 8) -> np.ndarray:
+    """
+    Returns the size of every page with the statistics index of the dataset (see
+    `src/datamodules/utils/statistics_index.py`), so the pages are just read if they are not yet indexed. Under an
+    initialized process group every rank has to call this function.
+
+    :param root: root folder of the dataset (location of the index)
+    :type root: Path
+    :param file_names_data: paths to the data images
+    :type file_names_data: Sequence[Union[str, Path]]
+    :param workers: number of worker processes to read the files which are not yet indexed
+    :type workers: int
+    :return: width and height of every page (N x 2)
+    :rtype: np.ndarray
+    """
+    index, keys_data, _ = update_statistics_index(root=root, file_names_data=file_names_data, workers=workers)
+    sizes = index.get_statistics(keys_data=keys_data).sizes
+    return np.asarray(sizes, dtype=np.int64).reshape(len(keys_data), 2)
+
+
+class AspectRatioBucketSampler(DistributedSampler):
+    """
+    Orders the pages of a dataset such that every `batch_size` consecutive pages belong to one bucket of pages with a
+    similar aspect ratio. The range of the (logarithmic) aspect ratios is split into `num_buckets` intervals of the same
+    width. Within a bucket the pages are shuffled and then sorted by their area in pools of `pool_batches` batches,
+    which keeps the padding within a batch small and still mixes the batches every epoch. Finally the order of the
+    batches is shuffled.
+
+    The last batch of a bucket is filled up with pages of the same bucket, or dropped with `drop_last`, so the data
+    loader (with the same `batch_size` and `shuffle=False`) cuts the order exactly into these batches. Every rank gets
+    every `num_replicas`-th batch. Like :class:`PageLocalitySampler` it is not replaced by Lightning.
+
+    :param page_sizes: Width and height of each page of the dataset (see :func:`get_page_sizes`)
+    :type page_sizes: Sequence[Tuple[int, int]]
+    :param batch_size: Batch size of the data loader
+    :type batch_size: int
+    :param num_buckets: Number of aspect ratio buckets
+    :type num_buckets: int
+    :param pool_batches: Number of batches whose pages are sorted by area together
+    :type pool_batches: int
+    :param num_replicas: Number of processes taking part in the training
+    :type num_replicas: int
+    :param rank: Rank of the current process
+    :type rank: int
+    :param shuffle: If False, the pages of every bucket are sorted by area and the batches are not shuffled
+    :type shuffle: bool
+    :param seed: Seed of the shuffling, it is combined with the epoch (see :meth:`set_epoch`)
+    :type seed: int
+    :param drop_last: If True, incomplete batches are dropped, otherwise they are filled up with pages of their bucket
+        (and the epoch with batches from its beginning to make it evenly divisible across the ranks)
+    :type drop_last: bool
+    """
+
+    def __init__(self, page_sizes: Sequence[Tuple[int, int]], batch_size: int, num_buckets: int = 4,
+                 pool_batches: int = 4, num_replicas: int = 1, rank: int = 0, shuffle: bool = True, seed: int = 0,
+                 drop_last: bool = False):
+        """
+        Constructor method for the AspectRatioBucketSampler class.
+        """
+        page_sizes = np.asarray(page_sizes, dtype=np.int64)
+        if page_sizes.ndim != 2 or page_sizes.shape[1] != 2:
+            raise ValueError(f'The page sizes have to be of shape (N x 2) (shape={page_sizes.shape})')
+        if batch_size < 1 or num_buckets < 1 or pool_batches < 1:
+            raise ValueError(f'The batch size, the number of buckets and the pool size have to be at least 1 '
+                             f'(batch_size={batch_size}, num_buckets={num_buckets}, pool_batches={pool_batches})')
+        super().__init__(dataset=page_sizes, num_replicas=num_replicas, rank=rank, shuffle=shuffle, seed=seed,
+                         drop_last=drop_last)
+
+        self.page_sizes = page_sizes
+        self.batch_size = batch_size
+        self.pool_batches = pool_batches
+        self.areas = page_sizes[:, 0] * page_sizes[:, 1]
+        self.buckets = self.get_buckets(page_sizes=page_sizes, num_buckets=num_buckets)
+
+        # the number of batches is the same in every epoch
+        if drop_last:
+            num_batches = sum(len(bucket) // batch_size for bucket in self.buckets)
+            self.num_batches = num_batches // num_replicas
+        else:
+            num_batches = sum(math.ceil(len(bucket) / batch_size) for bucket in self.buckets)
+            self.num_batches = math.ceil(num_batches / num_replicas)
+        if self.num_batches == 0:
+            raise ValueError(f'The epoch is empty, no bucket has a full batch for every rank '
+                             f'(batch_size={batch_size}, num_replicas={num_replicas})')
+        self.total_size = self.num_batches * num_replicas * batch_size
+        self.num_samples = self.num_batches * batch_size
+
+    @staticmethod
+    def get_buckets(page_sizes: np.ndarray, num_buckets: int) -> List[np.ndarray]:
+        """
+        Splits the pages into buckets of a similar aspect ratio (height / width).
+
+        :param page_sizes: Width and height of each page (N x 2)
+        :type page_sizes: np.ndarray
+        :param num_buckets: Number of buckets
+        :type num_buckets: int
+        :return: the indices of the pages of every (not empty) bucket
+        :rtype: List[np.ndarray]
+        """
+        log_ratios = np.log(page_sizes[:, 1] / page_sizes[:, 0])
+        edges = np.linspace(log_ratios.min(), log_ratios.max(), num_buckets + 1)[1:-1]
+        bucket_ids = np.searchsorted(edges, log_ratios, side='right')
+        return [np.flatnonzero(bucket_ids == bucket_id) for bucket_id in np.unique(bucket_ids)]
+
+    def _get_batches(self, generator: torch.Generator) -> List[np.ndarray]:
+        batches = []
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = bucket[torch.randperm(len(bucket), generator=generator).numpy()]
+                pool_size = self.pool_batches * self.batch_size
+                pools = [bucket[start:start + pool_size] for start in range(0, len(bucket), pool_size)]
+                bucket = np.concatenate([pool[np.argsort(self.areas[pool], kind='stable')] for pool in pools])
+            else:
+                bucket = bucket[np.argsort(self.areas[bucket], kind='stable')]
+
+            num_full_batches = len(bucket) // self.batch_size
+            batches.extend(np.split(bucket[:num_full_batches * self.batch_size], num_full_batches)
+                           if num_full_batches > 0 else [])
+            remainder = bucket[num_full_batches * self.batch_size:]
+            if len(remainder) > 0 and not self.drop_last:
+                batches.append(np.resize(np.concatenate([remainder, bucket]), self.batch_size))
+        return batches
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+
+        batches = self._get_batches(generator=generator)
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+
+        num_batches = self.num_batches * self.num_replicas
+        if self.drop_last:
+            batches = batches[:num_batches]
+        else:
+            batches += (batches * math.ceil(num_batches / len(batches)))[:num_batches - len(batches)]
+        assert len(batches) == num_batches
+
+        return iter(np.concatenate(batches[self.rank::self.num_replicas]).tolist())
+
+    def get_padding_fraction(self) -> float:
+        """
+        :return: the share of padded pixels in the batches of the current epoch (over all the ranks)
+        :rtype: float
+        """
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        padded_pixels = valid_pixels = 0
+        for batch in self._get_batches(generator=generator):
+            width, height = self.page_sizes[batch].max(axis=0)
+            padded_pixels += len(batch) * width * height
+            valid_pixels += self.areas[batch].sum()
+        return 1 - valid_pixels / padded_pixels
+
+
+def pad_collate(batch: List[Sequence[Any]]) -> List[Any]:
+    """
+    Collate function for pages of different sizes. The first element of every sample is the image (C x H x W), the
+    second one the gt (H x W) if it is a tensor of the same size. Both are padded at the bottom and on the right to
+    the largest page of the batch (with zeros) and the mask of the valid pixels (B x H x W) is inserted after them.
+    The other elements (e.g. the index of the sample) are collated as usual.
+
+    :param batch: the samples of the batch
+    :type batch: List[Sequence[Any]]
+    :return: the collated batch (image, [gt,] mask, ...)
+    :rtype: List[Any]
+    """
+    images = [sample[0] for sample in batch]
+    height = max(image.shape[-2] for image in images)
+    width = max(image.shape[-1] for image in images)
+    num_padded = 1
+    if len(batch[0]) > 1 and all(torch.is_tensor(sample[1]) and sample[1].shape[-2:] == sample[0].shape[-2:]
+                                 for sample in batch):
+        num_padded = 2
+
+    padded = [torch.stack([_pad(sample[i], height=height, width=width) for sample in batch])
+              for i in range(num_padded)]
+    mask = torch.stack([_pad(torch.ones(image.shape[-2:], dtype=torch.bool), height=height, width=width)
+                        for image in images])
+    rest = default_collate([tuple(sample[num_padded:]) for sample in batch]) if len(batch[0]) > num_padded else []
+    return [*padded, mask, *rest]
+
+
+def _pad(tensor: Tensor, height: int, width: int) -> Tensor:
+    return F.pad(tensor, (0, width - tensor.shape[-1], 0, height - tensor.shape[-2]))
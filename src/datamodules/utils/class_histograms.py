@@ -0,0 +1,109 @@
+"""
+Per-crop class histograms of the cropped datasets (e.g. for the :class:`ClassAwareSampler`).
+
+The histogram of a crop is the number of its pixels per class (in the order of the class encodings). For the crop
+files the pixels per class of every gt file are taken from the statistics index of the dataset (see
+`src/datamodules/utils/statistics_index.py`), so the gt files are only read once and the histograms of further
+trainings on the same dataset are available without a scan. The packed and tiled formats already contain the integer
+encoded ground truth, whose classes are counted directly.
+
+The histograms also tag the blank crops (e.g. crops of the parchment margin with a single class), which can be skipped
+during the training (see :func:`get_blank_crops`).
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+from src.datamodules.utils.statistics_index import update_statistics_index
+
+
+def count_classes(gt: np.ndarray, num_classes: int) -> np.ndarray:
+    """
+    Counts the pixels per class of an integer encoded ground truth. Pixels with an unknown class (-1) are ignored.
+
+    :param gt: integer encoded ground truth
+    :type gt: np.ndarray
+    :param num_classes: number of classes
+    :type num_classes: int
+    :return: the number of pixels per class
+    :rtype: np.ndarray
+    """
+    return np.bincount(np.asarray(gt, dtype=np.int64).ravel() + 1, minlength=num_classes + 1)[1:num_classes + 1]
+
+
+def get_class_histograms_encoded(gts: Iterable[np.ndarray], num_classes: int) -> np.ndarray:
+    """
+    Computes the class histograms of integer encoded ground truth crops.
+
+    :param gts: the integer encoded ground truth of every crop
+    :type gts: Iterable[np.ndarray]
+    :param num_classes: number of classes
+    :type num_classes: int
+    :return: the pixels per class of every crop (N x num_classes)
+    :rtype: np.ndarray
+    """
+    histograms = [count_classes(gt=gt, num_classes=num_classes) for gt in gts]
+    return np.asarray(histograms, dtype=np.int64).reshape(len(histograms), num_classes)
+
+
+def get_class_histograms_indexed(root: Path, file_names_gt: Sequence[Union[str, Path]], gt_format: str,
+                                 get_class_counts_func: Callable[[Union[str, Path]], Dict[Any, int]],
+                                 num_classes: int, get_class_id_func: Callable[[Any], Optional[int]],
+                                 workers: int = 8) -> np.ndarray:
+    """
+    Computes the class histograms of gt files with the statistics index of the dataset. Only the files which are not
+    yet indexed are read. Under an initialized process group every rank has to call this function.
+
+    :param root: root folder of the dataset (location of the index)
+    :type root: Path
+    :param file_names_gt: paths to the gt crops
+    :type file_names_gt: Sequence[Union[str, Path]]
+    :param gt_format: name of the gt format (e.g. `rgb`)
+    :type gt_format: str
+    :param get_class_counts_func: function returning the number of pixels per class key of a gt image
+    :type get_class_counts_func: Callable[[Union[str, Path]], Dict[Any, int]]
+    :param num_classes: number of classes
+    :type num_classes: int
+    :param get_class_id_func: function returning the class of a class key of the gt format (e.g. of a color), the
+        pixels are ignored if it returns None
+    :type get_class_id_func: Callable[[Any], Optional[int]]
+    :param workers: number of worker processes to read the files which are not yet indexed
+    :type workers: int
+    :return: the pixels per class of every crop (N x number of classes)
+    :rtype: np.ndarray
+    """
+    index, _, keys_gt = update_statistics_index(root=root, file_names_gt=file_names_gt, gt_format=gt_format,
+                                                get_class_counts_func=get_class_counts_func, workers=workers)
+    class_ids = {}
+    histograms = np.zeros((len(keys_gt), num_classes), dtype=np.int64)
+    for i, class_counts in enumerate(index.get_class_counts(keys_gt=keys_gt, gt_format=gt_format)):
+        for class_key, count in class_counts.items():
+            if class_key not in class_ids:
+                class_ids[class_key] = get_class_id_func(class_key)
+            if class_ids[class_key] is not None:
+                histograms[i, class_ids[class_key]] += count
+    return histograms
+
+
+def get_blank_crops(class_histograms: np.ndarray, threshold: float = 0.98) -> np.ndarray:
+    """
+    Tags the near-uniform crops, whose most frequent class covers at least `threshold` of their pixels. Crops without
+    a pixel of a known class are blank as well.
+
+    :param class_histograms: the pixels per class of every crop (N x num_classes)
+    :type class_histograms: np.ndarray
+    :param threshold: minimal share of the most frequent class of a blank crop (between 0 and 1)
+    :type threshold: float
+    :return: True for every blank crop
+    :rtype: np.ndarray
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f'The threshold has to be in (0, 1] (threshold={threshold})')
+    class_histograms = np.asarray(class_histograms)
+    if class_histograms.ndim != 2:
+        raise ValueError(f'The class histograms have to be of shape (N x number of classes) '
+                         f'(shape={class_histograms.shape})')
+    if class_histograms.shape[1] == 0:
+        return np.ones(len(class_histograms), dtype=bool)
+    return class_histograms.max(axis=1) >= threshold * class_histograms.sum(axis=1)
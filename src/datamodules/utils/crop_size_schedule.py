@@ -0,0 +1,70 @@
+"""
+Crop size curriculum of the cropped datamodules. The training starts on small crops with large batches and grows to
+the full crop size over the epochs, so the first epochs are a lot faster. The validation and test crops keep the full
+size.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+STAGE_KEYS = {'epochs', 'crop_size', 'batch_size'}
+
+
+class CropSizeSchedule:
+    """
+    The stages of a crop size curriculum. Every stage trains `epochs` epochs on random crops of `crop_size` with a
+    batch size of `batch_size`. Without a batch size the stage gets the full batch size scaled to the same number of
+    pixels per batch. After the last stage the training continues with the full crop size and batch size.
+
+    :param stages: the stages with `epochs`, `crop_size` and optionally `batch_size`
+    :type stages: Sequence[Dict]
+    :param crop_size: the full crop size (of the validation and test crops)
+    :type crop_size: int
+    :param batch_size: the batch size of the full crop size
+    :type batch_size: int
+    """
+
+    def __init__(self, stages: Sequence[Dict], crop_size: int, batch_size: int):
+        self.crop_size = crop_size
+        self.batch_size = batch_size
+
+        # first epoch, crop size and batch size of every stage
+        self.stages: List[Tuple[int, int, int]] = []
+        first_epoch = 0
+        for stage in stages:
+            unknown_keys = set(stage) - STAGE_KEYS
+            if unknown_keys:
+                raise ValueError(f'Unknown keys of a crop size stage: {", ".join(sorted(unknown_keys))} '
+                                 f'(supported: {", ".join(sorted(STAGE_KEYS))})')
+            if 'epochs' not in stage or 'crop_size' not in stage:
+                raise ValueError(f'A crop size stage needs the number of epochs and the crop size (stage={stage})')
+            epochs, stage_crop_size = int(stage['epochs']), int(stage['crop_size'])
+            if epochs < 1:
+                raise ValueError(f'A crop size stage needs at least one epoch (epochs={epochs})')
+            if not 0 < stage_crop_size <= crop_size:
+                raise ValueError(f'The crop size of a stage has to be between 1 and the full crop size {crop_size} '
+                                 f'(crop_size={stage_crop_size})')
+            stage_batch_size = stage.get('batch_size')
+            if stage_batch_size is None:
+                stage_batch_size = max(1, int(batch_size * (crop_size / stage_crop_size) ** 2))
+            self.stages.append((first_epoch, stage_crop_size, int(stage_batch_size)))
+            first_epoch += epochs
+        self.stages.append((first_epoch, crop_size, batch_size))
+
+    def get_stage(self, epoch: int) -> Tuple[int, int]:
+        """
+        :param epoch: the current epoch
+        :type epoch: int
+        :return: the crop size and the batch size of the epoch
+        :rtype: Tuple[int, int]
+        """
+        crop_size, batch_size = self.stages[0][1:]
+        for first_epoch, stage_crop_size, stage_batch_size in self.stages:
+            if epoch >= first_epoch:
+                crop_size, batch_size = stage_crop_size, stage_batch_size
+        return crop_size, batch_size
+
+    def get_sizes(self) -> List[Tuple[int, int]]:
+        """
+        :return: the different crop sizes and batch sizes of the schedule (including the full size)
+        :rtype: List[Tuple[int, int]]
+        """
+        return list(dict.fromkeys((crop_size, batch_size) for _, crop_size, batch_size in self.stages))
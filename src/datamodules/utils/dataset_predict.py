@@ -1,13 +1,13 @@
 from glob import glob
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import torch.utils.data as data
 from torch import is_tensor, Tensor
-from torchvision.datasets.folder import pil_loader
 from torchvision.transforms import ToTensor
 from PIL import Image
 
+from src.datamodules.utils.decoders import get_decoder, get_image_size, load_image
 from src.datamodules.utils.misc import ImageDimensions, get_output_file_list
 from src.utils import utils
 
@@ -20,18 +20,22 @@ class DatasetPredict(data.Dataset):
 
     :param image_path_list: list of image paths
     :type image_path_list: List[str]
-    :param image_dims: image dimensions
-    :type image_dims: ImageDimensions
+    :param image_dims: image dimensions, if None the images can have any size
+    :type image_dims: Optional[ImageDimensions]
     :param image_transform: image transformation
     :type image_transform: Callable
     :param target_transform: target transformation
     :type target_transform: Callable
     :param twin_transform: twin transformation
     :type twin_transform: Callable
+    :param decode_backend: backend which decodes the image files into uint8 arrays (`pil`, `torchvision` or
+        `numpy`, see :func:`get_decoder`), None loads PIL images with `pil_loader`
+    :type decode_backend: Optional[str]
     """
 
-    def __init__(self, image_path_list: List[str], image_dims: ImageDimensions,
-                 image_transform=None, target_transform=None, twin_transform=None):
+    def __init__(self, image_path_list: List[str], image_dims: Optional[ImageDimensions],
+                 image_transform=None, target_transform=None, twin_transform=None,
+                 decode_backend: Optional[str] = None):
         """
         Constructor method for the DatasetPredict class.
         """
@@ -41,6 +45,7 @@ class DatasetPredict(data.Dataset):
         self.output_file_list = get_output_file_list(image_path_list=self.image_path_list)
 
         self.image_dims = image_dims
+        self.decoder = get_decoder(decode_backend=decode_backend)
 
         # transformations
         self.image_transform = image_transform
@@ -85,9 +90,10 @@ class DatasetPredict(data.Dataset):
         :returns: The image at the given index
         :rtype: Image
         """
-        data_img = pil_loader(self.image_path_list[index])
+        data_img = load_image(self.image_path_list[index], decoder=self.decoder)
 
-        assert data_img.height == self.image_dims.height and data_img.width == self.image_dims.width
+        if self.image_dims is not None:
+            assert get_image_size(data_img) == (self.image_dims.width, self.image_dims.height)
 
         return data_img
 
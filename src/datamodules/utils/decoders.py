@@ -0,0 +1,158 @@
+"""
+Decode backends for the image files of the datasets.
+
+By default the datasets load every file with torchvision's `pil_loader` (or `pil_loader_gif`), which returns a PIL
+image that is then converted into an array by `ToTensor`. A :class:`ImageDecoder` decodes the files into uint8 arrays
+(HxWx3 for RGB, HxW palette indices for P) instead, without the intermediate PIL image. The backends are:
+
+- `pil`: PIL decodes the file and the pixels are converted into an array.
+- `torchvision`: `torchvision.io` decodes JPEG and PNG files straight into uint8 tensors (libjpeg-turbo / libpng),
+  the returned array shares the memory of the tensor. Other formats (e.g. GIF) are decoded with PIL.
+- `numpy`: palette images (e.g. the GIF ground truth) are decoded into their palette indices only and the colors
+  are looked up with NumPy, instead of converting the whole image with PIL.
+
+The transformations of the datamodules (`ToTensor`, :class:`TwinRandomCrop`, the ground truth encodings) accept the
+arrays as well.
+"""
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+from torchvision.datasets.folder import pil_loader
+from torchvision.io import ImageReadMode, decode_image, read_file
+
+from src.datamodules.utils.misc import pil_loader_gif
+
+TORCHVISION_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class ImageDecoder:
+    """
+    Base class of the decode backends. Decodes image files into uint8 arrays, HxWx3 for the mode `RGB` and HxW palette
+    indices for the mode `P`.
+    """
+    name = None
+
+    def decode(self, path: Union[Path, str], mode: str = 'RGB') -> np.ndarray:
+        """
+        Decodes an image file.
+
+        :param path: path to the image file
+        :type path: Union[Path, str]
+        :param mode: `RGB` for the colors or `P` for the palette indices of a palette image
+        :type mode: str
+        :return: the decoded image (HxWx3 or HxW, uint8)
+        :rtype: np.ndarray
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _decode_pil(path: Union[Path, str], mode: str) -> np.ndarray:
+        with open(path, 'rb') as f:
+            img = Image.open(f)
+            return np.array(img.convert(mode))
+
+
+class PILDecoder(ImageDecoder):
+    """
+    Decodes the images with PIL (same pixels as `pil_loader` and `pil_loader_gif`).
+    """
+    name = 'pil'
+
+    def decode(self, path: Union[Path, str], mode: str = 'RGB') -> np.ndarray:
+        return self._decode_pil(path=path, mode=mode)
+
+
+class TorchvisionDecoder(ImageDecoder):
+    """
+    Decodes JPEG and PNG files in the mode `RGB` with `torchvision.io`. Other formats and the mode `P` are decoded
+    with PIL.
+    """
+    name = 'torchvision'
+
+    def decode(self, path: Union[Path, str], mode: str = 'RGB') -> np.ndarray:
+        if mode != 'RGB' or Path(path).suffix.lower() not in TORCHVISION_EXTENSIONS:
+            return self._decode_pil(path=path, mode=mode)
+
+        pixels = decode_image(read_file(str(path)), mode=ImageReadMode.RGB)
+        return pixels.permute(1, 2, 0).numpy()
+
+
+class NumpyPaletteDecoder(ImageDecoder):
+    """
+    Decodes palette images (e.g. GIF files) into their palette indices and looks the colors up with NumPy. Images
+    without a palette are decoded with PIL.
+    """
+    name = 'numpy'
+
+    def decode(self, path: Union[Path, str], mode: str = 'RGB') -> np.ndarray:
+        with open(path, 'rb') as f:
+            img = Image.open(f)
+            if img.mode != 'P':
+                return self._decode_pil(path=path, mode=mode)
+            indices = np.array(img)
+            palette = img.getpalette()
+
+        if mode == 'P':
+            return indices
+
+        colors = np.zeros((256, 3), dtype=np.uint8)
+        palette_colors = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)[:256]
+        colors[:len(palette_colors)] = palette_colors
+        return np.take(colors, indices, axis=0)
+
+
+DECODE_BACKENDS = {decoder.name: decoder for decoder in [PILDecoder, TorchvisionDecoder, NumpyPaletteDecoder]}
+
+
+def get_decoder(decode_backend: Optional[str] = None) -> Optional[ImageDecoder]:
+    """
+    Creates the decoder of a backend.
+
+    :param decode_backend: name of the backend (`pil`, `torchvision` or `numpy`), None to load PIL images
+    :type decode_backend: Optional[str]
+    :return: the decoder or None
+    :rtype: Optional[ImageDecoder]
+    """
+    if decode_backend is None:
+        return None
+    if decode_backend not in DECODE_BACKENDS:
+        raise ValueError(f'Unknown decode backend "{decode_backend}" '
+                         f'(supported: {", ".join(DECODE_BACKENDS.keys())})')
+    return DECODE_BACKENDS[decode_backend]()
+
+
+def load_image(path: Union[Path, str], decoder: Optional[ImageDecoder],
+               mode: str = 'RGB') -> Union[Image.Image, np.ndarray]:
+    """
+    Loads an image with the decoder, or as PIL image with `pil_loader` / `pil_loader_gif` if there is no decoder.
+
+    :param path: path to the image file
+    :type path: Union[Path, str]
+    :param decoder: the decoder of the dataset or None
+    :type decoder: Optional[ImageDecoder]
+    :param mode: `RGB` or `P`
+    :type mode: str
+    :return: the image as PIL image or uint8 array
+    :rtype: Union[Image.Image, np.ndarray]
+    """
+    if decoder is not None:
+        return decoder.decode(path, mode=mode)
+    if mode == 'P':
+        return pil_loader_gif(path)
+    return pil_loader(str(path))
+
+
+def get_image_size(img: Union[Image.Image, np.ndarray]) -> Tuple[int, int]:
+    """
+    Returns the size of a PIL image or of a decoded array (HxW or HxWxC).
+
+    :param img: the image
+    :type img: Union[Image.Image, np.ndarray]
+    :return: width and height of the image (like `Image.size`)
+    :rtype: Tuple[int, int]
+    """
+    if isinstance(img, np.ndarray):
+        return img.shape[1], img.shape[0]
+    return img.size
@@ -0,0 +1,122 @@
+"""
+Helpers to compute the analytics of a dataset once for all the processes of a (ddp) run.
+
+If the default process group of `torch.distributed` is initialized (e.g. under the `ddp` strategy, also with the
+CPU `gloo` backend), the ranks split the files, exchange their statistics and just rank zero writes the files. If not,
+the processes which use the same dataset (e.g. the ranks before the process group is set up or several runs on the
+same machine) are serialized with a file lock, so the first one computes the analytics and the others load them.
+"""
+import functools
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, List, Union
+
+import torch.distributed as dist
+
+from src.utils import utils
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (not available on windows)
+    fcntl = None
+
+ANALYTICS_LOCK_FILENAME = 'analytics.lock'
+
+log = utils.get_logger(__name__)
+
+
+def is_distributed() -> bool:
+    """
+    :return: True if the default process group is initialized and has more than one rank
+    :rtype: bool
+    """
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def get_rank() -> int:
+    """
+    :return: the rank of this process in the default process group (0 if not distributed)
+    :rtype: int
+    """
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    """
+    :return: the number of ranks of the default process group (1 if not distributed)
+    :rtype: int
+    """
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def all_gather_object(obj: Any) -> List[Any]:
+    """
+    Gathers a picklable object of every rank.
+
+    :param obj: the object of this rank
+    :type obj: Any
+    :return: the objects of all the ranks (in the order of the ranks), just the object if not distributed
+    :rtype: List[Any]
+    """
+    if not is_distributed():
+        return [obj]
+    objects = [None] * get_world_size()
+    dist.all_gather_object(objects, obj)
+    return objects
+
+
+def barrier():
+    """
+    Waits for all the ranks (nothing happens if not distributed).
+    """
+    if is_distributed():
+        dist.barrier()
+
+
+@contextmanager
+def file_lock(lock_path: Union[str, Path]):
+    """
+    Exclusive lock on a file which serializes the processes which enter it with the same path. If the file can not be
+    created (e.g. read-only dataset) or locked (e.g. on windows), the context is entered without a lock.
+
+    :param lock_path: path to the lock file (created if it does not exist)
+    :type lock_path: Union[str, Path]
+    """
+    fd = None
+    try:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    except OSError as e:
+        log.debug(f'Could not create the lock file {lock_path}: {e}')
+    try:
+        if fd is not None and fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fd is not None:
+            # closing the file releases the lock
+            os.close(fd)
+
+
+def synchronize_analytics(func: Callable) -> Callable:
+    """
+    Decorator for the `get_analytics` functions (their first argument is the root of the dataset). Under an
+    initialized process group every rank has to call the function, the ranks compute the statistics together
+    (see :func:`compute_image_statistics_indexed`) and wait for rank zero to write the analytics files. Otherwise the
+    call holds the lock file `analytics.lock` in the root of the dataset, so the analytics are computed once.
+
+    :param func: the get analytics function
+    :type func: Callable
+    :return: the synchronized function
+    :rtype: Callable
+    """
+    @functools.wraps(func)
+    def wrapper(input_path: Path, *args, **kwargs):
+        if is_distributed():
+            result = func(input_path, *args, **kwargs)
+            barrier()
+            return result
+        with file_lock(Path(input_path) / ANALYTICS_LOCK_FILENAME):
+            return func(input_path, *args, **kwargs)
+
+    return wrapper
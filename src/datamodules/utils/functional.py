@@ -1,3 +1,5 @@
+from typing import Sequence
+
 import torch
 
 
@@ -11,3 +13,69 @@ def argmax_onehot(tensor: torch.Tensor):
     :rtype: torch.Tensor
     """
     return torch.LongTensor(torch.argmax(tensor, dim=0))
+
+
+def normalize_uint8(tensor: torch.Tensor, mean: Sequence[float], std: Sequence[float]) -> torch.Tensor:
+    """
+    Converts an uint8 image tensor (CxHxW or a batch NxCxHxW with values 0-255) into floats and normalizes it with
+    the mean and standard deviation of the dataset. Gives the same result as `ToTensor` followed by `Normalize`.
+
+    :param tensor: The uint8 image tensor
+    :type tensor: torch.Tensor
+    :param mean: The mean of every channel (range 0-1)
+    :type mean: Sequence[float]
+    :param std: The standard deviation of every channel (range 0-1)
+    :type std: Sequence[float]
+    :returns: The normalized float tensor
+    :rtype: torch.Tensor
+    """
+    mean = torch.as_tensor(mean, dtype=torch.float32, device=tensor.device).view(-1, 1, 1)
+    std = torch.as_tensor(std, dtype=torch.float32, device=tensor.device).view(-1, 1, 1)
+    return tensor.float().div_(255).sub_(mean).div_(std)
+
+
+def to_color_values(tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Returns the color values (0-255) of a ground truth tensor as int32. Float tensors (from `ToTensor`, range 0.0-1.0,
+    so multiples of 1/255) are scaled by 255, integer tensors (e.g. uint8 from `ToUint8Tensor`) are taken as they are.
+
+    :param tensor: The ground truth tensor
+    :type tensor: torch.Tensor
+    :returns: The color values
+    :rtype: torch.Tensor
+    """
+    if tensor.is_floating_point():
+        return (tensor * 255).int()
+    return tensor.int()
+
+
+def pack_colors(matrix: torch.Tensor) -> torch.Tensor:
+    """
+    Packs the three color channels of a ground truth tensor into one 24-bit integer per pixel
+    (channel 0 << 16 | channel 1 << 8 | channel 2).
+
+    :param matrix: The ground truth tensor of size [3 x ...], float or integer (see :func:`to_color_values`)
+    :type matrix: torch.Tensor
+    :returns: The packed colors of size [...]
+    :rtype: torch.Tensor
+    """
+    values = to_color_values(matrix)
+    return (values[0] << 16) | (values[1] << 8) | values[2]
+
+
+def lookup_packed_colors(packed: torch.Tensor, packed_encodings: torch.Tensor) -> torch.Tensor:
+    """
+    Looks the packed colors up in the packed class encodings with a binary search (`searchsorted`). Colors which are
+    not a class encoding are encoded with -1. If an encoding occurs several times, the last index is used.
+
+    :param packed: The packed colors (see :func:`pack_colors`)
+    :type packed: torch.Tensor
+    :param packed_encodings: The packed class encodings, the index of an encoding is its class
+    :type packed_encodings: torch.Tensor
+    :returns: The class of every color
+    :rtype: torch.LongTensor
+    """
+    sorted_encodings, classes = torch.sort(packed_encodings.to(packed.dtype), stable=True)
+    # the last of several equal encodings is left of the insertion point of `right=True`
+    positions = (torch.searchsorted(sorted_encodings, packed, right=True) - 1).clamp_(min=0)
+    return torch.where(sorted_encodings[positions] == packed, classes[positions], -1)
@@ -1,124 +1,198 @@
-import logging
+from dataclasses import dataclass, field
 from multiprocessing import Pool
 from pathlib import Path
-from typing import List, Tuple, Any, Union
+from typing import List, Tuple, Any, Union, Dict, Callable, Optional, Sequence, Iterator
 
 import numpy as np
 from PIL import Image
-from numpy import ndarray, dtype, floating
 
+from src.utils import utils
 
-def compute_mean_std(file_names: Union[np.ndarray, List[Path]], inmem: bool = False, workers: int = 8) -> Tuple[float, float]:
-    """
-    Computes mean and std of all images present at target folder.
+log = utils.get_logger(__name__)
 
-    :param file_names: List of the file names of the images
-    :type file_names: Union[np.ndarray[str], List[Path]]
-    :param inmem: Specifies whether is should be computed i nan online of offline fashion.
-    :type inmem: bool
-    :param workers: Number of workers to use for the mean/std computation
-    :type workers: int
-    :return: mean and std
-    :rtype: Tuple[float, float]
-    """
-    file_names_np = np.array(list(map(str, file_names)))
-    # Compute mean and std
-    mean, std = _cms_inmem(file_names_np) if inmem else _cms_online(file_names_np, workers)
-    return mean, std
+NUM_CHANNELS = 3
 
 
-def _cms_online(file_names: Union[np.ndarray, List[Path]], workers=4) -> Tuple[float, float]:
+@dataclass
+class ImageStatistics:
     """
-    Computes mean and image_classification deviation in an online fashion.
-    This is useful when the dataset is too big to be allocated in memory.
-
-    :param file_names: List of file names of the dataset
-    :type file_names: Union[np.ndarray[str], List[Path]]
-    :param workers: Number of workers to use for the mean/std computation
-    :type workers: int
-
-    :returns: mean and std
-    :rtype: Tuple[float, float]
+    Statistics of one or several data/gt image pairs, gathered in a single read of the files.
+
+    The channel sums and sums of squares are exact integers over the uint8 values, so the statistics of several files
+    are merged (`+`) without any loss and the mean and std are the same for every order and grouping of the files.
+
+    :param pixel_count: number of pixels of the data images
+    :type pixel_count: int
+    :param channel_sums: sum of the values (0-255) per channel
+    :type channel_sums: List[int]
+    :param channel_squared_sums: sum of the squared values per channel
+    :type channel_squared_sums: List[int]
+    :param class_counts: number of pixels per class key of the gt images (the key depends on the format)
+    :type class_counts: Dict[Any, int]
+    :param sizes: width and height of every data image (in the order of the files)
+    :type sizes: List[Tuple[int, int]]
     """
-    logging.info('Begin computing the mean')
-
-    # Set up a pool of workers
-    pool = Pool(workers + 1)
-
-    # Online mean
-    results = pool.map(_return_mean, file_names)
-    mean_sum = np.sum(np.array(results), axis=0)
-
-    # Divide by number of samples in train set
-    mean = mean_sum / file_names.size
-
-    logging.info('Finished computing the mean')
-    logging.info('Begin computing the std')
-
-    # Online image_classification deviation
-    results = pool.starmap(_return_std, [[item, mean] for item in file_names])
-    std_sum = np.sum(np.array([item[0] for item in results]), axis=0)
-    total_pixel_count = np.sum(np.array([item[1] for item in results]))
-    std = np.sqrt(std_sum / total_pixel_count)
-    logging.info('Finished computing the std')
-
-    # Shut down the pool
-    pool.close()
-
-    return mean, std
-
-
-def _return_mean(image_path: str) -> ndarray:
+    pixel_count: int = 0
+    channel_sums: List[int] = field(default_factory=lambda: [0] * NUM_CHANNELS)
+    channel_squared_sums: List[int] = field(default_factory=lambda: [0] * NUM_CHANNELS)
+    class_counts: Dict[Any, int] = field(default_factory=dict)
+    sizes: List[Tuple[int, int]] = field(default_factory=list)
+
+    def __add__(self, other: 'ImageStatistics') -> 'ImageStatistics':
+        result = ImageStatistics(pixel_count=self.pixel_count, channel_sums=list(self.channel_sums),
+                                 channel_squared_sums=list(self.channel_squared_sums),
+                                 class_counts=dict(self.class_counts), sizes=list(self.sizes))
+        result += other
+        return result
+
+    def __iadd__(self, other: 'ImageStatistics') -> 'ImageStatistics':
+        self.pixel_count += other.pixel_count
+        self.channel_sums = [a + b for a, b in zip(self.channel_sums, other.channel_sums)]
+        self.channel_squared_sums = [a + b for a, b in zip(self.channel_squared_sums, other.channel_squared_sums)]
+        for key, count in other.class_counts.items():
+            self.class_counts[key] = self.class_counts.get(key, 0) + count
+        self.sizes.extend(other.sizes)
+        return self
+
+    @property
+    def mean(self) -> np.ndarray:
+        """
+        :return: mean per channel in the range [0, 1]
+        :rtype: np.ndarray
+        """
+        return np.asarray([s / self.pixel_count for s in self.channel_sums]) / 255.0
+
+    @property
+    def std(self) -> np.ndarray:
+        """
+        :return: standard deviation per channel in the range [0, 1]
+        :rtype: np.ndarray
+        """
+        # n * sum(x^2) - sum(x)^2 is computed with python integers, so there is no cancellation
+        return np.asarray([np.sqrt(self.pixel_count * s2 - s * s) / self.pixel_count
+                           for s, s2 in zip(self.channel_sums, self.channel_squared_sums)]) / 255.0
+
+
+def get_image_statistics(data_path: Optional[Union[str, Path]], gt_path: Optional[Union[str, Path]] = None,
+                         get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]] = None) \
+        -> ImageStatistics:
     """
-    Computes mean of a single image
-
-    :param image_path: Path to the image
-    :type image_path: str
-    :returns: mean
-    :rtype: float
+    Reads a data/gt pair once and returns its statistics.
+
+    :param data_path: path to the data image (None to skip the data)
+    :type data_path: Optional[Union[str, Path]]
+    :param gt_path: path to the gt image (None to skip the gt)
+    :type gt_path: Optional[Union[str, Path]]
+    :param get_class_counts_func: function returning the number of pixels per class key of a gt image
+    :type get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]]
+    :return: the statistics of the pair
+    :rtype: ImageStatistics
     """
-    img = np.array(Image.open(image_path).convert('RGB'))
-    mean = np.array([np.mean(img[:, :, 0]), np.mean(img[:, :, 1]), np.mean(img[:, :, 2])]) / 255.0
-    return mean
-
-
-def _return_std(image_path: str, mean: ndarray) -> Tuple[ndarray, float]:
+    statistics = ImageStatistics()
+    if data_path is not None:
+        img = np.asarray(Image.open(data_path).convert('RGB'))
+        values = np.arange(256, dtype=np.int64)
+        # a histogram of the 256 values per channel gives the exact sums without a large integer copy of the image
+        histograms = [np.bincount(img[:, :, c].ravel(), minlength=256) for c in range(NUM_CHANNELS)]
+        statistics.pixel_count = img.shape[0] * img.shape[1]
+        statistics.channel_sums = [int(h @ values) for h in histograms]
+        statistics.channel_squared_sums = [int(h @ (values * values)) for h in histograms]
+        statistics.sizes = [(img.shape[1], img.shape[0])]
+    if gt_path is not None and get_class_counts_func is not None:
+        statistics.class_counts = get_class_counts_func(gt_path)
+    return statistics
+
+
+def _get_image_statistics_star(args) -> ImageStatistics:
+    return get_image_statistics(*args)
+
+
+def map_image_statistics(file_names_data: Optional[Sequence[Union[str, Path]]] = None,
+                         file_names_gt: Optional[Sequence[Union[str, Path]]] = None,
+                         get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]] = None,
+                         workers: int = 8) -> Iterator[ImageStatistics]:
     """
-    Computes image_classification deviation of a single image
-
-    :param image_path: Path to the image
-    :type image_path: str
-    :param mean: Mean value of all pixels of the image
-    :type mean: ndarray[Any, dtype[floating[Any]]]
-
-    :returns: Standard deviation of all pixels of the image
-    :rtype: Tuple[ndarray[Any, dtype[floating[Any]]], float]
+    Reads every data/gt pair once (in parallel) and yields the statistics of every pair in the order of the files.
+    Entries of the lists can be None to skip a file.
+
+    :param file_names_data: paths to the data images (None if only the gt is needed)
+    :type file_names_data: Optional[Sequence[Union[str, Path]]]
+    :param file_names_gt: paths to the gt images in the same order as the data images (None if only the data is needed)
+    :type file_names_gt: Optional[Sequence[Union[str, Path]]]
+    :param get_class_counts_func: function returning the number of pixels per class key of a gt image, it has to be a
+        module level function (it is sent to the workers)
+    :type get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]]
+    :param workers: number of worker processes (the files are read in this process if <= 1)
+    :type workers: int
+    :return: the statistics of every pair
+    :rtype: Iterator[ImageStatistics]
     """
-    img = np.array(Image.open(image_path).convert('RGB')) / 255.0
-    m2 = np.square(np.array([img[:, :, 0] - mean[0], img[:, :, 1] - mean[1], img[:, :, 2] - mean[2]]))
-    return np.sum(np.sum(m2, axis=1), 1), m2.size / 3.0
-
-
-def _cms_inmem(file_names: np.ndarray) -> Tuple[ndarray, ndarray]:
+    if file_names_data is None and file_names_gt is None:
+        raise ValueError('Either the data or the gt files are needed to compute the statistics')
+    if file_names_data is not None and file_names_gt is not None and len(file_names_data) != len(file_names_gt):
+        raise ValueError(f'The number of data ({len(file_names_data)}) and gt ({len(file_names_gt)}) files differ')
+
+    num_files = len(file_names_data) if file_names_data is not None else len(file_names_gt)
+    tasks = [(None if file_names_data is None or file_names_data[i] is None else str(file_names_data[i]),
+              None if file_names_gt is None or file_names_gt[i] is None else str(file_names_gt[i]),
+              get_class_counts_func) for i in range(num_files)]
+
+    if workers <= 1 or num_files <= 1:
+        yield from map(_get_image_statistics_star, tasks)
+    else:
+        with Pool(min(workers, num_files)) as pool:
+            chunksize = max(1, num_files // (workers * 4))
+            yield from pool.imap(_get_image_statistics_star, tasks, chunksize=chunksize)
+
+
+def compute_image_statistics(file_names_data: Optional[Sequence[Union[str, Path]]] = None,
+                             file_names_gt: Optional[Sequence[Union[str, Path]]] = None,
+                             get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]] = None,
+                             workers: int = 8) -> ImageStatistics:
     """
-    Computes mean and image_classification deviation in an offline fashion. This is possible only when the dataset can
-    be allocated in memory.
-
+    Computes the statistics of the data images (mean, std and size) and of the gt images (pixels per class) in a single
+    parallel pass, every data/gt pair is read once.
+
+    :param file_names_data: paths to the data images (None if only the gt is needed)
+    :type file_names_data: Optional[Sequence[Union[str, Path]]]
+    :param file_names_gt: paths to the gt images in the same order as the data images (None if only the data is needed)
+    :type file_names_gt: Optional[Sequence[Union[str, Path]]]
+    :param get_class_counts_func: function returning the number of pixels per class key of a gt image, it has to be a
+        module level function (it is sent to the workers)
+    :type get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]]
+    :param workers: number of worker processes (the files are read in this process if <= 1)
+    :type workers: int
+    :return: the merged statistics of all the files
+    :rtype: ImageStatistics
+    """
+    num_files = len(file_names_data) if file_names_data is not None else \
+        len(file_names_gt) if file_names_gt is not None else 0
+    if num_files == 0:
+        raise ValueError('There are no files to compute the statistics')
 
-    :param file_names: List of file names of the dataset
-    :type file_names: np.ndarray[str]
+    log.info(f'Begin computing the statistics of {num_files} files')
+    statistics = ImageStatistics()
+    for file_statistics in map_image_statistics(file_names_data=file_names_data, file_names_gt=file_names_gt,
+                                                get_class_counts_func=get_class_counts_func, workers=workers):
+        statistics += file_statistics
+    log.info('Finished computing the statistics')
 
-    :returns: Mean value of all pixels of the images in the input folder and the
-    standard deviation of all pixels of the images in the input folder
-    :rtype: Tuple[ndarray[Any, dtype[floating[Any]]], ndarray[Any, dtype[floating[Any]]]]
-    """
-    img = np.zeros([file_names.size] + list(np.array(Image.open(file_names[0]).convert('RGB')).shape))
+    return statistics
 
-    # Load all samples
-    for i, sample in enumerate(file_names):
-        img[i] = np.array(Image.open(sample).convert('RGB'))
 
-    mean = np.array([np.mean(img[:, :, :, 0]), np.mean(img[:, :, :, 1]), np.mean(img[:, :, :, 2])]) / 255.0
-    std = np.array([np.std(img[:, :, :, 0]), np.std(img[:, :, :, 1]), np.std(img[:, :, :, 2])]) / 255.0
+def compute_mean_std(file_names: Union[np.ndarray, List[Path]], inmem: bool = False, workers: int = 8) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes mean and std of all images present at target folder.
 
-    return mean, std
+    :param file_names: List of the file names of the images
+    :type file_names: Union[np.ndarray[str], List[Path]]
+    :param inmem: not used anymore, the images are never loaded at once (kept for compatibility)
+    :type inmem: bool
+    :param workers: Number of workers to use for the mean/std computation
+    :type workers: int
+    :return: mean and std
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    statistics = compute_image_statistics(file_names_data=list(file_names), workers=workers)
+    return statistics.mean, statistics.std
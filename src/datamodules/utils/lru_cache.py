@@ -0,0 +1,105 @@
+"""
+Least recently used cache for decoded arrays with a memory budget.
+
+Every DataLoader worker gets its own copy of the dataset and therefore its own cache. The hit, miss and eviction
+counters are kept in a shared memory tensor with one row per process, so the main process can read the statistics of
+all the workers (e.g. to log them with :class:`LogCacheStatistics`).
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+
+HITS, MISSES, EVICTIONS = 0, 1, 2
+
+
+class LRUCache:
+    """
+    Stores numpy arrays up to `max_bytes` and evicts the least recently used entries if the budget is exceeded.
+
+    :param max_bytes: Memory budget of the cache (per process)
+    :type max_bytes: int
+    :param num_workers: Number of DataLoader workers which use the cache, needed to reserve a statistics row for
+        each of them
+    :type num_workers: int
+    """
+
+    def __init__(self, max_bytes: int, num_workers: int = 0):
+        """
+        Constructor method for the LRUCache class.
+        """
+        if max_bytes <= 0:
+            raise ValueError(f'The memory budget of the cache has to be positive (max_bytes={max_bytes})')
+
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self._entries: 'OrderedDict[Hashable, np.ndarray]' = OrderedDict()
+        # row 0 is used by the main process, row i + 1 by the worker i
+        self._stats = torch.zeros((num_workers + 1, 3), dtype=torch.int64).share_memory_()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """
+        Returns the array stored under the key and marks it as recently used.
+
+        :param key: Key of the entry
+        :type key: Hashable
+        :return: The stored array or None if the key is not in the cache
+        :rtype: Optional[np.ndarray]
+        """
+        stats = self._stats[self._get_stats_row()]
+        value = self._entries.get(key)
+        if value is None:
+            stats[MISSES] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        stats[HITS] += 1
+        return value
+
+    def put(self, key: Hashable, value: np.ndarray):
+        """
+        Stores an array. Arrays which are larger than the memory budget are not stored.
+
+        :param key: Key of the entry
+        :type key: Hashable
+        :param value: The array to store
+        :type value: np.ndarray
+        """
+        if value.nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self.num_bytes -= self._entries.pop(key).nbytes
+
+        self._entries[key] = value
+        self.num_bytes += value.nbytes
+
+        stats = self._stats[self._get_stats_row()]
+        while self.num_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.num_bytes -= evicted.nbytes
+            stats[EVICTIONS] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Returns the statistics summed up over all the processes using the cache.
+
+        :return: number of hits, misses and evictions as well as the hit rate
+        :rtype: Dict[str, Any]
+        """
+        hits, misses, evictions = self._stats.sum(dim=0).tolist()
+        return {'hits': hits, 'misses': misses, 'evictions': evictions,
+                'hit_rate': hits / (hits + misses) if hits + misses > 0 else 0.}
+
+    def reset_stats(self):
+        self._stats.zero_()
+
+    def _get_stats_row(self) -> int:
+        worker_info = get_worker_info()
+        if worker_info is None:
+            return 0
+        return (worker_info.id + 1) % len(self._stats)
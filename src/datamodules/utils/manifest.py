@@ -0,0 +1,295 @@
+"""
+Persistent manifest of the files of a dataset split.
+
+Listing a split (:meth:`CroppedDatasetRGB.get_gt_data_paths`, :meth:`DatasetRGB.get_img_gt_path_list`) sorts the
+content of every page folder and checks the data and ground truth files pair by pair. On network storage this takes
+minutes and is repeated by every rank at every start. The manifest stores the result of the listing together with the
+page id, the crop coordinates and the file sizes of every sample in a json file in the split folder. It is reused as
+long as the modification times of the listed folders are unchanged (adding, removing or renaming a file changes the
+modification time of its folder) and the selection is resolved with lookups of the page names instead of a new walk.
+"""
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.datamodules.utils.misc import validate_selection
+from src.datamodules.utils.sample_index import CROP_COORDINATES_PATTERN
+from src.utils import utils
+
+MANIFEST_VERSION = 1
+
+log = utils.get_logger(__name__)
+
+
+def get_manifest_path(directory: Path, data_folder_name: str, gt_folder_name: str, cropped: bool) -> Path:
+    """
+    Returns the path of the manifest file of a split.
+
+    :param directory: Path to the split folder (train / val / test)
+    :type directory: Path
+    :param data_folder_name: name of the folder that contains the data
+    :type data_folder_name: str
+    :param gt_folder_name: name of the folder that contains the ground truth
+    :type gt_folder_name: str
+    :param cropped: True for the cropped layout (one folder per page), False for the full page layout
+    :type cropped: bool
+    :return: path to the manifest file
+    :rtype: Path
+    """
+    layout = 'cropped' if cropped else 'full_page'
+    return directory / f'manifest.{layout}.{data_folder_name}.{gt_folder_name}.json'
+
+
+@dataclass
+class DatasetManifest:
+    """
+    Listing of a split with the data and ground truth file of every sample (relative to the split folder), the page id
+    of every sample, the crop coordinates (-1 if the file name does not end with `_x{x}_y{y}`), the file sizes in bytes
+    and the modification times of the listed folders.
+
+    :param directory: Path to the split folder (train / val / test)
+    :type directory: Path
+    :param data_folder_name: name of the folder that contains the data
+    :type data_folder_name: str
+    :param gt_folder_name: name of the folder that contains the ground truth
+    :type gt_folder_name: str
+    :param cropped: True for the cropped layout (one folder per page), False for the full page layout
+    :type cropped: bool
+    :param page_names: names of the pages in the order of the listing
+    :type page_names: List[str]
+    :param page_ids: page of every sample (index into `page_names`)
+    :type page_ids: np.ndarray
+    :param data_files: data file of every sample relative to the split folder
+    :type data_files: List[str]
+    :param gt_files: ground truth file of every sample relative to the split folder
+    :type gt_files: List[str]
+    :param coordinates: crop coordinates (x, y) of every sample
+    :type coordinates: np.ndarray
+    :param file_sizes: size in bytes of the data and the ground truth file of every sample
+    :type file_sizes: np.ndarray
+    :param folder_mtimes: modification time (ns) of every listed folder relative to the split folder
+    :type folder_mtimes: Dict[str, int]
+    """
+    directory: Path
+    data_folder_name: str
+    gt_folder_name: str
+    cropped: bool
+    page_names: List[str]
+    page_ids: np.ndarray
+    data_files: List[str]
+    gt_files: List[str]
+    coordinates: np.ndarray
+    file_sizes: np.ndarray
+    folder_mtimes: Dict[str, int]
+    page_name_ids: Dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.page_name_ids = {name: i for i, name in enumerate(self.page_names)}
+
+    def __len__(self) -> int:
+        return len(self.page_ids)
+
+    @classmethod
+    def from_paths(cls, directory: Path, data_folder_name: str, gt_folder_name: str, cropped: bool,
+                   paths: Sequence[Tuple[Any, ...]]) -> 'DatasetManifest':
+        """
+        Creates the manifest from the listing of a split.
+
+        :param directory: Path to the split folder (train / val / test)
+        :type directory: Path
+        :param data_folder_name: name of the folder that contains the data
+        :type data_folder_name: str
+        :param gt_folder_name: name of the folder that contains the ground truth
+        :type gt_folder_name: str
+        :param cropped: True for the cropped layout (one folder per page), False for the full page layout
+        :type cropped: bool
+        :param paths: tuples which start with the data path, the ground truth path and the page name
+        :type paths: Sequence[Tuple[Any, ...]]
+        :return: the manifest
+        :rtype: DatasetManifest
+        """
+        page_name_ids: Dict[str, int] = {}
+        page_ids = np.empty(len(paths), dtype=np.int32)
+        coordinates = np.full((len(paths), 2), -1, dtype=np.int32)
+        file_sizes = np.empty((len(paths), 2), dtype=np.int64)
+        data_files, gt_files = [], []
+        folders = {directory / data_folder_name, directory / gt_folder_name}
+
+        for i, (data_path, gt_path, page_name, *_) in enumerate(paths):
+            data_path, gt_path = Path(data_path), Path(gt_path)
+            page_ids[i] = page_name_ids.setdefault(page_name, len(page_name_ids))
+            match = CROP_COORDINATES_PATTERN.search(data_path.stem)
+            if match is not None:
+                coordinates[i] = int(match.group(1)), int(match.group(2))
+            file_sizes[i] = data_path.stat().st_size, gt_path.stat().st_size
+            data_files.append(data_path.relative_to(directory).as_posix())
+            gt_files.append(gt_path.relative_to(directory).as_posix())
+            folders.update((data_path.parent, gt_path.parent))
+
+        folder_mtimes = {folder.relative_to(directory).as_posix(): folder.stat().st_mtime_ns
+                         for folder in sorted(folders)}
+
+        return cls(directory=directory, data_folder_name=data_folder_name, gt_folder_name=gt_folder_name,
+                   cropped=cropped, page_names=list(page_name_ids.keys()), page_ids=page_ids,
+                   data_files=data_files, gt_files=gt_files, coordinates=coordinates, file_sizes=file_sizes,
+                   folder_mtimes=folder_mtimes)
+
+    @classmethod
+    def load(cls, manifest_path: Path) -> Optional['DatasetManifest']:
+        """
+        Loads a manifest file.
+
+        :param manifest_path: path to the manifest file
+        :type manifest_path: Path
+        :return: the manifest or None if the file does not exist or is not readable
+        :rtype: Optional[DatasetManifest]
+        """
+        try:
+            with manifest_path.open(mode='r') as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if content.get('version') != MANIFEST_VERSION:
+            return None
+
+        return cls(directory=manifest_path.parent,
+                   data_folder_name=content['data_folder_name'],
+                   gt_folder_name=content['gt_folder_name'],
+                   cropped=content['cropped'],
+                   page_names=content['page_names'],
+                   page_ids=np.asarray(content['page_ids'], dtype=np.int32),
+                   data_files=content['data_files'],
+                   gt_files=content['gt_files'],
+                   coordinates=np.asarray(content['coordinates'], dtype=np.int32).reshape(-1, 2),
+                   file_sizes=np.asarray(content['file_sizes'], dtype=np.int64).reshape(-1, 2),
+                   folder_mtimes=content['folder_mtimes'])
+
+    def save(self, manifest_path: Path):
+        """
+        Writes the manifest to a file. The file is replaced atomically, so other processes (e.g. the other ranks)
+        never read a partially written manifest. A warning is logged if the split folder is not writable.
+
+        :param manifest_path: path to the manifest file
+        :type manifest_path: Path
+        """
+        content = {'version': MANIFEST_VERSION,
+                   'data_folder_name': self.data_folder_name,
+                   'gt_folder_name': self.gt_folder_name,
+                   'cropped': self.cropped,
+                   'page_names': self.page_names,
+                   'page_ids': self.page_ids.tolist(),
+                   'data_files': self.data_files,
+                   'gt_files': self.gt_files,
+                   'coordinates': self.coordinates.tolist(),
+                   'file_sizes': self.file_sizes.tolist(),
+                   'folder_mtimes': self.folder_mtimes}
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=manifest_path.parent, prefix=f'.{manifest_path.name}.')
+            with os.fdopen(fd, mode='w') as f:
+                json.dump(obj=content, fp=f)
+            os.replace(tmp_path, manifest_path)
+        except OSError as e:
+            log.warning(f'Could not write the dataset manifest {manifest_path}: {e}')
+
+    def is_up_to_date(self, data_folder_name: str, gt_folder_name: str, cropped: bool) -> bool:
+        """
+        Checks if the manifest describes the given layout and if none of the listed folders has been modified.
+
+        :param data_folder_name: name of the folder that contains the data
+        :type data_folder_name: str
+        :param gt_folder_name: name of the folder that contains the ground truth
+        :type gt_folder_name: str
+        :param cropped: True for the cropped layout (one folder per page), False for the full page layout
+        :type cropped: bool
+        :return: True if the manifest can be used instead of listing the split
+        :rtype: bool
+        """
+        if (self.data_folder_name, self.gt_folder_name, self.cropped) != (data_folder_name, gt_folder_name, cropped):
+            return False
+        for folder, mtime in self.folder_mtimes.items():
+            try:
+                if (self.directory / folder).stat().st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get_sample_indices(self, selection: Optional[Union[int, List[str]]] = None) -> np.ndarray:
+        """
+        Returns the indices of the samples of the selected pages.
+
+        :param selection: an integer selects the first n pages, a list selects the pages by name
+        :type selection: Optional[Union[int, List[str]]]
+        :return: indices of the selected samples in the order of the manifest
+        :rtype: np.ndarray
+        """
+        if selection:
+            selection = validate_selection(names=self.page_names, selection=selection, full_page=not self.cropped)
+        if not selection:
+            return np.arange(len(self))
+        if isinstance(selection, int):
+            # the pages are numbered in the order of the listing
+            return np.flatnonzero(self.page_ids < selection)
+        selected_page_ids = np.fromiter((self.page_name_ids[name] for name in selection), dtype=np.int32)
+        return np.flatnonzero(np.isin(self.page_ids, selected_page_ids))
+
+    def get_paths(self, selection: Optional[Union[int, List[str]]] = None) -> List[Tuple[Any, ...]]:
+        """
+        Returns the listing of the selected pages in the format of the listing functions of the datasets:
+        `(data path, gt path, page name, crop name)` for the cropped layout and `(data path, gt path, page name)`
+        for the full page layout.
+
+        :param selection: an integer selects the first n pages, a list selects the pages by name
+        :type selection: Optional[Union[int, List[str]]]
+        :return: the listing of the selected pages
+        :rtype: List[Tuple[Any, ...]]
+        """
+        paths = []
+        for i in self.get_sample_indices(selection=selection).tolist():
+            data_path = self.directory / self.data_files[i]
+            gt_path = self.directory / self.gt_files[i]
+            page_name = self.page_names[self.page_ids[i]]
+            if self.cropped:
+                paths.append((data_path, gt_path, page_name, data_path.stem))
+            else:
+                paths.append((data_path, gt_path, page_name))
+        return paths
+
+
+def load_or_create_manifest(directory: Path, data_folder_name: str, gt_folder_name: str, cropped: bool,
+                            list_split: Callable[[], Sequence[Tuple[Any, ...]]]) -> DatasetManifest:
+    """
+    Loads the manifest of a split if it is up-to-date, otherwise the split is listed with `list_split` and the
+    manifest is (re-)written.
+
+    :param directory: Path to the split folder (train / val / test)
+    :type directory: Path
+    :param data_folder_name: name of the folder that contains the data
+    :type data_folder_name: str
+    :param gt_folder_name: name of the folder that contains the ground truth
+    :type gt_folder_name: str
+    :param cropped: True for the cropped layout (one folder per page), False for the full page layout
+    :type cropped: bool
+    :param list_split: function which lists the whole split (without a selection)
+    :type list_split: Callable[[], Sequence[Tuple[Any, ...]]]
+    :return: the manifest of the split
+    :rtype: DatasetManifest
+    """
+    manifest_path = get_manifest_path(directory=directory, data_folder_name=data_folder_name,
+                                      gt_folder_name=gt_folder_name, cropped=cropped)
+    manifest = DatasetManifest.load(manifest_path=manifest_path)
+    if manifest is not None and manifest.is_up_to_date(data_folder_name=data_folder_name,
+                                                       gt_folder_name=gt_folder_name, cropped=cropped):
+        return manifest
+
+    log.info(f'Listing {directory} to create the dataset manifest {manifest_path.name}')
+    manifest = DatasetManifest.from_paths(directory=directory, data_folder_name=data_folder_name,
+                                          gt_folder_name=gt_folder_name, cropped=cropped, paths=list_split())
+    manifest.save(manifest_path=manifest_path)
+    return manifest
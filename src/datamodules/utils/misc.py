@@ -1,13 +1,18 @@
+import itertools
 import json
+import math
+import os
+import tempfile
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Union, List, Dict, Tuple, Any
+from typing import Union, List, Dict, Tuple, Any, Sequence
 
 import numpy as np
 import torch
 from PIL import Image
 from omegaconf import ListConfig
 
+from src.datamodules.utils.distributed import get_rank
 from src.datamodules.utils.exceptions import PathNone, PathNotDir, PathMissingSplitDir, PathMissingDirinSplitDir
 from src.utils import utils
 
@@ -181,9 +186,29 @@ def selection_validation(files_in_data_root: List[Path], selection: Union[int, L
     :returns: Validated selection parameter
     :rtype: Union[int, List[str], ListConfig]
     """
-    if not full_page:
-        subdirectories = [x.name for x in files_in_data_root if x.is_dir()]
+    if full_page:
+        names = [f.stem for f in files_in_data_root]
+    else:
+        names = [x.name for x in files_in_data_root if x.is_dir()]
+
+    return validate_selection(names=names, selection=selection, full_page=full_page)
+
+
+def validate_selection(names: Sequence[str], selection: Union[int, List[str], ListConfig],
+                       full_page: bool) -> Union[int, List[str], ListConfig]:
+    """
+    Validates the selection parameter against the names of the pages of a split (file stems if `full_page`,
+    otherwise subdirectory names). The names are checked with a set lookup, so large selections stay cheap.
 
+    :param names: Names of the pages of the split
+    :type names: Sequence[str]
+    :param selection: Selection parameter
+    :type selection: Union[int, List[str], ListConfig]
+    :param full_page: If True, the names are file names, otherwise subdirectory names (used in the error message)
+    :type full_page: bool
+    :returns: Validated selection parameter
+    :rtype: Union[int, List[str], ListConfig]
+    """
     if isinstance(selection, int):
 
         if selection < 0:
@@ -195,23 +220,20 @@ def selection_validation(files_in_data_root: List[Path], selection: Union[int, L
         elif selection == 0:
             selection = None
 
-        elif (selection > len(files_in_data_root) and full_page) or (not full_page and selection > len(subdirectories)):
+        elif selection > len(names):
             msg = f'Parameter "selection" is larger ({selection}) than ' \
-                  f'number of files ({len(files_in_data_root)}).'
+                  f'number of files ({len(names)}).'
             log.error(msg)
             raise ValueError(msg)
 
     elif isinstance(selection, ListConfig) or isinstance(selection, list):
-        if full_page:
-            if not all(x in [f.stem for f in files_in_data_root] for x in selection):
+        if not set(selection).issubset(names):
+            if full_page:
                 msg = 'Parameter "selection" contains a non-existing file names.)'
-                log.error(msg)
-                raise ValueError(msg)
-        else:
-            if not all(x in subdirectories for x in selection):
+            else:
                 msg = 'Parameter "selection" contains a non-existing subdirectory.)'
-                log.error(msg)
-                raise ValueError(msg)
+            log.error(msg)
+            raise ValueError(msg)
 
     else:
         msg = f'Parameter "selection" exists, but it is of unsupported type ({type(selection)})'
@@ -240,6 +262,90 @@ def get_image_dims(data_gt_path_list) -> ImageDimensions:
     return image_dims
 
 
+def get_crop_step_size(crop_size: int, overlap: float) -> int:
+    """
+    Returns the distance between two neighbouring crops like `tools/generate_cropped_dataset.py` does.
+
+    :param crop_size: Size of the (square) crops
+    :type crop_size: int
+    :param overlap: Overlap of two neighbouring crops (between 0-1)
+    :type overlap: float
+    :returns: Step size in pixels
+    :rtype: int
+    """
+    return int(crop_size * (1 - overlap))
+
+
+def get_num_crops(img_size: int, crop_size: int, step_size: int) -> int:
+    """
+    Returns the number of crops along one axis of an image.
+
+    :param img_size: Width or height of the image
+    :type img_size: int
+    :param crop_size: Size of the crops
+    :type crop_size: int
+    :param step_size: Distance between two neighbouring crops
+    :type step_size: int
+    :returns: Number of crops along the axis
+    :rtype: int
+    """
+    return math.ceil((img_size - crop_size) / step_size + 1)
+
+
+def convert_crop_index_to_position(crop_index: int, num_crops: int, img_size: int, crop_size: int,
+                                   step_size: int) -> int:
+    """
+    Returns the position of a crop along one axis of an image. The last crop is aligned with the end of the image.
+
+    :param crop_index: Index of the crop along the axis
+    :type crop_index: int
+    :param num_crops: Number of crops along the axis
+    :type num_crops: int
+    :param img_size: Width or height of the image
+    :type img_size: int
+    :param crop_size: Size of the crops
+    :type crop_size: int
+    :param step_size: Distance between two neighbouring crops
+    :type step_size: int
+    :returns: Position (x or y) of the crop
+    :rtype: int
+    """
+    if crop_index == num_crops - 1:
+        # We are at the end of the axis
+        return img_size - crop_size
+
+    position = step_size * crop_index
+    assert position < img_size - crop_size
+    return position
+
+
+def get_crop_coordinates(img_width: int, img_height: int, crop_size: int, overlap: float) -> List[Tuple[int, int]]:
+    """
+    Returns the coordinates (x, y) of all crops of an image in the same order as the :class:`CropGenerator` of
+    `tools/generate_cropped_dataset.py` creates them.
+
+    :param img_width: Width of the image
+    :type img_width: int
+    :param img_height: Height of the image
+    :type img_height: int
+    :param crop_size: Size of the (square) crops
+    :type crop_size: int
+    :param overlap: Overlap of two neighbouring crops (between 0-1)
+    :type overlap: float
+    :returns: List of the crop coordinates
+    :rtype: List[Tuple[int, int]]
+    """
+    step_size = get_crop_step_size(crop_size=crop_size, overlap=overlap)
+    num_horiz_crops = get_num_crops(img_size=img_width, crop_size=crop_size, step_size=step_size)
+    num_vert_crops = get_num_crops(img_size=img_height, crop_size=crop_size, step_size=step_size)
+
+    return [(convert_crop_index_to_position(crop_index=hcrop_index, num_crops=num_horiz_crops, img_size=img_width,
+                                            crop_size=crop_size, step_size=step_size),
+             convert_crop_index_to_position(crop_index=vcrop_index, num_crops=num_vert_crops, img_size=img_height,
+                                            crop_size=crop_size, step_size=step_size))
+            for hcrop_index, vcrop_index in itertools.product(range(num_horiz_crops), range(num_vert_crops))]
+
+
 def pil_loader_gif(path: Path) -> Image:
     """
     Loads a gif image using PIL.
@@ -256,7 +362,8 @@ def pil_loader_gif(path: Path) -> Image:
 
 def save_json(analytics: Dict, analytics_path: Path):
     """
-    Saves the analytics dict to a json file.
+    Saves the analytics dict to a json file. The file is replaced atomically, so other processes never read a
+    partially written file. Under an initialized process group just rank zero writes the file.
 
     :param analytics: The analytics dict that should be saved
     :type analytics: Dict
@@ -264,9 +371,13 @@ def save_json(analytics: Dict, analytics_path: Path):
     :type analytics_path: Path
     """
 
+    if get_rank() != 0:
+        return
     try:
-        with analytics_path.open(mode='w') as f:
+        fd, tmp_path = tempfile.mkstemp(dir=analytics_path.parent, prefix=f'.{analytics_path.name}.')
+        with os.fdopen(fd, mode='w') as f:
             json.dump(obj=analytics, fp=f)
+        os.replace(tmp_path, analytics_path)
     except IOError:
         print(f'WARNING: No permissions to write analytics file ({analytics_path})')
 
@@ -293,3 +404,23 @@ def check_missing_analytics(analytics_path_gt: Path, expected_keys_gt: List[str]
         if all(k in analytics for k in expected_keys_gt):
             missing_analytics = False
     return analytics, missing_analytics
+
+
+def read_analytics(analytics_path: Path, expected_keys: List[str]) -> Dict[str, Any]:
+    """
+    Reads an analytics file without computing missing analytics, so no image of the dataset is opened. The tools
+    which just need e.g. the class encodings of a dataset use this instead of a datamodule.
+
+    :param analytics_path: Path to the analytics file
+    :type analytics_path: Path
+    :param expected_keys: List of expected keys in the analytics file
+    :type expected_keys: List[str]
+    :return: the analytics
+    :rtype: Dict[str, Any]
+    :raises FileNotFoundError: if the analytics file is missing or incomplete
+    """
+    analytics, missing_analytics = check_missing_analytics(analytics_path, expected_keys)
+    if missing_analytics:
+        raise FileNotFoundError(f'The analytics file {analytics_path} is missing or incomplete, it is created by the '
+                                f'datamodule of the dataset')
+    return analytics
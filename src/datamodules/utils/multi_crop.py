@@ -0,0 +1,70 @@
+"""
+Multiple random crops per decoded page.
+
+Decoding a full page is much more expensive than cutting a random crop out of it. :class:`MultiCropDataset` decodes
+a page once and applies the (random) twin transformation of the wrapped dataset `crops_per_page` times, so every
+decode produces several independent samples. The crops of one page are returned stacked and
+:func:`multi_crop_collate` flattens them into the batch.
+"""
+from typing import Any, List, Sequence, Tuple
+
+import torch
+import torch.utils.data as data
+from torch import Tensor
+from torch.utils.data.dataloader import default_collate
+
+
+class MultiCropDataset(data.Dataset):
+    """
+    Wraps a train/val dataset and returns `crops_per_page` transformed crops of the same decoded page per index.
+    The wrapped dataset needs to provide `_load_data_and_gt(index)` and `_apply_transformation(img, gt)` (like
+    :class:`DatasetRGB`) and should have a random twin transformation (e.g. :class:`TwinRandomCrop`), otherwise all
+    the crops are the same.
+
+    :param dataset: The dataset to wrap
+    :type dataset: data.Dataset
+    :param crops_per_page: Number of crops which are cut out of each decoded page
+    :type crops_per_page: int
+    """
+
+    def __init__(self, dataset: data.Dataset, crops_per_page: int):
+        """
+        Constructor method for the MultiCropDataset class.
+        """
+        if crops_per_page < 1:
+            raise ValueError(f'crops_per_page has to be at least 1 (crops_per_page={crops_per_page})')
+        if getattr(dataset, 'is_test', False):
+            raise ValueError('The multi crop mode can not be used for testing')
+
+        self.dataset = dataset
+        self.crops_per_page = crops_per_page
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index: int) -> Tuple[Tensor, ...]:
+        """
+        Decodes the page at the given index once and returns the stacked crops.
+
+        :param index: index of the page
+        :type index: int
+        :return: the stacked items of the crops (e.g. image crops K x C x H x W and ground truth crops K x H x W)
+        :rtype: Tuple[Tensor, ...]
+        """
+        data_img, gt_img = self.dataset._load_data_and_gt(index=index)
+        crops = [self.dataset._apply_transformation(data_img, gt_img) for _ in range(self.crops_per_page)]
+        return tuple(torch.stack(items) for items in zip(*crops))
+
+
+def multi_crop_collate(batch: List[Sequence[Tensor]]) -> List[Tensor]:
+    """
+    Collate function for :class:`MultiCropDataset`. The crops of all pages are flattened into the batch, so a batch
+    of B pages results in B * K samples.
+
+    :param batch: list of the stacked crops of each page
+    :type batch: List[Sequence[Tensor]]
+    :return: the collated batch with the crop dimension merged into the batch dimension
+    :rtype: List[Tensor]
+    """
+    collated: List[Any] = default_collate(batch)
+    return [items.flatten(start_dim=0, end_dim=1) for items in collated]
@@ -1,6 +1,11 @@
-from typing import Tuple
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
 
 import numpy as np
+from PIL import Image
+
+# formats of the paletted output images (the file extension)
+OUTPUT_CODECS = ['gif', 'png']
 
 
 def merge_patches(patch: np.ndarray, coordinates: Tuple[int, int], full_output: np.ndarray) -> np.ndarray:
@@ -38,3 +43,81 @@ def merge_patches(patch: np.ndarray, coordinates: Tuple[int, int], full_output:
     full_output[:, y1:y2, x1:x2] = np.where(mask, patch, np.maximum(patch, full_output[:, y1:y2, x1:x2]))
 
     return full_output
+
+
+def output_to_class_indices(output: np.ndarray, perform_argmax: bool = True) -> np.ndarray:
+    """
+    Converts the output prediction matrix into the class index of every pixel. The indices are stored as uint8 if
+    there are at most 256 classes, so they can be used directly as palette indices.
+
+    :param output: output prediction of the network [#C x H x W] or class indices [H x W] (perform_argmax=False)
+    :type output: np.ndarray
+    :param perform_argmax: perform argmax on the output
+    :type perform_argmax: bool
+    :return: class indices of size [H x W]
+    :rtype: np.ndarray
+    """
+    output = np.asarray(output)
+    if not perform_argmax:
+        return output.astype(np.uint8) if output.max(initial=0) <= 255 else output.astype(np.int64)
+    class_indices = np.argmax(output, axis=0)
+    return class_indices.astype(np.uint8) if output.shape[0] <= 256 else class_indices
+
+
+def get_palette(class_encodings: Sequence[Union[Tuple[int, int, int], int, float]]) -> np.ndarray:
+    """
+    Creates the color palette of the class encodings. Class encodings with a single value (blue channel of the
+    DivaHisDB format) are converted into the colors (0, 0, value).
+
+    :param class_encodings: the color (or the blue channel value) of every class
+    :type class_encodings: Sequence[Union[Tuple[int, int, int], int, float]]
+    :return: uint8 array of size [#C x 3]
+    :rtype: np.ndarray
+    """
+    class_encodings = np.asarray(class_encodings)
+    if class_encodings.ndim == 1:
+        palette = np.zeros((len(class_encodings), 3), dtype=np.uint8)
+        palette[:, 2] = class_encodings
+        return palette
+    return class_encodings.astype(np.uint8)
+
+
+def decode_palette(class_indices: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """
+    Looks up the color of every pixel in the palette (single gather over the whole image).
+
+    :param class_indices: class indices of size [H x W]
+    :type class_indices: np.ndarray
+    :param palette: uint8 array of size [#C x 3]
+    :type palette: np.ndarray
+    :return: uint8 array of size [H x W x 3]
+    :rtype: np.ndarray
+    """
+    return np.take(palette, class_indices, axis=0)
+
+
+def save_paletted_image(class_indices: np.ndarray, palette: np.ndarray, file_path: Union[Path, str],
+                        compress_level: Optional[int] = None) -> None:
+    """
+    Saves the class indices as paletted image (mode P), the colors of the classes are stored in the palette of the
+    file. Readers that convert the image to RGB get the colors of the class encodings, readers of the indexed
+    formats get the class indices (the palette is not optimized, so the indices are kept).
+
+    :param class_indices: uint8 class indices of size [H x W]
+    :type class_indices: np.ndarray
+    :param palette: uint8 array of size [#C x 3] with at most 256 colors
+    :type palette: np.ndarray
+    :param file_path: path of the output file (the format is taken from the extension)
+    :type file_path: Union[Path, str]
+    :param compress_level: zlib compression level of PNG files (0-9, lower is faster), the default of PIL if None
+    :type compress_level: Optional[int]
+    """
+    if class_indices.dtype != np.uint8 or len(palette) > 256:
+        raise ValueError(f'A paletted image can store at most 256 classes as uint8 indices '
+                         f'(got {class_indices.dtype} with {len(palette)} classes)')
+    if compress_level is not None and not 0 <= compress_level <= 9:
+        raise ValueError(f'The compression level has to be between 0 and 9 (compress_level={compress_level})')
+    img = Image.fromarray(class_indices)
+    img.putpalette(palette.flatten().tolist())
+    save_kwargs = {} if compress_level is None else {'compress_level': compress_level}
+    img.save(str(file_path), optimize=False, **save_kwargs)
@@ -0,0 +1,407 @@
+"""
+Packed shard format for cropped segmentation datasets.
+
+A packed split replaces the ``data_folder_name/page/crop.png`` and ``gt_folder_name/page/crop.png`` file trees with a
+handful of large ``.npy`` shard files and an index. The structure of a packed split folder is as follows::
+
+    split_folder
+    ├── index.json
+    ├── shard_0000.data.npy     (N x H x W x 3, uint8)
+    ├── shard_0000.gt.npy       (N x H x W, int8, already integer encoded)
+    ├── shard_0000.mask.npy     (N x H x W, bool, only for DivaHisDB)
+    ├── ...
+    └── shard_XXXX.data.npy
+
+Binary datasets (e.g. binarized pages) can be stored bit-packed with 1 bit per pixel: a bit-packed data shard
+holds a single channel (N x H x ceil(W / 8), uint8, black 0 / white 255), a bit-packed gt shard the classes 0 and 1
+and a bit-packed mask shard the boundary mask. The bits are unpacked by the reader when a crop is accessed, so the
+datasets get the same arrays as from the unpacked shards.
+
+The shards are written with :class:`PackedShardWriter` (see `tools/generate_packed_dataset.py`) and read
+with :class:`PackedShardReader`, which memory maps the shard files lazily in every process that accesses them.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union, Any
+
+import numpy as np
+from omegaconf import ListConfig
+
+from src.datamodules.utils.exceptions import PathNone, PathNotDir, PathMissingSplitDir
+from src.datamodules.utils.sample_index import StringArray
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+INDEX_FILE_NAME = 'index.json'
+SHARD_FILE_NAME = 'shard_{shard_id:04d}.{kind}.npy'
+FORMAT_VERSION = 1
+
+
+class PackedShardWriter:
+    """
+    Writes the crops of one split into memory mapped shard files. The number of samples has to be known in advance,
+    as the shard files are pre-allocated and filled crop by crop.
+
+    :param output_path: Folder of the packed split (e.g. `data_dir/train`)
+    :type output_path: Path
+    :param num_samples: Total number of crops in the split
+    :type num_samples: int
+    :param crop_size: Size of the crops as (height, width)
+    :type crop_size: Tuple[int, int]
+    :param shard_size: Maximal number of crops per shard file
+    :type shard_size: int
+    :param with_mask: If True, a boundary mask is stored for every crop (DivaHisDB)
+    :type with_mask: bool
+    :param bit_packed_data: If True, the image crops are stored with 1 bit per pixel. The crops have to be binary
+        (the same value in all channels, either 0 or 255).
+    :type bit_packed_data: bool
+    :param bit_packed_gt: If True, the ground truth (classes 0 and 1) and the boundary masks are stored with 1 bit per
+        pixel
+    :type bit_packed_gt: bool
+    """
+
+    def __init__(self, output_path: Path, num_samples: int, crop_size: Tuple[int, int], shard_size: int = 4096,
+                 with_mask: bool = False, bit_packed_data: bool = False, bit_packed_gt: bool = False):
+        """
+        Constructor method for the PackedShardWriter class.
+        """
+        if num_samples <= 0:
+            raise ValueError(f'Can not write a packed split without samples (num_samples={num_samples})')
+        if shard_size <= 0:
+            raise ValueError(f'The shard size has to be positive (shard_size={shard_size})')
+
+        self.output_path = Path(output_path)
+        self.num_samples = num_samples
+        self.crop_height, self.crop_width = crop_size
+        self.shard_size = shard_size
+        self.with_mask = with_mask
+        self.bit_packed_kinds = (['data'] if bit_packed_data else []) + (['gt'] if bit_packed_gt else []) + \
+                                (['mask'] if bit_packed_gt and with_mask else [])
+
+        self.num_shards = int(np.ceil(num_samples / shard_size))
+
+        self.page_names: List[str] = []
+        self._page_ids: Dict[str, int] = {}
+        self.samples: List[Tuple[int, str, int, int]] = []
+
+        self._current_shard_id = -1
+        self._shard_arrays: Dict[str, np.ndarray] = {}
+
+        self.output_path.mkdir(parents=True, exist_ok=True)
+
+    def add(self, page_name: str, crop_name: str, coordinates: Tuple[int, int], img: np.ndarray, gt: np.ndarray,
+            mask: Optional[np.ndarray] = None):
+        """
+        Appends a crop to the current shard.
+
+        :param page_name: Name of the page the crop belongs to
+        :type page_name: str
+        :param crop_name: Name of the crop (without extension)
+        :type crop_name: str
+        :param coordinates: Coordinates (x, y) of the crop in the page
+        :type coordinates: Tuple[int, int]
+        :param img: Image crop with shape (H x W x 3)
+        :type img: np.ndarray
+        :param gt: Integer encoded ground truth with shape (H x W)
+        :type gt: np.ndarray
+        :param mask: Boundary mask with shape (H x W), only needed if the writer was created with `with_mask`
+        :type mask: Optional[np.ndarray]
+        """
+        sample_id = len(self.samples)
+        if sample_id >= self.num_samples:
+            raise ValueError(f'The writer was created for {self.num_samples} samples')
+        if img.shape != (self.crop_height, self.crop_width, 3) or gt.shape != (self.crop_height, self.crop_width):
+            raise ValueError(f'All crops of a split need the size {self.crop_height}x{self.crop_width} '
+                             f'(crop "{crop_name}" has {img.shape} and {gt.shape})')
+        if self.with_mask and mask is None:
+            raise ValueError(f'The writer expects a boundary mask (crop "{crop_name}")')
+
+        shard_id, offset = divmod(sample_id, self.shard_size)
+        if shard_id != self._current_shard_id:
+            self._open_shard(shard_id=shard_id)
+
+        if 'data' in self.bit_packed_kinds:
+            if not (np.all((img == 0) | (img == 255)) and np.all(img == img[:, :, :1])):
+                raise ValueError(f'Bit-packed crops have to be binary (crop "{crop_name}")')
+            img = np.packbits(img[:, :, 0] != 0, axis=-1)
+        if 'gt' in self.bit_packed_kinds:
+            if not np.all((gt == 0) | (gt == 1)):
+                raise ValueError(f'Bit-packed ground truth can just contain the classes 0 and 1 (crop "{crop_name}")')
+            gt = np.packbits(gt != 0, axis=-1)
+            if self.with_mask:
+                mask = np.packbits(mask, axis=-1)
+
+        self._shard_arrays['data'][offset] = img
+        self._shard_arrays['gt'][offset] = gt
+        if self.with_mask:
+            self._shard_arrays['mask'][offset] = mask
+
+        if page_name not in self._page_ids:
+            self._page_ids[page_name] = len(self.page_names)
+            self.page_names.append(page_name)
+        self.samples.append((self._page_ids[page_name], crop_name, int(coordinates[0]), int(coordinates[1])))
+
+    def close(self, class_encodings: List[Any]):
+        """
+        Flushes the last shard and writes the index of the split.
+
+        :param class_encodings: The class encodings that were used to encode the ground truth
+        :type class_encodings: List[Any]
+        """
+        if len(self.samples) != self.num_samples:
+            raise ValueError(f'Expected {self.num_samples} samples but only {len(self.samples)} were added')
+        self._flush()
+
+        index = {'version': FORMAT_VERSION,
+                 'num_samples': self.num_samples,
+                 'shard_size': self.shard_size,
+                 'num_shards': self.num_shards,
+                 'crop_height': self.crop_height,
+                 'crop_width': self.crop_width,
+                 'has_mask': self.with_mask,
+                 'bit_packed': self.bit_packed_kinds,
+                 'class_encodings': class_encodings,
+                 'page_names': self.page_names,
+                 'samples': self.samples}
+
+        with (self.output_path / INDEX_FILE_NAME).open(mode='w') as f:
+            json.dump(obj=index, fp=f)
+
+    def _open_shard(self, shard_id: int):
+        self._flush()
+        num_samples_shard = min(self.shard_size, self.num_samples - shard_id * self.shard_size)
+        spatial_shape = (num_samples_shard, self.crop_height, self.crop_width)
+
+        packed_shape = (num_samples_shard, self.crop_height, (self.crop_width + 7) // 8)
+
+        kinds = [('data', np.uint8, spatial_shape + (3,)), ('gt', np.int8, spatial_shape)]
+        if self.with_mask:
+            kinds.append(('mask', np.bool_, spatial_shape))
+        kinds = [(kind, np.uint8, packed_shape) if kind in self.bit_packed_kinds else (kind, dtype, shape)
+                 for kind, dtype, shape in kinds]
+
+        self._shard_arrays = {kind: np.lib.format.open_memmap(
+            filename=self.output_path / SHARD_FILE_NAME.format(shard_id=shard_id, kind=kind),
+            mode='w+', dtype=dtype, shape=shape) for kind, dtype, shape in kinds}
+        self._current_shard_id = shard_id
+
+    def _flush(self):
+        for array in self._shard_arrays.values():
+            array.flush()
+        self._shard_arrays = {}
+
+
+class PackedShardReader:
+    """
+    Gives access to the crops of a packed split. The shard files are memory mapped on first access, so every
+    DataLoader worker maps the files itself and only the pages of the crops that are used are read from disk.
+
+    :param path: Folder of the packed split (e.g. `data_dir/train`)
+    :type path: Path
+    """
+
+    def __init__(self, path: Path):
+        """
+        Constructor method for the PackedShardReader class.
+        """
+        self.path = Path(path)
+
+        with (self.path / INDEX_FILE_NAME).open(mode='r') as f:
+            index = json.load(fp=f)
+
+        if index['version'] != FORMAT_VERSION:
+            raise ValueError(f'Unsupported packed shard version {index["version"]} in {self.path}')
+
+        self.num_samples = index['num_samples']
+        self.shard_size = index['shard_size']
+        self.num_shards = index['num_shards']
+        self.crop_height = index['crop_height']
+        self.crop_width = index['crop_width']
+        self.has_mask = index['has_mask']
+        self.bit_packed_kinds = set(index.get('bit_packed', []))
+        self.class_encodings = index['class_encodings']
+        self.page_names = index['page_names']
+        # the sample information is kept in arrays, so the workers can share it without copying
+        self.sample_page_ids = np.asarray([sample[0] for sample in index['samples']], dtype=np.int32)
+        self.sample_crop_names = StringArray(strings=[sample[1] for sample in index['samples']])
+        self.sample_coordinates = np.asarray([sample[2:] for sample in index['samples']],
+                                             dtype=np.int32).reshape(-1, 2)
+
+        self._shard_arrays: Dict[Tuple[int, str], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # memory maps are not sent to the workers, they are re-opened in every process
+        state = self.__dict__.copy()
+        state['_shard_arrays'] = {}
+        return state
+
+    def get_sample(self, sample_id: int) -> Tuple[str, str, int, int]:
+        """
+        Returns the information about a sample.
+
+        :param sample_id: Index of the sample in the split
+        :type sample_id: int
+        :return: page name, crop name and the x and y coordinate of the crop
+        :rtype: Tuple[str, str, int, int]
+        """
+        x, y = self.sample_coordinates[sample_id].tolist()
+        return self.page_names[self.sample_page_ids[sample_id]], self.sample_crop_names[sample_id], x, y
+
+    def get_shard_path(self, sample_id: int, kind: str) -> Path:
+        """
+        Returns the path of the shard file that contains the given sample.
+
+        :param sample_id: Index of the sample in the split
+        :type sample_id: int
+        :param kind: Kind of the shard file (data, gt or mask)
+        :type kind: str
+        :return: Path to the shard file
+        :rtype: Path
+        """
+        return self.path / SHARD_FILE_NAME.format(shard_id=sample_id // self.shard_size, kind=kind)
+
+    def get_data(self, sample_id: int) -> np.ndarray:
+        """
+        Returns a read-only view of the image crop (H x W x 3, uint8). Bit-packed crops are unpacked into a new array.
+        """
+        data = self._get(sample_id=sample_id, kind='data')
+        if 'data' in self.bit_packed_kinds:
+            bits = self._unpack(data)
+            return np.repeat((bits * np.uint8(255))[:, :, None], 3, axis=-1)
+        return data
+
+    def get_gt(self, sample_id: int) -> np.ndarray:
+        """
+        Returns a read-only view of the integer encoded ground truth (H x W, int8). Bit-packed ground truth is
+        unpacked into a new array.
+        """
+        gt = self._get(sample_id=sample_id, kind='gt')
+        if 'gt' in self.bit_packed_kinds:
+            return self._unpack(gt).view(np.int8)
+        return gt
+
+    def get_mask(self, sample_id: int) -> np.ndarray:
+        """
+        Returns a read-only view of the boundary mask (H x W, bool).
+        """
+        if not self.has_mask:
+            raise ValueError(f'The packed split {self.path} does not contain boundary masks')
+        mask = self._get(sample_id=sample_id, kind='mask')
+        if 'mask' in self.bit_packed_kinds:
+            return self._unpack(mask).view(np.bool_)
+        return mask
+
+    def _unpack(self, packed: np.ndarray) -> np.ndarray:
+        # one uint8 (0 or 1) per pixel, the padding bits of the last byte of a row are dropped
+        return np.unpackbits(packed, axis=-1, count=self.crop_width)
+
+    def _get(self, sample_id: int, kind: str) -> np.ndarray:
+        shard_id, offset = divmod(sample_id, self.shard_size)
+        key = (shard_id, kind)
+        if key not in self._shard_arrays:
+            self._shard_arrays[key] = np.load(self.get_shard_path(sample_id=sample_id, kind=kind), mmap_mode='r')
+        return self._shard_arrays[key][offset]
+
+    def get_sample_ids(self, selection: Optional[Union[int, List[str], ListConfig]] = None) -> np.ndarray:
+        """
+        Returns the indices of the samples which belong to the selected pages. The selection works the same way as
+        in :meth:`CroppedDatasetRGB.get_gt_data_paths`. An integer selects the first n pages (sorted by name),
+        a list selects pages by name.
+
+        :param selection: selection of the pages
+        :type selection: Optional[Union[int, List[str], ListConfig]]
+        :return: Indices of the selected samples
+        :rtype: np.ndarray
+        """
+        if not selection:
+            return np.arange(self.num_samples)
+
+        selected_pages = get_selected_pages(page_names=self.page_names, selection=selection)
+        selected_page_ids = [page_id for page_id, page_name in enumerate(self.page_names) if page_name in selected_pages]
+        return np.flatnonzero(np.isin(self.sample_page_ids, selected_page_ids)).astype(np.int64)
+
+
+def get_selected_pages(page_names: List[str], selection: Union[int, List[str], ListConfig]) -> Set[str]:
+    """
+    Returns the names of the selected pages. An integer selects the first n pages (sorted by name),
+    a list selects pages by name.
+
+    :param page_names: Names of all pages of the split
+    :type page_names: List[str]
+    :param selection: selection of the pages
+    :type selection: Union[int, List[str], ListConfig]
+    :return: Names of the selected pages
+    :rtype: Set[str]
+    """
+    sorted_page_names = sorted(page_names)
+    if isinstance(selection, int):
+        if selection < 0:
+            msg = f'Parameter "selection" is a negative integer ({selection}). ' \
+                  f'Negative values are not supported!'
+            log.error(msg)
+            raise ValueError(msg)
+        if selection > len(sorted_page_names):
+            msg = f'Parameter "selection" is larger ({selection}) than ' \
+                  f'number of pages ({len(sorted_page_names)}).'
+            log.error(msg)
+            raise ValueError(msg)
+        return set(sorted_page_names[:selection])
+
+    if isinstance(selection, ListConfig) or isinstance(selection, list):
+        selected_pages = set(selection)
+        if not selected_pages.issubset(sorted_page_names):
+            msg = 'Parameter "selection" contains a non-existing page.)'
+            log.error(msg)
+            raise ValueError(msg)
+        return selected_pages
+
+    msg = f'Parameter "selection" exists, but it is of unsupported type ({type(selection)})'
+    log.error(msg)
+    raise TypeError(msg)
+
+
+def validate_path_for_packed_segmentation(data_dir: str, split_name: str,
+                                          index_file_name: str = INDEX_FILE_NAME) -> Path:
+    """
+    Checks if the data_dir folder contains a packed split with the given name (i.e. `data_dir/split_name/index.json`).
+
+    :param data_dir: Path to the root dir of the dataset
+    :type data_dir: str
+    :param split_name: Name of the split folder (train/val/test)
+    :type split_name: str
+    :param index_file_name: Name of the index file of the split
+    :type index_file_name: str
+    :returns: Path to the data_dir
+    :rtype: Path
+    """
+    if data_dir is None:
+        raise PathNone("Please provide the path to root dir of the dataset "
+                       "(folder containing the split(train/val/test) folders)")
+
+    data_folder = Path(data_dir)
+    if not data_folder.is_dir():
+        raise PathNotDir("Please provide the path to root dir of the dataset "
+                         "(folder containing the split(train/val/test) folder)")
+
+    if not (data_folder / split_name / index_file_name).is_file():
+        raise PathMissingSplitDir(f'Your path needs to contain the packed split "{split_name}" '
+                                  f'(a folder with a {index_file_name} and the packed files)')
+
+    return data_folder
+
+
+def missing_packed_analytics(directory: Path, **kwargs):
+    """
+    Stand-in for the path listing function of the `get_analytics` functions. A packed (or tiled) dataset has no image
+    files to compute the analytics from, they are written by `tools/generate_packed_dataset.py`.
+
+    :param directory: Path to the split folder
+    :type directory: Path
+    :raises FileNotFoundError: always
+    """
+    raise FileNotFoundError(f'The analytics files of the packed dataset in {directory.parent} are missing. '
+                            f'They are created together with the packed files by tools/generate_packed_dataset.py')
@@ -0,0 +1,187 @@
+"""
+Cache for decoded full pages. The full page datasets decode the image and encode the ground truth of a page on every
+access. With a page cache each page is decoded once and kept as an uint8 image together with its integer label map.
+
+Two storage modes are supported:
+
+- ``shared``: the pages are stored in shared memory tensors which are visible to all the workers of a DataLoader.
+  The slots are allocated up front, there are just as many as pages in the split (at most ``max_bytes``).
+- ``memmap``: the pages are stored in numpy memory maps in ``cache_dir``. This keeps the RAM usage low and the cache
+  survives between runs.
+
+A cached page is invalidated as soon as the modification time or the size of its data or ground truth file changes.
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from src.datamodules.utils.misc import ImageDimensions
+from src.utils import utils
+
+PAGE_CACHE_MODES = ('shared', 'memmap')
+CACHE_FILE_NAME = 'page_cache_{key}.{kind}.npy'
+
+log = utils.get_logger(__name__)
+
+
+@dataclass
+class PageCacheSpecs:
+    """
+    Specification of a page cache.
+
+    :param mode: where the pages are stored, either `shared` (shared memory) or `memmap` (memory map on disk)
+    :type mode: str
+    :param max_bytes: maximal number of bytes the cache is allowed to use. Pages that do not fit are not cached.
+    :type max_bytes: int
+    :param cache_dir: folder where the memory maps are stored (just needed for the `memmap` mode)
+    :type cache_dir: Optional[str]
+    """
+    mode: str = 'shared'
+    max_bytes: int = 2 * 1024 ** 3
+    cache_dir: Optional[str] = None
+
+
+class PageCache:
+    """
+    Stores the decoded pages and label maps of a dataset. The first `num_slots` pages (as many as fit into
+    `max_bytes`) get a slot in the cache, all the other pages are decoded on every access.
+
+    :param specs: specification of the cache
+    :type specs: PageCacheSpecs
+    :param page_paths: list of tuples with the path to the data and the ground truth file of each page
+    :type page_paths: List[Tuple[Path, Path]]
+    :param image_dims: dimensions of the pages
+    :type image_dims: ImageDimensions
+    """
+
+    def __init__(self, specs: PageCacheSpecs, page_paths: List[Tuple[Path, Path]], image_dims: ImageDimensions):
+        """
+        Constructor method for the PageCache class.
+        """
+        if specs.mode not in PAGE_CACHE_MODES:
+            raise ValueError(f'Unknown page cache mode "{specs.mode}" (supported: {", ".join(PAGE_CACHE_MODES)})')
+        if specs.mode == 'memmap' and specs.cache_dir is None:
+            raise ValueError('The page cache mode "memmap" needs a cache_dir')
+
+        self.mode = specs.mode
+        self.page_paths = [(Path(data_path), Path(gt_path)) for data_path, gt_path in page_paths]
+        self.image_dims = image_dims
+
+        height, width = image_dims.height, image_dims.width
+        # uint8 image, int16 label map and the signature of the two files
+        self.page_bytes = height * width * 3 + height * width * 2 + 4 * 8
+        self.num_slots = min(len(self.page_paths), specs.max_bytes // self.page_bytes)
+        if self.num_slots < len(self.page_paths):
+            log.warning(f'The page cache can only hold {self.num_slots} of {len(self.page_paths)} pages '
+                        f'(max_bytes: {specs.max_bytes}). The other pages are decoded on every access.')
+
+        shapes = {'data': (self.num_slots, height, width, 3),
+                  'labels': (self.num_slots, height, width),
+                  'signatures': (self.num_slots, 4)}
+        dtypes = {'data': np.uint8, 'labels': np.int16, 'signatures': np.int64}
+
+        if self.mode == 'shared':
+            self.cache_paths = None
+            self._arrays = {kind: self._create_shared_tensor(shape=shape, dtype=dtypes[kind])
+                            for kind, shape in shapes.items()}
+        else:
+            cache_dir = Path(specs.cache_dir)
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            key = self._get_cache_key()
+            self.cache_paths = {kind: cache_dir / CACHE_FILE_NAME.format(key=key, kind=kind) for kind in shapes}
+            for kind, shape in shapes.items():
+                self._create_memmap(path=self.cache_paths[kind], shape=shape, dtype=dtypes[kind])
+            self._arrays = None
+
+    def __getstate__(self):
+        # the memory maps are opened again in every worker
+        state = self.__dict__.copy()
+        if self.mode == 'memmap':
+            state['_arrays'] = None
+        return state
+
+    def load(self, index: int, decode_func: Callable[[int], Tuple[np.ndarray, np.ndarray]]) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the decoded image and the label map of the page at the given index. If the page is not in the
+        cache or one of its files changed, the page gets decoded with `decode_func` and stored in the cache.
+        The returned arrays can be views into the cache and must not be modified.
+
+        :param index: index of the page
+        :type index: int
+        :param decode_func: function which decodes the page with the given index into an uint8 image (HxWx3)
+            and a label map (HxW)
+        :type decode_func: Callable[[int], Tuple[np.ndarray, np.ndarray]]
+        :return: the image and the label map of the page
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        if index >= self.num_slots:
+            return decode_func(index)
+
+        data, labels, signatures = self._get_arrays()
+        signature = self._get_signature(index=index)
+        if np.array_equal(signatures[index], signature):
+            return data[index], labels[index]
+
+        img, label_map = decode_func(index)
+        # invalidate the slot while it is written
+        signatures[index] = 0
+        data[index] = img
+        labels[index] = label_map
+        signatures[index] = signature
+        return img, label_map
+
+    def is_cached(self, index: int) -> bool:
+        """
+        Checks if the page at the given index is in the cache and still up to date.
+
+        :param index: index of the page
+        :type index: int
+        :return: True if the page is cached
+        :rtype: bool
+        """
+        if index >= self.num_slots:
+            return False
+        _, _, signatures = self._get_arrays()
+        return np.array_equal(signatures[index], self._get_signature(index=index))
+
+    def _get_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.mode == 'shared':
+            return tuple(self._arrays[kind].numpy() for kind in ('data', 'labels', 'signatures'))
+        if self._arrays is None:
+            self._arrays = {kind: np.load(path, mmap_mode='r+') for kind, path in self.cache_paths.items()}
+        return self._arrays['data'], self._arrays['labels'], self._arrays['signatures']
+
+    def _get_signature(self, index: int) -> np.ndarray:
+        data_stat = os.stat(self.page_paths[index][0])
+        gt_stat = os.stat(self.page_paths[index][1])
+        return np.asarray([data_stat.st_mtime_ns, data_stat.st_size, gt_stat.st_mtime_ns, gt_stat.st_size],
+                          dtype=np.int64)
+
+    def _get_cache_key(self) -> str:
+        hash_function = hashlib.sha1()
+        hash_function.update(f'{self.image_dims.height}x{self.image_dims.width}x{self.num_slots}'.encode())
+        for data_path, gt_path in self.page_paths[:self.num_slots]:
+            hash_function.update(f'{data_path.resolve()}|{gt_path.resolve()}'.encode())
+        return hash_function.hexdigest()[:16]
+
+    @staticmethod
+    def _create_shared_tensor(shape: Tuple[int, ...], dtype) -> torch.Tensor:
+        # `share_memory_` copies the tensor into the shared memory, the empty tensor is zeroed afterwards (an empty
+        # signature) so the slots are not written twice
+        dtype = torch.from_numpy(np.empty(0, dtype=dtype)).dtype
+        return torch.empty(shape, dtype=dtype).share_memory_().zero_()
+
+    @staticmethod
+    def _create_memmap(path: Path, shape: Tuple[int, ...], dtype):
+        if path.exists():
+            existing = np.load(path, mmap_mode='r')
+            if existing.shape == shape and existing.dtype == dtype:
+                return
+            del existing
+        np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape).flush()
@@ -0,0 +1,230 @@
+"""
+Patch store for the test predictions of the cropped tasks.
+
+Instead of one ``.npy`` file per crop, the predictions of the crops of a page are appended to a single binary file and
+their coordinates are written to an index, so the merge tools (`tools/merge_cropped_output_*.py`) read every page with
+one sequential pass and do not have to list and parse thousands of file names. Every process writes its own shard, the
+crops of a page which is split between several processes are found in the shards of all of them. The structure of a
+patch store folder is as follows::
+
+    patches
+    ├── rank_0000
+    │   ├── index.json          (storage, dtype and the crops of every page with coordinates and offset)
+    │   ├── page_00000.bin      (the patches of the first page of this process, in the order they were added)
+    │   ├── ...
+    │   └── page_XXXXX.bin
+    └── rank_XXXX
+
+The patches are stored as float32 or float16 predictions [#C x H x W] or, with the `argmax` storage, as the class
+indices [H x W] (uint8 for at most 256 classes, int16 otherwise). Overlapping class indices can not be merged with the
+maximum of the predictions, the merge tools just paste them.
+The store is written with :class:`PatchStoreWriter` (see `save_numpy_files`) and read with :class:`PatchStoreReader`.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.datamodules.utils.sample_index import CROP_COORDINATES_PATTERN
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+PATCH_INDEX_FILE_NAME = 'index.json'
+PATCH_SHARD_FOLDER_NAME = 'rank_{rank:04d}'
+PATCH_SHARD_FOLDER_PATTERN = 'rank_*'
+PATCH_PAGE_FILE_NAME = 'page_{page_id:05d}.bin'
+PATCH_FORMAT_VERSION = 1
+PATCH_STORAGES = ['float32', 'float16', 'argmax']
+
+
+class PatchStoreWriter:
+    """
+    Appends the patches of the crops to one file per page and writes the index of the shard on :meth:`close`. The
+    crops of a page should arrive one after another (like from the page wise test sampler of the cropped datamodules),
+    otherwise the page file is opened again for every change of the page.
+
+    :param path: Folder of the patch store (e.g. `test_output/patches`)
+    :type path: Path
+    :param rank: Rank of the process, every process writes its own shard
+    :type rank: int
+    :param storage: How the patches are stored (float32, float16 or argmax)
+    :type storage: str
+    """
+
+    def __init__(self, path: Path, rank: int = 0, storage: str = 'float32'):
+        """
+        Constructor method for the PatchStoreWriter class.
+        """
+        if storage not in PATCH_STORAGES:
+            raise ValueError(f'Unknown patch storage "{storage}" (available: {PATCH_STORAGES})')
+
+        self.path = Path(path)
+        self.shard_path = self.path / PATCH_SHARD_FOLDER_NAME.format(rank=rank)
+        self.storage = storage
+        self.dtype: Optional[str] = None
+
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        self._crop_names = set()
+        self._page_name: Optional[str] = None
+        self._page_file = None
+
+    def __len__(self) -> int:
+        return len(self._crop_names)
+
+    def add(self, page_name: str, crop_name: str, patch: np.ndarray):
+        """
+        Appends the patch of a crop to the file of its page. Crops which are added a second time (e.g. to pad the test
+        set for several processes) are ignored.
+
+        :param page_name: Name of the page
+        :type page_name: str
+        :param crop_name: Name of the crop, it has to end with the coordinates of the crop (`_x<x>_y<y>`)
+        :type crop_name: str
+        :param patch: The prediction of the crop [#C x H x W]
+        :type patch: np.ndarray
+        """
+        match = CROP_COORDINATES_PATTERN.search(crop_name)
+        if match is None:
+            raise ValueError(f'The crop name "{crop_name}" does not contain the coordinates of the crop')
+        if crop_name in self._crop_names:
+            return
+        self._crop_names.add(crop_name)
+
+        patch = self._encode(np.asarray(patch))
+        if page_name != self._page_name:
+            self._open_page(page_name)
+
+        page = self.pages[page_name]
+        page['crops'].append([crop_name, int(match.group(1)), int(match.group(2)), page['size'], list(patch.shape)])
+        buffer = np.ascontiguousarray(patch).tobytes()
+        self._page_file.write(buffer)
+        page['size'] += len(buffer)
+
+    def close(self):
+        """
+        Closes the open page file and writes the index of the shard. Nothing is written if no crop was added.
+        """
+        if self._page_file is not None:
+            self._page_file.close()
+            self._page_file = None
+            self._page_name = None
+        if not self.pages:
+            return
+
+        index = {'version': PATCH_FORMAT_VERSION,
+                 'storage': self.storage,
+                 'dtype': self.dtype,
+                 'pages': self.pages}
+
+        with (self.shard_path / PATCH_INDEX_FILE_NAME).open(mode='w') as f:
+            json.dump(obj=index, fp=f)
+        log.info(f'Wrote {len(self)} patches of {len(self.pages)} pages to {self.shard_path}')
+
+    def _encode(self, patch: np.ndarray) -> np.ndarray:
+        if self.storage == 'argmax':
+            patch = np.argmax(patch, axis=0).astype(np.uint8 if patch.shape[0] <= 256 else np.int16)
+        else:
+            patch = patch.astype(self.storage)
+        if self.dtype is None:
+            self.dtype = patch.dtype.str
+        return patch
+
+    def _open_page(self, page_name: str):
+        if self._page_file is not None:
+            self._page_file.close()
+        if page_name not in self.pages:
+            self.shard_path.mkdir(parents=True, exist_ok=True)
+            self.pages[page_name] = {'file': PATCH_PAGE_FILE_NAME.format(page_id=len(self.pages)),
+                                     'size': 0,
+                                     'crops': []}
+        self._page_file = (self.shard_path / self.pages[page_name]['file']).open(mode='ab')
+        self._page_name = page_name
+
+
+class PatchStoreReader:
+    """
+    Reads the patches of a patch store. The shards of all the processes are merged, so the patches of a page are
+    found even if the page was split between several processes.
+
+    :param path: Folder of the patch store (e.g. `test_output/patches`)
+    :type path: Path
+    """
+
+    def __init__(self, path: Path):
+        """
+        Constructor method for the PatchStoreReader class.
+        """
+        self.path = Path(path)
+
+        index_files = sorted(self.path.glob(f'{PATCH_SHARD_FOLDER_PATTERN}/{PATCH_INDEX_FILE_NAME}'))
+        if not index_files:
+            raise ValueError(f'There is no patch store in {self.path}')
+
+        self.storage: Optional[str] = None
+        self.dtype: Optional[str] = None
+        # page name -> list of (page file, crops of the page in this file)
+        self.pages: Dict[str, List[Tuple[Path, List[List[Any]]]]] = {}
+        for index_file in index_files:
+            with index_file.open(mode='r') as f:
+                index = json.load(fp=f)
+            if index['version'] != PATCH_FORMAT_VERSION:
+                raise ValueError(f'Unsupported patch store version {index["version"]} in {index_file.parent}')
+            if self.storage is not None and (index['storage'], index['dtype']) != (self.storage, self.dtype):
+                raise ValueError(f'The shards of the patch store {self.path} have different storages')
+            self.storage, self.dtype = index['storage'], index['dtype']
+
+            for page_name, page in index['pages'].items():
+                self.pages.setdefault(page_name, []).append((index_file.parent / page['file'], page['crops']))
+
+        self.page_names = sorted(self.pages)
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    @staticmethod
+    def exists(path: Union[Path, str]) -> bool:
+        """
+        :param path: Folder of the patch store
+        :type path: Union[Path, str]
+        :return: True if the folder contains a patch store
+        :rtype: bool
+        """
+        return any(Path(path).glob(f'{PATCH_SHARD_FOLDER_PATTERN}/{PATCH_INDEX_FILE_NAME}'))
+
+    def get_crops(self, page_name: str) -> List[Tuple[str, int, int, Tuple[int, ...]]]:
+        """
+        :param page_name: Name of the page
+        :type page_name: str
+        :return: name, coordinates (x, y) and patch shape of the crops of the page
+        :rtype: List[Tuple[str, int, int, Tuple[int, ...]]]
+        """
+        crops = {crop_name: (crop_name, x, y, tuple(shape)) for _, page_crops in self.pages[page_name]
+                 for crop_name, x, y, _, shape in page_crops}
+        return list(crops.values())
+
+    def read_page(self, page_name: str) -> Iterator[Tuple[str, int, int, np.ndarray]]:
+        """
+        Reads the patches of a page. Every page file is read sequentially in the order the patches were written.
+        Patches which are in the shards of several processes are returned once.
+
+        :param page_name: Name of the page
+        :type page_name: str
+        :return: name, coordinates (x, y) and patch of every crop of the page (the patch is a [#C x H x W] prediction
+            or [H x W] class indices for the argmax storage)
+        :rtype: Iterator[Tuple[str, int, int, np.ndarray]]
+        """
+        dtype = np.dtype(self.dtype)
+        read_crops = set()
+        for page_file, crops in self.pages[page_name]:
+            with page_file.open(mode='rb') as f:
+                for crop_name, x, y, offset, shape in crops:
+                    length = int(np.prod(shape)) * dtype.itemsize
+                    if f.tell() != offset:
+                        f.seek(offset)
+                    buffer = f.read(length)
+                    if crop_name in read_crops:
+                        continue
+                    read_crops.add(crop_name)
+                    yield crop_name, x, y, np.frombuffer(buffer, dtype=dtype).reshape(shape)
@@ -0,0 +1,109 @@
+"""
+Compact sample index of the cropped datasets.
+
+A Python list with a tuple of two `Path` objects and two strings per crop needs several hundred bytes per crop and,
+even worse, every access of a forked DataLoader worker changes the reference counts of these objects, which copies
+the memory pages of the list into every worker (copy-on-write). :class:`CropSampleIndex` keeps the same information
+in a few NumPy arrays: all the strings are stored once in a single byte buffer with offsets, and every crop is
+described by integer arrays (string ids, page id and coordinates). The arrays are never written after the
+construction, so the workers share them with the main process.
+"""
+import re
+from pathlib import Path
+from typing import Dict, Iterator, Sequence, Tuple, Union
+
+import numpy as np
+
+CROP_COORDINATES_PATTERN = re.compile(r'_x(\d+)_y(\d+)$')
+
+
+class StringArray(Sequence):
+    """
+    Read-only sequence of strings which are stored in a single utf-8 byte buffer with offsets.
+
+    :param strings: The strings to store
+    :type strings: Sequence[str]
+    """
+
+    def __init__(self, strings: Sequence[str]):
+        """
+        Constructor method for the StringArray class.
+        """
+        encoded = [string.encode('utf-8') for string in strings]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=self.offsets[1:])
+        self.buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'Index {index} out of range for {len(self)} strings')
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+
+class CropSampleIndex(Sequence):
+    """
+    Read-only sequence which behaves like the list of tuples `(data path, gt path, page name, crop name)` of the
+    cropped datasets (`img_paths_per_page`).
+
+    Additionally to the tuples, the index provides the page id of every crop (`page_ids`, in order of the first
+    appearance of the page) and the crop coordinates parsed from the crop names (`coordinates`, -1 if the crop name
+    does not end with `_x{x}_y{y}`).
+
+    :param entries: tuples with the path to the data file, the path to the ground truth file, the name of the page
+        and the name of the crop
+    :type entries: Sequence[Tuple[Union[Path, str], Union[Path, str], str, str]]
+    """
+
+    def __init__(self, entries: Sequence[Tuple[Union[Path, str], Union[Path, str], str, str]]):
+        """
+        Constructor method for the CropSampleIndex class.
+        """
+        string_ids: Dict[str, int] = {}
+        page_name_ids: Dict[str, int] = {}
+
+        def get_string_id(string: str) -> int:
+            return string_ids.setdefault(string, len(string_ids))
+
+        # columns: data folder, data file name, gt folder, gt file name, crop name
+        self.string_ids = np.empty((len(entries), 5), dtype=np.int32)
+        self.page_ids = np.empty(len(entries), dtype=np.int32)
+        self.coordinates = np.full((len(entries), 2), -1, dtype=np.int32)
+
+        for i, (data_path, gt_path, page_name, crop_name) in enumerate(entries):
+            data_path, gt_path = Path(data_path), Path(gt_path)
+            self.string_ids[i] = (get_string_id(str(data_path.parent)), get_string_id(data_path.name),
+                                  get_string_id(str(gt_path.parent)), get_string_id(gt_path.name),
+                                  get_string_id(crop_name))
+            self.page_ids[i] = page_name_ids.setdefault(page_name, len(page_name_ids))
+            match = CROP_COORDINATES_PATTERN.search(crop_name)
+            if match is not None:
+                self.coordinates[i] = int(match.group(1)), int(match.group(2))
+
+        self.strings = StringArray(strings=list(string_ids.keys()))
+        self.page_names = StringArray(strings=list(page_name_ids.keys()))
+
+    def __len__(self) -> int:
+        return len(self.page_ids)
+
+    def __getitem__(self, index: int) -> Tuple[Path, Path, str, str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'Index {index} out of range for {len(self)} crops')
+
+        data_dir, data_file, gt_dir, gt_file, crop_name = (self.strings[string_id]
+                                                            for string_id in self.string_ids[index])
+        return Path(data_dir) / data_file, Path(gt_dir) / gt_file, self.page_names[self.page_ids[index]], crop_name
+
+    def __iter__(self) -> Iterator[Tuple[Path, Path, str, str]]:
+        for i in range(len(self)):
+            yield self[i]
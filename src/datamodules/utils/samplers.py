@@ -0,0 +1,354 @@
+"""
+Samplers for cropped datasets.
+"""
+import math
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import DistributedSampler
+
+from src.datamodules.utils.distributed import all_gather_object
+
+
+class PageLocalitySampler(DistributedSampler):
+    """
+    Shuffles the crops of a cropped dataset such that consecutive samples come from a small set of pages. First the
+    pages are shuffled, then the crops are shuffled within windows of `window_size` consecutive pages. A cache of
+    decoded pages or tiles (e.g. the tile cache of :class:`TiledCroppedDatasetRGB`) gets a lot more hits this way
+    than with a completely random order.
+
+    Like :class:`DistributedSampler` every rank gets a disjoint share of the (padded) epoch. The shares are
+    contiguous parts of the order, so the locality is kept on every rank. Lightning does not replace this sampler
+    with a distributed one because it already is a :class:`DistributedSampler`.
+
+    :param page_ids: Page of each crop of the dataset (e.g. `dataset.img_paths_per_page.page_ids`)
+    :type page_ids: Sequence
+    :param window_size: Number of pages whose crops are shuffled together
+    :type window_size: int
+    :param num_replicas: Number of processes taking part in the training
+    :type num_replicas: int
+    :param rank: Rank of the current process
+    :type rank: int
+    :param shuffle: If False, the crops are returned page by page in the order of the dataset
+    :type shuffle: bool
+    :param seed: Seed of the shuffling, it is combined with the epoch (see :meth:`set_epoch`)
+    :type seed: int
+    :param drop_last: If True, the tail of the epoch is dropped to make it evenly divisible across the ranks,
+        otherwise the epoch is padded with crops from its beginning
+    :type drop_last: bool
+    """
+
+    def __init__(self, page_ids: Sequence, window_size: int = 4, num_replicas: int = 1, rank: int = 0,
+                 shuffle: bool = True, seed: int = 0, drop_last: bool = False):
+        """
+        Constructor method for the PageLocalitySampler class.
+        """
+        if window_size < 1:
+            raise ValueError(f'The window size has to be at least 1 (window_size={window_size})')
+        super().__init__(dataset=page_ids, num_replicas=num_replicas, rank=rank, shuffle=shuffle, seed=seed,
+                         drop_last=drop_last)
+
+        self.window_size = window_size
+        # crop indices of every page, the pages are in the order of their first crop
+        _, first_indices, page_indices = np.unique(np.asarray(page_ids), return_index=True, return_inverse=True)
+        crop_indices = np.argsort(page_indices, kind='stable')
+        crops_per_page = np.split(crop_indices, np.cumsum(np.bincount(page_indices))[:-1])
+        self.crops_per_page = [crops_per_page[i] for i in np.argsort(first_indices)]
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+
+        pages = self.crops_per_page
+        if self.shuffle:
+            pages = [pages[i] for i in torch.randperm(len(pages), generator=generator).tolist()]
+
+        indices = []
+        for start in range(0, len(pages), self.window_size):
+            window = np.concatenate(pages[start:start + self.window_size])
+            if self.shuffle:
+                window = window[torch.randperm(len(window), generator=generator).numpy()]
+            indices.extend(window.tolist())
+
+        if self.drop_last:
+            indices = indices[:self.total_size]
+        else:
+            padding_size = self.total_size - len(indices)
+            indices += (indices * math.ceil(padding_size / len(indices)))[:padding_size]
+        assert len(indices) == self.total_size
+
+        # contiguous share for every rank to keep the locality
+        return iter(indices[self.rank * self.num_samples:(self.rank + 1) * self.num_samples])
+
+
+class ClassAwareSampler(DistributedSampler):
+    """
+    Draws the crops of an epoch (with replacement) with a probability which depends on the classes they contain, so
+    crops with rare classes (e.g. decoration or comments) are seen more often than crops of plain background.
+
+    Every class gets the weight `frequency ** (-1 / temperature)`, where the frequency is the share of the class in
+    all the pixels of the dataset. The weight of a crop is the mean weight of its pixels. A temperature of 1 balances
+    the classes (as far as the crops allow it), a higher temperature gets closer to uniform sampling. Crops without a
+    pixel of a known class are never drawn.
+
+    Every epoch the ranks draw the same order (seeded with `seed + epoch`) and take every `num_replicas`-th crop of it,
+    so the ranks get disjoint shares of the epoch. Like :class:`PageLocalitySampler` it is not replaced by Lightning.
+
+    :param class_histograms: Number of pixels per class of each crop of the dataset (N x number of classes)
+    :type class_histograms: np.ndarray
+    :param temperature: Temperature of the class weights (> 0)
+    :type temperature: float
+    :param num_replicas: Number of processes taking part in the training
+    :type num_replicas: int
+    :param rank: Rank of the current process
+    :type rank: int
+    :param seed: Seed of the sampling, it is combined with the epoch (see :meth:`set_epoch`)
+    :type seed: int
+    :param drop_last: If True, the epoch is shortened to make it evenly divisible across the ranks, otherwise it is
+        extended
+    :type drop_last: bool
+    """
+
+    def __init__(self, class_histograms: np.ndarray, temperature: float = 1.0, num_replicas: int = 1, rank: int = 0,
+                 seed: int = 0, drop_last: bool = False):
+        """
+        Constructor method for the ClassAwareSampler class.
+        """
+        class_histograms = np.asarray(class_histograms)
+        if class_histograms.ndim != 2:
+            raise ValueError(f'The class histograms have to be of shape (N x number of classes) '
+                             f'(shape={class_histograms.shape})')
+        super().__init__(dataset=class_histograms, num_replicas=num_replicas, rank=rank, shuffle=True, seed=seed,
+                         drop_last=drop_last)
+
+        self.temperature = temperature
+        self.weights = self.get_crop_weights(class_histograms=class_histograms, temperature=temperature)
+
+    @staticmethod
+    def get_crop_weights(class_histograms: np.ndarray, temperature: float) -> np.ndarray:
+        """
+        Computes the sampling weights of the crops.
+
+        :param class_histograms: Number of pixels per class of each crop (N x number of classes)
+        :type class_histograms: np.ndarray
+        :param temperature: Temperature of the class weights (> 0)
+        :type temperature: float
+        :return: The weight of every crop (they are not normalized)
+        :rtype: np.ndarray
+        """
+        if temperature <= 0:
+            raise ValueError(f'The temperature has to be positive (temperature={temperature})')
+        class_histograms = np.asarray(class_histograms, dtype=np.float64)
+        class_pixels = class_histograms.sum(axis=0)
+        if class_pixels.sum() == 0:
+            raise ValueError('The crops do not contain any pixel of a known class')
+
+        frequencies = class_pixels / class_pixels.sum()
+        class_weights = np.zeros_like(frequencies)
+        present = frequencies > 0
+        class_weights[present] = frequencies[present] ** (-1 / temperature)
+        # normalized for the numerical stability of high powers
+        class_weights /= class_weights.max()
+
+        crop_pixels = class_histograms.sum(axis=1)
+        weights = class_histograms @ class_weights
+        return np.divide(weights, crop_pixels, out=np.zeros_like(weights), where=crop_pixels > 0)
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices = torch.multinomial(torch.as_tensor(self.weights), num_samples=self.total_size, replacement=True,
+                                    generator=generator).tolist()
+        return iter(indices[self.rank:self.total_size:self.num_replicas])
+
+
+class HardExampleSampler(DistributedSampler):
+    """
+    Draws the crops of an epoch (with replacement) with a probability which depends on their recent training loss, so
+    the model sees the crops it still gets wrong more often than the ones it has learned.
+
+    The sampler keeps a loss table with an exponential moving average of the loss of every crop. The task reports the
+    losses of the crops of every training batch with the dataset indices of the crops (see :meth:`update`). Crops
+    which have not been seen yet get the highest loss of the table. The probability of a crop is
+    `uniform_fraction / N + (1 - uniform_fraction) * loss / sum(losses)`, so a part of every epoch is still sampled
+    uniformly.
+
+    The reported losses are kept per rank until :meth:`synchronize` merges them (in the order of the ranks) into the
+    loss table of every rank. The task calls it at the end of every training epoch on all the ranks, so all the ranks
+    draw the next epoch from the same table. :meth:`__iter__` and :meth:`state_dict` just use the merged table, the
+    losses which are reported after the last merge are not in a checkpoint. Every rank draws the same order (seeded
+    with `seed + epoch`) and takes every `num_replicas`-th crop of it.
+
+    :param num_crops: Number of crops of the dataset
+    :type num_crops: int
+    :param uniform_fraction: Share of the sampling probability which is distributed uniformly (between 0 and 1)
+    :type uniform_fraction: float
+    :param momentum: Weight of the previous loss of a crop in the moving average (between 0 and 1)
+    :type momentum: float
+    :param num_replicas: Number of processes taking part in the training
+    :type num_replicas: int
+    :param rank: Rank of the current process
+    :type rank: int
+    :param seed: Seed of the sampling, it is combined with the epoch (see :meth:`set_epoch`)
+    :type seed: int
+    :param drop_last: If True, the epoch is shortened to make it evenly divisible across the ranks, otherwise it is
+        extended
+    :type drop_last: bool
+    """
+
+    def __init__(self, num_crops: int, uniform_fraction: float = 0.5, momentum: float = 0.9, num_replicas: int = 1,
+                 rank: int = 0, seed: int = 0, drop_last: bool = False):
+        """
+        Constructor method for the HardExampleSampler class.
+        """
+        if not 0 <= uniform_fraction <= 1:
+            raise ValueError(f'The uniform fraction has to be between 0 and 1 (uniform_fraction={uniform_fraction})')
+        if not 0 <= momentum < 1:
+            raise ValueError(f'The momentum has to be in [0, 1) (momentum={momentum})')
+        super().__init__(dataset=range(num_crops), num_replicas=num_replicas, rank=rank, shuffle=True, seed=seed,
+                         drop_last=drop_last)
+
+        self.uniform_fraction = uniform_fraction
+        self.momentum = momentum
+        # moving average of the loss of every crop, NaN if the crop has not been seen yet
+        self.losses = np.full(num_crops, np.nan)
+        self._pending_indices: List[np.ndarray] = []
+        self._pending_losses: List[np.ndarray] = []
+
+    def get_probabilities(self) -> np.ndarray:
+        """
+        :return: the sampling probability of every crop
+        :rtype: np.ndarray
+        """
+        num_crops = len(self.losses)
+        seen = ~np.isnan(self.losses)
+        if not seen.any():
+            return np.full(num_crops, 1 / num_crops)
+        losses = np.where(seen, self.losses, self.losses[seen].max())
+        if losses.sum() <= 0:
+            return np.full(num_crops, 1 / num_crops)
+        return self.uniform_fraction / num_crops + (1 - self.uniform_fraction) * losses / losses.sum()
+
+    def update(self, indices: Sequence[int], losses: Sequence[float]):
+        """
+        Reports the losses of crops, they are added to the loss table by :meth:`synchronize`.
+
+        :param indices: Indices of the crops
+        :type indices: Sequence[int]
+        :param losses: Loss of each crop
+        :type losses: Sequence[float]
+        """
+        if len(indices) != len(losses):
+            raise ValueError(f'Got {len(losses)} losses for {len(indices)} crops')
+        self._pending_indices.append(np.asarray(indices, dtype=np.int64))
+        self._pending_losses.append(np.asarray(losses, dtype=np.float64))
+
+    def synchronize(self):
+        """
+        Merges the reported losses of all the ranks into the loss table. Under an initialized process group every
+        rank has to call it (e.g. in `on_train_epoch_end` of the task).
+        """
+        pending = (np.concatenate(self._pending_indices) if self._pending_indices else np.zeros(0, dtype=np.int64),
+                   np.concatenate(self._pending_losses) if self._pending_losses else np.zeros(0))
+        self._pending_indices, self._pending_losses = [], []
+        for indices, losses in all_gather_object(pending):
+            for index, loss in zip(indices.tolist(), losses.tolist()):
+                previous = self.losses[index]
+                self.losses[index] = loss if np.isnan(previous) else \
+                    self.momentum * previous + (1 - self.momentum) * loss
+
+    def state_dict(self) -> Dict[str, Any]:
+        """
+        Returns the loss table, the losses which have not been merged yet (see :meth:`synchronize`) are not included.
+
+        :return: the state of the sampler
+        :rtype: Dict[str, Any]
+        """
+        return {'losses': self.losses.copy()}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]):
+        """
+        Restores the loss table.
+
+        :param state_dict: the state of :meth:`state_dict`
+        :type state_dict: Dict[str, Any]
+        """
+        losses = np.asarray(state_dict['losses'], dtype=np.float64)
+        if losses.shape != self.losses.shape:
+            raise ValueError(f'The loss table has {len(losses)} entries, but the dataset has {len(self.losses)} crops')
+        self.losses = losses.copy()
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices = torch.multinomial(torch.as_tensor(self.get_probabilities()), num_samples=self.total_size,
+                                    replacement=True, generator=generator).tolist()
+        return iter(indices[self.rank:self.total_size:self.num_replicas])
+
+
+class BlankCropSampler(DistributedSampler):
+    """
+    Skips most of the blank crops of a dataset (e.g. the crops of the parchment margin, see :func:`get_blank_crops`).
+    Every epoch contains all the other crops and a random share `keep_fraction` of the blank crops, which is drawn
+    anew every epoch (seeded with `seed + epoch`), so the epochs get shorter but the model still sees blank crops.
+
+    Every rank computes the same epoch and takes every `num_replicas`-th crop of it. Like :class:`PageLocalitySampler`
+    it is not replaced by Lightning.
+
+    :param blank_crops: True for every blank crop of the dataset
+    :type blank_crops: Sequence[bool]
+    :param keep_fraction: Share of the blank crops in every epoch (between 0 and 1, 0 excludes them)
+    :type keep_fraction: float
+    :param num_replicas: Number of processes taking part in the training
+    :type num_replicas: int
+    :param rank: Rank of the current process
+    :type rank: int
+    :param shuffle: If False, the crops of an epoch are returned in the order of the dataset
+    :type shuffle: bool
+    :param seed: Seed of the selection and the shuffling, it is combined with the epoch (see :meth:`set_epoch`)
+    :type seed: int
+    :param drop_last: If True, the tail of the epoch is dropped to make it evenly divisible across the ranks,
+        otherwise the epoch is padded with crops from its beginning
+    :type drop_last: bool
+    """
+
+    def __init__(self, blank_crops: Sequence[bool], keep_fraction: float = 0.0, num_replicas: int = 1, rank: int = 0,
+                 shuffle: bool = True, seed: int = 0, drop_last: bool = False):
+        """
+        Constructor method for the BlankCropSampler class.
+        """
+        if not 0 <= keep_fraction <= 1:
+            raise ValueError(f'The keep fraction has to be between 0 and 1 (keep_fraction={keep_fraction})')
+        blank_crops = np.asarray(blank_crops, dtype=bool)
+        self.content_indices = np.flatnonzero(~blank_crops)
+        self.blank_indices = np.flatnonzero(blank_crops)
+        self.keep_fraction = keep_fraction
+        self.num_kept_blank = int(round(keep_fraction * len(self.blank_indices)))
+        epoch_size = len(self.content_indices) + self.num_kept_blank
+        if epoch_size == 0:
+            raise ValueError('The epoch is empty, all the crops are blank and none of them are kept')
+        super().__init__(dataset=range(epoch_size), num_replicas=num_replicas, rank=rank, shuffle=shuffle, seed=seed,
+                         drop_last=drop_last)
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+
+        kept_blank = self.blank_indices[torch.randperm(len(self.blank_indices),
+                                                       generator=generator)[:self.num_kept_blank].numpy()]
+        indices = np.concatenate([self.content_indices, kept_blank])
+        if self.shuffle:
+            indices = indices[torch.randperm(len(indices), generator=generator).numpy()]
+        else:
+            indices = np.sort(indices)
+        indices = indices.tolist()
+
+        if self.drop_last:
+            indices = indices[:self.total_size]
+        else:
+            padding_size = self.total_size - len(indices)
+            indices += (indices * math.ceil(padding_size / len(indices)))[:padding_size]
+        assert len(indices) == self.total_size
+
+        return iter(indices[self.rank:self.total_size:self.num_replicas])
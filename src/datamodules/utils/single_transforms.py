@@ -1,8 +1,9 @@
 import itertools
-from typing import List
+from typing import List, Union
 
 import numpy as np
 import torch
+from PIL import Image
 from torchvision.transforms import functional
 
 import torch
@@ -23,6 +24,25 @@ class OneHotToPixelLabelling(object):
         return src.datamodules.utils.functional.argmax_onehot(tensor)
 
 
+class ToUint8Tensor(object):
+    """
+    Converts a PIL image or an uint8 array (HxWxC or HxW) into an uint8 tensor (CxHxW). Unlike `ToTensor` the values
+    are neither converted into floats nor scaled, so the samples need a quarter of the memory. Like `pil_to_tensor`
+    the tensor shares the memory of the array.
+
+    :param pic: The image to convert
+    :type pic: Union[Image.Image, np.ndarray]
+    :returns: The uint8 tensor
+    :rtype: torch.Tensor
+    """
+    def __call__(self, pic: Union[Image.Image, np.ndarray]) -> torch.Tensor:
+        if isinstance(pic, np.ndarray):
+            if pic.ndim == 2:
+                pic = pic[:, :, None]
+            return torch.from_numpy(pic).permute(2, 0, 1)
+        return functional.pil_to_tensor(pic)
+
+
 class RightAngleRotation:
     """
     Rotates the input tensor by a random angle from the list of angles.
@@ -0,0 +1,318 @@
+"""
+Persistent index of the statistics of every file of a dataset.
+
+The analytics files (`analytics.*.json`) hold the result for a whole split, so a new split (e.g. `training-20` next to
+`training-10`) or a new selection of pages needs a full scan of the images. The index stores the statistics of every
+single file (channel sums, sums of squares, pixel count and size of the data images, pixels per class of the gt
+images) in a json file in the root of the dataset. The entries are keyed by the path of the file relative to the root
+(symbolic links are resolved, so splits which link to the same pages share the entries) and are valid as long as the
+size and the modification time of the file are unchanged. The analytics of any list of files are then computed by
+summing up the entries, only files which are not (or no longer) in the index are read.
+"""
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Union, List, Tuple
+
+from src.datamodules.utils.distributed import is_distributed, get_rank, get_world_size, all_gather_object
+from src.datamodules.utils.image_analytics import ImageStatistics, map_image_statistics
+from src.utils import utils
+
+STATISTICS_INDEX_VERSION = 1
+STATISTICS_INDEX_FILENAME = 'analytics.index.json'
+
+log = utils.get_logger(__name__)
+
+
+def get_statistics_index_path(root: Path) -> Path:
+    """
+    Returns the path of the statistics index of a dataset.
+
+    :param root: root folder of the dataset
+    :type root: Path
+    :return: path to the index file
+    :rtype: Path
+    """
+    return root / STATISTICS_INDEX_FILENAME
+
+
+def _to_json_key(key: Any) -> Any:
+    return [_to_json_key(k) for k in key] if isinstance(key, tuple) else key
+
+
+def _from_json_key(key: Any) -> Any:
+    return tuple(_from_json_key(k) for k in key) if isinstance(key, list) else key
+
+
+@dataclass
+class StatisticsIndex:
+    """
+    Statistics of every data file and of every gt file (per gt format, as the class keys depend on the format) of a
+    dataset.
+
+    :param root: root folder of the dataset, the keys of the entries are relative to it
+    :type root: Path
+    :param data_entries: statistics of the data files with their size and modification time
+    :type data_entries: Dict[str, Dict[str, Any]]
+    :param gt_entries: statistics of the gt files with their size and modification time per gt format
+    :type gt_entries: Dict[str, Dict[str, Dict[str, Any]]]
+    """
+    root: Path
+    data_entries: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    gt_entries: Dict[str, Dict[str, Dict[str, Any]]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, root: Path) -> 'StatisticsIndex':
+        """
+        Loads the index of a dataset, an empty index is returned if there is none (or it is not readable).
+
+        :param root: root folder of the dataset
+        :type root: Path
+        :return: the index
+        :rtype: StatisticsIndex
+        """
+        try:
+            with get_statistics_index_path(root).open(mode='r') as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return cls(root=root)
+        if content.get('version') != STATISTICS_INDEX_VERSION:
+            return cls(root=root)
+        return cls(root=root, data_entries=content['data'], gt_entries=content['gt'])
+
+    def save(self):
+        """
+        Writes the index to the root of the dataset. The file is replaced atomically, so other processes never read a
+        partially written index. A warning is logged if the root folder is not writable.
+        """
+        index_path = get_statistics_index_path(self.root)
+        content = {'version': STATISTICS_INDEX_VERSION,
+                   'data': self.data_entries,
+                   'gt': self.gt_entries}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=f'.{index_path.name}.')
+            with os.fdopen(fd, mode='w') as f:
+                json.dump(obj=content, fp=f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            log.warning(f'Could not write the statistics index {index_path}: {e}')
+
+    def _get_key(self, path: Union[str, Path]) -> str:
+        return Path(os.path.relpath(os.path.realpath(path), os.path.realpath(self.root))).as_posix()
+
+    @staticmethod
+    def _is_valid(entry: Optional[Dict[str, Any]], stat: os.stat_result) -> bool:
+        return entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def update(self, file_names_data: Optional[Sequence[Union[str, Path]]] = None,
+               file_names_gt: Optional[Sequence[Union[str, Path]]] = None, gt_format: Optional[str] = None,
+               get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]] = None,
+               workers: int = 8) -> Tuple[List[str], List[str], int]:
+        """
+        Adds the files which are missing in the index or have been modified since they were indexed. The missing data
+        and gt files are read in a single pass.
+
+        :param file_names_data: paths to the data images
+        :type file_names_data: Optional[Sequence[Union[str, Path]]]
+        :param file_names_gt: paths to the gt images
+        :type file_names_gt: Optional[Sequence[Union[str, Path]]]
+        :param gt_format: name of the gt format (e.g. `rgb`), needed for the gt files
+        :type gt_format: Optional[str]
+        :param get_class_counts_func: function returning the number of pixels per class key of a gt image
+        :type get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]]
+        :param workers: number of worker processes to read the missing files
+        :type workers: int
+        :return: the keys of the data and of the gt files and the number of files that have been read
+        :rtype: Tuple[List[str], List[str], int]
+        """
+        file_names_data = [] if file_names_data is None else list(file_names_data)
+        file_names_gt = [] if file_names_gt is None else list(file_names_gt)
+        if file_names_gt and (gt_format is None or get_class_counts_func is None):
+            raise ValueError('The gt format and the class counts function are needed to index gt files')
+        gt_entries = self.gt_entries.setdefault(gt_format, {}) if file_names_gt else {}
+
+        keys_data = [self._get_key(p) for p in file_names_data]
+        keys_gt = [self._get_key(p) for p in file_names_gt]
+        missing_data = {}
+        for path, key in zip(file_names_data, keys_data):
+            stat = os.stat(path)
+            if not self._is_valid(self.data_entries.get(key), stat):
+                missing_data[key] = (path, stat)
+        missing_gt = {}
+        for path, key in zip(file_names_gt, keys_gt):
+            stat = os.stat(path)
+            if not self._is_valid(gt_entries.get(key), stat):
+                missing_gt[key] = (path, stat)
+
+        num_missing = max(len(missing_data), len(missing_gt))
+        if num_missing == 0:
+            return keys_data, keys_gt, 0
+
+        log.info(f'Indexing the statistics of {len(missing_data)} data and {len(missing_gt)} gt files')
+        data_items = list(missing_data.items()) + [None] * (num_missing - len(missing_data))
+        gt_items = list(missing_gt.items()) + [None] * (num_missing - len(missing_gt))
+        file_statistics = map_image_statistics(file_names_data=[None if item is None else item[1][0]
+                                                                for item in data_items],
+                                               file_names_gt=[None if item is None else item[1][0]
+                                                              for item in gt_items],
+                                               get_class_counts_func=get_class_counts_func, workers=workers)
+        for data_item, gt_item, statistics in zip(data_items, gt_items, file_statistics):
+            if data_item is not None:
+                key, (_, stat) = data_item
+                width, height = statistics.sizes[0]
+                self.data_entries[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                          'pixel_count': statistics.pixel_count,
+                                          'channel_sums': statistics.channel_sums,
+                                          'channel_squared_sums': statistics.channel_squared_sums,
+                                          'width': width, 'height': height}
+            if gt_item is not None:
+                key, (_, stat) = gt_item
+                gt_entries[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                   'class_counts': [[_to_json_key(k), c] for k, c in statistics.class_counts.items()]}
+        return keys_data, keys_gt, num_missing
+
+    def get_statistics(self, keys_data: Sequence[str] = (), keys_gt: Sequence[str] = (),
+                       gt_format: Optional[str] = None) -> ImageStatistics:
+        """
+        Sums up the statistics of the given (indexed) files.
+
+        :param keys_data: keys of the data files (see :meth:`update`)
+        :type keys_data: Sequence[str]
+        :param keys_gt: keys of the gt files (see :meth:`update`)
+        :type keys_gt: Sequence[str]
+        :param gt_format: name of the gt format
+        :type gt_format: Optional[str]
+        :return: the merged statistics of the files
+        :rtype: ImageStatistics
+        """
+        statistics = ImageStatistics()
+        for key in keys_data:
+            entry = self.data_entries[key]
+            statistics += ImageStatistics(pixel_count=entry['pixel_count'], channel_sums=entry['channel_sums'],
+                                          channel_squared_sums=entry['channel_squared_sums'],
+                                          sizes=[(entry['width'], entry['height'])])
+        gt_entries = self.gt_entries.get(gt_format, {})
+        for key in keys_gt:
+            statistics += ImageStatistics(class_counts={_from_json_key(k): c
+                                                        for k, c in gt_entries[key]['class_counts']})
+        return statistics
+
+    def get_class_counts(self, keys_gt: Sequence[str], gt_format: str) -> List[Dict[Any, int]]:
+        """
+        Returns the pixels per class key of every given (indexed) gt file.
+
+        :param keys_gt: keys of the gt files (see :meth:`update`)
+        :type keys_gt: Sequence[str]
+        :param gt_format: name of the gt format
+        :type gt_format: str
+        :return: the number of pixels per class key of each file
+        :rtype: List[Dict[Any, int]]
+        """
+        gt_entries = self.gt_entries.get(gt_format, {})
+        return [{_from_json_key(k): c for k, c in gt_entries[key]['class_counts']} for key in keys_gt]
+
+
+def _update_distributed(index: StatisticsIndex, file_names_data: Optional[Sequence[Union[str, Path]]] = None,
+                        file_names_gt: Optional[Sequence[Union[str, Path]]] = None, gt_format: Optional[str] = None,
+                        get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]] = None,
+                        workers: int = 8) -> Tuple[List[str], List[str], int]:
+    """
+    Like :meth:`StatisticsIndex.update`, but every rank just checks (and reads if needed) every world size-th file.
+    The entries of the files are then exchanged, so the index of every rank contains all the files.
+    """
+    file_names_data = [] if file_names_data is None else list(file_names_data)
+    file_names_gt = [] if file_names_gt is None else list(file_names_gt)
+    rank, world_size = get_rank(), get_world_size()
+
+    shard_keys_data, shard_keys_gt, num_read = index.update(file_names_data=file_names_data[rank::world_size],
+                                                            file_names_gt=file_names_gt[rank::world_size],
+                                                            gt_format=gt_format,
+                                                            get_class_counts_func=get_class_counts_func,
+                                                            workers=workers)
+    gt_entries = index.gt_entries.get(gt_format, {})
+    shards = all_gather_object(({key: index.data_entries[key] for key in shard_keys_data},
+                                {key: gt_entries[key] for key in shard_keys_gt},
+                                num_read))
+
+    num_read = 0
+    for shard_data_entries, shard_gt_entries, shard_num_read in shards:
+        index.data_entries.update(shard_data_entries)
+        if shard_gt_entries:
+            index.gt_entries.setdefault(gt_format, {}).update(shard_gt_entries)
+        num_read += shard_num_read
+    return [index._get_key(p) for p in file_names_data], [index._get_key(p) for p in file_names_gt], num_read
+
+
+def update_statistics_index(root: Path, file_names_data: Optional[Sequence[Union[str, Path]]] = None,
+                            file_names_gt: Optional[Sequence[Union[str, Path]]] = None,
+                            gt_format: Optional[str] = None,
+                            get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]] = None,
+                            workers: int = 8) -> Tuple[StatisticsIndex, List[str], List[str]]:
+    """
+    Loads the statistics index of a dataset and adds the files which are missing. The index is saved if files have
+    been added. Under an initialized process group every rank has to call this function, the files are split across
+    the ranks and just rank zero saves the index.
+
+    :param root: root folder of the dataset (location of the index)
+    :type root: Path
+    :param file_names_data: paths to the data images
+    :type file_names_data: Optional[Sequence[Union[str, Path]]]
+    :param file_names_gt: paths to the gt images
+    :type file_names_gt: Optional[Sequence[Union[str, Path]]]
+    :param gt_format: name of the gt format (e.g. `rgb`), the class keys of the formats differ
+    :type gt_format: Optional[str]
+    :param get_class_counts_func: function returning the number of pixels per class key of a gt image
+    :type get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]]
+    :param workers: number of worker processes to read the missing files
+    :type workers: int
+    :return: the index and the keys of the data and of the gt files
+    :rtype: Tuple[StatisticsIndex, List[str], List[str]]
+    """
+    index = StatisticsIndex.load(root=root)
+    update = _update_distributed if is_distributed() else StatisticsIndex.update
+    keys_data, keys_gt, num_read = update(index, file_names_data=file_names_data, file_names_gt=file_names_gt,
+                                          gt_format=gt_format, get_class_counts_func=get_class_counts_func,
+                                          workers=workers)
+    if num_read > 0 and get_rank() == 0:
+        index.save()
+    return index, keys_data, keys_gt
+
+
+def compute_image_statistics_indexed(root: Path, file_names_data: Optional[Sequence[Union[str, Path]]] = None,
+                                     file_names_gt: Optional[Sequence[Union[str, Path]]] = None,
+                                     gt_format: Optional[str] = None,
+                                     get_class_counts_func: Optional[Callable[[Union[str, Path]],
+                                                                              Dict[Any, int]]] = None,
+                                     workers: int = 8) -> ImageStatistics:
+    """
+    Computes the statistics of the files like :func:`compute_image_statistics`, but the statistics of every file are
+    taken from the statistics index of the dataset. Only the files which are missing in the index are read, the index
+    is saved if files have been added.
+    Under an initialized process group every rank has to call this function, the files are split across the ranks and
+    just rank zero saves the index.
+
+    :param root: root folder of the dataset (location of the index)
+    :type root: Path
+    :param file_names_data: paths to the data images (None if only the gt is needed)
+    :type file_names_data: Optional[Sequence[Union[str, Path]]]
+    :param file_names_gt: paths to the gt images (None if only the data is needed)
+    :type file_names_gt: Optional[Sequence[Union[str, Path]]]
+    :param gt_format: name of the gt format (e.g. `rgb`), the class keys of the formats differ
+    :type gt_format: Optional[str]
+    :param get_class_counts_func: function returning the number of pixels per class key of a gt image
+    :type get_class_counts_func: Optional[Callable[[Union[str, Path]], Dict[Any, int]]]
+    :param workers: number of worker processes to read the missing files
+    :type workers: int
+    :return: the merged statistics of all the files
+    :rtype: ImageStatistics
+    """
+    if len(file_names_data if file_names_data is not None else []) == 0 \
+            and len(file_names_gt if file_names_gt is not None else []) == 0:
+        raise ValueError('There are no files to compute the statistics')
+
+    index, keys_data, keys_gt = update_statistics_index(root=root, file_names_data=file_names_data,
+                                                        file_names_gt=file_names_gt, gt_format=gt_format,
+                                                        get_class_counts_func=get_class_counts_func, workers=workers)
+    return index.get_statistics(keys_data=keys_data, keys_gt=keys_gt, gt_format=gt_format)
@@ -0,0 +1,277 @@
+"""
+Tiled page store for virtual crop datasets.
+
+A tiled split stores every page only once. The pages are cut into square tiles and every tile is compressed on its own
+with zlib, so a crop can be read by decompressing only the tiles it touches. The crops themselves are not stored, they
+are computed on demand, which means that the crop size and the overlap can be changed without writing the dataset
+again. The structure of a tiled split folder is as follows::
+
+    split_folder
+    ├── store.json      (pages, tile offsets, class encodings, default crop settings)
+    └── tiles.bin       (the compressed tiles of all pages)
+
+For every page the store contains the image (H x W x 3, uint8), the integer encoded ground truth (H x W, int8) and,
+for DivaHisDB, the boundary mask (H x W, bool).
+The store is written with :class:`TiledPageStoreWriter` (see `tools/generate_packed_dataset.py`) and read with
+:class:`TiledPageStoreReader`.
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from omegaconf import ListConfig
+
+from src.datamodules.utils.lru_cache import LRUCache
+from src.datamodules.utils.packed_shards import get_selected_pages
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+STORE_INDEX_FILE_NAME = 'store.json'
+STORE_TILES_FILE_NAME = 'tiles.bin'
+STORE_FORMAT_VERSION = 1
+
+TILE_KINDS = {'data': (np.uint8, (3,)),
+              'gt': (np.int8, ()),
+              'mask': (np.bool_, ())}
+
+
+class TiledPageStoreWriter:
+    """
+    Writes the pages of one split into a tiled store.
+
+    :param output_path: Folder of the tiled split (e.g. `data_dir/train`)
+    :type output_path: Path
+    :param tile_size: Size of the square tiles
+    :type tile_size: int
+    :param with_mask: If True, a boundary mask is stored for every page (DivaHisDB)
+    :type with_mask: bool
+    :param compression_level: zlib compression level of the tiles (0-9)
+    :type compression_level: int
+    """
+
+    def __init__(self, output_path: Path, tile_size: int = 256, with_mask: bool = False, compression_level: int = 6):
+        """
+        Constructor method for the TiledPageStoreWriter class.
+        """
+        if tile_size <= 0:
+            raise ValueError(f'The tile size has to be positive (tile_size={tile_size})')
+
+        self.output_path = Path(output_path)
+        self.tile_size = tile_size
+        self.with_mask = with_mask
+        self.compression_level = compression_level
+
+        self.pages: List[Dict[str, Any]] = []
+
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        self._tiles_file = (self.output_path / STORE_TILES_FILE_NAME).open(mode='wb')
+        self._offset = 0
+
+    def add_page(self, page_name: str, img: np.ndarray, gt: np.ndarray, mask: Optional[np.ndarray] = None):
+        """
+        Cuts a page into tiles and appends the compressed tiles to the store.
+
+        :param page_name: Name of the page
+        :type page_name: str
+        :param img: Image of the page with shape (H x W x 3)
+        :type img: np.ndarray
+        :param gt: Integer encoded ground truth with shape (H x W)
+        :type gt: np.ndarray
+        :param mask: Boundary mask with shape (H x W), only needed if the writer was created with `with_mask`
+        :type mask: Optional[np.ndarray]
+        """
+        height, width = gt.shape
+        if img.shape != (height, width, 3):
+            raise ValueError(f'The image and the ground truth of the page "{page_name}" have a different size '
+                             f'({img.shape} and {gt.shape})')
+        if self.with_mask and mask is None:
+            raise ValueError(f'The writer expects a boundary mask (page "{page_name}")')
+        if any(page['name'] == page_name for page in self.pages):
+            raise ValueError(f'The page "{page_name}" was already added')
+
+        arrays = {'data': img, 'gt': gt}
+        if self.with_mask:
+            arrays['mask'] = mask
+
+        tiles = {}
+        for kind, array in arrays.items():
+            dtype, _ = TILE_KINDS[kind]
+            array = np.asarray(array, dtype=dtype)
+            tiles[kind] = [self._write_tile(array[y:y + self.tile_size, x:x + self.tile_size])
+                           for y in range(0, height, self.tile_size)
+                           for x in range(0, width, self.tile_size)]
+
+        self.pages.append({'name': page_name, 'height': int(height), 'width': int(width), 'tiles': tiles})
+
+    def close(self, class_encodings: List[Any], crop_defaults: Optional[Dict[str, Any]] = None):
+        """
+        Closes the tile file and writes the index of the store.
+
+        :param class_encodings: The class encodings that were used to encode the ground truth
+        :type class_encodings: List[Any]
+        :param crop_defaults: Default settings of the virtual crops (crop_size, overlap and leading_zeros_length)
+        :type crop_defaults: Optional[Dict[str, Any]]
+        """
+        if not self.pages:
+            raise ValueError('Can not write a tiled split without pages')
+        self._tiles_file.close()
+
+        index = {'version': STORE_FORMAT_VERSION,
+                 'tile_size': self.tile_size,
+                 'has_mask': self.with_mask,
+                 'class_encodings': class_encodings,
+                 'crop_defaults': crop_defaults or {},
+                 'pages': self.pages}
+
+        with (self.output_path / STORE_INDEX_FILE_NAME).open(mode='w') as f:
+            json.dump(obj=index, fp=f)
+
+    def _write_tile(self, tile: np.ndarray) -> Tuple[int, int]:
+        buffer = zlib.compress(np.ascontiguousarray(tile).tobytes(), self.compression_level)
+        self._tiles_file.write(buffer)
+        position = (self._offset, len(buffer))
+        self._offset += len(buffer)
+        return position
+
+
+class TiledPageStoreReader:
+    """
+    Reads windows out of the pages of a tiled split. Only the tiles which overlap with the window are read and
+    decompressed. The tile file is opened on first access, so every DataLoader worker has its own file descriptor.
+
+    :param path: Folder of the tiled split (e.g. `data_dir/train`)
+    :type path: Path
+    :param tile_cache: Cache for the decompressed tiles, neighbouring crops share most of their tiles
+    :type tile_cache: Optional[LRUCache]
+    """
+
+    def __init__(self, path: Path, tile_cache: Optional[LRUCache] = None):
+        """
+        Constructor method for the TiledPageStoreReader class.
+        """
+        self.path = Path(path)
+
+        with (self.path / STORE_INDEX_FILE_NAME).open(mode='r') as f:
+            index = json.load(fp=f)
+
+        if index['version'] != STORE_FORMAT_VERSION:
+            raise ValueError(f'Unsupported tiled store version {index["version"]} in {self.path}')
+
+        self.tile_size = index['tile_size']
+        self.has_mask = index['has_mask']
+        self.class_encodings = index['class_encodings']
+        self.crop_defaults = index['crop_defaults']
+        self.pages = index['pages']
+        self.page_names = [page['name'] for page in self.pages]
+        self.tiles_path = self.path / STORE_TILES_FILE_NAME
+        self.tile_cache = tile_cache
+
+        self._file_descriptor = None
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # file descriptors are not sent to the workers, the file is opened in every process
+        state = self.__dict__.copy()
+        state['_file_descriptor'] = None
+        return state
+
+    def __del__(self):
+        if getattr(self, '_file_descriptor', None) is not None:
+            os.close(self._file_descriptor)
+
+    def get_page_size(self, page_id: int) -> Tuple[int, int]:
+        """
+        Returns the size of a page.
+
+        :param page_id: Index of the page in the store
+        :type page_id: int
+        :return: width and height of the page
+        :rtype: Tuple[int, int]
+        """
+        return self.pages[page_id]['width'], self.pages[page_id]['height']
+
+    def read_window(self, page_id: int, kind: str, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """
+        Reads a window of a page.
+
+        :param page_id: Index of the page in the store
+        :type page_id: int
+        :param kind: What should be read (data, gt or mask)
+        :type kind: str
+        :param x: x coordinate of the upper left corner of the window
+        :type x: int
+        :param y: y coordinate of the upper left corner of the window
+        :type y: int
+        :param width: width of the window
+        :type width: int
+        :param height: height of the window
+        :type height: int
+        :return: The window (height x width x 3 for the data, height x width otherwise)
+        :rtype: np.ndarray
+        """
+        if kind == 'mask' and not self.has_mask:
+            raise ValueError(f'The tiled split {self.path} does not contain boundary masks')
+
+        page = self.pages[page_id]
+        if x < 0 or y < 0 or x + width > page['width'] or y + height > page['height']:
+            raise ValueError(f'The window ({x}, {y}, {width}, {height}) is outside of the page "{page["name"]}" '
+                             f'({page["width"]}x{page["height"]})')
+
+        dtype, channels = TILE_KINDS[kind]
+        window = np.empty((height, width) + channels, dtype=dtype)
+        num_tiles_x = -(-page['width'] // self.tile_size)
+
+        for tile_y in range(y // self.tile_size, (y + height - 1) // self.tile_size + 1):
+            for tile_x in range(x // self.tile_size, (x + width - 1) // self.tile_size + 1):
+                tile_top, tile_left = tile_y * self.tile_size, tile_x * self.tile_size
+                tile_shape = (min(self.tile_size, page['height'] - tile_top),
+                              min(self.tile_size, page['width'] - tile_left)) + channels
+                tile = self._get_tile(page_id=page_id, kind=kind, tile_index=tile_y * num_tiles_x + tile_x,
+                                      dtype=dtype, tile_shape=tile_shape)
+
+                top, bottom = max(y, tile_top), min(y + height, tile_top + tile_shape[0])
+                left, right = max(x, tile_left), min(x + width, tile_left + tile_shape[1])
+                window[top - y:bottom - y, left - x:right - x] = \
+                    tile[top - tile_top:bottom - tile_top, left - tile_left:right - tile_left]
+
+        return window
+
+    def get_page_ids(self, selection: Optional[Union[int, List[str], ListConfig]] = None) -> List[int]:
+        """
+        Returns the indices of the selected pages. The selection works the same way as in
+        :meth:`PackedShardReader.get_sample_ids`.
+
+        :param selection: selection of the pages
+        :type selection: Optional[Union[int, List[str], ListConfig]]
+        :return: Indices of the selected pages
+        :rtype: List[int]
+        """
+        if not selection:
+            return list(range(len(self.pages)))
+
+        selected_pages = get_selected_pages(page_names=self.page_names, selection=selection)
+        return [i for i, page_name in enumerate(self.page_names) if page_name in selected_pages]
+
+    def _get_tile(self, page_id: int, kind: str, tile_index: int, dtype, tile_shape: Tuple[int, ...]) -> np.ndarray:
+        key = (page_id, kind, tile_index)
+        if self.tile_cache is not None:
+            tile = self.tile_cache.get(key)
+            if tile is not None:
+                return tile
+
+        offset, length = self.pages[page_id]['tiles'][kind][tile_index]
+        tile = np.frombuffer(zlib.decompress(self._read(offset=offset, length=length)), dtype=dtype).reshape(tile_shape)
+        if self.tile_cache is not None:
+            self.tile_cache.put(key, tile)
+        return tile
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if self._file_descriptor is None:
+            self._file_descriptor = os.open(self.tiles_path, os.O_RDONLY)
+        return os.pread(self._file_descriptor, length, offset)
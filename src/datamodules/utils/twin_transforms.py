@@ -6,6 +6,8 @@ from PIL import Image
 from torch import Tensor
 from torchvision.transforms import functional as F
 
+from src.datamodules.utils.decoders import get_image_size
+
 
 class TwinCompose(object):
     """
@@ -26,7 +28,7 @@ class TwinCompose(object):
 
 class TwinRandomCrop(object):
     """
-    Crop the given PIL Images at the same random location
+    Crop the given PIL Images (or uint8 arrays of a decode backend) at the same random location
 
     :param crop_size: Desired output size of the crop.
     :type crop_size: int
@@ -57,7 +59,10 @@ class TwinRandomCrop(object):
         return i, j, th, tw
 
     def __call__(self, img, gt):
-        i, j, h, w = self.get_params(img.size)
+        i, j, h, w = self.get_params(get_image_size(img))
+        if isinstance(img, np.ndarray):
+            # uint8 arrays of a decode backend (H x W x C or H x W)
+            return img[i:i + h, j:j + w], gt[i:i + h, j:j + w]
         return F.crop(img, i, j, h, w), F.crop(gt, i, j, h, w)
 
 
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional, Callable, Union, Any, List
+from typing import Optional, Callable, Union, Any, List, Dict
 
 import numpy as np
 import torch.nn as nn
@@ -9,9 +9,11 @@ from pytorch_lightning.utilities import rank_zero_only
 
 from src.datamodules.RGB.utils.output_tools import save_output_page_image
 from src.datamodules.utils.misc import _get_argmax
+from src.datamodules.utils.output_tools import OUTPUT_CODECS
 from src.tasks.base_task import AbstractTask
 from src.utils import utils
 from src.tasks.utils.outputs import OutputKeys, reduce_dict
+from src.tasks.utils.output_writer import AsyncOutputWriter
 
 log = utils.get_logger(__name__)
 
@@ -21,6 +23,10 @@ class SemanticSegmentationRGB(AbstractTask):
     Semantic Segmentation task for whole images that are RGB encoded, so the class is encoded in the color.
     The output for the test are also full images in the RGB format.
 
+    With the aspect ratio bucketing of the datamodule (`bucketing`) the batches contain padded pages of different
+    sizes and the mask of their valid pixels after the gt (see `src/datamodules/utils/bucketing.py`). The loss and the
+    metrics ignore the padding and the outputs are cropped to the size of their page.
+
     :param model: The model to train, validate and test.
     :type model: nn.Module
     :param optimizer: The optimizer used during training.
@@ -41,6 +47,18 @@ class SemanticSegmentationRGB(AbstractTask):
     :type confusion_matrix_log_every_n_epoch: int
     :param lr: The learning rate.
     :type lr: float
+    :param batch_augmentation: Batch twin transform applied to the training batches on the device.
+    :type batch_augmentation: Optional[Callable]
+    :param output_codec: Format of the output images of the test and predict (gif or png, both paletted).
+    :type output_codec: str
+    :param output_compression_level: zlib compression level of the png output images (0-9, lower is faster), the
+        default of PIL if None.
+    :type output_compression_level: Optional[int]
+    :param num_output_writers: Number of background threads which write the outputs of the test and predict (see
+        class: `AsyncOutputWriter`), with 0 the outputs are written in the steps.
+    :type num_output_writers: int
+    :param max_pending_outputs: Maximal number of outputs which wait to be written, the steps block if there are more.
+    :type max_pending_outputs: int
     """
 
     def __init__(self,
@@ -55,7 +73,12 @@ class SemanticSegmentationRGB(AbstractTask):
                  confusion_matrix_val: Optional[bool] = False,
                  confusion_matrix_test: Optional[bool] = False,
                  confusion_matrix_log_every_n_epoch: Optional[int] = 1,
-                 lr: float = 1e-3
+                 lr: float = 1e-3,
+                 batch_augmentation: Optional[Callable] = None,
+                 output_codec: str = 'gif',
+                 output_compression_level: Optional[int] = None,
+                 num_output_writers: int = 0,
+                 max_pending_outputs: int = 8
                  ) -> None:
         """
         Construction method for the SemanticSegmentationRGB task
@@ -73,7 +96,15 @@ class SemanticSegmentationRGB(AbstractTask):
             confusion_matrix_val=confusion_matrix_val,
             confusion_matrix_test=confusion_matrix_test,
             confusion_matrix_log_every_n_epoch=confusion_matrix_log_every_n_epoch,
+            batch_augmentation=batch_augmentation,
         )
+        if output_codec not in OUTPUT_CODECS:
+            raise ValueError(f'Unknown output codec "{output_codec}" (available: {OUTPUT_CODECS})')
+        if output_compression_level is not None and output_codec != 'png':
+            raise ValueError('The compression level can only be set for the png output codec')
+        self.output_codec = output_codec
+        self.output_compression_level = output_compression_level
+        self.output_writer = AsyncOutputWriter(num_workers=num_output_writers, max_pending=max_pending_outputs)
         # self.save_hyperparameters()
 
     def setup(self, stage: str) -> None:
@@ -95,8 +126,9 @@ class SemanticSegmentationRGB(AbstractTask):
     ########################################### TRAIN ###########################################
     #############################################################################################
     def training_step(self, batch, batch_idx, **kwargs):
-        input_batch, target_batch = batch
-        output = super().training_step(batch=(input_batch, target_batch), batch_idx=batch_idx)
+        input_batch, target_batch, *mask = batch
+        output = super().training_step(batch=(input_batch, target_batch), batch_idx=batch_idx,
+                                       **self._get_mask_kwargs(mask))
         return reduce_dict(input_dict=output, key_list=[OutputKeys.LOSS])
 
     #############################################################################################
@@ -104,8 +136,9 @@ class SemanticSegmentationRGB(AbstractTask):
     #############################################################################################
 
     def validation_step(self, batch, batch_idx, **kwargs):
-        input_batch, target_batch = batch
-        output = super().validation_step(batch=(input_batch, target_batch), batch_idx=batch_idx)
+        input_batch, target_batch, *mask = batch
+        output = super().validation_step(batch=(input_batch, target_batch), batch_idx=batch_idx,
+                                         **self._get_mask_kwargs(mask))
         return reduce_dict(input_dict=output, key_list=[])
 
     #############################################################################################
@@ -125,29 +158,23 @@ class SemanticSegmentationRGB(AbstractTask):
                                 info_filename=info_filename)
 
     def test_step(self, batch, batch_idx, **kwargs):
-        input_batch, target_batch, input_idx = batch
-        output = super().test_step(batch=(input_batch, target_batch), batch_idx=batch_idx)
+        input_batch, target_batch, *mask, input_idx = batch
+        output = super().test_step(batch=(input_batch, target_batch), batch_idx=batch_idx,
+                                   **self._get_mask_kwargs(mask))
 
         if not hasattr(self.trainer.datamodule, 'get_output_filename_test'):
             raise NotImplementedError('Datamodule does not provide output info for test')
 
-        for pred_raw, idx in zip(output[OutputKeys.PREDICTION].detach().cpu().numpy(),
+        for pred_raw, idx in zip(self._get_page_predictions(output[OutputKeys.PREDICTION], mask),
                                  input_idx.detach().cpu().numpy()):
             img_name = self.trainer.datamodule.get_output_filename_test(idx)
-            dest_folder = self.test_output_path / 'pred_raw'
-            dest_folder.mkdir(parents=True, exist_ok=True)
-            dest_filename = dest_folder / f'{img_name}.npy'
-            np.save(file=str(dest_filename), arr=pred_raw)
-
-            dest_folder = self.test_output_path / 'pred'
-            dest_folder.mkdir(parents=True, exist_ok=True)
-            save_output_page_image(image_name=f'{img_name}.gif', output_image=pred_raw,
-                                   output_folder=dest_folder, class_encoding=self.trainer.datamodule.class_encodings)
+            self.output_writer.submit(self._save_page_output, pred_raw=pred_raw, img_name=img_name,
+                                      output_path=self.test_output_path)
 
         return reduce_dict(input_dict=output, key_list=[])
 
     def on_test_end(self) -> None:
-        pass
+        self.output_writer.close()
 
     #############################################################################################
     ######################################### PREDICT ###########################################
@@ -166,27 +193,76 @@ class SemanticSegmentationRGB(AbstractTask):
                                 info_filename=info_filename)
 
     def predict_step(self, batch: Any, batch_idx: int, dataloader_idx: Optional[int] = None) -> Any:
-        input_batch, input_idx = batch
+        input_batch, *mask, input_idx = batch
         output = super().predict_step(batch=input_batch, batch_idx=batch_idx, dataloader_idx=dataloader_idx)
 
         if not hasattr(self.trainer.datamodule, 'get_output_filename_predict'):
             raise NotImplementedError('Datamodule does not provide output info for predict')
 
-        for pred_raw, idx in zip(output[OutputKeys.PREDICTION].detach().cpu().numpy(),
+        for pred_raw, idx in zip(self._get_page_predictions(output[OutputKeys.PREDICTION], mask),
                                  input_idx.detach().cpu().numpy()):
             img_name = self.trainer.datamodule.get_output_filename_predict(idx)
-            dest_folder = self.predict_output_path / 'pred_raw'
-            dest_folder.mkdir(parents=True, exist_ok=True)
-            dest_filename = dest_folder / f'{img_name}.npy'
-            np.save(file=str(dest_filename), arr=pred_raw)
-
-            dest_folder = self.predict_output_path / 'pred'
-            dest_folder.mkdir(parents=True, exist_ok=True)
-            save_output_page_image(image_name=f'{img_name}.gif', output_image=pred_raw,
-                                   output_folder=dest_folder, class_encoding=self.trainer.datamodule.class_encodings)
+            self.output_writer.submit(self._save_page_output, pred_raw=pred_raw, img_name=img_name,
+                                      output_path=self.predict_output_path)
 
         return reduce_dict(input_dict=output, key_list=[])
 
+    def on_predict_end(self) -> None:
+        self.output_writer.close()
+
+    def _save_page_output(self, pred_raw: np.ndarray, img_name: str, output_path: Path) -> None:
+        """
+        Saves the raw prediction of a page to `pred_raw` and the output image to `pred` of the output path. Runs in
+        the threads of the output writer.
+
+        :param pred_raw: the prediction of the page (C x H x W)
+        :type pred_raw: np.ndarray
+        :param img_name: the output file name of the page
+        :type img_name: str
+        :param output_path: the test or predict output path
+        :type output_path: Path
+        """
+        dest_folder = output_path / 'pred_raw'
+        dest_folder.mkdir(parents=True, exist_ok=True)
+        dest_filename = dest_folder / f'{img_name}.npy'
+        np.save(file=str(dest_filename), arr=pred_raw)
+
+        dest_folder = output_path / 'pred'
+        dest_folder.mkdir(parents=True, exist_ok=True)
+        save_output_page_image(image_name=f'{img_name}.{self.output_codec}', output_image=pred_raw,
+                               output_folder=dest_folder, class_encoding=self.trainer.datamodule.class_encodings,
+                               compress_level=self.output_compression_level)
+
+    @staticmethod
+    def _get_mask_kwargs(mask: List[torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """
+        :param mask: the remaining elements of the batch, the mask of the valid pixels if the pages are padded
+        :type mask: List[torch.Tensor]
+        :return: the keyword arguments of :meth:`AbstractTask.step`
+        :rtype: Dict[str, torch.Tensor]
+        """
+        return {'mask': mask[0]} if mask else {}
+
+    @staticmethod
+    def _get_page_predictions(prediction: torch.Tensor, mask: List[torch.Tensor]) -> List[np.ndarray]:
+        """
+        Returns the predictions of the pages of a batch, the predictions of padded pages are cropped to the size of
+        their page.
+
+        :param prediction: the predictions of the batch (B x C x H x W)
+        :type prediction: torch.Tensor
+        :param mask: the remaining elements of the batch, the mask of the valid pixels if the pages are padded
+        :type mask: List[torch.Tensor]
+        :return: the prediction of every page (C x H x W)
+        :rtype: List[np.ndarray]
+        """
+        predictions = list(prediction.detach().cpu().numpy())
+        if not mask:
+            return predictions
+        heights = mask[0].any(dim=2).sum(dim=1).tolist()
+        widths = mask[0].any(dim=1).sum(dim=1).tolist()
+        return [pred[:, :height, :width] for pred, height, width in zip(predictions, heights, widths)]
+
     @staticmethod
     def write_file_mapping(output_file_list: List[str], image_path_list: List[Path],
                            output_path: Path, info_filename: str):
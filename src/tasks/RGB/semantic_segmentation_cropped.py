@@ -1,15 +1,16 @@
 from pathlib import Path
 from typing import Optional, Callable, Union
 
+import numpy as np
 import torch.nn as nn
 import torch.optim
 import torchmetrics
 
+from src.datamodules.RGB.utils.output_tools import save_output_page_image
 from src.datamodules.utils.misc import _get_argmax
 from src.tasks.base_task import AbstractTask
 from src.utils import utils
-from src.tasks.utils.outputs import OutputKeys, reduce_dict, save_numpy_files
-from src.tasks.utils.task_utils import print_merge_tool_info
+from src.tasks.utils.outputs import OutputKeys, reduce_dict
 
 log = utils.get_logger(__name__)
 
@@ -40,6 +41,23 @@ class SemanticSegmentationCroppedRGB(AbstractTask):
     :type confusion_matrix_log_every_n_epoch: int
     :param lr: The learning rate.
     :type lr: float
+    :param batch_augmentation: Batch twin transform applied to the training batches on the device.
+    :type batch_augmentation: Optional[Callable]
+    :param stitch_test_pages: If True, the test crops are stitched into their pages while the test runs (see
+        class: `PageStitcher`). Every finished page is written to `result/pred` of the test output and scored with
+        the test metrics (`test/page_<metric>`, the values of every page are written to `result/page_metrics.txt`).
+        Just the crops of pages which are split between several processes are saved as patches for
+        `tools/merge_cropped_output_RGB.py`.
+    :type stitch_test_pages: bool
+    :param patch_store: How the test patches are stored in the patch store (float32, float16 or argmax, see
+        class: `PatchStoreWriter`). Every process appends the patches of a page to a single file, which
+        `tools/merge_cropped_output_RGB.py` reads sequentially. If None, every patch is saved as `.npy` file.
+    :type patch_store: Optional[str]
+    :param num_output_writers: Number of background threads which write the `.npy` patches and the stitched pages
+        (see class: `AsyncOutputWriter`), with 0 the outputs are written in the steps.
+    :type num_output_writers: int
+    :param max_pending_outputs: Maximal number of outputs which wait to be written, the steps block if there are more.
+    :type max_pending_outputs: int
     """
 
     def __init__(self,
@@ -54,7 +72,12 @@ class SemanticSegmentationCroppedRGB(AbstractTask):
                  confusion_matrix_val: Optional[bool] = False,
                  confusion_matrix_test: Optional[bool] = False,
                  confusion_matrix_log_every_n_epoch: Optional[int] = 1,
-                 lr: float = 1e-3
+                 lr: float = 1e-3,
+                 batch_augmentation: Optional[Callable] = None,
+                 stitch_test_pages: bool = False,
+                 patch_store: Optional[str] = None,
+                 num_output_writers: int = 0,
+                 max_pending_outputs: int = 8
                  ) -> None:
         """
         Construction method for RGB SegemntationCropped task.
@@ -72,7 +95,10 @@ class SemanticSegmentationCroppedRGB(AbstractTask):
             confusion_matrix_val=confusion_matrix_val,
             confusion_matrix_test=confusion_matrix_test,
             confusion_matrix_log_every_n_epoch=confusion_matrix_log_every_n_epoch,
+            batch_augmentation=batch_augmentation,
         )
+        self._init_test_outputs(stitch_test_pages=stitch_test_pages, patch_store=patch_store,
+                                num_output_writers=num_output_writers, max_pending_outputs=max_pending_outputs)
         # self.save_hyperparameters()
 
     def setup(self, stage: str) -> None:
@@ -92,8 +118,10 @@ class SemanticSegmentationCroppedRGB(AbstractTask):
     ########################################### TRAIN ###########################################
     #############################################################################################
     def training_step(self, batch, batch_idx, **kwargs):
-        input_batch, target_batch = batch
-        output = super().training_step(batch=(input_batch, target_batch), batch_idx=batch_idx)
+        # with the hard example mining the crops come with their dataset index
+        input_batch, target_batch, *input_idx = batch
+        output = super().training_step(batch=(input_batch, target_batch), batch_idx=batch_idx,
+                                       input_idx=input_idx[0] if input_idx else None)
         return reduce_dict(input_dict=output, key_list=[OutputKeys.LOSS])
 
     #############################################################################################
@@ -113,9 +141,18 @@ class SemanticSegmentationCroppedRGB(AbstractTask):
         input_batch, target_batch, input_idx = batch
         output = super().test_step(batch=(input_batch, target_batch), batch_idx=batch_idx)
 
-        save_numpy_files(self.trainer, self.test_output_path, input_idx, output)
+        self._save_test_crops(output=output, input_idx=input_idx, gt=target_batch)
 
         return reduce_dict(input_dict=output, key_list=[])
 
+    def on_test_start(self) -> None:
+        self._setup_test_outputs()
+
+    def on_test_page_end(self, page_name: str, prediction: np.ndarray, gt: np.ndarray) -> None:
+        self.output_writer.submit(save_output_page_image, image_name=f'{page_name}.gif', output_image=prediction,
+                                  output_folder=self.test_output_path / 'result' / 'pred',
+                                  class_encoding=self.trainer.datamodule.class_encodings)
+        self._log_page_metrics(page_name=page_name, prediction=prediction, gt=gt)
+
     def on_test_end(self) -> None:
-        print_merge_tool_info(self.trainer, self.test_output_path, 'RGB')
+        self._close_test_outputs(data_format='RGB')
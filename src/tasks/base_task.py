@@ -1,3 +1,4 @@
+import copy
 import os
 from abc import ABCMeta
 from pathlib import Path
@@ -21,8 +22,12 @@ from torch.optim import Optimizer
 from torch.optim.lr_scheduler import _LRScheduler
 
 from src.callbacks.wandb_callbacks import get_wandb_logger
-from src.tasks.utils.outputs import OutputKeys
-from src.tasks.utils.task_utils import get_callable_dict
+from src.datamodules.utils.functional import normalize_uint8
+from src.datamodules.utils.patch_store import PATCH_STORAGES, PatchStoreWriter
+from src.tasks.utils.output_writer import AsyncOutputWriter
+from src.tasks.utils.outputs import OutputKeys, save_numpy_files
+from src.tasks.utils.page_stitching import PageStitcher
+from src.tasks.utils.task_utils import get_callable_dict, print_merge_tool_info
 from src.utils import utils
 
 log = utils.get_logger(__name__)
@@ -40,7 +45,8 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
         - ``OutputKeys.LOG``: A dictionary with all the logs. The keys are the metric names and the values are the
             metric values.
         - ``OutputKeys.TARGET``: The target of the model.
-
+        - ``OutputKeys.MASK``: The mask of the valid pixels, if the batch contains padded pages (see
+            `src/datamodules/utils/bucketing.py`).
 
     :param model: Composed model to use for the task.
     :type model: nn.Module
@@ -72,6 +78,9 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
     :type test_output_path: Union[str, Path]
     :param predict_output_path: Path relative to the normal output folder where to save the predict output
     :type predict_output_path: Union[str, Path]
+    :param batch_augmentation: Batch twin transform (see `src/datamodules/utils/batch_twin_transforms.py`) which is
+        applied to the training batches after the transfer to the device, defaults to None.
+    :type batch_augmentation: Optional[Callable]
     """
 
     def __init__(
@@ -90,8 +99,8 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
             confusion_matrix_log_every_n_epoch: Optional[int] = 1,
             lr: float = 1e-3,
             test_output_path: Optional[Union[str, Path]] = 'test_output',
-            predict_output_path: Optional[Union[str, Path]] = 'predict_output'
-
+            predict_output_path: Optional[Union[str, Path]] = 'predict_output',
+            batch_augmentation: Optional[Callable] = None
     ):
         super().__init__()
 
@@ -121,6 +130,7 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
         self.lr = lr
         self.test_output_path = Path(test_output_path)
         self.predict_output_path = Path(predict_output_path)
+        self.batch_augmentation = batch_augmentation
         # self.save_hyperparameters()
 
     def setup(self, stage: str):
@@ -151,9 +161,42 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
                     f'Number of sample ({num_samples}) in {datasplit_name} not dividable by batch size ({batch_size}).')
                 log.warning('Last batch will be incomplete. Behavior depends on datamodule.drop_last setting.')
 
+    def on_after_batch_transfer(self, batch: Any, dataloader_idx: int) -> Any:
+        """
+        Prepares the batch on the device. The images (the first element of the batch in every stage) are normalized
+        if the datamodule ships uint8 batches (`uint8_batches`) and the training batches are augmented with the
+        `batch_augmentation`.
+
+        :param batch: the batch on the device
+        :type batch: Any
+        :param dataloader_idx: index of the dataloader
+        :type dataloader_idx: int
+        :return: the prepared batch
+        :rtype: Any
+        """
+        if not isinstance(batch, (list, tuple)) or not torch.is_tensor(batch[0]):
+            return batch
+
+        datamodule = self.trainer.datamodule
+        normalize = getattr(datamodule, 'uint8_batches', False) and batch[0].dtype == torch.uint8
+        augment = self.batch_augmentation is not None and self.trainer.training
+        if not normalize and not augment:
+            return batch
+
+        x, *rest = batch
+        if normalize:
+            x = normalize_uint8(x, mean=datamodule.mean, std=datamodule.std)
+        if augment:
+            x, *rest = self.batch_augmentation(x, *rest)
+        if isinstance(batch, tuple):
+            return (x, *rest)
+        return [x, *rest]
+
     def step(self,
              batch: Any,
-             metric_kwargs: Optional[Dict[str, Dict[str, Any]]] = None) -> Union[Dict[OutputKeys, Any], Tuple[Any, Any]]:
+             metric_kwargs: Optional[Dict[str, Dict[str, Any]]] = None,
+             input_idx: Optional[torch.Tensor] = None,
+             mask: Optional[torch.Tensor] = None) -> Union[Dict[OutputKeys, Any], Tuple[Any, Any]]:
         """
         The training/validation/test step. Override for custom behavior.
 
@@ -163,6 +206,12 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
             e.g. you have two metrics (A, B) and B takes an additional arguments x and y so the dictionary would
             look like this: {'B': {'x': 'value', 'y': 'value'}}
         :type metric_kwargs: Optional[Dict[str, Dict[str, Any]]]
+        :param input_idx: the dataset indices of the samples of the batch, if given the loss of every sample is
+            reported to the hard example sampler of the datamodule
+        :type input_idx: Optional[torch.Tensor]
+        :param mask: the valid (not padded) pixels of a batch of padded pages (B x H x W), if given the loss and the
+            metrics are just computed on these pixels and the share of the padding is logged
+        :type mask: Optional[torch.Tensor]
         """
         for key in self.loss_fn:
             if hasattr(self.loss_fn[key], 'weight') and self.loss_fn[key].weight is not None:
@@ -177,25 +226,89 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
             y_hat = y_hat['out']
         output = {OutputKeys.PREDICTION: y_hat}
         y_hat = self.to_loss_format(output[OutputKeys.PREDICTION])
-        losses = {name: l_fn(y_hat, y) for name, l_fn in self.loss_fn.items()}
+        y_valid = y if mask is None else y[mask]
+        losses = {name: l_fn(self._get_valid_pixels(y_hat, mask=mask), y_valid) for name, l_fn in self.loss_fn.items()}
+        if input_idx is not None:
+            self._update_hard_example_sampler(y_hat=y_hat, y=y, input_idx=input_idx)
         logs = {}
-        y_hat = self.to_metrics_format(output[OutputKeys.PREDICTION])
+        y_hat = self._get_valid_pixels(self.to_metrics_format(output[OutputKeys.PREDICTION]), mask=mask)
         current_metric = self._get_current_metric()
 
         for name, metric in current_metric.items():
             if name in metric_kwargs:
-                logs[name] = metric(y_hat, y, **metric_kwargs[name])
+                logs[name] = metric(y_hat, y_valid, **metric_kwargs[name])
             else:
-                logs[name] = metric(y_hat, y)
+                logs[name] = metric(y_hat, y_valid)
         logs.update(losses)
+        if mask is not None:
+            logs['padding_fraction'] = 1 - mask.float().mean()
         if len(losses.values()) > 1:
             logs["total_loss"] = sum(losses.values())
             return logs["total_loss"], logs
         output[OutputKeys.LOSS] = list(losses.values())[0]
         output[OutputKeys.LOG] = logs
         output[OutputKeys.TARGET] = y
+        if mask is not None:
+            output[OutputKeys.MASK] = mask
         return output
 
+    @staticmethod
+    def _get_valid_pixels(x: torch.Tensor, mask: Optional[torch.Tensor]) -> torch.Tensor:
+        """
+        Selects the valid pixels of a batch of padded pages.
+
+        :param x: the batch with (B x C x H x W) or without (B x H x W) a channel dimension
+        :type x: torch.Tensor
+        :param mask: the valid pixels (B x H x W), x is returned unchanged if None
+        :type mask: Optional[torch.Tensor]
+        :return: the valid pixels (N x C or N)
+        :rtype: torch.Tensor
+        """
+        if mask is None:
+            return x
+        if x.dim() == mask.dim() + 1:
+            return x.movedim(1, -1)[mask]
+        return x[mask]
+
+    def _update_conf_mat(self, conf_mat: MulticlassConfusionMatrix, output: Dict[OutputKeys, Any]) -> None:
+        """
+        Adds the prediction of a step to the confusion matrix, just the valid pixels of padded pages.
+
+        :param conf_mat: the confusion matrix of the stage
+        :type conf_mat: MulticlassConfusionMatrix
+        :param output: the output of the step
+        :type output: Dict[OutputKeys, Any]
+        """
+        mask = output.get(OutputKeys.MASK)
+        target = output[OutputKeys.TARGET]
+        conf_mat(preds=self._get_valid_pixels(output[OutputKeys.PREDICTION], mask=mask),
+                 target=target if mask is None else target[mask])
+
+    def _update_hard_example_sampler(self, y_hat: torch.Tensor, y: torch.Tensor, input_idx: torch.Tensor) -> None:
+        """
+        Reports the loss of every sample of the batch (the sum of the loss functions) to the hard example sampler. The
+        loss functions are evaluated once for the whole batch with `reduction='none'` and averaged over the pixels of
+        every sample, so they need a `reduction` attribute like the losses of `torch.nn`.
+
+        :param y_hat: the output of the model in the loss format
+        :type y_hat: torch.Tensor
+        :param y: the gt
+        :type y: torch.Tensor
+        :param input_idx: the dataset indices of the samples
+        :type input_idx: torch.Tensor
+        """
+        sample_losses = torch.zeros(len(input_idx), device=y_hat.device)
+        with torch.no_grad():
+            for name, l_fn in self.loss_fn.items():
+                if not hasattr(l_fn, 'reduction'):
+                    raise ValueError(f'The hard example mining needs a loss function with a reduction attribute '
+                                     f'("{name}" has none)')
+                sample_loss_fn = copy.copy(l_fn)
+                sample_loss_fn.reduction = 'none'
+                sample_losses += sample_loss_fn(y_hat, y).flatten(start_dim=1).mean(dim=1)
+        self.trainer.datamodule.hard_example_sampler.update(indices=input_idx.tolist(),
+                                                            losses=sample_losses.float().cpu().numpy())
+
     @staticmethod
     def to_loss_format(x: torch.Tensor, **kwargs) -> torch.Tensor:
         """
@@ -254,6 +367,13 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
         self._log_metrics_and_loss(output, stage='train')
         return output
 
+    def on_train_epoch_end(self) -> None:
+        # merges the losses which every rank reported to the hard example sampler, so all the ranks draw the next
+        # epoch from the same loss table (a collective, so it is called on every rank)
+        sampler = getattr(self.trainer.datamodule, 'hard_example_sampler', None)
+        if sampler is not None:
+            sampler.synchronize()
+
     def validation_step(self, batch: Any, batch_idx: int, **kwargs) -> None:
         """
         the validation step. Calls the step method and logs the metrics and loss.
@@ -273,7 +393,7 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
         self._log_metrics_and_loss(output, stage='val')
         if self.confusion_matrix_val and (
                 self.trainer.current_epoch + 1) % self.confusion_matrix_log_every_n_epoch == 0:
-            self.metric_conf_mat_val(preds=output[OutputKeys.PREDICTION], target=output[OutputKeys.TARGET])
+            self._update_conf_mat(conf_mat=self.metric_conf_mat_val, output=output)
         return output
 
     def validation_epoch_end(self, outputs: Any) -> None:
@@ -292,7 +412,7 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
     def test_step(self, batch: Any, batch_idx: int, **kwargs) -> None:
         output = self.step(batch=batch, **kwargs)
         if self.confusion_matrix_test:
-            self.metric_conf_mat_test(preds=output[OutputKeys.PREDICTION], target=output[OutputKeys.TARGET])
+            self._update_conf_mat(conf_mat=self.metric_conf_mat_test, output=output)
         self._log_metrics_and_loss(output, stage='test')
         return output
 
@@ -307,6 +427,184 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
 
         self.metric_conf_mat_test.reset()
 
+    def _init_test_outputs(self, stitch_test_pages: bool, patch_store: Optional[str], num_output_writers: int,
+                           max_pending_outputs: int) -> None:
+        """
+        Sets the options of the test outputs of a cropped test split. The crops are stitched into their pages or
+        saved as patches (see :meth:`_save_test_crops`).
+
+        :param stitch_test_pages: if True, the test crops are stitched into their pages while the test runs
+        :type stitch_test_pages: bool
+        :param patch_store: how the patches are stored in the patch store (see class: `PatchStoreWriter`), if None
+            every patch is saved as `.npy` file
+        :type patch_store: Optional[str]
+        :param num_output_writers: number of background threads which write the outputs (see
+            class: `AsyncOutputWriter`)
+        :type num_output_writers: int
+        :param max_pending_outputs: maximal number of outputs which wait to be written
+        :type max_pending_outputs: int
+        :raises ValueError: if the patch store is unknown
+        """
+        if patch_store is not None and patch_store not in PATCH_STORAGES:
+            raise ValueError(f'Unknown patch store "{patch_store}" (available: {PATCH_STORAGES})')
+        self.stitch_test_pages = stitch_test_pages
+        self.patch_store = patch_store
+        self.patch_store_writer: Optional[PatchStoreWriter] = None
+        self.output_writer = AsyncOutputWriter(num_workers=num_output_writers, max_pending=max_pending_outputs)
+
+    def _setup_test_outputs(self) -> None:
+        """
+        Prepares the page stitcher and the patch store of this process at the start of the test.
+        """
+        if self.stitch_test_pages:
+            self._setup_page_stitcher()
+        if self.patch_store is not None:
+            self.patch_store_writer = PatchStoreWriter(path=self.test_output_path / 'patches',
+                                                       rank=self.global_rank, storage=self.patch_store)
+
+    def _setup_page_stitcher(self) -> None:
+        """
+        Prepares the online stitching of a cropped test split (see class: `PageStitcher`). The stitcher gets the
+        crops of the test sampler of this process and the page-level metrics are a copy of the test metrics.
+        """
+        dataset = self.trainer.datamodule.test
+        self.page_stitcher = PageStitcher(page_ids=dataset.img_paths_per_page.page_ids,
+                                          coordinates=dataset.img_paths_per_page.coordinates,
+                                          indices=list(self.trainer.test_dataloaders[0].sampler))
+        self.metric_test_page = copy.deepcopy(self.metric_test).to(self.device)
+        self.page_metrics = {}
+        self.num_unstitched_crops = 0
+        log.info(f'{self.page_stitcher.stitched_pages.sum()} of {len(self.page_stitcher.stitched_pages)} test pages '
+                 f'are stitched by this process.')
+
+    def _save_test_crops(self, output: Dict[OutputKeys, Any], input_idx: torch.Tensor,
+                         **pixel_batches: torch.Tensor) -> None:
+        """
+        Stitches the crops of a test batch into their pages (with `stitch_test_pages`) and saves the crops of the
+        pages which are not stitched by this process as patches.
+
+        :param output: the output of :meth:`test_step`
+        :type output: Dict[OutputKeys, Any]
+        :param input_idx: the dataset indices of the crops
+        :type input_idx: torch.Tensor
+        :param pixel_batches: further pixel arrays of the batch [B x H x W] which are stitched (e.g. `gt`)
+        :type pixel_batches: torch.Tensor
+        """
+        if self.stitch_test_pages:
+            not_stitched = self._stitch_test_crops(prediction=output[OutputKeys.PREDICTION], input_idx=input_idx,
+                                                   **pixel_batches)
+            input_idx = input_idx[not_stitched]
+            output = {OutputKeys.PREDICTION: output[OutputKeys.PREDICTION][not_stitched]}
+        save_numpy_files(self.trainer, self.test_output_path, input_idx, output,
+                         patch_store=self.patch_store_writer, output_writer=self.output_writer)
+
+    def _stitch_test_crops(self, prediction: torch.Tensor, input_idx: torch.Tensor,
+                           **pixel_batches: torch.Tensor) -> List[int]:
+        """
+        Adds the crops of a test batch to the page stitcher and calls :meth:`on_test_page_end` for every finished
+        page.
+
+        :param prediction: the prediction of the batch [B x #C x H x W]
+        :type prediction: torch.Tensor
+        :param input_idx: the dataset indices of the crops
+        :type input_idx: torch.Tensor
+        :param pixel_batches: further pixel arrays of the batch [B x H x W] which are stitched (e.g. `gt`)
+        :type pixel_batches: torch.Tensor
+        :return: the positions of the crops in the batch whose page is not stitched by this process
+        :rtype: List[int]
+        """
+        predictions = prediction.detach().float().cpu().numpy()
+        pixel_batches = {name: batch.detach().cpu().numpy() for name, batch in pixel_batches.items()}
+        page_names = self.trainer.datamodule.test.img_paths_per_page.page_names
+        not_stitched = []
+        for i, index in enumerate(input_idx.tolist()):
+            if not self.page_stitcher.is_stitched(index):
+                not_stitched.append(i)
+                continue
+            page = self.page_stitcher.add(index, predictions[i],
+                                          **{name: batch[i] for name, batch in pixel_batches.items()})
+            if page is not None:
+                page_id, canvases = page
+                self.on_test_page_end(page_name=page_names[page_id], **canvases)
+        self.num_unstitched_crops += len(not_stitched)
+        return not_stitched
+
+    def on_test_page_end(self, page_name: str, prediction: np.ndarray, **pixel_arrays: np.ndarray) -> None:
+        """
+        Called for every page which is stitched during the test. Override to save the page and score it with
+        :meth:`_log_page_metrics`.
+
+        :param page_name: name of the page
+        :type page_name: str
+        :param prediction: the prediction of the page [#C x H x W]
+        :type prediction: np.ndarray
+        :param pixel_arrays: further stitched pixel arrays of the page (e.g. `gt`)
+        :type pixel_arrays: np.ndarray
+        """
+        pass
+
+    def _log_page_metrics(self, page_name: str, prediction: np.ndarray, gt: np.ndarray,
+                          metric_kwargs: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """
+        Scores a stitched test page with the test metrics and logs the values as `test/page_<metric>`, so the epoch
+        value is the mean over the pages. The values of every page are stored in `page_metrics`.
+
+        :param page_name: name of the page
+        :type page_name: str
+        :param prediction: the prediction of the page [#C x H x W]
+        :type prediction: np.ndarray
+        :param gt: the gt of the page [H x W]
+        :type gt: np.ndarray
+        :param metric_kwargs: additional arguments of the metrics (see :meth:`step`)
+        :type metric_kwargs: Optional[Dict[str, Dict[str, Any]]]
+        """
+        if metric_kwargs is None:
+            metric_kwargs = {}
+        preds = self.to_metrics_format(torch.from_numpy(prediction[None])).to(self.device)
+        target = torch.from_numpy(gt[None]).to(self.device)
+        logs = {f'page_{name}': metric(preds, target, **metric_kwargs.get(name, {}))
+                for name, metric in self.metric_test_page.items()}
+        self.page_metrics[page_name] = {name: value.tolist() for name, value in logs.items()}
+        self._log_metrics_and_loss(output={OutputKeys.LOG: logs}, stage='test')
+
+    def _save_page_metrics(self, output_path: Path) -> None:
+        """
+        Writes the page-level metrics of the stitched test pages of this process into a tab separated file.
+
+        :param output_path: folder of the file
+        :type output_path: Path
+        """
+        if not self.page_metrics:
+            return
+        output_path.mkdir(parents=True, exist_ok=True)
+        file_name = 'page_metrics.txt' if self.trainer.world_size == 1 else \
+            f'page_metrics_rank_{self.trainer.global_rank}.txt'
+        metric_names = list(next(iter(self.page_metrics.values())).keys())
+        with (output_path / file_name).open('w') as f:
+            f.write('\t'.join(['page', *metric_names]) + '\n')
+            for page_name, values in self.page_metrics.items():
+                f.write('\t'.join([page_name, *[str(values[name]) for name in metric_names]]) + '\n')
+
+    def _close_test_outputs(self, data_format: str) -> None:
+        """
+        Waits for the test outputs, closes the patch store and writes the page metrics at the end of the test. If
+        crops were saved as patches, the call of the merge tool is logged.
+
+        :param data_format: the format of the merge tool (`tools/merge_cropped_output_<data_format>.py`)
+        :type data_format: str
+        """
+        try:
+            self.output_writer.close()
+        finally:
+            # the patches are complete even if the writer failed
+            if self.patch_store_writer is not None:
+                self.patch_store_writer.close()
+        if self.stitch_test_pages:
+            self._save_page_metrics(output_path=self.test_output_path / 'result')
+            if self.num_unstitched_crops == 0:
+                return
+        print_merge_tool_info(self.trainer, self.test_output_path, data_format)
+
     def predict_step(self, batch: Any, batch_idx: int, dataloader_idx: Optional[int] = None) -> Any:
         y_hat = self(batch)
         return {OutputKeys.PREDICTION: y_hat}
@@ -401,7 +699,9 @@ class AbstractTask(LightningModule, metaclass=ABCMeta):
             expected_sum = num_steps * num_processes * batch_size * pixels_per_crop
 
         matrix_sum = matrix.sum()
-        if not np.isclose(a=expected_sum, b=matrix_sum, rtol=2.5e-7):
+        # with the aspect ratio bucketing the pages have different sizes and just their valid pixels are counted
+        has_page_sizes = getattr(self.trainer.datamodule, 'bucketing', None) is not None
+        if not has_page_sizes and not np.isclose(a=expected_sum, b=matrix_sum, rtol=2.5e-7):
             log.warning(f'matrix.sum() is not close to expected_sum '
                         f'({matrix_sum} != {expected_sum}, '
                         f'diff: {matrix_sum - expected_sum}')
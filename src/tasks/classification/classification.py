@@ -38,6 +38,8 @@ class Classification(AbstractTask):
     :type confusion_matrix_log_every_n_epoch: int
     :param lr: The learning rate.
     :type lr: float
+    :param batch_augmentation: Batch twin transform applied to the training batches on the device.
+    :type batch_augmentation: Optional[Callable]
 
     """
 
@@ -51,7 +53,8 @@ class Classification(AbstractTask):
                  confusion_matrix_val: Optional[bool] = False,
                  confusion_matrix_test: Optional[bool] = False,
                  confusion_matrix_log_every_n_epoch: Optional[int] = 1,
-                 lr: float = 1e-3
+                 lr: float = 1e-3,
+                 batch_augmentation: Optional[Callable] = None
                  ) -> None:
         """
         Constructor method for the :class: `classification`.
@@ -67,6 +70,7 @@ class Classification(AbstractTask):
             confusion_matrix_val=confusion_matrix_val,
             confusion_matrix_test=confusion_matrix_test,
             confusion_matrix_log_every_n_epoch=confusion_matrix_log_every_n_epoch,
+            batch_augmentation=batch_augmentation,
         )
         # self.save_hyperparameters()
 
@@ -0,0 +1,127 @@
+"""
+Background writer for the outputs of the test and predict steps. Saving the raw predictions, the argmax, the palette
+conversion and the encoding of the output images are done by a pool of threads, so the step loop can run the model on
+the next batch in the meantime. The image encoders of PIL, zlib and the file writes release the GIL, so threads are
+enough and the predictions do not have to be copied to another process.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from src.utils import utils
+
+log = utils.get_logger(__name__)
+
+
+class AsyncOutputWriter:
+    """
+    Runs the output writes in background threads. At most `max_pending` writes are queued or running, :meth:`submit`
+    blocks until one of them is done if there are more (backpressure, so the predictions do not pile up in memory if
+    the writes are slower than the model). An exception of a write is raised by the next call of :meth:`submit` or
+    :meth:`flush` after the write. The threads are started with the first write and stopped by :meth:`close`, after
+    which the writer can be used again (e.g. for the next test).
+
+    :param num_workers: Number of writer threads, with 0 the outputs are written directly in :meth:`submit`
+    :type num_workers: int
+    :param max_pending: Maximal number of writes which are queued or running
+    :type max_pending: int
+    """
+
+    def __init__(self, num_workers: int = 2, max_pending: int = 8):
+        """
+        Constructor method for the AsyncOutputWriter class.
+        """
+        if num_workers < 0:
+            raise ValueError(f'The number of writer threads can not be negative (num_workers={num_workers})')
+        if max_pending <= 0:
+            raise ValueError(f'The number of pending writes has to be positive (max_pending={max_pending})')
+
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._condition = threading.Condition()
+        self._num_pending = 0
+        self._error: Optional[BaseException] = None
+
+    def __getstate__(self):
+        # the threads are not copied with the task (e.g. for the DDP spawn strategy), they are started on first use
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_condition'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._condition = threading.Condition()
+
+    @property
+    def num_pending(self) -> int:
+        """
+        :return: the number of writes which are queued or running
+        :rtype: int
+        """
+        return self._num_pending
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any):
+        """
+        Writes an output with `fn(*args, **kwargs)` in the background. Blocks if `max_pending` writes are pending.
+
+        :param fn: The function which writes the output
+        :type fn: Callable
+        :param args: positional arguments of the function
+        :param kwargs: keyword arguments of the function
+        """
+        if self.num_workers == 0:
+            fn(*args, **kwargs)
+            return
+
+        with self._condition:
+            while self._num_pending >= self.max_pending:
+                self._condition.wait()
+            error, self._error = self._error, None
+            if error is None:
+                self._num_pending += 1
+        self._raise_error(error)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix='output_writer')
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._on_done(future=None)
+            raise
+        future.add_done_callback(self._on_done)
+
+    def flush(self):
+        """
+        Waits until all the pending writes are done and raises the exception of a failed write.
+        """
+        with self._condition:
+            while self._num_pending > 0:
+                self._condition.wait()
+            error, self._error = self._error, None
+        self._raise_error(error)
+
+    def close(self):
+        """
+        Flushes the writer and stops the threads.
+        """
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _on_done(self, future: Optional[Future]):
+        with self._condition:
+            self._num_pending -= 1
+            if future is not None and future.exception() is not None and self._error is None:
+                self._error = future.exception()
+            self._condition.notify_all()
+
+    @staticmethod
+    def _raise_error(error: Optional[BaseException]):
+        if error is not None:
+            raise RuntimeError('Writing an output in the background failed') from error
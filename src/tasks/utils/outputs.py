@@ -1,9 +1,12 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import numpy
 import numpy as np
 from pytorch_lightning.utilities import LightningEnum
 
+from src.datamodules.utils.patch_store import PatchStoreWriter
+from src.tasks.utils.output_writer import AsyncOutputWriter
+
 
 class OutputKeys(LightningEnum):
     """
@@ -13,6 +16,7 @@ class OutputKeys(LightningEnum):
     TARGET = 'target'
     LOG = 'logs'
     LOSS = 'loss'
+    MASK = 'mask'
 
     def __hash__(self):
         return hash(self.value)
@@ -32,7 +36,26 @@ def reduce_dict(input_dict: Dict, key_list: List) -> Dict:
     return {key: input_dict[key] for key in key_list if key in input_dict}
 
 
-def save_numpy_files(trainer, test_output_path, input_idx, output):
+def save_numpy_files(trainer, test_output_path, input_idx, output, patch_store: Optional[PatchStoreWriter] = None,
+                     output_writer: Optional[AsyncOutputWriter] = None):
+    """
+    Saves the predictions of the crops of a test batch, either as one `.npy` file per crop in
+    `test_output_path/patches/<page>` or, if a patch store is given, appended to the file of the page in the store.
+
+    :param trainer: The trainer, its datamodule has to provide `get_img_name_coordinates`
+    :type trainer: pytorch_lightning.Trainer
+    :param test_output_path: The test output folder
+    :type test_output_path: Path
+    :param input_idx: The indices of the crops in the test dataset
+    :type input_idx: torch.Tensor
+    :param output: The output of the step with the predictions of the crops
+    :type output: Dict
+    :param patch_store: The writer of the patch store of this process, None to write `.npy` files
+    :type patch_store: Optional[PatchStoreWriter]
+    :param output_writer: Writes the `.npy` files in the background, the patches are written directly if None. The
+        patch store is always written directly, as the patches of a page are appended in order.
+    :type output_writer: Optional[AsyncOutputWriter]
+    """
     if not hasattr(trainer.datamodule, 'get_img_name_coordinates'):
         raise NotImplementedError('Datamodule does not provide detailed information of the crop')
     for patch, idx in zip(output[OutputKeys.PREDICTION].detach().cpu().numpy(),
@@ -40,8 +63,14 @@ def save_numpy_files(trainer, test_output_path, input_idx, output):
         patch_info = trainer.datamodule.get_img_name_coordinates(idx)
         img_name = patch_info[0]
         patch_name = patch_info[1]
+        if patch_store is not None:
+            patch_store.add(page_name=img_name, crop_name=patch_name, patch=patch)
+            continue
         dest_folder = test_output_path / 'patches' / img_name
         dest_folder.mkdir(parents=True, exist_ok=True)
         dest_filename = dest_folder / f'{patch_name}.npy'
 
-        np.save(file=str(dest_filename), arr=patch)
+        if output_writer is not None:
+            output_writer.submit(np.save, file=str(dest_filename), arr=patch)
+        else:
+            np.save(file=str(dest_filename), arr=patch)
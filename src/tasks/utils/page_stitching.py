@@ -0,0 +1,113 @@
+"""
+Online stitching of the test crops of the cropped tasks. Instead of writing a `.npy` file per crop which is merged
+by `tools/merge_cropped_output_*.py` after the test, the predictions of the crops are merged into a canvas per page
+while the test runs. A page is finished as soon as its last crop arrives, so just the pages in flight are kept in
+memory. The cropped datamodules test the crops page by page and give every rank a contiguous share of the pages
+(:class:`PageLocalitySampler` without shuffling), so there are just a few of them.
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class PageStitcher:
+    """
+    Merges the predictions of the crops of a cropped test split into page canvases. Overlapping predictions are
+    merged with the maximum (like :func:`merge_patches`), further pixel arrays of the crops (e.g. the gt) are just
+    pasted. A page can be stitched if all its crops are processed by this process (see :meth:`is_stitched`), the
+    crops of the other pages have to be handled otherwise (e.g. with `save_numpy_files`).
+
+    :param page_ids: Page of each crop of the dataset (e.g. `dataset.img_paths_per_page.page_ids`)
+    :type page_ids: Sequence[int]
+    :param coordinates: Top left corner (x, y) of each crop, -1 if unknown (e.g.
+        `dataset.img_paths_per_page.coordinates`)
+    :type coordinates: Sequence[Tuple[int, int]]
+    :param indices: The indices of the crops which this process gets (e.g. the indices of the sampler), all the
+        crops if None
+    :type indices: Optional[Sequence[int]]
+    """
+
+    def __init__(self, page_ids: Sequence[int], coordinates: Sequence[Tuple[int, int]],
+                 indices: Optional[Sequence[int]] = None):
+        """
+        Constructor method for the PageStitcher class.
+        """
+        self.page_ids = np.asarray(page_ids, dtype=np.int64)
+        self.coordinates = np.asarray(coordinates, dtype=np.int64).reshape(len(self.page_ids), 2)
+        num_pages = int(self.page_ids.max()) + 1 if len(self.page_ids) > 0 else 0
+
+        # coordinates of the last crop of every page, the canvas ends with it (all the crops have the same size)
+        self.max_coordinates = np.zeros((num_pages, 2), dtype=np.int64)
+        np.maximum.at(self.max_coordinates, self.page_ids, self.coordinates)
+
+        # a page is stitched if all its crops have coordinates and are processed by this process
+        num_crops = np.bincount(self.page_ids, minlength=num_pages)
+        indices = np.arange(len(self.page_ids)) if indices is None else np.unique(np.asarray(indices, dtype=np.int64))
+        self.remaining_crops = np.bincount(self.page_ids[indices], minlength=num_pages)
+        unknown_coordinates = np.bincount(self.page_ids, weights=(self.coordinates < 0).any(axis=1),
+                                          minlength=num_pages) > 0
+        self.stitched_pages = (self.remaining_crops == num_crops) & ~unknown_coordinates
+
+        self.added = np.zeros(len(self.page_ids), dtype=bool)
+        self.canvases: Dict[int, Dict[str, np.ndarray]] = {}
+
+    @property
+    def num_pages_in_flight(self) -> int:
+        """
+        :return: the number of pages whose canvases are in memory
+        :rtype: int
+        """
+        return len(self.canvases)
+
+    def is_stitched(self, index: int) -> bool:
+        """
+        :param index: index of the crop
+        :type index: int
+        :return: True if the page of the crop is stitched by this process
+        :rtype: bool
+        """
+        return bool(self.stitched_pages[self.page_ids[index]])
+
+    def add(self, index: int, prediction: np.ndarray,
+            **pixel_arrays: np.ndarray) -> Optional[Tuple[int, Dict[str, np.ndarray]]]:
+        """
+        Adds the prediction of a crop (and further arrays of its pixels) to the canvas of its page. Crops which are
+        added a second time (e.g. to pad the test set for several processes) are ignored.
+
+        :param index: index of the crop
+        :type index: int
+        :param prediction: the prediction of the crop [#C x H x W]
+        :type prediction: np.ndarray
+        :param pixel_arrays: further arrays of the crop [H x W] which are stitched (e.g. `gt`)
+        :type pixel_arrays: np.ndarray
+        :return: the page id and the canvases (`prediction` and the `pixel_arrays`) if the page is finished
+        :rtype: Optional[Tuple[int, Dict[str, np.ndarray]]]
+        """
+        page_id = int(self.page_ids[index])
+        if not self.stitched_pages[page_id]:
+            raise ValueError(f'The page of the crop {index} is not stitched by this process')
+        if self.added[index]:
+            return None
+        self.added[index] = True
+
+        if page_id not in self.canvases:
+            max_x, max_y = self.max_coordinates[page_id]
+            height, width = max_y + prediction.shape[-2], max_x + prediction.shape[-1]
+            canvases = {'prediction': np.full((prediction.shape[0], height, width), np.nan, dtype=np.float32)}
+            canvases.update({name: np.zeros((height, width), dtype=array.dtype)
+                             for name, array in pixel_arrays.items()})
+            self.canvases[page_id] = canvases
+
+        canvases = self.canvases[page_id]
+        x, y = self.coordinates[index]
+        height, width = prediction.shape[-2:]
+        region = canvases['prediction'][:, y:y + height, x:x + width]
+        # np.fmax takes the prediction where the canvas is still NaN
+        np.fmax(region, prediction, out=region)
+        for name, array in pixel_arrays.items():
+            canvases[name][y:y + height, x:x + width] = array
+
+        self.remaining_crops[page_id] -= 1
+        if self.remaining_crops[page_id] > 0:
+            return None
+        return page_id, self.canvases.pop(page_id)
@@ -0,0 +1,59 @@
+import pytest
+import torch
+
+from src.datamodules.DivaHisDB.datasets.cropped_dataset import CroppedHisDBDataset
+from src.datamodules.DivaHisDB.datasets.packed_cropped_dataset import PackedCroppedHisDBDataset
+from src.datamodules.DivaHisDB.utils.single_transform import IntegerEncoding
+from src.datamodules.RGB.datasets.packed_cropped_dataset import PackedCroppedDatasetRGB
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
+from src.datamodules.utils.wrapper_transforms import OnlyTarget
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped, data_dir_packed_hisdb, data_dir_packed_rgb
+
+
+@pytest.fixture
+def dataset_train(data_dir_packed_hisdb):
+    return PackedCroppedHisDBDataset(path=data_dir_packed_hisdb / 'train', twin_transform=TwinRandomCrop(crop_size=256))
+
+
+@pytest.fixture
+def dataset_test(data_dir_packed_hisdb):
+    return PackedCroppedHisDBDataset(path=data_dir_packed_hisdb / 'test', is_test=True)
+
+
+def test__get_train_val_items(dataset_train):
+    img, gt, mask = dataset_train[0]
+    assert img.shape == torch.Size([3, 256, 256])
+    assert gt.shape == torch.Size([256, 256])
+    assert mask.shape == torch.Size([256, 256])
+    assert mask.dtype == torch.bool
+
+
+def test_train_mask_same_window(dataset_train):
+    torch.manual_seed(1)
+    img, gt, mask = dataset_train[2]
+    # the border pixels are encoded as background, so every border pixel is background
+    assert torch.all(gt[mask] == 0)
+
+
+def test__get_test_items(dataset_test):
+    img, gt, mask, index = dataset_test[3]
+    assert img.shape == torch.Size([3, 256, 256])
+    assert index == 3
+
+
+def test_same_as_file_dataset(data_dir_packed_hisdb, dataset_test):
+    dataset_files = CroppedHisDBDataset(path=data_dir_packed_hisdb / 'test', data_folder_name='data',
+                                        gt_folder_name='gt', is_test=True,
+                                        target_transform=OnlyTarget(IntegerEncoding(class_encodings=[1, 2, 4, 8])))
+    for index in range(len(dataset_files)):
+        for item_files, item_packed in zip(dataset_files[index], dataset_test[index]):
+            if torch.is_tensor(item_files):
+                assert torch.equal(item_files, item_packed)
+            else:
+                assert item_files == item_packed
+
+
+def test_no_mask_in_shards(data_dir_packed_rgb):
+    assert len(PackedCroppedDatasetRGB(path=data_dir_packed_rgb / 'test')) == 15
+    with pytest.raises(ValueError):
+        PackedCroppedHisDBDataset(path=data_dir_packed_rgb / 'test')
@@ -0,0 +1,62 @@
+import pytest
+import torch
+from torchvision.datasets.folder import pil_loader
+from torchvision.transforms import ToTensor
+
+from src.datamodules.DivaHisDB.datasets.tiled_cropped_dataset import TiledCroppedHisDBDataset
+from src.datamodules.DivaHisDB.utils.single_transform import IntegerEncoding
+from src.datamodules.utils.misc import get_crop_coordinates
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir, data_dir_tiled_hisdb, data_dir_tiled_rgb
+
+
+@pytest.fixture
+def dataset_train(data_dir_tiled_hisdb):
+    return TiledCroppedHisDBDataset(path=data_dir_tiled_hisdb / 'train', twin_transform=TwinRandomCrop(crop_size=128))
+
+
+@pytest.fixture
+def dataset_test(data_dir_tiled_hisdb):
+    return TiledCroppedHisDBDataset(path=data_dir_tiled_hisdb / 'test', is_test=True)
+
+
+def test__get_train_val_items(dataset_train):
+    img, gt, mask = dataset_train[0]
+    assert img.shape == torch.Size([3, 128, 128])
+    assert gt.shape == torch.Size([128, 128])
+    assert mask.shape == torch.Size([128, 128])
+    assert mask.dtype == torch.bool
+
+
+def test__get_train_val_items_return_index(data_dir_tiled_hisdb):
+    dataset = TiledCroppedHisDBDataset(path=data_dir_tiled_hisdb / 'train',
+                                       twin_transform=TwinRandomCrop(crop_size=128), return_index=True)
+    img, gt, mask, index = dataset[2]
+    assert index == 2
+    assert img.shape == torch.Size([3, 128, 128])
+    assert mask.shape == torch.Size([128, 128])
+
+
+def test_crops_equal_page_windows(data_dir_tiled_hisdb, dataset_test):
+    page_name = 'e-codices_fmb-cb-0055_0098v_max_2'
+    split_path = data_dir_tiled_hisdb / 'test'
+    page_img = ToTensor()(pil_loader(split_path / 'data' / f'{page_name}.jpg'))
+    page_gt = ToTensor()(pil_loader(split_path / 'gt' / f'{page_name}.png'))
+    page_mask = page_gt[0] != 0
+    page_gt = IntegerEncoding(class_encodings=[1, 2, 4, 8])(page_gt)
+
+    indices = [i for i, paths in enumerate(dataset_test.img_paths_per_page) if paths[2] == page_name]
+    coordinates = get_crop_coordinates(img_width=487, img_height=649, crop_size=256, overlap=0.5)
+    assert len(indices) == len(coordinates)
+    for index, (x, y) in zip(indices, coordinates):
+        img, gt, mask, returned_index = dataset_test[index]
+        assert returned_index == index
+        assert torch.equal(img, page_img[:, y:y + 256, x:x + 256])
+        assert torch.equal(gt, page_gt[y:y + 256, x:x + 256])
+        assert torch.equal(mask, page_mask[y:y + 256, x:x + 256])
+        assert torch.all(gt[mask] == 0)
+
+
+def test_no_mask_in_store(data_dir_tiled_rgb):
+    with pytest.raises(ValueError):
+        TiledCroppedHisDBDataset(path=data_dir_tiled_rgb / 'test')
@@ -1,9 +1,15 @@
+import numpy as np
 import pytest
 import torch
 from omegaconf import OmegaConf
+from pytorch_lightning import Trainer
 
 from src.datamodules.DivaHisDB.datamodule_cropped import DivaHisDBDataModuleCropped
-from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
+from src.datamodules.DivaHisDB.datasets.packed_cropped_dataset import PackedCroppedHisDBDataset
+from src.datamodules.DivaHisDB.datasets.tiled_cropped_dataset import TiledCroppedHisDBDataset
+from src.datamodules.utils.samplers import PageLocalitySampler, ClassAwareSampler, BlankCropSampler
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped, data_dir_packed_hisdb, data_dir, \
+    data_dir_tiled_hisdb
 from tests.datamodules.DivaHisDB.datasets.test_cropped_hisdb_dataset import dataset_test
 
 NUM_WORKERS = 4
@@ -25,8 +31,8 @@ def test_init_datamodule(data_module_cropped_hisdb):
     assert torch.equal(data_module_cropped_hisdb.class_weights,
                        torch.tensor(
                            [0.004952207651647859, 0.07424270397485577, 0.8964025044572563, 0.02440258391624002]))
-    assert data_module_cropped_hisdb.mean == [0.7050454974582426, 0.6503181590413943, 0.5567698583877997]
-    assert data_module_cropped_hisdb.std == [0.3104060859619883, 0.3053311838884032, 0.28919611393432726]
+    assert data_module_cropped_hisdb.mean == [0.7050454974582425, 0.6503181590413943, 0.5567698583877996]
+    assert data_module_cropped_hisdb.std == [0.31040608596198827, 0.30533118388840325, 0.28919611393432737]
     with pytest.raises(AttributeError):
         getattr(data_module_cropped_hisdb, 'train')
         getattr(data_module_cropped_hisdb, 'val')
@@ -47,3 +53,152 @@ def test__create_dataset_parameters_cropped(data_module_cropped_hisdb):
     parameters = data_module_cropped_hisdb._create_dataset_parameters()
     assert 'train' in str(parameters['path'])
     assert not parameters['is_test']
+
+
+def test_packed_missing_analytics(data_dir_cropped):
+    OmegaConf.clear_resolvers()
+    data_module = DivaHisDBDataModuleCropped(data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                             dataset_format='packed')
+    with pytest.raises(FileNotFoundError):
+        getattr(data_module, 'class_encodings')
+
+
+def test_setup_packed(data_dir_packed_hisdb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DivaHisDBDataModuleCropped(data_dir_packed_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                             num_workers=NUM_WORKERS, dataset_format='packed')
+    assert data_module.class_encodings == [1, 2, 4, 8]
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    assert isinstance(data_module.train, PackedCroppedHisDBDataset)
+    img, gt, mask = data_module.train[0]
+    assert img.shape == torch.Size(data_module.dims)
+    assert mask.shape == gt.shape
+    data_module.setup('test')
+    assert data_module.get_img_name_coordinates(2) == ('e-codices_fmb-cb-0055_0098v_max',
+                                                       'e-codices_fmb-cb-0055_0098v_max_x0000_y0231')
+
+
+def test_setup_tiled(data_dir_tiled_hisdb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DivaHisDBDataModuleCropped(data_dir_tiled_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                             num_workers=NUM_WORKERS, dataset_format='tiled',
+                                             virtual_crops={'overlap': 0.25})
+    assert data_module.class_encodings == [1, 2, 4, 8]
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    assert isinstance(data_module.train, TiledCroppedHisDBDataset)
+    img, gt, mask = data_module.train[0]
+    assert img.shape == torch.Size(data_module.dims)
+    assert mask.shape == gt.shape
+    data_module.setup('test')
+    assert data_module.test.overlap == 0.25
+    assert data_module.get_img_name_coordinates(1) == ('e-codices_fmb-cb-0055_0098v_max',
+                                                       'e-codices_fmb-cb-0055_0098v_max_x0000_y0192')
+
+
+def test_train_dataloader_page_locality(data_dir_tiled_hisdb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DivaHisDBDataModuleCropped(data_dir_tiled_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                             num_workers=0, batch_size=4, dataset_format='tiled',
+                                             page_window_size=1, tile_cache_bytes=2 ** 24)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    dataloader = data_module.train_dataloader()
+    assert isinstance(dataloader.sampler, PageLocalitySampler)
+    assert sorted(dataloader.sampler) == list(range(len(data_module.train)))
+    for _ in dataloader:
+        pass
+    assert data_module.train.tile_cache.get_stats()['hit_rate'] > 0
+
+
+def test_tile_cache_needs_tiled_format(data_dir_cropped):
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DivaHisDBDataModuleCropped(data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                   tile_cache_bytes=2 ** 24)
+
+
+def test_setup_use_manifest(data_dir_cropped, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DivaHisDBDataModuleCropped(data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                             num_workers=NUM_WORKERS, use_manifest=True)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    assert data_module.train.use_manifest
+    assert (data_dir_cropped / 'train' / 'manifest.cropped.data.gt.json').is_file()
+    assert (data_dir_cropped / 'val' / 'manifest.cropped.data.gt.json').is_file()
+    img, gt, mask = data_module.train[0]
+    assert img.shape == torch.Size(data_module.dims)
+
+
+def test_manifest_needs_files_format(data_dir_tiled_hisdb):
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DivaHisDBDataModuleCropped(data_dir_tiled_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                   dataset_format='tiled', use_manifest=True)
+
+
+def test_decode_backend_needs_files_format(data_dir_tiled_hisdb):
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DivaHisDBDataModuleCropped(data_dir_tiled_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                   dataset_format='tiled', decode_backend='torchvision')
+
+
+def test_train_dataloader_class_aware(data_dir_packed_hisdb, monkeypatch):
+    histograms = {}
+    for dataset_format in ['files', 'packed']:
+        OmegaConf.clear_resolvers()
+        data_module = DivaHisDBDataModuleCropped(data_dir_packed_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                                 num_workers=NUM_WORKERS, dataset_format=dataset_format,
+                                                 class_sampling_temperature=1)
+        trainer = Trainer(accelerator='cpu', strategy='ddp')
+        monkeypatch.setattr(data_module, 'trainer', trainer)
+        monkeypatch.setattr(trainer, 'datamodule', data_module)
+        data_module.setup('fit')
+        assert isinstance(data_module.train_dataloader().sampler, ClassAwareSampler)
+        histograms[dataset_format] = data_module._get_class_histograms()
+    assert histograms['files'].shape == (len(data_module.train), 4)
+    assert np.array_equal(histograms['files'], histograms['packed'])
+
+
+def test_train_dataloader_blank_crops(data_dir_packed_hisdb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DivaHisDBDataModuleCropped(data_dir_packed_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                             num_workers=NUM_WORKERS, batch_size=1, dataset_format='packed',
+                                             blank_crops={'threshold': 0.9})
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    sampler = data_module.train_dataloader().sampler
+    assert isinstance(sampler, BlankCropSampler)
+    histograms = data_module._get_class_histograms()
+    content_crops = np.flatnonzero(histograms.max(axis=1) < 0.9 * histograms.sum(axis=1))
+    # the blank crops are excluded
+    assert sorted(sampler) == content_crops.tolist()
+
+
+def test_train_dataloader_class_aware_tiled(data_dir_tiled_hisdb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DivaHisDBDataModuleCropped(data_dir_tiled_hisdb, data_folder_name='data', gt_folder_name='gt',
+                                             num_workers=0, batch_size=4, dataset_format='tiled',
+                                             class_sampling_temperature=1)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    sampler = data_module.train_dataloader().sampler
+    assert isinstance(sampler, ClassAwareSampler)
+    histograms = data_module._get_class_histograms()
+    assert histograms.shape == (len(data_module.train), 4)
+    assert np.all(histograms.sum(axis=1) <= data_module.train.crop_size ** 2)
@@ -0,0 +1,47 @@
+import pytest
+import torch
+
+from src.datamodules.DivaHisDB.utils.functional import gt_to_int_encoding, gt_to_one_hot, color_to_class_id
+
+CLASS_ENCODINGS = [1, 2, 4, 8]
+
+
+@pytest.fixture()
+def input_matrix():
+    # red channel: border pixels, blue channel: classes (16 is unknown, 0 is a filler)
+    return torch.tensor([[[0, 0, 128], [0, 0, 0]],
+                         [[0, 0, 0], [0, 0, 0]],
+                         [[1, 2, 8], [4, 16, 0]]], dtype=torch.uint8)
+
+
+def test_gt_to_int_encoding(input_matrix):
+    expected = torch.tensor([[0, 1, 0], [2, -1, -1]])
+    assert torch.equal(gt_to_int_encoding(input_matrix, CLASS_ENCODINGS), expected)
+    assert torch.equal(gt_to_int_encoding(input_matrix.float() / 255, CLASS_ENCODINGS), expected)
+    assert torch.equal(gt_to_int_encoding(input_matrix.long(), CLASS_ENCODINGS), expected)
+
+
+def test_color_to_class_id(input_matrix):
+    colors = input_matrix.permute(1, 2, 0).reshape(-1, 3).tolist()
+    class_ids = [color_to_class_id(tuple(color), CLASS_ENCODINGS) for color in colors]
+    expected = gt_to_int_encoding(input_matrix, CLASS_ENCODINGS).ravel().tolist()
+    assert class_ids == [None if class_id == -1 else class_id for class_id in expected]
+
+
+def test_gt_to_int_encoding_keeps_input(input_matrix):
+    matrix = input_matrix.int()
+    gt_to_int_encoding(matrix, CLASS_ENCODINGS)
+    assert torch.equal(matrix, input_matrix.int())
+
+
+def test_gt_to_one_hot(input_matrix):
+    input_matrix[2, 1, 1] = 8
+    output = gt_to_one_hot(input_matrix, CLASS_ENCODINGS)
+    assert output.shape == torch.Size([4, 2, 3])
+    assert torch.equal(output.argmax(dim=0), torch.tensor([[0, 1, 0], [2, 3, 0]]))
+    assert torch.equal(output, gt_to_one_hot(input_matrix.float() / 255, CLASS_ENCODINGS))
+
+
+def test_gt_to_one_hot_unknown(input_matrix):
+    with pytest.raises(KeyError):
+        gt_to_one_hot(input_matrix, CLASS_ENCODINGS)
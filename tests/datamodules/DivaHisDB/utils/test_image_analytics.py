@@ -1,9 +1,10 @@
 import json
 
 import numpy as np
+import pytest
 
 from src.datamodules.DivaHisDB.datasets.cropped_dataset import CroppedHisDBDataset
-from src.datamodules.DivaHisDB.utils.image_analytics import get_analytics, get_class_weights
+from src.datamodules.DivaHisDB.utils.image_analytics import get_analytics, get_class_weights, read_analytics_gt
 from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
 
 TEST_JSON_DATA = {'mean': [0.7050454974582426, 0.6503181590413943, 0.5567698583877997],
@@ -45,6 +46,15 @@ def test_get_analytics_load_from_file(data_dir_cropped):
     test_get_analytics_no_file(data_dir_cropped=data_dir_cropped)
 
 
+def test_read_analytics_gt(data_dir_cropped):
+    with pytest.raises(FileNotFoundError):
+        read_analytics_gt(input_path=data_dir_cropped, gt_folder_name=GT_FOLDER_NAME)
+    with (data_dir_cropped / GT_ANALYTICS_FILENAME).open(mode='w') as f:
+        json.dump(obj=TEST_JSON_GT, fp=f)
+    analytics_gt = read_analytics_gt(input_path=data_dir_cropped, gt_folder_name=GT_FOLDER_NAME)
+    assert analytics_gt == TEST_JSON_GT
+
+
 def test_get_class_weights(data_dir_cropped):
     weights = get_class_weights(input_folder=data_dir_cropped)
     assert np.array_equal(weights, [0.2857142857142857, 0.35714285714285715, 0.35714285714285715])
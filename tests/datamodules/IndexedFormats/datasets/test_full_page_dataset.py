@@ -1,8 +1,10 @@
 import pytest
+import torch
 from torch import is_tensor
 
 from src.datamodules.IndexedFormats.datasets.full_page_dataset import DatasetIndexed
 from src.datamodules.utils.misc import ImageDimensions
+from src.datamodules.utils.page_cache import PageCacheSpecs
 from tests.test_data.dummy_fixed_gif.dummy_data import data_dir
 
 
@@ -64,3 +66,27 @@ def test_get_img_gt_path_list(data_dir):
         (data_dir / 'train' / 'data' / '2022C-01-dum-folioN-1000.jpg', data_dir / 'train' / 'gt' / '2022C-01-dum-gtL-1000.gif'),
         (data_dir / 'train' / 'data' / '2022C-01-dum-folioN-1001.jpg', data_dir / 'train' / 'gt' / '2022C-01-dum-gtL-1001.gif')]
     assert paths == expected_paths
+
+
+def test_page_cache_same_items(data_dir, dataset_train):
+    dataset_cached = DatasetIndexed(path=data_dir / 'train', data_folder_name='data', gt_folder_name='gt',
+                                    image_dims=ImageDimensions(width=960, height=1344),
+                                    page_cache=PageCacheSpecs())
+    for _ in range(2):
+        for index in range(len(dataset_train)):
+            img, gt = dataset_train[index]
+            img_cached, gt_cached = dataset_cached[index]
+            assert torch.equal(img, img_cached)
+            assert torch.equal(gt, gt_cached)
+    assert dataset_cached.page_cache.is_cached(0)
+
+
+@pytest.mark.parametrize('backend', ['pil', 'numpy'])
+def test_decode_backend_same_items(data_dir, dataset_val, backend):
+    dataset_decoded = DatasetIndexed(path=data_dir / 'val', data_folder_name='data', gt_folder_name='gt',
+                                     image_dims=ImageDimensions(width=960, height=1344), decode_backend=backend)
+    for i in range(len(dataset_val)):
+        img, gt = dataset_val[i]
+        img_decoded, gt_decoded = dataset_decoded[i]
+        assert torch.equal(img, img_decoded)
+        assert torch.equal(gt, gt_decoded)
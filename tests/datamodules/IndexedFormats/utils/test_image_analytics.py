@@ -1,8 +1,9 @@
 import numpy as np
 
 from src.datamodules.IndexedFormats.datasets.full_page_dataset import DatasetIndexed
-from src.datamodules.IndexedFormats.utils.image_analytics import get_analytics, \
-    _get_class_frequencies_weights_segmentation_indexed
+from src.datamodules.IndexedFormats.utils.image_analytics import get_analytics, get_class_counts_indexed, \
+    get_class_weights_encodings_indexed
+from src.datamodules.utils.image_analytics import compute_image_statistics
 from tests.test_data.dummy_fixed_gif.dummy_data import data_dir
 
 CLASS_ENCODINGS = np.asarray([[0, 0, 0], [0, 255, 255], [255, 0, 255], [255, 255, 0]])
@@ -21,10 +22,12 @@ def test_get_analytics(data_dir):
     assert np.array_equal(analytics_gt['class_encodings'], CLASS_ENCODINGS)
 
 
-def test__get_class_frequencies_weights_segmentation_indexed(data_dir):
+def test_get_class_weights_encodings_indexed(data_dir):
     img_gt_path_list = list((data_dir / 'train' / 'gt').iterdir())
     file_names_gt = np.asarray(img_gt_path_list)
-    class_weights, class_encodings = _get_class_frequencies_weights_segmentation_indexed(gt_images=file_names_gt)
+    statistics = compute_image_statistics(file_names_gt=file_names_gt, get_class_counts_func=get_class_counts_indexed,
+                                          workers=1)
+    class_weights, class_encodings = get_class_weights_encodings_indexed(class_counts=statistics.class_counts)
 
     assert np.array_equal(class_encodings, CLASS_ENCODINGS)
     assert np.allclose(class_weights, CLASS_WEIGHTS)
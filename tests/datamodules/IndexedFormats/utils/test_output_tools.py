@@ -0,0 +1,20 @@
+import numpy as np
+import torch
+from PIL import Image
+
+from src.datamodules.IndexedFormats.utils.output_tools import save_output_page_image
+
+
+def test_save_output_page_image(tmp_path):
+    output = torch.tensor([[[0., 0.3], [4., 2.]],
+                           [[1., 4.1], [-0.2, 1.9]],
+                           [[1.1, -0.8], [4.9, 1.3]],
+                           [[-0.4, 4.4], [2.9, 0.1]]])
+    class_encodings = [(0, 0, 0), (255, 0, 0), (255, 255, 0), (255, 255, 255)]
+    save_output_page_image('test.gif', output, tmp_path, class_encodings)
+    loaded_img = Image.open(tmp_path / 'test.gif')
+    assert loaded_img.mode == 'P'
+    # the indices are kept (no palette optimization of the gif)
+    assert np.array_equal(np.array(loaded_img), [[2, 3], [2, 0]])
+    assert np.array_equal(np.array(loaded_img.convert('RGB')),
+                          [[[255, 255, 0], [255, 255, 255]], [[255, 255, 0], [0, 0, 0]]])
@@ -122,6 +122,15 @@ def test_dataset_rgb_train(dataset_train):
     assert gt_tensor.ndim == 3
 
 
+def test_dataset_rgb_train_return_index(data_dir_cropped, dataset_train):
+    dataset = CroppedDatasetRGB(path=data_dir_cropped / 'train', data_folder_name=DATA_FOLDER_NAME,
+                                gt_folder_name=GT_FOLDER_NAME, return_index=True)
+    data_tensor, gt_tensor, idx = dataset[3]
+    assert idx == 3
+    assert torch.equal(data_tensor, dataset_train[3][0])
+    assert torch.equal(gt_tensor, dataset_train[3][1])
+
+
 def test__load_data_and_gt(dataset_train):
     data_img, gt_img = dataset_train._load_data_and_gt(index=0)
     assert data_img.size == gt_img.size
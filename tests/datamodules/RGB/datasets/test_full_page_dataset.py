@@ -1,7 +1,12 @@
 import pytest
+import torch
 
 from src.datamodules.RGB.datasets.full_page_dataset import DatasetRGB
+from src.datamodules.RGB.utils.single_transform import IntegerEncoding
 from src.datamodules.utils.misc import ImageDimensions
+from src.datamodules.utils.page_cache import PageCacheSpecs
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
+from src.datamodules.utils.wrapper_transforms import OnlyTarget
 from tests.test_data.dummy_data_hisdb.dummy_data import data_dir
 
 
@@ -97,3 +102,45 @@ def test__load_data_and_gt(dataset_train):
     assert data_img.size == gt_img.size
     assert data_img.mode == 'RGB'
     assert gt_img.mode == 'RGB'
+
+
+@pytest.mark.parametrize('mode', ['shared', 'memmap'])
+def test_page_cache_same_items(data_dir, tmp_path, mode):
+    class_encodings = torch.tensor([(0, 0, 1), (0, 0, 2), (0, 0, 4), (0, 0, 8), (128, 0, 1), (128, 0, 2),
+                                    (128, 0, 4), (128, 0, 8)]) / 255
+    kwargs = {'path': data_dir / 'test', 'data_folder_name': 'data', 'gt_folder_name': 'gt',
+              'image_dims': ImageDimensions(width=487, height=649), 'is_test': True,
+              'target_transform': OnlyTarget(IntegerEncoding(class_encodings=class_encodings))}
+    dataset = DatasetRGB(**kwargs)
+    dataset_cached = DatasetRGB(**kwargs, page_cache=PageCacheSpecs(mode=mode, cache_dir=str(tmp_path)))
+    for _ in range(2):
+        for index in range(len(dataset)):
+            img, gt, _ = dataset[index]
+            img_cached, gt_cached, _ = dataset_cached[index]
+            assert torch.equal(img, img_cached)
+            assert torch.equal(gt, gt_cached)
+    assert dataset_cached.page_cache.is_cached(1)
+
+
+def test_page_cache_wrong_transforms(data_dir):
+    with pytest.raises(ValueError):
+        DatasetRGB(path=data_dir / 'train', data_folder_name='data', gt_folder_name='gt',
+                   image_dims=ImageDimensions(width=487, height=649), page_cache=PageCacheSpecs())
+    with pytest.raises(ValueError):
+        DatasetRGB(path=data_dir / 'train', data_folder_name='data', gt_folder_name='gt',
+                   image_dims=ImageDimensions(width=487, height=649), page_cache=PageCacheSpecs(),
+                   twin_transform=TwinRandomCrop(crop_size=64), target_transform=OnlyTarget(lambda gt: gt))
+
+
+@pytest.mark.parametrize('backend', ['pil', 'torchvision', 'numpy'])
+def test_decode_backend_same_items(data_dir, backend):
+    class_encodings = torch.tensor([(0, 0, 1), (0, 0, 2), (0, 0, 4), (0, 0, 8), (128, 0, 1), (128, 0, 2),
+                                    (128, 0, 4), (128, 0, 8)]) / 255
+    kwargs = {'path': data_dir / 'test', 'data_folder_name': 'data', 'gt_folder_name': 'gt',
+              'image_dims': ImageDimensions(width=487, height=649), 'is_test': True,
+              'target_transform': OnlyTarget(IntegerEncoding(class_encodings=class_encodings))}
+    dataset = DatasetRGB(**kwargs)
+    dataset_decoded = DatasetRGB(**kwargs, decode_backend=backend)
+    for i in range(len(dataset)):
+        for item, item_decoded in zip(dataset[i], dataset_decoded[i]):
+            assert torch.equal(torch.as_tensor(item), torch.as_tensor(item_decoded))
@@ -0,0 +1,85 @@
+import pytest
+import torch
+
+from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.RGB.datasets.packed_cropped_dataset import PackedCroppedDatasetRGB
+from src.datamodules.RGB.utils.single_transform import IntegerEncoding
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
+from src.datamodules.utils.wrapper_transforms import OnlyTarget
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped, data_dir_packed_rgb
+
+
+@pytest.fixture
+def dataset_train(data_dir_packed_rgb):
+    return PackedCroppedDatasetRGB(path=data_dir_packed_rgb / 'train', twin_transform=TwinRandomCrop(crop_size=256))
+
+
+@pytest.fixture
+def dataset_test(data_dir_packed_rgb):
+    return PackedCroppedDatasetRGB(path=data_dir_packed_rgb / 'test', is_test=True)
+
+
+def test___len__(dataset_train, dataset_test):
+    assert len(dataset_train) == 12
+    assert len(dataset_test) == 15
+
+
+def test__load_data_and_gt(dataset_train):
+    data_img, gt_img = dataset_train._load_data_and_gt(0)
+    assert data_img.shape == (300, 300, 3)
+    assert gt_img.shape == (300, 300)
+
+
+def test__get_train_val_items_train(dataset_train):
+    img, gt = dataset_train._get_train_val_items(index=0)
+    assert img.shape == torch.Size([3, 256, 256])
+    assert img.dtype == torch.float32
+    assert gt.shape == torch.Size([256, 256])
+    assert gt.dtype == torch.long
+
+
+def test__get_test_items(dataset_test):
+    img, gt, index = dataset_test[1]
+    assert img.shape == torch.Size([3, 256, 256])
+    assert gt.shape == torch.Size([256, 256])
+    assert index == 1
+
+
+def test_same_as_file_dataset(data_dir_packed_rgb, dataset_test):
+    class_encodings = torch.tensor([(0, 0, 1), (0, 0, 2), (0, 0, 4), (0, 0, 8), (128, 0, 1), (128, 0, 2),
+                                    (128, 0, 4), (128, 0, 8)]) / 255
+    dataset_files = CroppedDatasetRGB(path=data_dir_packed_rgb / 'test', data_folder_name='data',
+                                      gt_folder_name='gt', is_test=True,
+                                      target_transform=OnlyTarget(IntegerEncoding(class_encodings=class_encodings)))
+    for index in range(len(dataset_files)):
+        img_files, gt_files, _ = dataset_files[index]
+        img_packed, gt_packed, _ = dataset_test[index]
+        assert torch.equal(img_files, img_packed)
+        assert torch.equal(gt_files, gt_packed)
+        assert dataset_files.img_paths_per_page[index][2:] == dataset_test.img_paths_per_page[index][2:]
+
+
+def test_twin_transform_window(dataset_train):
+    torch.manual_seed(0)
+    img_full, gt_full = dataset_train._load_data_and_gt(3)
+    dataset_train.image_transform = None
+    img, gt = dataset_train._apply_transformation(img_full, gt_full)
+    # find the window of the random crop in the full crop
+    found = False
+    for i in range(300 - 256 + 1):
+        for j in range(300 - 256 + 1):
+            if torch.equal(torch.from_numpy(gt_full[i:i + 256, j:j + 256]).long(), gt) and \
+                    torch.equal(torch.from_numpy(img_full[i:i + 256, j:j + 256]).permute(2, 0, 1).float() / 255,
+                                img):
+                found = True
+                break
+        if found:
+            break
+    assert found
+
+
+def test_selection(data_dir_packed_rgb):
+    dataset = PackedCroppedDatasetRGB(path=data_dir_packed_rgb / 'train', selection=1)
+    assert len(dataset) == 12
+    with pytest.raises(ValueError):
+        PackedCroppedDatasetRGB(path=data_dir_packed_rgb / 'train', selection=['not_a_page'])
@@ -0,0 +1,94 @@
+import random
+
+import numpy as np
+import pytest
+import torch
+from torchvision.datasets.folder import pil_loader
+from torchvision.transforms import ToTensor
+
+from src.datamodules.RGB.datasets.tiled_cropped_dataset import TiledCroppedDatasetRGB
+from src.datamodules.RGB.utils.single_transform import IntegerEncoding
+from src.datamodules.utils.misc import get_crop_coordinates
+from src.datamodules.utils.tiled_store import TiledPageStoreReader, TiledPageStoreWriter
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir, data_dir_tiled_rgb
+
+
+def _get_page(split_path, page_name):
+    img = ToTensor()(pil_loader(split_path / 'data' / f'{page_name}.jpg'))
+    gt = pil_loader(split_path / 'gt' / f'{page_name}.png')
+    class_encodings = torch.tensor(TiledPageStoreReader(path=split_path).class_encodings) / 255
+    return img, IntegerEncoding(class_encodings=class_encodings)(ToTensor()(gt))
+
+
+@pytest.fixture
+def dataset_train(data_dir_tiled_rgb):
+    return TiledCroppedDatasetRGB(path=data_dir_tiled_rgb / 'train')
+
+
+@pytest.fixture
+def dataset_test(data_dir_tiled_rgb):
+    return TiledCroppedDatasetRGB(path=data_dir_tiled_rgb / 'test', is_test=True)
+
+
+def test_len(dataset_train, dataset_test):
+    # page size 487x649 with crop size 256 and overlap 0.5 gives 3x5 crops per page
+    assert len(dataset_train) == 15
+    assert len(dataset_test) == 30
+
+
+def test_crop_names(dataset_train):
+    page_name, crop_name = dataset_train.img_paths_per_page[0][2:]
+    assert page_name == 'e-codices_fmb-cb-0055_0098v_max'
+    assert crop_name == 'e-codices_fmb-cb-0055_0098v_max_x0000_y0000'
+    assert dataset_train.img_paths_per_page[-1][3] == 'e-codices_fmb-cb-0055_0098v_max_x0231_y0393'
+
+
+def test_crops_equal_page_windows(data_dir_tiled_rgb, dataset_test):
+    split_path = data_dir_tiled_rgb / 'test'
+    for page_name in TiledPageStoreReader(path=split_path).page_names:
+        page_img, page_gt = _get_page(split_path=split_path, page_name=page_name)
+        for (x, y), index in zip(get_crop_coordinates(img_width=487, img_height=649, crop_size=256, overlap=0.5),
+                                 [i for i, paths in enumerate(dataset_test.img_paths_per_page)
+                                  if paths[2] == page_name]):
+            img, gt, returned_index = dataset_test[index]
+            assert returned_index == index
+            assert torch.equal(img, page_img[:, y:y + 256, x:x + 256])
+            assert torch.equal(gt, page_gt[y:y + 256, x:x + 256])
+
+
+def test_twin_transform_window(data_dir_tiled_rgb):
+    dataset = TiledCroppedDatasetRGB(path=data_dir_tiled_rgb / 'train', twin_transform=TwinRandomCrop(crop_size=100))
+    dataset_full = TiledCroppedDatasetRGB(path=data_dir_tiled_rgb / 'train')
+    random.seed(0)
+    img, gt = dataset[4]
+    assert img.shape == torch.Size([3, 100, 100])
+    assert gt.shape == torch.Size([100, 100])
+    random.seed(0)
+    i, j, _, _ = TwinRandomCrop(crop_size=100).get_params((256, 256))
+    full_img, full_gt = dataset_full[4]
+    assert torch.equal(img, full_img[:, i:i + 100, j:j + 100])
+    assert torch.equal(gt, full_gt[i:i + 100, j:j + 100])
+
+
+def test_crop_size_override(data_dir_tiled_rgb):
+    dataset = TiledCroppedDatasetRGB(path=data_dir_tiled_rgb / 'test', crop_size=300, is_test=True)
+    assert len(dataset) == 24
+    img, gt, _ = dataset[0]
+    assert img.shape == torch.Size([3, 300, 300])
+    assert dataset.img_paths_per_page[1][3].endswith('_x0000_y0150')
+
+
+def test_selection(data_dir_tiled_rgb):
+    dataset = TiledCroppedDatasetRGB(path=data_dir_tiled_rgb / 'test', selection=1)
+    assert len(dataset) == 15
+    assert {paths[2] for paths in dataset.img_paths_per_page} == {'e-codices_fmb-cb-0055_0098v_max'}
+
+
+def test_no_default_crop_size(tmp_path):
+    writer = TiledPageStoreWriter(output_path=tmp_path)
+    writer.add_page(page_name='page', img=np.zeros((8, 8, 3), dtype=np.uint8), gt=np.zeros((8, 8), dtype=np.int8))
+    writer.close(class_encodings=[])
+    with pytest.raises(ValueError):
+        TiledCroppedDatasetRGB(path=tmp_path)
+    assert len(TiledCroppedDatasetRGB(path=tmp_path, crop_size=8)) == 1
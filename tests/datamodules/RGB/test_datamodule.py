@@ -1,8 +1,11 @@
 import pytest
+import torch
 from omegaconf import OmegaConf
+from PIL import Image
 from pytorch_lightning import Trainer
 
 from src.datamodules.RGB.datamodule import DataModuleRGB
+from src.datamodules.utils.multi_crop import MultiCropDataset
 from tests.test_data.dummy_data_hisdb.dummy_data import data_dir
 
 NUM_WORKERS = 4
@@ -75,3 +78,133 @@ def test_setup_predict_error(data_dir, monkeypatch):
     monkeypatch.setattr(trainer, 'datamodule', data_module_rgb)
     with pytest.raises(RuntimeError):
         data_module_rgb.setup(stage)
+
+
+def test_setup_test_page_cache(data_dir, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module_rgb = DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', num_workers=NUM_WORKERS,
+                                    page_cache=OmegaConf.create({'mode': 'shared', 'max_bytes': 2 ** 30}))
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_rgb, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module_rgb)
+    data_module_rgb.setup('test')
+    assert data_module_rgb.test.page_cache is not None
+    assert data_module_rgb.test.page_cache.num_slots == 2
+    img, gt, _ = data_module_rgb.test[0]
+    assert img.shape[-2:] == gt.shape
+    assert data_module_rgb.test.page_cache.is_cached(0)
+
+
+def test_setup_fit_multi_crop(data_dir, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module_rgb = DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', num_workers=0,
+                                    batch_size=2, train_crop_size=128, crops_per_page=2)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_rgb, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module_rgb)
+    monkeypatch.setattr(data_module_rgb, 'drop_last', False)
+    data_module_rgb.setup('fit')
+    assert isinstance(data_module_rgb.train, MultiCropDataset)
+    img, gt = next(iter(data_module_rgb.train_dataloader()))
+    assert img.shape == torch.Size([2, 3, 128, 128])
+    assert gt.shape == torch.Size([2, 128, 128])
+    img, gt = data_module_rgb.val[0]
+    assert img.shape == torch.Size(data_module_rgb.dims)
+
+
+def test_setup_fit_multi_crop_decode_backend(data_dir, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module_rgb = DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', num_workers=0,
+                                    batch_size=2, train_crop_size=128, crops_per_page=2, decode_backend='torchvision')
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_rgb, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module_rgb)
+    monkeypatch.setattr(data_module_rgb, 'drop_last', False)
+    data_module_rgb.setup('fit')
+    assert data_module_rgb.train.dataset.decoder.name == 'torchvision'
+    img, gt = next(iter(data_module_rgb.train_dataloader()))
+    assert img.shape == torch.Size([2, 3, 128, 128])
+    assert gt.shape == torch.Size([2, 128, 128])
+    img, gt = data_module_rgb.val[0]
+    assert img.shape == torch.Size(data_module_rgb.dims)
+
+
+def test_setup_fit_uint8_batches(data_dir, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module_rgb = DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', num_workers=0,
+                                    batch_size=2, train_crop_size=128, crops_per_page=2, uint8_batches=True)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_rgb, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module_rgb)
+    monkeypatch.setattr(data_module_rgb, 'drop_last', False)
+    data_module_rgb.setup('fit')
+    img, gt = next(iter(data_module_rgb.train_dataloader()))
+    assert img.dtype == torch.uint8
+    assert img.shape == torch.Size([2, 3, 128, 128])
+    assert gt.dtype == torch.int64
+    img, gt = data_module_rgb.val[0]
+    assert img.dtype == torch.uint8
+    assert img.shape == torch.Size(data_module_rgb.dims)
+
+
+def test_multi_crop_errors(data_dir):
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', crops_per_page=2)
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', batch_size=3, train_crop_size=64,
+                      crops_per_page=2)
+
+
+def test_bucketing_errors(data_dir):
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', train_crop_size=64,
+                      bucketing={'num_buckets': 2})
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', page_cache={'mode': 'shared'},
+                      bucketing={'num_buckets': 2})
+
+
+def test_train_dataloader_bucketing(data_dir, monkeypatch):
+    # a second training page with a smaller size
+    page_name = 'e-codices_fmb-cb-0055_0098v_max'
+    for folder_name, extension in [('data', 'jpg'), ('gt', 'png')]:
+        page = Image.open(data_dir / 'train' / folder_name / f'{page_name}.{extension}')
+        page.crop((0, 0, 450, 600)).save(data_dir / 'train' / folder_name / f'{page_name}_small.{extension}')
+
+    OmegaConf.clear_resolvers()
+    data_module_rgb = DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', num_workers=0,
+                                    batch_size=2, drop_last=False, bucketing={'num_buckets': 1})
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_rgb, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module_rgb)
+    data_module_rgb.setup('fit')
+    assert data_module_rgb.train.image_dims is None
+
+    batches = list(data_module_rgb.train_dataloader())
+    assert len(batches) == 1
+    img, gt, mask = batches[0]
+    assert img.shape == torch.Size([2, 3, 649, 487])
+    assert gt.shape == torch.Size([2, 649, 487])
+    assert sorted(mask.sum(dim=(1, 2)).tolist()) == [450 * 600, 487 * 649]
+
+    img, gt, mask = next(iter(data_module_rgb.val_dataloader()))
+    assert img.shape == torch.Size([2, 3, 649, 487])
+    assert mask.all()
+
+
+def test_test_dataloader_bucketing(data_dir, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module_rgb = DataModuleRGB(data_dir, data_folder_name='data', gt_folder_name='gt', num_workers=0,
+                                    batch_size=2, bucketing={'num_buckets': 2})
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_rgb, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module_rgb)
+    data_module_rgb.setup('test')
+    img, gt, mask, idx = next(iter(data_module_rgb.test_dataloader()))
+    assert img.shape == torch.Size([2, 3, 649, 487])
+    assert mask.shape == torch.Size([2, 649, 487])
+    assert idx.tolist() == [0, 1]
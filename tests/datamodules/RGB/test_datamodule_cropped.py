@@ -5,7 +5,11 @@ from omegaconf import OmegaConf
 from pytorch_lightning import Trainer
 
 from src.datamodules.RGB.datamodule_cropped import DataModuleCroppedRGB
-from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
+from src.datamodules.RGB.datasets.packed_cropped_dataset import PackedCroppedDatasetRGB
+from src.datamodules.RGB.datasets.tiled_cropped_dataset import TiledCroppedDatasetRGB
+from src.datamodules.utils.samplers import PageLocalitySampler, ClassAwareSampler, BlankCropSampler
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped, data_dir_packed_rgb, data_dir, \
+    data_dir_tiled_rgb
 from tests.datamodules.DivaHisDB.datasets.test_cropped_hisdb_dataset import dataset_test
 
 NUM_WORKERS = 4
@@ -57,8 +61,8 @@ def test_init_datamodule(data_module_cropped_rgb, class_encodings):
                        torch.tensor([1.1816224514404894e-06, 2.8860862585133873e-05, 0.0003646973054856062,
                                      8.845096090226434e-06, 0.0015267175622284412, 4.577706567943096e-05,
                                      0.0005162622546777129, 1.7000731531879865e-05]))
-    assert data_module_cropped_rgb.mean == [0.7050454974582426, 0.6503181590413943, 0.5567698583877997]
-    assert data_module_cropped_rgb.std == [0.3104060859619883, 0.3053311838884032, 0.28919611393432726]
+    assert data_module_cropped_rgb.mean == [0.7050454974582425, 0.6503181590413943, 0.5567698583877996]
+    assert data_module_cropped_rgb.std == [0.31040608596198827, 0.30533118388840325, 0.28919611393432737]
     with pytest.raises(AttributeError):
         getattr(data_module_cropped_rgb, 'train')
         getattr(data_module_cropped_rgb, 'val')
@@ -79,3 +83,181 @@ def test__create_dataset_parameters_cropped(data_module_cropped_rgb, class_encod
     parameters = data_module_cropped_rgb._create_dataset_parameters()
     assert 'train' in str(parameters['path'])
     assert not parameters['is_test']
+
+
+def test_lazy_analytics(data_dir_cropped, class_encodings):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_cropped, data_folder_name='data', gt_folder_name='gt')
+    assert not (data_dir_cropped / 'analytics.gt.gt.train.json').exists()
+    assert data_module.class_encodings == class_encodings
+    assert (data_dir_cropped / 'analytics.gt.gt.train.json').exists()
+    assert data_module.num_classes == 8
+
+
+def test_lazy_analytics_assigned(data_dir_cropped):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_cropped, data_folder_name='data', gt_folder_name='gt')
+    data_module.mean = [0.5, 0.5, 0.5]
+    assert data_module.mean == [0.5, 0.5, 0.5]
+    assert not (data_dir_cropped / 'analytics.data.data.train.json').exists()
+
+
+def test_unknown_dataset_format(data_dir_cropped):
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DataModuleCroppedRGB(data_dir_cropped, data_folder_name='data', gt_folder_name='gt', dataset_format='zip')
+
+
+def test_packed_missing_analytics(data_dir_cropped):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       dataset_format='packed')
+    with pytest.raises(FileNotFoundError):
+        data_module.load_analytics()
+    # a failed load is tried again, so the attributes raise the real error
+    with pytest.raises(FileNotFoundError):
+        _ = data_module.mean
+    with pytest.raises(FileNotFoundError):
+        _ = data_module.class_encodings
+
+
+def test_setup_packed(data_dir_packed_rgb, class_encodings, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_packed_rgb, data_folder_name='data', gt_folder_name='gt',
+                                       num_workers=NUM_WORKERS, dataset_format='packed')
+    assert data_module.class_encodings == [list(c) for c in class_encodings]
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    assert isinstance(data_module.train, PackedCroppedDatasetRGB)
+    assert isinstance(data_module.val, PackedCroppedDatasetRGB)
+    img, gt = data_module.train[0]
+    assert img.shape == torch.Size(data_module.dims)
+    data_module.setup('test')
+    assert data_module.get_img_name_coordinates(1) == ('e-codices_fmb-cb-0055_0098v_max',
+                                                       'e-codices_fmb-cb-0055_0098v_max_x0000_y0128')
+
+
+def test_setup_tiled(data_dir_tiled_rgb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_tiled_rgb, data_folder_name='data', gt_folder_name='gt',
+                                       num_workers=NUM_WORKERS, dataset_format='tiled', crop_size=128,
+                                       virtual_crops={'crop_size_train': 200, 'crop_size_test': 300})
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    assert isinstance(data_module.train, TiledCroppedDatasetRGB)
+    assert data_module.train.crop_size == 200
+    assert data_module.val.crop_size == 256
+    img, gt = data_module.train[0]
+    assert img.shape == torch.Size(data_module.dims)
+    assert gt.shape == torch.Size(data_module.dims[1:])
+    data_module.setup('test')
+    assert len(data_module.test) == 24
+    assert data_module.get_img_name_coordinates(1) == ('e-codices_fmb-cb-0055_0098v_max',
+                                                       'e-codices_fmb-cb-0055_0098v_max_x0000_y0150')
+
+
+def test_train_dataloader_page_locality(data_dir_cropped, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       num_workers=NUM_WORKERS, page_window_size=2)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    sampler = data_module.train_dataloader().sampler
+    assert isinstance(sampler, PageLocalitySampler)
+    assert sampler.window_size == 2
+    assert len(sampler) == len(data_module.train)
+
+
+def test_train_dataloader_class_aware(data_dir_packed_rgb, monkeypatch):
+    histograms = {}
+    for dataset_format in ['files', 'packed']:
+        OmegaConf.clear_resolvers()
+        data_module = DataModuleCroppedRGB(data_dir_packed_rgb, data_folder_name='data', gt_folder_name='gt',
+                                           num_workers=NUM_WORKERS, dataset_format=dataset_format,
+                                           class_sampling_temperature=2)
+        trainer = Trainer(accelerator='cpu', strategy='ddp')
+        monkeypatch.setattr(data_module, 'trainer', trainer)
+        monkeypatch.setattr(trainer, 'datamodule', data_module)
+        data_module.setup('fit')
+        sampler = data_module.train_dataloader().sampler
+        assert isinstance(sampler, ClassAwareSampler)
+        assert sampler.temperature == 2
+        assert len(sampler) == len(data_module.train)
+        histograms[dataset_format] = data_module._get_class_histograms()
+    assert histograms['files'].shape == (len(data_module.train), data_module.num_classes)
+    assert np.all(histograms['files'].sum(axis=1) == 300 * 300)
+    # the histograms of the files (statistics index) and of the encoded shards are the same
+    assert np.array_equal(histograms['files'], histograms['packed'])
+
+
+def test_train_dataloader_blank_crops(data_dir_packed_rgb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_packed_rgb, data_folder_name='data', gt_folder_name='gt',
+                                       num_workers=NUM_WORKERS, batch_size=1,
+                                       blank_crops={'threshold': 0.9, 'keep_fraction': 0.5})
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    sampler = data_module.train_dataloader().sampler
+    assert isinstance(sampler, BlankCropSampler)
+    histograms = data_module._get_class_histograms()
+    blank_crops = histograms.max(axis=1) >= 0.9 * histograms.sum(axis=1)
+    assert len(sampler.blank_indices) == blank_crops.sum()
+    assert len(sampler) == (~blank_crops).sum() + round(blank_crops.sum() / 2)
+    # the validation crops are not skipped
+    assert not isinstance(data_module.val_dataloader().sampler, BlankCropSampler)
+
+
+def test_train_dataloader_blank_crops_crop_size_schedule(data_dir_packed_rgb, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_packed_rgb, data_folder_name='data', gt_folder_name='gt',
+                                       num_workers=NUM_WORKERS, batch_size=1,
+                                       blank_crops={'threshold': 0.9, 'keep_fraction': 0.5},
+                                       crop_size_schedule=[{'epochs': 2, 'crop_size': 128, 'batch_size': 3}])
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+
+    checked_batch_sizes = []
+    monkeypatch.setattr(data_module, 'check_min_num_samples',
+                        lambda num_devices, batch_size, **kwargs: checked_batch_sizes.append(batch_size))
+    data_module.train_dataloader()
+    # the minimal number of crops is checked with the batch size of the crop size schedule
+    assert checked_batch_sizes == [3]
+
+
+def test_train_dataloader_crop_size_schedule(data_dir_cropped, monkeypatch):
+    OmegaConf.clear_resolvers()
+    data_module = DataModuleCroppedRGB(data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       num_workers=NUM_WORKERS, batch_size=2,
+                                       crop_size_schedule=[{'epochs': 2, 'crop_size': 128, 'batch_size': 4}])
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    data_module.setup('fit')
+    assert trainer.reload_dataloaders_every_n_epochs == 1
+
+    train_dataloader = data_module.train_dataloader()
+    assert train_dataloader.batch_size == 4
+    assert next(iter(train_dataloader))[0].shape == (4, 3, 128, 128)
+    assert next(iter(data_module.val_dataloader()))[0].shape == (2, 3, 256, 256)
+
+    trainer.fit_loop.epoch_progress.current.completed = 2
+    train_dataloader = data_module.train_dataloader()
+    assert train_dataloader.batch_size == 2
+    assert next(iter(train_dataloader))[0].shape == (2, 3, 256, 256)
+
+
+def test_class_aware_and_page_locality(data_dir_cropped):
+    OmegaConf.clear_resolvers()
+    with pytest.raises(ValueError):
+        DataModuleCroppedRGB(data_dir_cropped, data_folder_name='data', gt_folder_name='gt', page_window_size=2,
+                             class_sampling_temperature=1)
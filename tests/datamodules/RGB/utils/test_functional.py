@@ -35,3 +35,18 @@ def test_gt_to_one_hot(input_matrix, class_encodings):
                                              [[1, 0, 0],
                                               [0, 0, 0],
                                               [0, 0, 1]]]))
+
+
+def test_gt_to_int_encoding_uint8(input_matrix, class_encodings):
+    output = gt_to_int_encoding(matrix=input_matrix.to(torch.uint8), class_encodings=class_encodings / 255)
+    assert torch.equal(output, torch.tensor([[3, 2, 1], [2, 1, 0], [1, 0, 3]]))
+
+
+def test_gt_to_int_encoding_float(input_matrix, class_encodings):
+    output = gt_to_int_encoding(matrix=input_matrix / 255, class_encodings=class_encodings / 255)
+    assert torch.equal(output, torch.tensor([[3, 2, 1], [2, 1, 0], [1, 0, 3]]))
+
+
+def test_gt_to_int_encoding_unknown_color(input_matrix, class_encodings):
+    output = gt_to_int_encoding(matrix=input_matrix, class_encodings=class_encodings[1:])
+    assert torch.equal(output, torch.tensor([[2, 1, 0], [1, 0, -1], [0, -1, 2]]))
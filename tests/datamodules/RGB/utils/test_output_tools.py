@@ -25,10 +25,13 @@ def test_save_output_page_image(tmp_path, input_image, class_encodings):
     img_output_path = tmp_path / img_name
     loaded_img = Image.open(img_output_path)
     assert img_output_path.exists()
-    assert np.array_equal(output_to_class_encodings(input_image, class_encodings), np.array(loaded_img))
+    assert loaded_img.mode == 'P'
+    assert np.array_equal(np.array(loaded_img), [[2, 3], [2, 0]])
+    assert np.array_equal(output_to_class_encodings(input_image, class_encodings), np.array(loaded_img.convert('RGB')))
 
 
 def test_output_to_class_encodings(input_image, class_encodings):
     encoded = output_to_class_encodings(output=input_image, class_encodings=class_encodings)
     expected_output = [[[255, 255, 0], [255, 255, 255]], [[255, 255, 0], [0, 0, 0]]]
+    assert encoded.dtype == np.uint8
     assert np.array_equal(encoded, expected_output)
@@ -1,7 +1,12 @@
+import numpy as np
 import pytest
+import torch
 
 from src.datamodules.RolfFormat.datasets.dataset import DatasetRolfFormat, DatasetSpecs
+from src.datamodules.RGB.utils.single_transform import IntegerEncoding
 from src.datamodules.utils.misc import ImageDimensions
+from src.datamodules.utils.page_cache import PageCacheSpecs
+from src.datamodules.utils.wrapper_transforms import OnlyTarget
 from tests.test_data.dummy_data_rolf.dummy_data import data_dir
 
 
@@ -79,6 +84,23 @@ def test__load_data_and_gt(dataset_train):
     assert gt_img.mode == 'RGB'
 
 
+
+def test_page_cache_same_items(data_dir, dataset_train):
+    _, gt_img = dataset_train._load_data_and_gt(index=0)
+    class_encodings = torch.unique(torch.from_numpy(np.asarray(gt_img)).reshape(-1, 3), dim=0) / 255
+    kwargs = {'dataset_specs': [_get_dataspecs(data_dir, train=True)],
+              'image_dims': ImageDimensions(width=960, height=1344),
+              'target_transform': OnlyTarget(IntegerEncoding(class_encodings=class_encodings))}
+    dataset = DatasetRolfFormat(**kwargs)
+    dataset_cached = DatasetRolfFormat(**kwargs, page_cache=PageCacheSpecs())
+    for _ in range(2):
+        for index in range(len(dataset)):
+            img, gt = dataset[index]
+            img_cached, gt_cached = dataset_cached[index]
+            assert torch.equal(img, img_cached)
+            assert torch.equal(gt, gt_cached)
+
+
 def _get_dataspecs(data_root, train: bool = True):
     if train:
         return DatasetSpecs(data_root=data_root,
@@ -1,4 +1,5 @@
 import pytest
+import torch
 from omegaconf import OmegaConf
 from pytorch_lightning import Trainer
 
@@ -96,3 +97,18 @@ def test_setup_predict_error(data_dir, monkeypatch):
     monkeypatch.setattr(trainer, 'datamodule', datamodules)
     with pytest.raises(RuntimeError):
         datamodules.setup(stage)
+
+
+def test_setup_fit_multi_crop(data_dir, monkeypatch):
+    specs_train = _get_dataspecs(data_root=data_dir, train=True).__dict__
+    del specs_train['data_root']
+    OmegaConf.clear_resolvers()
+    data_module_rolf = DataModuleRolfFormat(data_dir, train_specs={'a': specs_train}, val_specs={'a': specs_train},
+                                            num_workers=0, batch_size=2, train_crop_size=32, crops_per_page=2)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_rolf, 'trainer', trainer)
+    monkeypatch.setattr(trainer, 'datamodule', data_module_rolf)
+    data_module_rolf.setup('fit')
+    img, gt = next(iter(data_module_rolf.train_dataloader()))
+    assert img.shape == torch.Size([2, 3, 32, 32])
+    assert gt.shape == torch.Size([2, 32, 32])
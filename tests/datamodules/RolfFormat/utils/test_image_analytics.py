@@ -2,7 +2,7 @@ import numpy as np
 
 from tests.datamodules.RolfFormat.datasets.test_full_page_dataset import _get_dataspecs
 from src.datamodules.RolfFormat.datasets.dataset import DatasetRolfFormat
-from src.datamodules.RolfFormat.utils.image_analytics import get_analytics_data, get_analytics_gt
+from src.datamodules.RolfFormat.utils.image_analytics import get_analytics_data, get_analytics_gt, get_analytics
 from src.datamodules.utils.misc import ImageDimensions, get_image_dims
 from tests.test_data.dummy_data_rolf.dummy_data import data_dir
 
@@ -32,6 +32,15 @@ def test_get_analytics_gt(data_dir):
     assert np.array_equal(TEST_JSON_GT['class_encodings'], analytics_gt['class_encodings'])
 
 
+def test_get_analytics(data_dir):
+    img_gt_path_list = DatasetRolfFormat.get_img_gt_path_list(
+        list_specs=[_get_dataspecs(data_root=data_dir, train=True)])
+    analytics_data, analytics_gt = get_analytics(img_gt_path_list=img_gt_path_list, workers=2)
+    assert analytics_data == get_analytics_data(img_gt_path_list=img_gt_path_list)
+    assert analytics_gt == get_analytics_gt(img_gt_path_list=img_gt_path_list)
+    assert get_analytics(img_gt_path_list=img_gt_path_list, gt=False, workers=1) == (analytics_data, None)
+
+
 def test_get_image_dims(data_dir):
     img_gt_path_list = DatasetRolfFormat.get_img_gt_path_list(
         list_specs=[_get_dataspecs(data_root=data_dir, train=True)])
@@ -25,8 +25,8 @@ def test_init_datamodule(data_module_cropped_rotnet):
     assert data_module_cropped_rotnet.num_classes == 4
     assert np.array_equal(data_module_cropped_rotnet.class_encodings, [0, 90, 180, 270])
     assert torch.equal(data_module_cropped_rotnet.class_weights, torch.tensor([.25, .25, .25, .25]))
-    assert data_module_cropped_rotnet.mean == [0.7050454974582426, 0.6503181590413943, 0.5567698583877997]
-    assert data_module_cropped_rotnet.std == [0.3104060859619883, 0.3053311838884032, 0.28919611393432726]
+    assert data_module_cropped_rotnet.mean == [0.7050454974582425, 0.6503181590413943, 0.5567698583877996]
+    assert data_module_cropped_rotnet.std == [0.31040608596198827, 0.30533118388840325, 0.28919611393432737]
     with pytest.raises(AttributeError):
         getattr(data_module_cropped_rotnet, 'train')
         getattr(data_module_cropped_rotnet, 'val')
@@ -0,0 +1,80 @@
+import pytest
+import torch
+
+from src.datamodules.utils.batch_twin_transforms import BatchColorJitter, BatchRandomFlip, \
+    BatchRandomRightAngleRotation, BatchTwinCompose
+
+
+@pytest.fixture
+def batch():
+    torch.manual_seed(0)
+    gt = torch.randint(low=0, high=4, size=(16, 6, 6))
+    # the first channel of the image is the gt, so the geometric consistency can be checked
+    img = torch.cat([gt[:, None].float(), torch.rand(16, 2, 6, 6)], dim=1)
+    return img, gt
+
+
+def _assert_consistent(img, gt):
+    assert torch.equal(img[:, 0].long(), gt)
+
+
+def test_batch_random_flip(batch):
+    img, gt = batch
+    original = gt.clone()
+    labels = torch.arange(16)
+    img, gt, out_labels = BatchRandomFlip(horizontal=0.5, vertical=0.5)(img, gt, labels)
+    _assert_consistent(img, gt)
+    assert out_labels is labels
+    flipped = [not torch.equal(gt[i], original[i]) for i in range(16)]
+    assert any(flipped) and not all(flipped)
+    for i in range(16):
+        assert any(torch.equal(gt[i], candidate)
+                   for candidate in [original[i], original[i].flip(-1), original[i].flip(-2),
+                                     original[i].flip(-1).flip(-2)])
+
+
+def test_batch_random_flip_never(batch):
+    img, gt = batch
+    original = img.clone()
+    img, gt = BatchRandomFlip(horizontal=0.0, vertical=0.0)(img, gt)
+    assert torch.equal(img, original)
+
+
+def test_batch_random_right_angle_rotation(batch):
+    img, gt = batch
+    original = gt.clone()
+    img, gt = BatchRandomRightAngleRotation()(img, gt)
+    _assert_consistent(img, gt)
+    for i in range(16):
+        assert any(torch.equal(gt[i], torch.rot90(original[i], k=k, dims=(-2, -1))) for k in range(4))
+
+
+def test_batch_random_right_angle_rotation_errors():
+    with pytest.raises(ValueError):
+        BatchRandomRightAngleRotation(angle_list=[0, 45])
+    with pytest.raises(ValueError):
+        BatchRandomRightAngleRotation()(torch.rand(2, 3, 4, 6), torch.zeros(2, 4, 6))
+    img, gt = BatchRandomRightAngleRotation(angle_list=[0, 180])(torch.rand(2, 3, 4, 6), torch.zeros(2, 4, 6))
+    assert img.shape == torch.Size([2, 3, 4, 6])
+
+
+def test_batch_color_jitter(batch):
+    img, gt = batch
+    original_img, original_gt = img.clone(), gt.clone()
+    img, gt = BatchColorJitter(brightness=0.5, contrast=0.5)(img, gt)
+    assert torch.equal(gt, original_gt)
+    assert not torch.allclose(img, original_img)
+    assert torch.all((img.mean(dim=(-2, -1)) - original_img.mean(dim=(-2, -1))).abs() <= 0.5 + 1e-5)
+
+
+def test_batch_color_jitter_errors():
+    with pytest.raises(ValueError):
+        BatchColorJitter(brightness=-1)
+    with pytest.raises(ValueError):
+        BatchColorJitter(contrast=2)
+
+
+def test_batch_twin_compose(batch):
+    img, gt = batch
+    img, gt = BatchTwinCompose([BatchRandomFlip(), BatchRandomRightAngleRotation()])(img, gt)
+    _assert_consistent(img, gt)
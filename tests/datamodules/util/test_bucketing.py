@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from src.datamodules.utils.bucketing import AspectRatioBucketSampler, get_page_sizes, pad_collate
+
+# 5 portrait, 7 landscape and 3 square pages
+PAGE_SIZES = [(100, 140)] * 5 + [(140, 100)] * 7 + [(100, 100)] * 3
+
+
+def _get_batches(sampler: AspectRatioBucketSampler):
+    indices = list(sampler)
+    return [indices[i:i + sampler.batch_size] for i in range(0, len(indices), sampler.batch_size)]
+
+
+def test_get_buckets():
+    buckets = AspectRatioBucketSampler.get_buckets(page_sizes=np.asarray(PAGE_SIZES), num_buckets=3)
+    assert [bucket.tolist() for bucket in buckets] == [list(range(5, 12)), list(range(12, 15)), list(range(5))]
+
+
+def test_get_buckets_single_ratio():
+    buckets = AspectRatioBucketSampler.get_buckets(page_sizes=np.asarray([(100, 140)] * 4), num_buckets=3)
+    assert [bucket.tolist() for bucket in buckets] == [[0, 1, 2, 3]]
+
+
+def test_sampler_batches_from_one_bucket():
+    sampler = AspectRatioBucketSampler(page_sizes=PAGE_SIZES, batch_size=2, num_buckets=3)
+    # ceil(5 / 2) + ceil(7 / 2) + ceil(3 / 2) batches
+    assert len(sampler) == 18
+    batches = _get_batches(sampler)
+    assert len(batches) == 9
+    for batch in batches:
+        assert len({PAGE_SIZES[i] for i in batch}) == 1
+    assert set(np.concatenate(batches).tolist()) == set(range(len(PAGE_SIZES)))
+    assert sampler.get_padding_fraction() == 0.0
+
+
+def test_sampler_drop_last():
+    sampler = AspectRatioBucketSampler(page_sizes=PAGE_SIZES, batch_size=2, num_buckets=3, drop_last=True)
+    # 5 // 2 + 7 // 2 + 3 // 2 batches
+    assert len(sampler) == 12
+    batches = _get_batches(sampler)
+    assert len(batches) == 6
+    assert all(len(set(batch)) == 2 for batch in batches)
+
+
+def test_sampler_epochs():
+    sampler = AspectRatioBucketSampler(page_sizes=PAGE_SIZES, batch_size=2, num_buckets=3, seed=1)
+    first_epoch = list(sampler)
+    assert list(sampler) == first_epoch
+    sampler.set_epoch(1)
+    assert list(sampler) != first_epoch
+    assert len(list(sampler)) == len(first_epoch)
+
+
+def test_sampler_ranks():
+    samplers = [AspectRatioBucketSampler(page_sizes=PAGE_SIZES, batch_size=2, num_buckets=3, num_replicas=2,
+                                         rank=rank) for rank in range(2)]
+    # 9 batches are padded to 10
+    assert [len(sampler) for sampler in samplers] == [10, 10]
+    batches = [batch for sampler in samplers for batch in _get_batches(sampler)]
+    assert all(len({PAGE_SIZES[i] for i in batch}) == 1 for batch in batches)
+    assert set(np.concatenate(batches).tolist()) == set(range(len(PAGE_SIZES)))
+
+
+def test_sampler_padding_fraction():
+    sampler = AspectRatioBucketSampler(page_sizes=[(100, 100), (50, 50)], batch_size=2, num_buckets=1)
+    assert sampler.get_padding_fraction() == pytest.approx(0.375)
+
+
+def test_sampler_not_shuffled():
+    page_sizes = [(100, 100), (40, 40), (80, 80), (60, 60)]
+    sampler = AspectRatioBucketSampler(page_sizes=page_sizes, batch_size=2, num_buckets=1, shuffle=False)
+    assert list(sampler) == [1, 3, 2, 0]
+
+
+def test_sampler_errors():
+    with pytest.raises(ValueError):
+        AspectRatioBucketSampler(page_sizes=[100, 100], batch_size=2)
+    with pytest.raises(ValueError):
+        AspectRatioBucketSampler(page_sizes=PAGE_SIZES, batch_size=0)
+    with pytest.raises(ValueError):
+        AspectRatioBucketSampler(page_sizes=PAGE_SIZES, batch_size=2, num_buckets=0)
+    with pytest.raises(ValueError):
+        AspectRatioBucketSampler(page_sizes=PAGE_SIZES[:3], batch_size=4, drop_last=True)
+
+
+def test_pad_collate():
+    batch = [(torch.ones(3, 4, 6), torch.ones(4, 6, dtype=torch.long), 0),
+             (torch.ones(3, 5, 3), torch.ones(5, 3, dtype=torch.long), 1)]
+    img, gt, mask, idx = pad_collate(batch)
+    assert img.shape == torch.Size([2, 3, 5, 6])
+    assert gt.shape == torch.Size([2, 5, 6])
+    assert mask.dtype == torch.bool
+    assert mask.shape == torch.Size([2, 5, 6])
+    assert mask[0].sum() == 24
+    assert mask[1].sum() == 15
+    assert torch.equal(img[:, 0] == 1, mask)
+    assert torch.equal(gt == 1, mask)
+    assert idx.tolist() == [0, 1]
+
+
+def test_pad_collate_without_gt():
+    batch = [(torch.ones(3, 4, 6), 0), (torch.ones(3, 5, 3), 1)]
+    img, mask, idx = pad_collate(batch)
+    assert img.shape == torch.Size([2, 3, 5, 6])
+    assert mask.shape == torch.Size([2, 5, 6])
+    assert idx.tolist() == [0, 1]
+
+
+def test_get_page_sizes(tmp_path):
+    file_names = []
+    for i, size in enumerate([(30, 20), (20, 30)]):
+        file_name = tmp_path / f'page_{i}.png'
+        Image.new('RGB', size=size).save(file_name)
+        file_names.append(file_name)
+    page_sizes = get_page_sizes(root=tmp_path, file_names_data=file_names, workers=1)
+    assert page_sizes.tolist() == [[30, 20], [20, 30]]
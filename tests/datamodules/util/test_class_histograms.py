@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.RGB.utils.image_analytics import get_class_counts_rgb
+from src.datamodules.utils.class_histograms import count_classes, get_class_histograms_encoded, \
+    get_class_histograms_indexed, get_blank_crops
+from src.datamodules.utils.statistics_index import get_statistics_index_path
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
+
+
+def test_count_classes():
+    gt = np.asarray([[0, 0, 2], [-1, 2, 2]], dtype=np.int8)
+    assert count_classes(gt=gt, num_classes=4).tolist() == [2, 0, 3, 0]
+
+
+def test_get_class_histograms_encoded():
+    gts = [np.zeros((2, 2), dtype=np.int8), np.ones((2, 2), dtype=np.int8)]
+    assert get_class_histograms_encoded(gts=gts, num_classes=2).tolist() == [[4, 0], [0, 4]]
+    assert get_class_histograms_encoded(gts=[], num_classes=2).shape == (0, 2)
+
+
+def test_get_class_histograms_indexed(data_dir_cropped):
+    file_names_gt = [gt_path for _, gt_path, _, _ in CroppedDatasetRGB.get_gt_data_paths(
+        directory=data_dir_cropped / 'train', data_folder_name='data', gt_folder_name='gt')]
+    # just the blue channel value 1 is a class, the other colors are ignored
+    histograms = get_class_histograms_indexed(root=data_dir_cropped, file_names_gt=file_names_gt, gt_format='rgb',
+                                              get_class_counts_func=get_class_counts_rgb, num_classes=1,
+                                              get_class_id_func={(0, 0, 1): 0}.get, workers=1)
+    assert get_statistics_index_path(data_dir_cropped).exists()
+    assert histograms.shape == (len(file_names_gt), 1)
+    for gt_path, histogram in zip(file_names_gt, histograms):
+        assert histogram[0] == get_class_counts_rgb(gt_path).get((0, 0, 1), 0)
+
+
+def test_get_blank_crops():
+    histograms = np.asarray([[100, 0, 0], [98, 1, 1], [50, 50, 0], [0, 0, 0]])
+    assert get_blank_crops(class_histograms=histograms, threshold=0.98).tolist() == [True, True, False, True]
+    assert get_blank_crops(class_histograms=histograms, threshold=1).tolist() == [True, False, False, True]
+
+
+@pytest.mark.parametrize('histograms, threshold', [(np.ones((2, 2)), 0), (np.ones((2, 2)), 1.1), (np.ones(2), 0.9)])
+def test_get_blank_crops_invalid(histograms, threshold):
+    with pytest.raises(ValueError):
+        get_blank_crops(class_histograms=histograms, threshold=threshold)
@@ -0,0 +1,26 @@
+import pytest
+
+from src.datamodules.utils.crop_size_schedule import CropSizeSchedule
+
+
+def test_get_stage():
+    schedule = CropSizeSchedule(stages=[{'epochs': 2, 'crop_size': 64}, {'epochs': 1, 'crop_size': 128,
+                                                                          'batch_size': 6}],
+                                crop_size=256, batch_size=4)
+    assert [schedule.get_stage(epoch=epoch) for epoch in range(5)] == [(64, 64), (64, 64), (128, 6), (256, 4),
+                                                                       (256, 4)]
+
+
+def test_get_sizes():
+    schedule = CropSizeSchedule(stages=[{'epochs': 1, 'crop_size': 128}, {'epochs': 1, 'crop_size': 128}],
+                                crop_size=256, batch_size=2)
+    assert schedule.get_sizes() == [(128, 8), (256, 2)]
+    assert CropSizeSchedule(stages=[], crop_size=256, batch_size=2).get_sizes() == [(256, 2)]
+
+
+@pytest.mark.parametrize('stage', [{'epochs': 0, 'crop_size': 128}, {'epochs': 1, 'crop_size': 512},
+                                   {'epochs': 1, 'crop_size': 0}, {'crop_size': 128},
+                                   {'epochs': 1, 'crop_size': 128, 'size': 3}])
+def test_invalid_stage(stage):
+    with pytest.raises(ValueError):
+        CropSizeSchedule(stages=[stage], crop_size=256, batch_size=2)
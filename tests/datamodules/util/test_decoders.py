@@ -0,0 +1,79 @@
+import pickle
+import random
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+from torchvision.datasets.folder import pil_loader
+
+from src.datamodules.utils.decoders import DECODE_BACKENDS, get_decoder, get_image_size, load_image
+from src.datamodules.utils.misc import pil_loader_gif
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
+
+TEST_DATA = Path(__file__).parents[2] / 'test_data'
+RGB_FILES = sorted(glob(str(TEST_DATA / 'dummy_data_hisdb' / 'dummy_dataset' / 'train' / '*' / '*')))
+GIF_FILES = sorted(glob(str(TEST_DATA / 'dummy_data_histdb_new' / 'dummy_dataset' / 'train' / 'gt' / '*.gif')))
+
+
+@pytest.mark.parametrize('backend', DECODE_BACKENDS.keys())
+def test_decode_rgb(backend):
+    decoder = get_decoder(decode_backend=backend)
+    for path in RGB_FILES + GIF_FILES:
+        decoded = decoder.decode(path)
+        assert decoded.dtype == np.uint8
+        assert np.array_equal(decoded, np.asarray(pil_loader(path)))
+
+
+@pytest.mark.parametrize('backend', DECODE_BACKENDS.keys())
+def test_decode_palette(backend):
+    decoder = get_decoder(decode_backend=backend)
+    for path in GIF_FILES:
+        decoded = decoder.decode(path, mode='P')
+        assert decoded.ndim == 2
+        assert np.array_equal(decoded, np.asarray(pil_loader_gif(path)))
+
+
+@pytest.mark.parametrize('backend', DECODE_BACKENDS.keys())
+def test_decode_new_arrays(backend):
+    decoder = get_decoder(decode_backend=backend)
+    for path, mode in [(RGB_FILES[0], 'RGB'), (GIF_FILES[0], 'RGB'), (GIF_FILES[0], 'P')]:
+        decoded = decoder.decode(path, mode=mode)
+        # the arrays are not shared between the samples and can be changed in place (e.g. by `torch.from_numpy`)
+        assert decoded.flags.writeable
+        assert not np.shares_memory(decoded, decoder.decode(path, mode=mode))
+
+    decoder = pickle.loads(pickle.dumps(decoder))
+    assert np.array_equal(decoder.decode(RGB_FILES[0]), np.asarray(pil_loader(RGB_FILES[0])))
+
+
+def test_get_decoder():
+    assert get_decoder(decode_backend=None) is None
+    assert get_decoder(decode_backend='torchvision').name == 'torchvision'
+    with pytest.raises(ValueError):
+        get_decoder(decode_backend='opencv')
+
+
+def test_load_image():
+    assert isinstance(load_image(RGB_FILES[0], decoder=None), Image.Image)
+    assert load_image(GIF_FILES[0], decoder=None, mode='P').mode == 'P'
+    assert isinstance(load_image(RGB_FILES[0], decoder=get_decoder('pil')), np.ndarray)
+
+
+def test_get_image_size():
+    img = pil_loader(RGB_FILES[0])
+    assert get_image_size(img) == img.size
+    assert get_image_size(np.asarray(img)) == img.size
+    assert get_image_size(np.asarray(img)[..., 0]) == img.size
+
+
+def test_twin_random_crop_array():
+    img, gt = pil_loader(RGB_FILES[0]), pil_loader(RGB_FILES[1])
+    crop = TwinRandomCrop(crop_size=100)
+    random.seed(0)
+    img_crop, gt_crop = crop(img, gt)
+    random.seed(0)
+    img_array_crop, gt_array_crop = crop(np.asarray(img), np.asarray(gt))
+    assert np.array_equal(img_array_crop, np.asarray(img_crop))
+    assert np.array_equal(gt_array_crop, np.asarray(gt_crop))
@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.RGB.utils.image_analytics import get_analytics, get_class_counts_rgb
+from src.datamodules.utils.distributed import file_lock, get_rank, get_world_size, all_gather_object, \
+    ANALYTICS_LOCK_FILENAME
+from src.datamodules.utils.image_analytics import compute_image_statistics
+from src.datamodules.utils.statistics_index import StatisticsIndex
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
+
+WORLD_SIZE = 2
+
+
+def _get_analytics_rank(rank, init_file, data_dir, result_dir):
+    dist.init_process_group('gloo', init_method=f'file://{init_file}', rank=rank, world_size=WORLD_SIZE)
+    try:
+        analytics_data, analytics_gt = get_analytics(input_path=data_dir, data_folder_name='data',
+                                                     gt_folder_name='gt', train_folder_name='train',
+                                                     get_img_gt_path_list_func=CroppedDatasetRGB.get_gt_data_paths,
+                                                     workers=1)
+        with (result_dir / f'{rank}.json').open(mode='w') as f:
+            json.dump([get_rank(), get_world_size(), analytics_data, analytics_gt], f)
+    finally:
+        dist.destroy_process_group()
+
+
+def test_not_distributed():
+    assert get_rank() == 0
+    assert get_world_size() == 1
+    assert all_gather_object({'a': 1}) == [{'a': 1}]
+
+
+def test_file_lock(tmp_path):
+    with file_lock(tmp_path / 'test.lock'):
+        assert (tmp_path / 'test.lock').exists()
+    # not creatable lock files are ignored
+    with file_lock(tmp_path / 'missing' / 'test.lock'):
+        pass
+
+
+def test_get_analytics_lock(data_dir_cropped):
+    get_analytics(input_path=data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                  train_folder_name='train', get_img_gt_path_list_func=CroppedDatasetRGB.get_gt_data_paths,
+                  workers=1)
+    assert (data_dir_cropped / ANALYTICS_LOCK_FILENAME).exists()
+
+
+def test_get_analytics_gloo(data_dir_cropped, tmp_path_factory):
+    result_dir = tmp_path_factory.mktemp('results')
+    init_file = tmp_path_factory.mktemp('init') / 'process_group'
+    mp.spawn(_get_analytics_rank, args=(init_file, data_dir_cropped, result_dir), nprocs=WORLD_SIZE, join=True)
+
+    results = []
+    for rank in range(WORLD_SIZE):
+        with (result_dir / f'{rank}.json').open() as f:
+            results.append(json.load(f))
+    assert [r[:2] for r in results] == [[0, WORLD_SIZE], [1, WORLD_SIZE]]
+    assert results[0][2:] == results[1][2:]
+
+    file_names_data = sorted((data_dir_cropped / 'train' / 'data' / 'e-codices_fmb-cb-0055_0098v_max').iterdir())
+    file_names_gt = sorted((data_dir_cropped / 'train' / 'gt' / 'e-codices_fmb-cb-0055_0098v_max').iterdir())
+    expected = compute_image_statistics(file_names_data=file_names_data, file_names_gt=file_names_gt,
+                                        get_class_counts_func=get_class_counts_rgb, workers=1)
+    analytics_data = results[0][2]
+    assert np.allclose(analytics_data['mean'], expected.mean)
+    assert np.allclose(analytics_data['std'], expected.std)
+
+    # rank zero wrote the analytics and the index with the files of both ranks
+    with (data_dir_cropped / 'analytics.data.data.train.json').open() as f:
+        assert json.load(f) == analytics_data
+    index = StatisticsIndex.load(root=data_dir_cropped)
+    assert len(index.data_entries) == len(file_names_data)
+    assert len(index.gt_entries['rgb']) == len(file_names_gt)
+    assert not list(data_dir_cropped.glob('.analytics*'))
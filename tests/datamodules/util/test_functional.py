@@ -1,6 +1,9 @@
+import numpy as np
 import torch
+from torchvision import transforms
 
-from src.datamodules.utils.functional import argmax_onehot
+from src.datamodules.utils.functional import argmax_onehot, lookup_packed_colors, normalize_uint8, pack_colors, \
+    to_color_values
 
 
 def test_argmax_onehot():
@@ -22,3 +25,33 @@ def test_argmax_onehot():
     output_tensor = argmax_onehot(input_tensor)
     assert output_tensor.shape == torch.Size([3, 3])
     assert torch.equal(output_tensor, torch.tensor([[1, 3, 1], [1, 3, 1], [3, 1, 3]]))
+
+
+def test_normalize_uint8():
+    mean = [0.2, 0.5, 0.7]
+    std = [0.1, 0.25, 0.3]
+    array = np.random.default_rng(0).integers(0, 256, size=(4, 5, 3), dtype=np.uint8)
+    expected = transforms.Normalize(mean=mean, std=std)(transforms.ToTensor()(array))
+    batch = torch.from_numpy(array).permute(2, 0, 1)[None, :]
+    output = normalize_uint8(batch, mean=mean, std=std)
+    assert output.dtype == torch.float32
+    assert torch.allclose(output[0], expected, atol=1e-6)
+
+
+def test_to_color_values():
+    values = torch.tensor([0, 1, 128, 255], dtype=torch.uint8)
+    assert torch.equal(to_color_values(values), values.int())
+    assert torch.equal(to_color_values(transforms.ToTensor()(values.numpy()[None, :])[0, 0]), values.int())
+
+
+def test_pack_colors():
+    matrix = torch.tensor([[[255, 0]], [[1, 0]], [[2, 7]]], dtype=torch.uint8)
+    assert torch.equal(pack_colors(matrix), torch.tensor([[0xFF0102, 0x000007]], dtype=torch.int32))
+    assert torch.equal(pack_colors(matrix.float() / 255), pack_colors(matrix))
+
+
+def test_lookup_packed_colors():
+    packed_encodings = torch.tensor([30, 10, 20, 10])
+    packed = torch.tensor([[10, 20, 30], [5, 25, 40]], dtype=torch.int32)
+    assert torch.equal(lookup_packed_colors(packed=packed, packed_encodings=packed_encodings),
+                       torch.tensor([[3, 2, 0], [-1, -1, -1]]))
@@ -1,6 +1,9 @@
 import numpy as np
+import pytest
 
-from src.datamodules.utils.image_analytics import compute_mean_std, _return_mean, _return_std
+from src.datamodules.RGB.utils.image_analytics import get_class_counts_rgb
+from src.datamodules.utils.image_analytics import compute_mean_std, compute_image_statistics, get_image_statistics, \
+    ImageStatistics
 from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped, data_dir
 
 
@@ -20,16 +23,71 @@ def test_compute_mean_std_not_inmem(data_dir_cropped):
     assert np.isclose(std, [0.3104060859619883, 0.30533118388840325, 0.28919611393432726]).any()
 
 
-def test__return_mean(data_dir):
+def test_get_image_statistics(data_dir):
     path_to_files = data_dir / 'train' / 'data'
     path_file = list(path_to_files.iterdir())[0]
-    mean = _return_mean(image_path=path_file)
-    assert np.allclose(mean, [0.6613600924561268, 0.6080705925283078, 0.5188177611400755], rtol=2e-02)
+    statistics = get_image_statistics(data_path=path_file)
+    assert statistics.pixel_count == 316063
+    assert statistics.sizes == [(487, 649)]
+    assert statistics.class_counts == {}
+    assert np.allclose(statistics.mean, [0.6613600924561268, 0.6080705925283078, 0.5188177611400755], rtol=2e-02)
+    # sum of the squared deviations from the mean of the image
+    assert np.allclose(statistics.std ** 2 * statistics.pixel_count,
+                       [38926.12389586361, 36001.38344827261, 30250.40256187894], rtol=2e-02)
 
 
-def test__return_std(data_dir):
-    path_to_files = data_dir / 'train' / 'data'
-    path_file = list(path_to_files.iterdir())[0]
-    std_class, std_glob = _return_std(image_path=path_file, mean=_return_mean(path_file))
-    assert std_glob == 316063.0
-    assert np.allclose(std_class, [38926.12389586361, 36001.38344827261, 30250.40256187894], rtol=2e-02)
+def test_get_image_statistics_gt(data_dir):
+    path_file = list((data_dir / 'train' / 'gt').iterdir())[0]
+    statistics = get_image_statistics(data_path=None, gt_path=path_file, get_class_counts_func=get_class_counts_rgb)
+    assert statistics.pixel_count == 0
+    assert sum(statistics.class_counts.values()) == 316063
+
+
+def test_image_statistics_add():
+    a = ImageStatistics(pixel_count=2, channel_sums=[1, 2, 3], channel_squared_sums=[1, 4, 9],
+                        class_counts={1: 2}, sizes=[(2, 1)])
+    b = ImageStatistics(pixel_count=1, channel_sums=[3, 2, 1], channel_squared_sums=[9, 4, 1],
+                        class_counts={1: 1, 2: 3}, sizes=[(1, 1)])
+    c = a + b
+    assert c.pixel_count == 3
+    assert c.channel_sums == [4, 4, 4]
+    assert c.channel_squared_sums == [10, 8, 10]
+    assert c.class_counts == {1: 3, 2: 3}
+    assert c.sizes == [(2, 1), (1, 1)]
+    # the operands are not changed
+    assert a.pixel_count == 2 and a.class_counts == {1: 2} and a.sizes == [(2, 1)]
+
+
+def test_image_statistics_mean_std():
+    values = np.array([[0, 10, 255], [255, 20, 255], [7, 30, 255]])
+    statistics = ImageStatistics(pixel_count=3, channel_sums=values.sum(axis=0).tolist(),
+                                 channel_squared_sums=(values ** 2).sum(axis=0).tolist())
+    assert np.allclose(statistics.mean, values.mean(axis=0) / 255)
+    assert np.allclose(statistics.std, values.std(axis=0) / 255)
+    assert statistics.std[2] == 0
+
+
+def test_compute_image_statistics_workers(data_dir_cropped):
+    path_to_files = data_dir_cropped / 'train'
+    file_names_data = sorted((path_to_files / 'data').glob('**/*.png'))
+    file_names_gt = sorted((path_to_files / 'gt').glob('**/*.png'))
+    serial = compute_image_statistics(file_names_data=file_names_data, file_names_gt=file_names_gt,
+                                      get_class_counts_func=get_class_counts_rgb, workers=1)
+    parallel = compute_image_statistics(file_names_data=file_names_data, file_names_gt=file_names_gt,
+                                        get_class_counts_func=get_class_counts_rgb, workers=2)
+    assert serial == parallel
+    assert len(serial.sizes) == len(file_names_data)
+    assert serial.pixel_count == sum(serial.class_counts.values())
+
+
+def test_compute_image_statistics_no_files():
+    with pytest.raises(ValueError):
+        compute_image_statistics()
+    with pytest.raises(ValueError):
+        compute_image_statistics(file_names_data=[])
+
+
+def test_compute_image_statistics_different_lengths(data_dir):
+    file_names_data = list((data_dir / 'train' / 'data').iterdir())
+    with pytest.raises(ValueError):
+        compute_image_statistics(file_names_data=file_names_data, file_names_gt=file_names_data[:-1])
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from src.datamodules.utils.lru_cache import LRUCache
+
+
+class _CachedDataset(Dataset):
+    def __init__(self, cache: LRUCache):
+        self.cache = cache
+
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, index):
+        if self.cache.get(index % 2) is None:
+            self.cache.put(index % 2, np.zeros(4, dtype=np.uint8))
+        return index
+
+
+def test_get_put():
+    cache = LRUCache(max_bytes=16)
+    assert cache.get('a') is None
+    cache.put('a', np.arange(2, dtype=np.int32))
+    assert np.array_equal(cache.get('a'), [0, 1])
+    assert len(cache) == 1
+    assert cache.num_bytes == 8
+    assert cache.get_stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'hit_rate': 0.5}
+
+
+def test_eviction_least_recently_used():
+    cache = LRUCache(max_bytes=16)
+    cache.put('a', np.zeros(8, dtype=np.uint8))
+    cache.put('b', np.zeros(8, dtype=np.uint8))
+    cache.get('a')
+    cache.put('c', np.zeros(8, dtype=np.uint8))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.num_bytes == 16
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_put_too_large():
+    cache = LRUCache(max_bytes=4)
+    cache.put('a', np.zeros(8, dtype=np.uint8))
+    assert len(cache) == 0
+    assert cache.num_bytes == 0
+
+
+def test_put_replace():
+    cache = LRUCache(max_bytes=16)
+    cache.put('a', np.zeros(8, dtype=np.uint8))
+    cache.put('a', np.zeros(4, dtype=np.uint8))
+    assert cache.num_bytes == 4
+
+
+def test_reset_stats():
+    cache = LRUCache(max_bytes=16)
+    cache.get('a')
+    cache.reset_stats()
+    assert cache.get_stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'hit_rate': 0.}
+
+
+def test_invalid_budget():
+    with pytest.raises(ValueError):
+        LRUCache(max_bytes=0)
+
+
+def test_stats_of_workers():
+    cache = LRUCache(max_bytes=16, num_workers=2)
+    list(DataLoader(_CachedDataset(cache=cache), batch_size=2, num_workers=2))
+    stats = cache.get_stats()
+    # every worker misses each of the two keys once
+    assert stats['misses'] == 4
+    assert stats['hits'] == 4
+    assert torch.all(cache._stats[0] == 0)
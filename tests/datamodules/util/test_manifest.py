@@ -0,0 +1,139 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.RGB.datasets.full_page_dataset import DatasetRGB
+from src.datamodules.utils.manifest import DatasetManifest, get_manifest_path, load_or_create_manifest
+from src.datamodules.utils.misc import validate_selection
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir, data_dir_cropped
+
+PAGE_NAME = 'e-codices_fmb-cb-0055_0098v_max'
+
+
+@pytest.fixture
+def split_cropped(data_dir_cropped):
+    # add a second page to the train split
+    split = data_dir_cropped / 'train'
+    for folder_name in ['data', 'gt']:
+        shutil.copytree(split / folder_name / PAGE_NAME, split / folder_name / 'page_b')
+    return split
+
+
+def _list_cropped(split):
+    return CroppedDatasetRGB.get_gt_data_paths(split, data_folder_name='data', gt_folder_name='gt')
+
+
+def test_manifest_matches_listing(split_cropped):
+    expected = _list_cropped(split_cropped)
+    manifest = load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       cropped=True, list_split=lambda: _list_cropped(split_cropped))
+    assert get_manifest_path(split_cropped, 'data', 'gt', cropped=True).is_file()
+    assert manifest.get_paths() == expected
+    assert manifest.page_names == [PAGE_NAME, 'page_b']
+    assert manifest.coordinates[0].tolist() == [0, 0]
+    assert manifest.coordinates[1].tolist() == [0, 150]
+    assert manifest.file_sizes[0].tolist() == [expected[0][0].stat().st_size, expected[0][1].stat().st_size]
+
+
+def test_manifest_reused_if_unchanged(split_cropped):
+    load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                            cropped=True, list_split=lambda: _list_cropped(split_cropped))
+
+    def fail():
+        raise AssertionError('the split should not be listed again')
+
+    manifest = load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       cropped=True, list_split=fail)
+    assert manifest.get_paths() == _list_cropped(split_cropped)
+
+
+def test_manifest_recreated_if_folder_changed(split_cropped):
+    manifest = load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       cropped=True, list_split=lambda: _list_cropped(split_cropped))
+    num_samples = len(manifest)
+
+    for folder_name in ['data', 'gt']:
+        page_folder = split_cropped / folder_name / 'page_b'
+        removed = sorted(page_folder.iterdir())[0]
+        removed.unlink()
+        # make sure the modification time changes on file systems with a coarse resolution
+        mtime_ns = page_folder.stat().st_mtime_ns + 10 ** 9
+        os.utime(page_folder, ns=(mtime_ns, mtime_ns))
+
+    manifest = load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       cropped=True, list_split=lambda: _list_cropped(split_cropped))
+    assert len(manifest) == num_samples - 1
+    assert manifest.get_paths() == _list_cropped(split_cropped)
+
+
+def test_manifest_not_used_for_other_layout(split_cropped):
+    load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                            cropped=True, list_split=lambda: _list_cropped(split_cropped))
+    manifest = DatasetManifest.load(get_manifest_path(split_cropped, 'data', 'gt', cropped=True))
+    assert manifest.is_up_to_date(data_folder_name='data', gt_folder_name='gt', cropped=True)
+    assert not manifest.is_up_to_date(data_folder_name='data', gt_folder_name='gt', cropped=False)
+
+
+def test_manifest_corrupt_file(split_cropped):
+    get_manifest_path(split_cropped, 'data', 'gt', cropped=True).write_text('{"version": 1, ')
+    manifest = load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       cropped=True, list_split=lambda: _list_cropped(split_cropped))
+    assert manifest.get_paths() == _list_cropped(split_cropped)
+
+
+def test_manifest_selection(split_cropped):
+    manifest = load_or_create_manifest(directory=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                       cropped=True, list_split=lambda: _list_cropped(split_cropped))
+    for selection in [1, ['page_b'], [PAGE_NAME, 'page_b']]:
+        assert manifest.get_paths(selection=selection) == CroppedDatasetRGB.get_gt_data_paths(
+            split_cropped, data_folder_name='data', gt_folder_name='gt', selection=selection)
+    assert np.all(manifest.page_ids[manifest.get_sample_indices(selection=['page_b'])] == 1)
+
+    with pytest.raises(ValueError):
+        manifest.get_paths(selection=['page_c'])
+    with pytest.raises(ValueError):
+        manifest.get_paths(selection=3)
+
+
+def test_get_gt_data_paths_use_manifest(split_cropped):
+    paths = CroppedDatasetRGB.get_gt_data_paths(split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                                selection=['page_b'], use_manifest=True)
+    assert paths == CroppedDatasetRGB.get_gt_data_paths(split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                                        selection=['page_b'])
+    assert get_manifest_path(split_cropped, 'data', 'gt', cropped=True).is_file()
+
+
+def test_get_img_gt_path_list_use_manifest(data_dir):
+    split = data_dir / 'test'
+    expected = DatasetRGB.get_img_gt_path_list(split, data_folder_name='data', gt_folder_name='gt')
+    paths = DatasetRGB.get_img_gt_path_list(split, data_folder_name='data', gt_folder_name='gt', use_manifest=True)
+    assert paths == expected
+    assert get_manifest_path(split, 'data', 'gt', cropped=False).is_file()
+
+    selection = [expected[1][2]]
+    assert DatasetRGB.get_img_gt_path_list(split, data_folder_name='data', gt_folder_name='gt',
+                                           selection=selection, use_manifest=True) == [expected[1]]
+
+
+def test_cropped_dataset_use_manifest(split_cropped):
+    dataset = CroppedDatasetRGB(path=split_cropped, data_folder_name='data', gt_folder_name='gt',
+                                selection=1, use_manifest=True)
+    assert len(dataset) == len(_list_cropped(split_cropped)) // 2
+    assert list(dataset.img_paths_per_page) == CroppedDatasetRGB.get_gt_data_paths(
+        split_cropped, data_folder_name='data', gt_folder_name='gt', selection=1)
+
+
+def test_validate_selection():
+    names = ['a', 'b', 'c']
+    assert validate_selection(names=names, selection=['c', 'a'], full_page=True) == ['c', 'a']
+    assert validate_selection(names=names, selection=0, full_page=True) is None
+    assert validate_selection(names=names, selection=3, full_page=False) == 3
+    with pytest.raises(ValueError):
+        validate_selection(names=names, selection=['d'], full_page=False)
+    with pytest.raises(ValueError):
+        validate_selection(names=names, selection=4, full_page=True)
+    with pytest.raises(TypeError):
+        validate_selection(names=names, selection='a', full_page=True)
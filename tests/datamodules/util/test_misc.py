@@ -6,7 +6,7 @@ import torch
 
 from src.datamodules.utils.exceptions import PathNone, PathNotDir, PathMissingSplitDir, PathMissingDirinSplitDir
 from src.datamodules.utils.misc import validate_path_for_segmentation, _get_argmax, get_output_file_list, \
-    find_new_filename, selection_validation, get_image_dims
+    find_new_filename, selection_validation, get_image_dims, get_crop_coordinates
 from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped, data_dir
 
 
@@ -240,3 +240,14 @@ def test_get_image_dims_list_tuples(get_test_data_full_page):
     img_dims = get_image_dims([(get_test_data_full_page[0], get_test_data_full_page[0])])
     assert img_dims.width == 487
     assert img_dims.height == 649
+
+
+@pytest.mark.parametrize('img_width, img_height, crop_size, overlap, expected', [
+    (10, 10, 10, 0.5, [(0, 0)]),
+    (12, 10, 8, 0.5, [(0, 0), (0, 2), (4, 0), (4, 2)]),
+    (20, 8, 8, 0.5, [(0, 0), (4, 0), (8, 0), (12, 0)]),
+    (10, 8, 8, 0., [(0, 0), (2, 0)]),
+])
+def test_get_crop_coordinates(img_width, img_height, crop_size, overlap, expected):
+    assert get_crop_coordinates(img_width=img_width, img_height=img_height, crop_size=crop_size,
+                                overlap=overlap) == expected
@@ -0,0 +1,66 @@
+import random
+from pathlib import Path
+
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from src.datamodules.RGB.datasets.full_page_dataset import DatasetRGB
+from src.datamodules.utils.misc import ImageDimensions
+from src.datamodules.utils.multi_crop import MultiCropDataset, multi_crop_collate
+from src.datamodules.utils.twin_transforms import TwinRandomCrop
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir
+
+
+def _get_dataset(data_dir: Path, split: str = 'test', is_test: bool = False) -> DatasetRGB:
+    return DatasetRGB(path=data_dir / split, data_folder_name='data', gt_folder_name='gt',
+                      image_dims=ImageDimensions(width=487, height=649), is_test=is_test,
+                      twin_transform=TwinRandomCrop(crop_size=64))
+
+
+@pytest.fixture
+def dataset_multi_crop(data_dir):
+    return MultiCropDataset(dataset=_get_dataset(data_dir), crops_per_page=3)
+
+
+def test_len(dataset_multi_crop):
+    assert len(dataset_multi_crop) == 2
+
+
+def test_getitem(dataset_multi_crop):
+    img, gt = dataset_multi_crop[0]
+    assert img.shape == torch.Size([3, 3, 64, 64])
+    assert gt.shape == torch.Size([3, 3, 64, 64])
+
+
+def test_getitem_same_as_single_crops(data_dir, dataset_multi_crop):
+    dataset = _get_dataset(data_dir)
+    random.seed(5)
+    img, gt = dataset_multi_crop[1]
+    random.seed(5)
+    for k in range(3):
+        img_single, gt_single = dataset[1]
+        assert torch.equal(img[k], img_single)
+        assert torch.equal(gt[k], gt_single)
+
+
+def test_decodes_page_once(dataset_multi_crop, monkeypatch):
+    calls = []
+    load_func = dataset_multi_crop.dataset._load_data_and_gt
+    monkeypatch.setattr(dataset_multi_crop.dataset, '_load_data_and_gt',
+                        lambda index: calls.append(index) or load_func(index=index))
+    dataset_multi_crop[0]
+    assert calls == [0]
+
+
+def test_collate(dataset_multi_crop):
+    img, gt = next(iter(DataLoader(dataset_multi_crop, batch_size=2, collate_fn=multi_crop_collate)))
+    assert img.shape == torch.Size([6, 3, 64, 64])
+    assert gt.shape == torch.Size([6, 3, 64, 64])
+
+
+def test_errors(data_dir):
+    with pytest.raises(ValueError):
+        MultiCropDataset(dataset=_get_dataset(data_dir), crops_per_page=0)
+    with pytest.raises(ValueError):
+        MultiCropDataset(dataset=_get_dataset(data_dir, is_test=True), crops_per_page=2)
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.datamodules.utils.output_tools import decode_palette, get_palette, output_to_class_indices, \
+    save_paletted_image
+
+
+@pytest.fixture()
+def output():
+    return np.array([[[0., 0.3], [4., 2.]],
+                     [[1., 4.1], [-0.2, 1.9]],
+                     [[1.1, -0.8], [4.9, 1.3]],
+                     [[-0.4, 4.4], [2.9, 0.1]]])
+
+
+def test_output_to_class_indices(output):
+    class_indices = output_to_class_indices(output)
+    assert class_indices.dtype == np.uint8
+    assert np.array_equal(class_indices, np.argmax(output, axis=0))
+
+
+def test_output_to_class_indices_no_argmax():
+    class_indices = output_to_class_indices(np.array([[0, 3], [1, 2]]), perform_argmax=False)
+    assert class_indices.dtype == np.uint8
+    assert np.array_equal(class_indices, [[0, 3], [1, 2]])
+
+
+def test_output_to_class_indices_many_classes():
+    output = np.zeros((300, 1, 2))
+    output[299, 0, 1] = 1
+    class_indices = output_to_class_indices(output)
+    assert class_indices.dtype == np.int64
+    assert np.array_equal(class_indices, [[0, 299]])
+
+
+def test_get_palette_rgb():
+    palette = get_palette([(0, 0, 0), (255, 0, 0), (255, 255, 0)])
+    assert palette.dtype == np.uint8
+    assert np.array_equal(palette, [[0, 0, 0], [255, 0, 0], [255, 255, 0]])
+
+
+def test_get_palette_blue_values():
+    assert np.array_equal(get_palette([1., 2., 4., 8.]), [[0, 0, 1], [0, 0, 2], [0, 0, 4], [0, 0, 8]])
+
+
+def test_decode_palette():
+    palette = get_palette([(0, 0, 0), (255, 0, 0), (255, 255, 0)])
+    decoded = decode_palette(np.array([[2, 1], [0, 2]], dtype=np.uint8), palette)
+    assert decoded.dtype == np.uint8
+    assert np.array_equal(decoded, [[[255, 255, 0], [255, 0, 0]], [[0, 0, 0], [255, 255, 0]]])
+
+
+@pytest.mark.parametrize('extension', ['png', 'gif'])
+def test_save_paletted_image(tmp_path, extension):
+    palette = get_palette([(0, 0, 0), (1, 2, 3), (9, 9, 9), (255, 0, 0)])
+    class_indices = np.array([[0, 3], [3, 3]], dtype=np.uint8)
+    save_paletted_image(class_indices, palette, tmp_path / f'test.{extension}')
+    loaded_img = Image.open(tmp_path / f'test.{extension}')
+    assert loaded_img.mode == 'P'
+    assert np.array_equal(np.array(loaded_img), class_indices)
+    assert np.array_equal(np.array(loaded_img.convert('RGB')), decode_palette(class_indices, palette))
+
+
+def test_save_paletted_image_too_many_classes(tmp_path):
+    with pytest.raises(ValueError):
+        save_paletted_image(np.zeros((2, 2), dtype=np.int64), np.zeros((300, 3), dtype=np.uint8),
+                            tmp_path / 'test.png')
+
+
+def test_save_paletted_image_compress_level(tmp_path):
+    palette = get_palette([(0, 0, 0), (255, 0, 0)])
+    class_indices = np.tile(np.array([0, 1], dtype=np.uint8), (64, 32))
+    save_paletted_image(class_indices, palette, tmp_path / 'fast.png', compress_level=0)
+    save_paletted_image(class_indices, palette, tmp_path / 'small.png', compress_level=9)
+    assert (tmp_path / 'fast.png').stat().st_size > (tmp_path / 'small.png').stat().st_size
+    assert np.array_equal(np.array(Image.open(tmp_path / 'fast.png')), class_indices)
+    with pytest.raises(ValueError):
+        save_paletted_image(class_indices, palette, tmp_path / 'test.png', compress_level=10)
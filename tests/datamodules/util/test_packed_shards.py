@@ -0,0 +1,183 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from src.datamodules.utils.exceptions import PathNone, PathNotDir, PathMissingSplitDir
+from src.datamodules.utils.packed_shards import PackedShardWriter, PackedShardReader, INDEX_FILE_NAME, \
+    validate_path_for_packed_segmentation, missing_packed_analytics
+
+
+@pytest.fixture
+def packed_split(tmp_path):
+    split_path = tmp_path / 'train'
+    writer = PackedShardWriter(output_path=split_path, num_samples=5, crop_size=(4, 6), shard_size=2,
+                               with_mask=True)
+    for i in range(5):
+        page_name = 'page_a' if i < 3 else 'page_b'
+        writer.add(page_name=page_name, crop_name=f'{page_name}_x{i:04d}_y0000', coordinates=(i, 0),
+                   img=np.full((4, 6, 3), fill_value=i, dtype=np.uint8),
+                   gt=np.full((4, 6), fill_value=i - 1, dtype=np.int8),
+                   mask=np.full((4, 6), fill_value=i % 2 == 0))
+    writer.close(class_encodings=[1, 2, 4, 8])
+    return split_path
+
+
+def test_writer_files(packed_split):
+    assert (packed_split / INDEX_FILE_NAME).exists()
+    assert len(list(packed_split.glob('*.data.npy'))) == 3
+    assert len(list(packed_split.glob('*.gt.npy'))) == 3
+    assert len(list(packed_split.glob('*.mask.npy'))) == 3
+    assert np.load(packed_split / 'shard_0002.data.npy').shape == (1, 4, 6, 3)
+
+
+def test_writer_wrong_crop_size(tmp_path):
+    writer = PackedShardWriter(output_path=tmp_path, num_samples=1, crop_size=(4, 4))
+    with pytest.raises(ValueError):
+        writer.add(page_name='a', crop_name='a_x0000_y0000', coordinates=(0, 0),
+                   img=np.zeros((4, 6, 3), dtype=np.uint8), gt=np.zeros((4, 6), dtype=np.int8))
+
+
+def test_writer_missing_samples(tmp_path):
+    writer = PackedShardWriter(output_path=tmp_path, num_samples=2, crop_size=(4, 4))
+    writer.add(page_name='a', crop_name='a_x0000_y0000', coordinates=(0, 0),
+               img=np.zeros((4, 4, 3), dtype=np.uint8), gt=np.zeros((4, 4), dtype=np.int8))
+    with pytest.raises(ValueError):
+        writer.close(class_encodings=[])
+
+
+def test_writer_missing_mask(tmp_path):
+    writer = PackedShardWriter(output_path=tmp_path, num_samples=1, crop_size=(4, 4), with_mask=True)
+    with pytest.raises(ValueError):
+        writer.add(page_name='a', crop_name='a_x0000_y0000', coordinates=(0, 0),
+                   img=np.zeros((4, 4, 3), dtype=np.uint8), gt=np.zeros((4, 4), dtype=np.int8))
+
+
+def test_reader(packed_split):
+    reader = PackedShardReader(path=packed_split)
+    assert len(reader) == 5
+    assert reader.page_names == ['page_a', 'page_b']
+    assert reader.class_encodings == [1, 2, 4, 8]
+    assert reader.get_sample(sample_id=3) == ('page_b', 'page_b_x0003_y0000', 3, 0)
+    for i in range(5):
+        assert np.all(reader.get_data(i) == i)
+        assert reader.get_data(i).dtype == np.uint8
+        assert np.all(reader.get_gt(i) == i - 1)
+        assert np.all(reader.get_mask(i) == (i % 2 == 0))
+    assert reader.get_shard_path(sample_id=4, kind='gt') == packed_split / 'shard_0002.gt.npy'
+
+
+def test_reader_read_only(packed_split):
+    reader = PackedShardReader(path=packed_split)
+    with pytest.raises(ValueError):
+        reader.get_data(0)[0, 0, 0] = 1
+
+
+def test_reader_pickle_without_memory_maps(packed_split):
+    reader = PackedShardReader(path=packed_split)
+    reader.get_data(0)
+    assert len(reader._shard_arrays) == 1
+    reader_copy = pickle.loads(pickle.dumps(reader))
+    assert len(reader_copy._shard_arrays) == 0
+    assert np.all(reader_copy.get_data(1) == 1)
+
+
+def test_reader_no_mask(tmp_path):
+    writer = PackedShardWriter(output_path=tmp_path, num_samples=1, crop_size=(4, 4))
+    writer.add(page_name='a', crop_name='a_x0000_y0000', coordinates=(0, 0),
+               img=np.zeros((4, 4, 3), dtype=np.uint8), gt=np.zeros((4, 4), dtype=np.int8))
+    writer.close(class_encodings=[])
+    with pytest.raises(ValueError):
+        PackedShardReader(path=tmp_path).get_mask(0)
+
+
+def test_get_sample_ids(packed_split):
+    reader = PackedShardReader(path=packed_split)
+    assert reader.get_sample_ids().tolist() == [0, 1, 2, 3, 4]
+    assert reader.get_sample_ids(selection=0).tolist() == [0, 1, 2, 3, 4]
+    assert reader.get_sample_ids(selection=1).tolist() == [0, 1, 2]
+    assert reader.get_sample_ids(selection=['page_b']).tolist() == [3, 4]
+
+
+@pytest.mark.parametrize('selection, error', [(-1, ValueError), (3, ValueError), (['page_c'], ValueError),
+                                              ('page_a', TypeError)])
+def test_get_sample_ids_errors(packed_split, selection, error):
+    reader = PackedShardReader(path=packed_split)
+    with pytest.raises(error):
+        reader.get_sample_ids(selection=selection)
+
+
+@pytest.fixture
+def bit_packed_split(tmp_path):
+    split_path = tmp_path / 'train'
+    writer = PackedShardWriter(output_path=split_path, num_samples=3, crop_size=(4, 10), shard_size=2,
+                               with_mask=True, bit_packed_data=True, bit_packed_gt=True)
+    rng = np.random.default_rng(seed=42)
+    crops = []
+    for i in range(3):
+        bits = rng.integers(0, 2, size=(4, 10), dtype=np.uint8)
+        crop = (np.repeat(bits[:, :, None], 3, axis=-1) * 255, (1 - bits).astype(np.int8), bits == 1)
+        writer.add(page_name='page_a', crop_name=f'page_a_x{i:04d}_y0000', coordinates=(i, 0),
+                   img=crop[0], gt=crop[1], mask=crop[2])
+        crops.append(crop)
+    writer.close(class_encodings=[1, 2])
+    return split_path, crops
+
+
+def test_bit_packed_reader(bit_packed_split):
+    split_path, crops = bit_packed_split
+    reader = PackedShardReader(path=split_path)
+    assert reader.bit_packed_kinds == {'data', 'gt', 'mask'}
+    for i, (img, gt, mask) in enumerate(crops):
+        assert reader.get_data(i).dtype == np.uint8
+        assert np.array_equal(reader.get_data(i), img)
+        assert reader.get_gt(i).dtype == np.int8
+        assert np.array_equal(reader.get_gt(i), gt)
+        assert reader.get_mask(i).dtype == np.bool_
+        assert np.array_equal(reader.get_mask(i), mask)
+
+
+def test_bit_packed_shard_size(bit_packed_split):
+    split_path, _ = bit_packed_split
+    # 10 pixels per row are packed into 2 bytes
+    assert np.load(split_path / 'shard_0000.data.npy').shape == (2, 4, 2)
+    assert np.load(split_path / 'shard_0000.gt.npy').shape == (2, 4, 2)
+    assert np.load(split_path / 'shard_0001.mask.npy').shape == (1, 4, 2)
+
+
+def test_bit_packed_data_not_binary(tmp_path):
+    writer = PackedShardWriter(output_path=tmp_path, num_samples=1, crop_size=(4, 4), bit_packed_data=True)
+    with pytest.raises(ValueError):
+        writer.add(page_name='a', crop_name='a_x0000_y0000', coordinates=(0, 0),
+                   img=np.full((4, 4, 3), fill_value=128, dtype=np.uint8), gt=np.zeros((4, 4), dtype=np.int8))
+    img = np.zeros((4, 4, 3), dtype=np.uint8)
+    img[:, :, 0] = 255
+    with pytest.raises(ValueError):
+        writer.add(page_name='a', crop_name='a_x0000_y0000', coordinates=(0, 0),
+                   img=img, gt=np.zeros((4, 4), dtype=np.int8))
+
+
+def test_bit_packed_gt_not_binary(tmp_path):
+    writer = PackedShardWriter(output_path=tmp_path, num_samples=1, crop_size=(4, 4), bit_packed_gt=True)
+    with pytest.raises(ValueError):
+        writer.add(page_name='a', crop_name='a_x0000_y0000', coordinates=(0, 0),
+                   img=np.zeros((4, 4, 3), dtype=np.uint8), gt=np.full((4, 4), fill_value=2, dtype=np.int8))
+
+
+def test_validate_path_for_packed_segmentation(packed_split):
+    assert validate_path_for_packed_segmentation(data_dir=str(packed_split.parent), split_name='train') == \
+           packed_split.parent
+
+
+def test_validate_path_for_packed_segmentation_errors(packed_split):
+    with pytest.raises(PathNone):
+        validate_path_for_packed_segmentation(data_dir=None, split_name='train')
+    with pytest.raises(PathNotDir):
+        validate_path_for_packed_segmentation(data_dir=str(packed_split / INDEX_FILE_NAME), split_name='train')
+    with pytest.raises(PathMissingSplitDir):
+        validate_path_for_packed_segmentation(data_dir=str(packed_split.parent), split_name='val')
+
+
+def test_missing_packed_analytics(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        missing_packed_analytics(tmp_path / 'train', data_folder_name='data', gt_folder_name='gt')
@@ -0,0 +1,113 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from src.datamodules.utils.misc import ImageDimensions
+from src.datamodules.utils.page_cache import PageCache, PageCacheSpecs
+
+
+@pytest.fixture
+def page_paths(tmp_path):
+    paths = []
+    for i in range(3):
+        data_path = tmp_path / f'data_{i}.png'
+        gt_path = tmp_path / f'gt_{i}.png'
+        data_path.write_bytes(b'data')
+        gt_path.write_bytes(b'gt')
+        paths.append((data_path, gt_path))
+    return paths
+
+
+class Decoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, index):
+        self.calls.append(index)
+        return np.full((2, 3, 3), fill_value=index, dtype=np.uint8), np.full((2, 3), fill_value=index - 1)
+
+
+@pytest.mark.parametrize('mode', ['shared', 'memmap'])
+def test_load_decodes_once(page_paths, tmp_path, mode):
+    cache = PageCache(specs=PageCacheSpecs(mode=mode, cache_dir=str(tmp_path / 'cache')), page_paths=page_paths,
+                      image_dims=ImageDimensions(width=3, height=2))
+    decoder = Decoder()
+    for _ in range(2):
+        for i in range(3):
+            img, label_map = cache.load(index=i, decode_func=decoder)
+            assert np.all(img == i)
+            assert np.all(label_map == i - 1)
+    assert decoder.calls == [0, 1, 2]
+    assert cache.is_cached(2)
+
+
+def test_load_invalidation(page_paths):
+    cache = PageCache(specs=PageCacheSpecs(), page_paths=page_paths, image_dims=ImageDimensions(width=3, height=2))
+    decoder = Decoder()
+    cache.load(index=0, decode_func=decoder)
+    page_paths[0][1].write_bytes(b'new gt')
+    assert not cache.is_cached(0)
+    cache.load(index=0, decode_func=decoder)
+    stat = os.stat(page_paths[0][0])
+    os.utime(page_paths[0][0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    cache.load(index=0, decode_func=decoder)
+    assert decoder.calls == [0, 0, 0]
+
+
+def test_max_bytes(page_paths):
+    cache = PageCache(specs=PageCacheSpecs(max_bytes=2 * (18 + 12 + 32)), page_paths=page_paths,
+                      image_dims=ImageDimensions(width=3, height=2))
+    assert cache.num_slots == 2
+    decoder = Decoder()
+    for _ in range(2):
+        img, _ = cache.load(index=2, decode_func=decoder)
+        assert np.all(img == 2)
+    assert decoder.calls == [2, 2]
+    assert not cache.is_cached(2)
+
+
+def test_memmap_persistent(page_paths, tmp_path):
+    specs = PageCacheSpecs(mode='memmap', cache_dir=str(tmp_path / 'cache'))
+    cache = PageCache(specs=specs, page_paths=page_paths, image_dims=ImageDimensions(width=3, height=2))
+    cache.load(index=1, decode_func=Decoder())
+    assert len(list((tmp_path / 'cache').glob('*.npy'))) == 3
+
+    decoder = Decoder()
+    cache_new = PageCache(specs=specs, page_paths=page_paths, image_dims=ImageDimensions(width=3, height=2))
+    img, label_map = cache_new.load(index=1, decode_func=decoder)
+    assert decoder.calls == []
+    assert np.all(img == 1)
+    assert np.all(label_map == 0)
+
+
+def test_memmap_pickle_without_memory_maps(page_paths, tmp_path):
+    cache = PageCache(specs=PageCacheSpecs(mode='memmap', cache_dir=str(tmp_path / 'cache')), page_paths=page_paths,
+                      image_dims=ImageDimensions(width=3, height=2))
+    cache.load(index=0, decode_func=Decoder())
+    assert cache._arrays is not None
+    cache_copy = pickle.loads(pickle.dumps(cache))
+    assert cache_copy._arrays is None
+    assert cache_copy.is_cached(0)
+
+
+def test_wrong_specs(page_paths):
+    with pytest.raises(ValueError):
+        PageCache(specs=PageCacheSpecs(mode='disk'), page_paths=page_paths,
+                  image_dims=ImageDimensions(width=3, height=2))
+    with pytest.raises(ValueError):
+        PageCache(specs=PageCacheSpecs(mode='memmap'), page_paths=page_paths,
+                  image_dims=ImageDimensions(width=3, height=2))
+
+
+def test_shared_slots(page_paths):
+    # the default budget holds far more than the three pages, the slots are sized for the pages of the split
+    cache = PageCache(specs=PageCacheSpecs(), page_paths=page_paths, image_dims=ImageDimensions(width=3, height=2))
+    assert cache.num_slots == 3
+    data, labels, signatures = cache._get_arrays()
+    assert data.shape == (3, 2, 3, 3)
+    assert labels.shape == (3, 2, 3)
+    assert not signatures.any()
+    assert all(tensor.is_shared() for tensor in cache._arrays.values())
+    assert not any(cache.is_cached(i) for i in range(3))
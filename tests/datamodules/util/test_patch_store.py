@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from src.datamodules.utils.patch_store import PatchStoreReader, PatchStoreWriter
+
+
+@pytest.fixture
+def patches():
+    rng = np.random.default_rng(0)
+    return rng.random((4, 3, 4, 4)).astype(np.float32)
+
+
+def _write_store(path, patches, storage='float32'):
+    writer = PatchStoreWriter(path=path, rank=0, storage=storage)
+    writer.add(page_name='page_a', crop_name='page_a_x0000_y0000', patch=patches[0])
+    writer.add(page_name='page_a', crop_name='page_a_x0002_y0000', patch=patches[1])
+    writer.add(page_name='page_b', crop_name='page_b_x0000_y0000', patch=patches[2])
+    # a crop which is added a second time is ignored
+    writer.add(page_name='page_b', crop_name='page_b_x0000_y0000', patch=patches[3])
+    writer.close()
+    return writer
+
+
+def test_write_read(tmp_path, patches):
+    writer = _write_store(tmp_path, patches)
+    assert len(writer) == 3
+    assert sorted(p.name for p in (tmp_path / 'rank_0000').iterdir()) == ['index.json', 'page_00000.bin',
+                                                                          'page_00001.bin']
+
+    reader = PatchStoreReader(tmp_path)
+    assert reader.page_names == ['page_a', 'page_b']
+    assert reader.get_crops('page_a') == [('page_a_x0000_y0000', 0, 0, (3, 4, 4)),
+                                          ('page_a_x0002_y0000', 2, 0, (3, 4, 4))]
+    crops = list(reader.read_page('page_a'))
+    assert [(name, x, y) for name, x, y, _ in crops] == [('page_a_x0000_y0000', 0, 0), ('page_a_x0002_y0000', 2, 0)]
+    assert np.array_equal(crops[1][3], patches[1])
+    _, _, _, patch = next(reader.read_page('page_b'))
+    assert np.array_equal(patch, patches[2])
+
+
+def test_float16(tmp_path, patches):
+    _write_store(tmp_path, patches, storage='float16')
+    reader = PatchStoreReader(tmp_path)
+    _, _, _, patch = next(reader.read_page('page_a'))
+    assert patch.dtype == np.float16
+    assert np.allclose(patch, patches[0], atol=1e-3)
+
+
+def test_argmax(tmp_path, patches):
+    _write_store(tmp_path, patches, storage='argmax')
+    reader = PatchStoreReader(tmp_path)
+    assert reader.storage == 'argmax'
+    _, _, _, patch = next(reader.read_page('page_a'))
+    assert patch.dtype == np.uint8
+    assert np.array_equal(patch, np.argmax(patches[0], axis=0))
+
+
+def test_page_split_between_ranks(tmp_path, patches):
+    for rank in range(2):
+        writer = PatchStoreWriter(path=tmp_path, rank=rank)
+        writer.add(page_name='page_a', crop_name=f'page_a_x{rank:04d}_y0000', patch=patches[rank])
+        # the last crop is padded to the second process
+        writer.add(page_name='page_a', crop_name='page_a_x0001_y0000', patch=patches[1])
+        writer.close()
+
+    reader = PatchStoreReader(tmp_path)
+    assert reader.page_names == ['page_a']
+    assert [name for name, _, _, _ in reader.read_page('page_a')] == ['page_a_x0000_y0000', 'page_a_x0001_y0000']
+    assert len(reader.get_crops('page_a')) == 2
+
+
+def test_interleaved_pages(tmp_path, patches):
+    writer = PatchStoreWriter(path=tmp_path)
+    writer.add(page_name='page_a', crop_name='page_a_x0000_y0000', patch=patches[0])
+    writer.add(page_name='page_b', crop_name='page_b_x0000_y0000', patch=patches[1])
+    writer.add(page_name='page_a', crop_name='page_a_x0000_y0002', patch=patches[2])
+    writer.close()
+
+    patches_a = [patch for _, _, _, patch in PatchStoreReader(tmp_path).read_page('page_a')]
+    assert np.array_equal(patches_a[0], patches[0])
+    assert np.array_equal(patches_a[1], patches[2])
+
+
+def test_empty_store(tmp_path):
+    PatchStoreWriter(path=tmp_path).close()
+    assert not PatchStoreReader.exists(tmp_path)
+    with pytest.raises(ValueError):
+        PatchStoreReader(tmp_path)
+
+
+def test_errors(tmp_path, patches):
+    with pytest.raises(ValueError):
+        PatchStoreWriter(path=tmp_path, storage='int8')
+    with pytest.raises(ValueError):
+        PatchStoreWriter(path=tmp_path).add(page_name='page_a', crop_name='page_a', patch=patches[0])
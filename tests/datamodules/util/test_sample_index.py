@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.utils.sample_index import CropSampleIndex, StringArray
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
+
+
+@pytest.fixture
+def entries():
+    return [(Path('/data/train/data/page_a/page_a_x0000_y0000.png'),
+             Path('/data/train/gt/page_a/page_a_x0000_y0000.gif'), 'page_a', 'page_a_x0000_y0000'),
+            (Path('/data/train/data/page_a/page_a_x0128_y0000.png'),
+             Path('/data/train/gt/page_a/page_a_x0128_y0000.gif'), 'page_a', 'page_a_x0128_y0000'),
+            (Path('/data/train/data/page_ü/page_ü_x0000_y0064.png'),
+             Path('/data/train/gt/page_ü/page_ü_x0000_y0064.gif'), 'page_ü', 'page_ü_x0000_y0064'),
+            ('/shards/data.npy', '/shards/gt.npy', 'page_b', 'crop')]
+
+
+def test_string_array():
+    strings = StringArray(strings=['a', '', 'äbc'])
+    assert len(strings) == 3
+    assert list(strings) == ['a', '', 'äbc']
+    assert strings[-1] == 'äbc'
+    assert strings[1:] == ['', 'äbc']
+    with pytest.raises(IndexError):
+        strings[3]
+
+
+def test_crop_sample_index(entries):
+    index = CropSampleIndex(entries=entries)
+    assert len(index) == 4
+    assert index[0] == entries[0]
+    assert index[2] == entries[2]
+    assert index[-1] == (Path('/shards/data.npy'), Path('/shards/gt.npy'), 'page_b', 'crop')
+    assert index[1][2:] == ('page_a', 'page_a_x0128_y0000')
+    assert list(index)[:3] == entries[:3]
+    with pytest.raises(IndexError):
+        index[4]
+
+
+def test_crop_sample_index_arrays(entries):
+    index = CropSampleIndex(entries=entries)
+    assert np.array_equal(index.page_ids, [0, 0, 1, 2])
+    assert list(index.page_names) == ['page_a', 'page_ü', 'page_b']
+    assert np.array_equal(index.coordinates, [[0, 0], [128, 0], [0, 64], [-1, -1]])
+    # the folders are stored once
+    assert len(index.strings) == 4 * 2 + 3 + 2 + 4
+
+
+def test_cropped_dataset_same_paths(data_dir_cropped):
+    paths = CroppedDatasetRGB.get_gt_data_paths(directory=data_dir_cropped / 'train', data_folder_name='data',
+                                                gt_folder_name='gt')
+    dataset = CroppedDatasetRGB(path=data_dir_cropped / 'train', data_folder_name='data', gt_folder_name='gt')
+    assert isinstance(dataset.img_paths_per_page, CropSampleIndex)
+    assert list(dataset.img_paths_per_page) == paths
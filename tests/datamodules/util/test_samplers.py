@@ -0,0 +1,262 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from src.datamodules.utils.samplers import PageLocalitySampler, ClassAwareSampler, HardExampleSampler, \
+    BlankCropSampler
+
+PAGE_NAMES = [f'page{p}' for p in range(6) for _ in range(5)]
+
+
+def _pages_of(indices):
+    return [PAGE_NAMES[i] for i in indices]
+
+
+def test_no_shuffle():
+    sampler = PageLocalitySampler(page_ids=PAGE_NAMES, window_size=2, shuffle=False)
+    assert list(sampler) == list(range(30))
+
+
+def test_shuffle_is_permutation():
+    sampler = PageLocalitySampler(page_ids=PAGE_NAMES, window_size=2)
+    assert len(sampler) == 30
+    indices = list(sampler)
+    assert sorted(indices) == list(range(30))
+    assert indices != list(range(30))
+
+
+@pytest.mark.parametrize('window_size', [1, 2, 4])
+def test_locality(window_size):
+    indices = list(PageLocalitySampler(page_ids=PAGE_NAMES, window_size=window_size, seed=3))
+    for start in range(0, 30, window_size * 5):
+        assert len(set(_pages_of(indices[start:start + window_size * 5]))) <= window_size
+
+
+def test_set_epoch():
+    sampler = PageLocalitySampler(page_ids=PAGE_NAMES, window_size=2)
+    first_epoch = list(sampler)
+    assert list(sampler) == first_epoch
+    sampler.set_epoch(1)
+    assert list(sampler) != first_epoch
+
+
+@pytest.mark.parametrize('drop_last, expected_len', [(False, 8), (True, 7)])
+def test_ranks_disjoint(drop_last, expected_len):
+    samplers = [PageLocalitySampler(page_ids=PAGE_NAMES, window_size=1, num_replicas=4, rank=rank,
+                                    drop_last=drop_last) for rank in range(4)]
+    shares = [list(sampler) for sampler in samplers]
+    assert all(len(share) == expected_len for share in shares)
+    all_indices = [i for share in shares for i in share]
+    if drop_last:
+        assert len(set(all_indices)) == len(all_indices)
+    else:
+        assert set(all_indices) == set(range(30))
+    # every rank only sees a few pages
+    assert all(len(set(_pages_of(share))) <= 3 for share in shares)
+
+
+def test_invalid_window_size():
+    with pytest.raises(ValueError):
+        PageLocalitySampler(page_ids=PAGE_NAMES, window_size=0)
+
+
+# 8 background crops, 1 crop with a rare class and 1 crop without a known class
+CLASS_HISTOGRAMS = np.asarray([[100, 0]] * 8 + [[50, 50], [0, 0]])
+
+
+def test_class_aware_weights():
+    weights = ClassAwareSampler.get_crop_weights(class_histograms=CLASS_HISTOGRAMS, temperature=1)
+    assert np.all(weights[:8] == weights[0])
+    assert weights[8] > weights[0]
+    assert weights[9] == 0
+    # the temperature moves the weights towards uniform sampling
+    weights_hot = ClassAwareSampler.get_crop_weights(class_histograms=CLASS_HISTOGRAMS, temperature=100)
+    assert weights_hot[8] / weights_hot[0] < weights[8] / weights[0]
+
+
+def test_class_aware_oversampling():
+    sampler = ClassAwareSampler(class_histograms=CLASS_HISTOGRAMS, temperature=1)
+    counts = np.zeros(len(CLASS_HISTOGRAMS), dtype=int)
+    for epoch in range(100):
+        sampler.set_epoch(epoch)
+        indices = list(sampler)
+        assert len(indices) == len(CLASS_HISTOGRAMS)
+        np.add.at(counts, indices, 1)
+    assert counts[9] == 0
+    assert counts[8] > counts[:8].mean() * 5
+
+
+def test_class_aware_deterministic():
+    sampler = ClassAwareSampler(class_histograms=CLASS_HISTOGRAMS, temperature=2, seed=1)
+    first_epoch = list(sampler)
+    assert list(ClassAwareSampler(class_histograms=CLASS_HISTOGRAMS, temperature=2, seed=1)) == first_epoch
+    sampler.set_epoch(1)
+    assert list(sampler) != first_epoch
+
+
+@pytest.mark.parametrize('drop_last, expected_len', [(False, 4), (True, 3)])
+def test_class_aware_ranks(drop_last, expected_len):
+    samplers = [ClassAwareSampler(class_histograms=CLASS_HISTOGRAMS, num_replicas=3, rank=rank, drop_last=drop_last)
+                for rank in range(3)]
+    shares = [list(sampler) for sampler in samplers]
+    assert all(len(share) == expected_len for share in shares)
+    # every rank draws the same order of the epoch and takes its share of it
+    order = torch.multinomial(torch.as_tensor(samplers[0].weights), num_samples=samplers[0].total_size,
+                              replacement=True, generator=torch.Generator().manual_seed(0)).tolist()
+    assert [i for position in zip(*shares) for i in position] == order
+
+
+@pytest.mark.parametrize('class_histograms, temperature', [(CLASS_HISTOGRAMS, 0), (np.zeros((3, 2)), 1),
+                                                           (np.ones(3), 1)])
+def test_class_aware_invalid(class_histograms, temperature):
+    with pytest.raises(ValueError):
+        ClassAwareSampler(class_histograms=class_histograms, temperature=temperature)
+
+
+BLANK_CROPS = [i % 3 != 0 for i in range(30)]
+
+
+def test_blank_crops_excluded():
+    sampler = BlankCropSampler(blank_crops=BLANK_CROPS)
+    assert len(sampler) == 10
+    assert sorted(sampler) == list(range(0, 30, 3))
+
+
+def test_blank_crops_keep_fraction():
+    sampler = BlankCropSampler(blank_crops=BLANK_CROPS, keep_fraction=0.25)
+    assert sampler.num_kept_blank == 5
+    kept_blank = set()
+    for epoch in range(5):
+        sampler.set_epoch(epoch)
+        indices = list(sampler)
+        assert len(indices) == len(set(indices)) == 15
+        blank = [i for i in indices if BLANK_CROPS[i]]
+        assert len(blank) == 5
+        assert set(range(0, 30, 3)) <= set(indices)
+        kept_blank.update(blank)
+    # the kept blank crops change between the epochs
+    assert len(kept_blank) > 5
+
+
+def test_blank_crops_no_shuffle():
+    sampler = BlankCropSampler(blank_crops=BLANK_CROPS, keep_fraction=0.1, shuffle=False)
+    indices = list(sampler)
+    assert indices == sorted(indices)
+    assert len(indices) == 12
+
+
+@pytest.mark.parametrize('drop_last, expected_len', [(False, 4), (True, 3)])
+def test_blank_crops_ranks(drop_last, expected_len):
+    samplers = [BlankCropSampler(blank_crops=BLANK_CROPS, num_replicas=3, rank=rank, drop_last=drop_last)
+                for rank in range(3)]
+    shares = [list(sampler) for sampler in samplers]
+    assert all(len(share) == expected_len for share in shares)
+    if not drop_last:
+        assert {i for share in shares for i in share} == set(range(0, 30, 3))
+
+
+@pytest.mark.parametrize('blank_crops, keep_fraction', [(BLANK_CROPS, -0.1), (BLANK_CROPS, 1.5), ([True] * 4, 0)])
+def test_blank_crops_invalid(blank_crops, keep_fraction):
+    with pytest.raises(ValueError):
+        BlankCropSampler(blank_crops=blank_crops, keep_fraction=keep_fraction)
+
+
+def test_hard_example_probabilities():
+    sampler = HardExampleSampler(num_crops=4, uniform_fraction=0.2)
+    assert np.allclose(sampler.get_probabilities(), 0.25)
+    sampler.update(indices=[0, 1], losses=[1.0, 3.0])
+    sampler.synchronize()
+    # the unseen crops get the highest loss
+    assert np.allclose(sampler.get_probabilities(), 0.2 / 4 + 0.8 * np.asarray([1, 3, 3, 3]) / 10)
+    assert np.isclose(sampler.get_probabilities().sum(), 1)
+
+
+def test_hard_example_moving_average():
+    sampler = HardExampleSampler(num_crops=3, momentum=0.5)
+    sampler.update(indices=[0, 1], losses=[2.0, 4.0])
+    # the losses are pending until the synchronization
+    assert np.all(np.isnan(sampler.losses))
+    sampler.synchronize()
+    sampler.update(indices=[0], losses=[4.0])
+    sampler.synchronize()
+    assert np.allclose(sampler.losses, [3.0, 4.0, np.nan], equal_nan=True)
+
+
+def test_hard_example_oversampling():
+    sampler = HardExampleSampler(num_crops=10, uniform_fraction=0.1)
+    sampler.update(indices=list(range(10)), losses=[0.1] * 9 + [5.0])
+    sampler.synchronize()
+    counts = np.zeros(10, dtype=int)
+    for epoch in range(20):
+        sampler.set_epoch(epoch)
+        np.add.at(counts, list(sampler), 1)
+    assert counts[9] > counts[:9].mean() * 5
+
+
+def test_hard_example_no_collectives(monkeypatch):
+    sampler = HardExampleSampler(num_crops=10, num_replicas=2, rank=1)
+    sampler.update(indices=[0], losses=[1.0])
+
+    def _fail(obj):
+        raise AssertionError('collective outside of synchronize')
+
+    # iterating and saving the state do not merge the pending losses
+    monkeypatch.setattr('src.datamodules.utils.samplers.all_gather_object', _fail)
+    assert len(list(sampler)) == 5
+    assert np.all(np.isnan(sampler.state_dict()['losses']))
+
+
+def test_hard_example_state_dict():
+    sampler = HardExampleSampler(num_crops=3)
+    sampler.update(indices=[1], losses=[2.0])
+    sampler.synchronize()
+    state = sampler.state_dict()
+    assert np.allclose(state['losses'], [np.nan, 2.0, np.nan], equal_nan=True)
+
+    restored = HardExampleSampler(num_crops=3)
+    restored.load_state_dict(state)
+    assert np.array_equal(restored.losses, sampler.losses, equal_nan=True)
+    with pytest.raises(ValueError):
+        HardExampleSampler(num_crops=4).load_state_dict(state)
+
+
+@pytest.mark.parametrize('kwargs', [{'uniform_fraction': 1.5}, {'momentum': 1}, {'momentum': -0.1}])
+def test_hard_example_invalid(kwargs):
+    with pytest.raises(ValueError):
+        HardExampleSampler(num_crops=3, **kwargs)
+
+
+def _synchronize_rank(rank, init_file, result_dir):
+    dist.init_process_group('gloo', init_method=f'file://{init_file}', rank=rank, world_size=2)
+    try:
+        sampler = HardExampleSampler(num_crops=4, num_replicas=2, rank=rank)
+        sampler.update(indices=[rank], losses=[float(rank + 1)])
+        sampler.synchronize()
+        with (result_dir / f'{rank}.json').open(mode='w') as f:
+            json.dump([list(sampler), np.nan_to_num(sampler.losses, nan=-1).tolist()], f)
+        dist.barrier()
+    finally:
+        dist.destroy_process_group()
+
+
+def test_hard_example_synchronize_gloo(tmp_path_factory):
+    result_dir = tmp_path_factory.mktemp('results')
+    init_file = tmp_path_factory.mktemp('init') / 'process_group'
+    mp.spawn(_synchronize_rank, args=(init_file, result_dir), nprocs=2, join=True)
+
+    results = []
+    for rank in range(2):
+        with (result_dir / f'{rank}.json').open() as f:
+            results.append(json.load(f))
+    # the loss tables are merged and the ranks get disjoint shares of the same order
+    assert results[0][1] == results[1][1] == [1.0, 2.0, -1, -1]
+    sampler = HardExampleSampler(num_crops=4)
+    sampler.update(indices=[0, 1], losses=[1.0, 2.0])
+    sampler.synchronize()
+    order = list(sampler)
+    assert results[0][0] == order[0::2]
+    assert results[1][0] == order[1::2]
@@ -1,6 +1,8 @@
+import numpy as np
 import torch
+from PIL import Image
 
-from src.datamodules.utils.single_transforms import OneHotToPixelLabelling, RightAngleRotation
+from src.datamodules.utils.single_transforms import OneHotToPixelLabelling, RightAngleRotation, ToUint8Tensor
 
 
 def test_one_hot_to_pixel_labelling():
@@ -37,3 +39,18 @@ def test__update_target_class():
     transformation._update_target_class()
     assert transformation.target_class is not None
 
+
+def test_to_uint8_tensor():
+    array = np.arange(2 * 3 * 3, dtype=np.uint8).reshape((2, 3, 3))
+    expected = torch.from_numpy(array).permute(2, 0, 1)
+    for pic in [array, Image.fromarray(array)]:
+        output = ToUint8Tensor()(pic)
+        assert output.dtype == torch.uint8
+        assert torch.equal(output, expected)
+
+
+def test_to_uint8_tensor_gray_array():
+    array = np.arange(6, dtype=np.uint8).reshape((2, 3))
+    output = ToUint8Tensor()(array)
+    assert output.shape == torch.Size([1, 2, 3])
+    assert torch.equal(output[0], torch.from_numpy(array))
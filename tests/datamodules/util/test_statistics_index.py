@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.RGB.utils.image_analytics import get_class_counts_rgb, get_analytics
+from src.datamodules.utils.image_analytics import compute_image_statistics
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed, StatisticsIndex, \
+    get_statistics_index_path, STATISTICS_INDEX_VERSION
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
+
+
+@pytest.fixture
+def file_names(data_dir_cropped):
+    file_names_data = sorted((data_dir_cropped / 'train' / 'data' / 'e-codices_fmb-cb-0055_0098v_max').iterdir())
+    file_names_gt = sorted((data_dir_cropped / 'train' / 'gt' / 'e-codices_fmb-cb-0055_0098v_max').iterdir())
+    return file_names_data, file_names_gt
+
+
+def test_compute_image_statistics_indexed(data_dir_cropped, file_names):
+    file_names_data, file_names_gt = file_names
+    statistics = compute_image_statistics_indexed(root=data_dir_cropped, file_names_data=file_names_data,
+                                                  file_names_gt=file_names_gt, gt_format='rgb',
+                                                  get_class_counts_func=get_class_counts_rgb, workers=1)
+    expected = compute_image_statistics(file_names_data=file_names_data, file_names_gt=file_names_gt,
+                                        get_class_counts_func=get_class_counts_rgb, workers=1)
+    assert statistics == expected
+
+    with get_statistics_index_path(data_dir_cropped).open() as f:
+        content = json.load(f)
+    assert content['version'] == STATISTICS_INDEX_VERSION
+    assert len(content['data']) == len(file_names_data)
+    assert len(content['gt']['rgb']) == len(file_names_gt)
+
+
+def test_compute_image_statistics_indexed_from_index(data_dir_cropped, file_names):
+    file_names_data, file_names_gt = file_names
+    compute_image_statistics_indexed(root=data_dir_cropped, file_names_data=file_names_data,
+                                     file_names_gt=file_names_gt, gt_format='rgb',
+                                     get_class_counts_func=get_class_counts_rgb, workers=1)
+
+    index = StatisticsIndex.load(root=data_dir_cropped)
+    keys_data, keys_gt, num_read = index.update(file_names_data=file_names_data, file_names_gt=file_names_gt,
+                                                gt_format='rgb', get_class_counts_func=get_class_counts_rgb,
+                                                workers=1)
+    assert num_read == 0
+    assert keys_data[0] == 'train/data/e-codices_fmb-cb-0055_0098v_max/' + file_names_data[0].name
+
+    # a subset is aggregated from the index
+    statistics = index.get_statistics(keys_data=keys_data[:3], keys_gt=keys_gt[:3], gt_format='rgb')
+    expected = compute_image_statistics(file_names_data=file_names_data[:3], file_names_gt=file_names_gt[:3],
+                                        get_class_counts_func=get_class_counts_rgb, workers=1)
+    assert statistics == expected
+
+
+def test_statistics_index_modified_file(data_dir_cropped, file_names):
+    file_names_data, _ = file_names
+    compute_image_statistics_indexed(root=data_dir_cropped, file_names_data=file_names_data, workers=1)
+
+    stat = os.stat(file_names_data[0])
+    os.utime(file_names_data[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    index = StatisticsIndex.load(root=data_dir_cropped)
+    _, _, num_read = index.update(file_names_data=file_names_data, workers=1)
+    assert num_read == 1
+
+
+def test_statistics_index_invalid_file(data_dir_cropped):
+    get_statistics_index_path(data_dir_cropped).write_text('{"version": 1, "data": ')
+    index = StatisticsIndex.load(root=data_dir_cropped)
+    assert index.data_entries == {}
+    assert index.gt_entries == {}
+
+
+def test_statistics_index_gt_without_format(data_dir_cropped, file_names):
+    _, file_names_gt = file_names
+    index = StatisticsIndex(root=data_dir_cropped)
+    with pytest.raises(ValueError):
+        index.update(file_names_gt=file_names_gt)
+
+
+def test_compute_image_statistics_indexed_no_files(data_dir_cropped):
+    with pytest.raises(ValueError):
+        compute_image_statistics_indexed(root=data_dir_cropped, file_names_data=np.asarray([]))
+
+
+def test_get_analytics_selection(data_dir_cropped):
+    analytics_data, analytics_gt = get_analytics(input_path=data_dir_cropped, data_folder_name='data',
+                                                 gt_folder_name='gt', train_folder_name='train',
+                                                 get_img_gt_path_list_func=CroppedDatasetRGB.get_gt_data_paths,
+                                                 workers=1, selection=1)
+    assert np.allclose(analytics_data['mean'], [0.7050454974582425, 0.6503181590413943, 0.5567698583877996])
+    assert len(analytics_gt['class_encodings']) == 8
+    # the analytics of a selection are not written, only the index
+    assert not (data_dir_cropped / 'analytics.data.data.train.json').exists()
+    assert not (data_dir_cropped / 'analytics.gt.gt.train.json').exists()
+    assert get_statistics_index_path(data_dir_cropped).exists()
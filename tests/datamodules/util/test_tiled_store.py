@@ -0,0 +1,114 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from src.datamodules.utils.lru_cache import LRUCache
+from src.datamodules.utils.tiled_store import TiledPageStoreWriter, TiledPageStoreReader, STORE_INDEX_FILE_NAME, \
+    STORE_TILES_FILE_NAME
+
+
+@pytest.fixture
+def pages():
+    rng = np.random.default_rng(seed=0)
+    return {name: (rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8),
+                   rng.integers(-1, 4, size=(h, w), dtype=np.int8),
+                   rng.integers(0, 2, size=(h, w)).astype(bool))
+            for name, h, w in [('page_b', 23, 31), ('page_a', 16, 8)]}
+
+
+@pytest.fixture
+def tiled_split(tmp_path, pages):
+    split_path = tmp_path / 'train'
+    writer = TiledPageStoreWriter(output_path=split_path, tile_size=8, with_mask=True)
+    for name, (img, gt, mask) in pages.items():
+        writer.add_page(page_name=name, img=img, gt=gt, mask=mask)
+    writer.close(class_encodings=[1, 2, 4, 8], crop_defaults={'crop_size': 8, 'overlap': 0.5})
+    return split_path
+
+
+def test_writer_files(tiled_split):
+    assert (tiled_split / STORE_INDEX_FILE_NAME).exists()
+    assert (tiled_split / STORE_TILES_FILE_NAME).exists()
+
+
+def test_writer_errors(tmp_path, pages):
+    img, gt, mask = pages['page_a']
+    writer = TiledPageStoreWriter(output_path=tmp_path, tile_size=8, with_mask=True)
+    with pytest.raises(ValueError):
+        writer.add_page(page_name='page_a', img=img, gt=gt)
+    with pytest.raises(ValueError):
+        writer.add_page(page_name='page_a', img=img[:-1], gt=gt, mask=mask)
+    writer.add_page(page_name='page_a', img=img, gt=gt, mask=mask)
+    with pytest.raises(ValueError):
+        writer.add_page(page_name='page_a', img=img, gt=gt, mask=mask)
+
+
+def test_writer_no_pages(tmp_path):
+    with pytest.raises(ValueError):
+        TiledPageStoreWriter(output_path=tmp_path).close(class_encodings=[])
+
+
+def test_reader(tiled_split):
+    reader = TiledPageStoreReader(path=tiled_split)
+    assert len(reader) == 2
+    assert reader.page_names == ['page_b', 'page_a']
+    assert reader.class_encodings == [1, 2, 4, 8]
+    assert reader.crop_defaults == {'crop_size': 8, 'overlap': 0.5}
+    assert reader.get_page_size(page_id=0) == (31, 23)
+
+
+@pytest.mark.parametrize('x, y, width, height', [(0, 0, 31, 23), (0, 0, 8, 8), (3, 5, 10, 12), (23, 15, 8, 8),
+                                                 (30, 22, 1, 1), (7, 7, 2, 2)])
+def test_read_window(tiled_split, pages, x, y, width, height):
+    reader = TiledPageStoreReader(path=tiled_split)
+    img, gt, mask = pages['page_b']
+    window = (slice(y, y + height), slice(x, x + width))
+    for kind, expected in [('data', img), ('gt', gt), ('mask', mask)]:
+        actual = reader.read_window(page_id=0, kind=kind, x=x, y=y, width=width, height=height)
+        assert actual.dtype == expected.dtype
+        assert np.array_equal(actual, expected[window])
+
+
+def test_read_window_outside(tiled_split):
+    reader = TiledPageStoreReader(path=tiled_split)
+    with pytest.raises(ValueError):
+        reader.read_window(page_id=1, kind='data', x=1, y=0, width=8, height=8)
+
+
+def test_read_window_no_mask(tmp_path, pages):
+    img, gt, _ = pages['page_a']
+    writer = TiledPageStoreWriter(output_path=tmp_path)
+    writer.add_page(page_name='page_a', img=img, gt=gt)
+    writer.close(class_encodings=[])
+    with pytest.raises(ValueError):
+        TiledPageStoreReader(path=tmp_path).read_window(page_id=0, kind='mask', x=0, y=0, width=2, height=2)
+
+
+def test_reader_pickle_without_file_descriptor(tiled_split, pages):
+    reader = TiledPageStoreReader(path=tiled_split)
+    reader.read_window(page_id=0, kind='data', x=0, y=0, width=2, height=2)
+    assert reader._file_descriptor is not None
+    reader_copy = pickle.loads(pickle.dumps(reader))
+    assert reader_copy._file_descriptor is None
+    assert np.array_equal(reader_copy.read_window(page_id=1, kind='gt', x=0, y=0, width=8, height=16),
+                          pages['page_a'][1])
+
+
+def test_get_page_ids(tiled_split):
+    reader = TiledPageStoreReader(path=tiled_split)
+    assert reader.get_page_ids() == [0, 1]
+    assert reader.get_page_ids(selection=1) == [1]
+    assert reader.get_page_ids(selection=['page_b']) == [0]
+    with pytest.raises(ValueError):
+        reader.get_page_ids(selection=['page_c'])
+
+
+def test_read_window_tile_cache(tiled_split, pages):
+    reader = TiledPageStoreReader(path=tiled_split, tile_cache=LRUCache(max_bytes=2 ** 20))
+    img = pages['page_b'][0]
+    for _ in range(2):
+        assert np.array_equal(reader.read_window(page_id=0, kind='data', x=3, y=5, width=10, height=12),
+                              img[5:17, 3:13])
+    # the window touches 2x3 tiles
+    assert reader.tile_cache.get_stats() == {'hits': 6, 'misses': 6, 'evictions': 0, 'hit_rate': 0.5}
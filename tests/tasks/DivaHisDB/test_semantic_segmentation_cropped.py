@@ -5,9 +5,14 @@ import pytest
 import pytorch_lightning as pl
 import torch.optim.optimizer
 from omegaconf import OmegaConf
+from PIL import Image
 from pytorch_lightning import seed_everything, Trainer
+from torchmetrics import MetricCollection
+from torchmetrics.classification import MulticlassJaccardIndex
 
 from src.datamodules.DivaHisDB.datamodule_cropped import DivaHisDBDataModuleCropped
+from src.datamodules.utils.patch_store import PatchStoreReader, PatchStoreWriter
+from src.datamodules.utils.samplers import HardExampleSampler
 from src.models.backbone_header_model import BackboneHeaderModel
 from src.models.backbones.unet import UNet
 from src.models.headers.unet import UNetFCNHead
@@ -130,3 +135,136 @@ def test_test_step(monkeypatch, datamodule_and_dir, task, capsys, tmp_path):
     assert (tmp_path / 'patches').exists()
     assert (tmp_path / 'patches' / 'e-codices_fmb-cb-0055_0098v_max').exists()
     assert len(list((tmp_path / 'patches' / 'e-codices_fmb-cb-0055_0098v_max').iterdir())) == 1
+
+
+def test_hard_example_mining(tmp_path, task, data_dir_cropped, monkeypatch):
+    monkeypatch.chdir(data_dir_cropped)
+    data_module = DivaHisDBDataModuleCropped(data_dir=str(data_dir_cropped), data_folder_name='data',
+                                             gt_folder_name='gt', batch_size=2, num_workers=2,
+                                             hard_example_mining={'uniform_fraction': 0.2})
+    trainer = pl.Trainer(max_epochs=1, limit_train_batches=3, limit_val_batches=0, precision=32,
+                         default_root_dir=tmp_path, accelerator='cpu', strategy='ddp')
+    reported = []
+    update = HardExampleSampler.update
+
+    def _update(self, indices, losses):
+        reported.extend(indices)
+        update(self, indices, losses)
+
+    monkeypatch.setattr(HardExampleSampler, 'update', _update)
+    trainer.fit(task, datamodule=data_module)
+
+    sampler = data_module.hard_example_sampler
+    assert sampler.uniform_fraction == 0.2
+    # the crops of the batches are reported with their dataset indices (the first epoch is drawn uniformly)
+    assert reported == list(HardExampleSampler(num_crops=len(data_module.train)))[:6]
+    drawn = set(reported)
+    checkpoint_path = tmp_path / 'hard_example_mining.ckpt'
+    trainer.save_checkpoint(checkpoint_path)
+    losses = data_module.state_dict()['hard_example_sampler']['losses']
+    assert {int(i) for i in np.flatnonzero(~np.isnan(losses))} == drawn
+    assert np.all(losses[list(drawn)] > 0)
+
+    # the loss table is restored from the checkpoint
+    checkpoint = torch.load(checkpoint_path)
+    data_module_resumed = DivaHisDBDataModuleCropped(data_dir=str(data_dir_cropped), data_folder_name='data',
+                                                     gt_folder_name='gt', batch_size=2, num_workers=2,
+                                                     hard_example_mining={'uniform_fraction': 0.2})
+    data_module_resumed.load_state_dict(checkpoint[DivaHisDBDataModuleCropped.__qualname__])
+    monkeypatch.setattr(data_module_resumed, 'trainer', trainer)
+    data_module_resumed.setup('fit')
+    data_module_resumed.train_dataloader()
+    assert np.array_equal(data_module_resumed.hard_example_sampler.losses, losses, equal_nan=True)
+
+
+class _RecordBatchShapes(pl.Callback):
+    def __init__(self):
+        self.shapes = []
+
+    def on_train_batch_start(self, trainer, pl_module, batch, batch_idx):
+        self.shapes.append((trainer.current_epoch, tuple(batch[0].shape)))
+
+
+def test_crop_size_schedule(tmp_path, task, data_dir_cropped, monkeypatch):
+    monkeypatch.chdir(data_dir_cropped)
+    data_module = DivaHisDBDataModuleCropped(data_dir=str(data_dir_cropped), data_folder_name='data',
+                                             gt_folder_name='gt', batch_size=2, num_workers=2,
+                                             crop_size_schedule=[{'epochs': 1, 'crop_size': 128}])
+    assert data_module.get_input_shapes() == [(8, 3, 128, 128), (2, 3, 256, 256)]
+    record = _RecordBatchShapes()
+    trainer = pl.Trainer(max_epochs=2, limit_train_batches=1, limit_val_batches=1, precision=32,
+                         default_root_dir=tmp_path, accelerator='cpu', strategy='ddp', callbacks=[record],
+                         num_sanity_val_steps=0)
+    trainer.fit(task, datamodule=data_module)
+
+    assert trainer.reload_dataloaders_every_n_epochs == 1
+    assert record.shapes == [(0, (8, 3, 128, 128)), (1, (2, 3, 256, 256))]
+    # the validation crops keep the full size
+    assert data_module.dims == (3, 256, 256)
+    assert data_module.val.twin_transform.crop_size == 256
+
+
+def test_stitch_test_pages(tmp_path, model_backbone, model_header, datamodule_and_dir, monkeypatch):
+    data_module, data_dir_cropped = datamodule_and_dir
+    monkeypatch.chdir(data_dir_cropped)
+    task = SemanticSegmentationCroppedHisDB(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
+                                            optimizer=torch.optim.Adam(params=model_backbone.parameters()),
+                                            loss_fn=torch.nn.CrossEntropyLoss(),
+                                            metric_test=MetricCollection(
+                                                {'jaccard_index': MulticlassJaccardIndex(num_classes=4)}),
+                                            test_output_path=tmp_path,
+                                            stitch_test_pages=True)
+    trainer = pl.Trainer(precision=32, default_root_dir=tmp_path, accelerator='cpu', strategy='ddp')
+
+    results = trainer.test(task, datamodule=data_module)
+
+    page_name = 'e-codices_fmb-cb-0055_0098v_max'
+    assert 'test/page_jaccard_index_epoch' in results[0] or 'test/page_jaccard_index' in results[0]
+    assert not (tmp_path / 'patches').exists()
+    assert Image.open(tmp_path / 'result' / 'pred' / f'{page_name}.png').size == (649, 487)
+    page_metrics = (tmp_path / 'result' / 'page_metrics.txt').read_text().splitlines()
+    assert page_metrics[0] == 'page\tpage_jaccard_index'
+    assert page_metrics[1].startswith(f'{page_name}\t')
+    assert task.page_stitcher.num_pages_in_flight == 0
+
+
+def test_patch_store(tmp_path, model_backbone, model_header, datamodule_and_dir, monkeypatch):
+    data_module, data_dir_cropped = datamodule_and_dir
+    monkeypatch.chdir(data_dir_cropped)
+    task = SemanticSegmentationCroppedHisDB(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
+                                            optimizer=torch.optim.Adam(params=model_backbone.parameters()),
+                                            loss_fn=torch.nn.CrossEntropyLoss(),
+                                            test_output_path=tmp_path,
+                                            patch_store='argmax')
+    trainer = pl.Trainer(precision=32, default_root_dir=tmp_path, accelerator='cpu', strategy='ddp')
+
+    trainer.test(task, datamodule=data_module)
+
+    reader = PatchStoreReader(tmp_path / 'patches')
+    assert reader.page_names == ['e-codices_fmb-cb-0055_0098v_max']
+    crops = list(reader.read_page('e-codices_fmb-cb-0055_0098v_max'))
+    assert len(crops) == len(data_module.test)
+    assert crops[0][3].shape == (256, 256)
+    assert not list((tmp_path / 'patches').glob('*/*.npy'))
+
+
+def test_patch_store_closed_on_writer_error(tmp_path, task, monkeypatch):
+    task.patch_store_writer = PatchStoreWriter(path=tmp_path / 'patches', rank=0, storage='argmax')
+    task.patch_store_writer.add(page_name='page', crop_name='page_x0000_y0000', patch=np.zeros((3, 4, 4)))
+
+    def fail():
+        raise RuntimeError('write failed')
+
+    monkeypatch.setattr(task.output_writer, 'close', fail)
+    with pytest.raises(RuntimeError):
+        task.on_test_end()
+
+    reader = PatchStoreReader(tmp_path / 'patches')
+    assert reader.page_names == ['page']
+
+
+def test_patch_store_unknown(model_backbone, model_header):
+    with pytest.raises(ValueError):
+        SemanticSegmentationCroppedHisDB(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
+                                         optimizer=torch.optim.Adam(params=model_backbone.parameters()),
+                                         patch_store='int8')
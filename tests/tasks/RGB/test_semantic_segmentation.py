@@ -88,6 +88,18 @@ def test_to_metrics_format():
     assert torch.equal(torch.as_tensor([2, 2]), y)
 
 
+
+def test__get_page_predictions():
+    prediction = torch.rand(2, 3, 5, 6)
+    mask = torch.zeros(2, 5, 6, dtype=torch.bool)
+    mask[0, :4, :6] = True
+    mask[1, :5, :3] = True
+    pages = SemanticSegmentationRGB._get_page_predictions(prediction, [mask])
+    assert [page.shape for page in pages] == [(3, 4, 6), (3, 5, 3)]
+    assert np.array_equal(pages[1], prediction[1, :, :, :3].numpy())
+    pages = SemanticSegmentationRGB._get_page_predictions(prediction, [])
+    assert [page.shape for page in pages] == [(3, 5, 6), (3, 5, 6)]
+
 def test_training_step(monkeypatch, datamodule_and_dir, task, capsys):
     data_module, data_dir = datamodule_and_dir
     trainer = Trainer(accelerator='cpu', strategy='ddp')
@@ -162,3 +174,36 @@ def test_predict_step(monkeypatch, datamodule_and_dir, task, capsys, tmp_path):
     assert (tmp_path / 'pred_raw').exists()
     assert (tmp_path / 'pred_raw' / 'D1-LC-Car-folio-1001.npy').exists()
     assert len(list((tmp_path / 'pred_raw').iterdir())) == 1
+
+
+def test_test_step_output_writer(monkeypatch, datamodule_and_dir, model_backbone, model_header, tmp_path):
+    data_module, data_dir = datamodule_and_dir
+    task = SemanticSegmentationRGB(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
+                                   optimizer=torch.optim.Adam(params=model_backbone.parameters()),
+                                   loss_fn=torch.nn.CrossEntropyLoss(),
+                                   test_output_path=tmp_path,
+                                   output_codec='png', output_compression_level=1,
+                                   num_output_writers=2, max_pending_outputs=1)
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module, 'trainer', trainer)
+    task.trainer = trainer
+    monkeypatch.setattr(trainer, 'datamodule', data_module)
+    monkeypatch.setattr(task, 'log', fake_log)
+    data_module.setup('test')
+
+    img, gt, idx = data_module.test[0]
+    task.test_step(batch=(img[None, :], gt[None, :], torch.as_tensor([idx])), batch_idx=0)
+    task.on_test_end()
+    assert task.output_writer.num_pending == 0
+    assert (tmp_path / 'pred' / 'D1-LC-Car-folio-1000.png').exists()
+    assert (tmp_path / 'pred_raw' / 'D1-LC-Car-folio-1000.npy').exists()
+
+
+def test_output_codec_errors(model_backbone, model_header):
+    model = BackboneHeaderModel(backbone=model_backbone, header=model_header)
+    with pytest.raises(ValueError):
+        SemanticSegmentationRGB(model=model, optimizer=torch.optim.Adam(params=model.parameters()),
+                                output_codec='jpg')
+    with pytest.raises(ValueError):
+        SemanticSegmentationRGB(model=model, optimizer=torch.optim.Adam(params=model.parameters()),
+                                output_compression_level=1)
@@ -10,10 +10,13 @@ from pytorch_lightning.trainer.states import TrainerState, RunningStage
 from torch.nn import Identity, CrossEntropyLoss
 from torchmetrics import MetricCollection
 from torchmetrics.classification import MulticlassPrecision
+from torchvision import transforms
 
 from src.models.backbone_header_model import BackboneHeaderModel
 from src.models.backbones.unet import UNet
 from src.models.headers.unet import UNetFCNHead
+from src.datamodules.utils.batch_twin_transforms import BatchRandomFlip
+from src.datamodules.utils.single_transforms import ToUint8Tensor
 from src.tasks.base_task import AbstractTask
 from src.tasks.utils.outputs import OutputKeys
 from tests.test_data.dummy_data_hisdb.dummy_data import data_dir_cropped
@@ -141,6 +144,53 @@ def test_setup_conf_mats(monkeypatch, data_module_cropped_hisdb):
     assert isinstance(task.metric_conf_mat_test, torchmetrics.classification.MulticlassConfusionMatrix)
 
 
+def test_on_after_batch_transfer_uint8(monkeypatch, data_module_cropped_hisdb):
+    task = AbstractTask()
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    task.trainer = trainer
+    monkeypatch.setattr(trainer, 'datamodule', data_module_cropped_hisdb)
+    monkeypatch.setattr(data_module_cropped_hisdb, 'uint8_batches', True)
+
+    img = np.random.default_rng(0).integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+    expected = transforms.Normalize(mean=data_module_cropped_hisdb.mean,
+                                    std=data_module_cropped_hisdb.std)(transforms.ToTensor()(img))
+    gt = torch.zeros(1, 8, 8, dtype=torch.long)
+    batch = task.on_after_batch_transfer([ToUint8Tensor()(img)[None, :], gt], dataloader_idx=0)
+    assert isinstance(batch, list)
+    assert batch[0].dtype == torch.float32
+    assert torch.allclose(batch[0][0], expected, atol=1e-5)
+    assert batch[1] is gt
+
+
+def test_on_after_batch_transfer_float(monkeypatch, data_module_cropped_hisdb):
+    task = AbstractTask()
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    task.trainer = trainer
+    monkeypatch.setattr(trainer, 'datamodule', data_module_cropped_hisdb)
+    batch = (torch.rand(1, 3, 4, 4), torch.zeros(1, 4, 4))
+    assert task.on_after_batch_transfer(batch, dataloader_idx=0) is batch
+
+
+def test_on_after_batch_transfer_augmentation(monkeypatch, data_module_cropped_hisdb):
+    task = AbstractTask(batch_augmentation=BatchRandomFlip(horizontal=1.0))
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    task.trainer = trainer
+    monkeypatch.setattr(trainer, 'datamodule', data_module_cropped_hisdb)
+    img = torch.rand(2, 3, 4, 4)
+    gt = torch.randint(low=0, high=4, size=(2, 4, 4))
+    expected_img, expected_gt = img.flip(-1), gt.flip(-1)
+
+    trainer.state.stage = RunningStage.VALIDATING
+    batch = (img, gt)
+    assert task.on_after_batch_transfer(batch, dataloader_idx=0) is batch
+
+    trainer.state.stage = RunningStage.TRAINING
+    batch = task.on_after_batch_transfer((img, gt), dataloader_idx=0)
+    assert isinstance(batch, tuple)
+    assert torch.equal(batch[0], expected_img)
+    assert torch.equal(batch[1], expected_gt)
+
+
 def test_step(monkeypatch, data_module_cropped_hisdb, model_backbone, model_header):
     # setup
     task = AbstractTask(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
@@ -158,6 +208,55 @@ def test_step(monkeypatch, data_module_cropped_hisdb, model_backbone, model_head
     assert output[OutputKeys.PREDICTION].shape == torch.Size([1, 4, 256, 256])
 
 
+
+def test_step_mask(monkeypatch, data_module_cropped_hisdb, model_backbone, model_header):
+    # setup
+    task = AbstractTask(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
+                        loss_fn=CrossEntropyLoss())
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_cropped_hisdb, 'trainer', trainer)
+    task.trainer = trainer
+    monkeypatch.setattr(trainer, 'datamodule', data_module_cropped_hisdb)
+    data_module_cropped_hisdb.setup('fit')
+
+    img, gt, _ = data_module_cropped_hisdb.train[0]
+    mask = torch.zeros(1, 256, 256, dtype=torch.bool)
+    mask[:, :128, :64] = True
+    output = task.step(batch=(img[None, :], gt[None, :]), mask=mask)
+    y_hat = output[OutputKeys.PREDICTION]
+    expected_loss = CrossEntropyLoss()(y_hat[:, :, :128, :64], gt[None, :128, :64])
+    assert torch.isclose(output[OutputKeys.LOSS], expected_loss)
+    assert torch.equal(output[OutputKeys.MASK], mask)
+    assert torch.isclose(output[OutputKeys.LOG]['padding_fraction'], torch.tensor(0.875))
+    assert y_hat.shape == torch.Size([1, 4, 256, 256])
+
+
+def test_step_hard_example_losses(monkeypatch, data_module_cropped_hisdb, model_backbone, model_header):
+    task = AbstractTask(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
+                        loss_fn=CrossEntropyLoss())
+    trainer = Trainer(accelerator='cpu', strategy='ddp')
+    monkeypatch.setattr(data_module_cropped_hisdb, 'trainer', trainer)
+    task.trainer = trainer
+    monkeypatch.setattr(trainer, 'datamodule', data_module_cropped_hisdb)
+    data_module_cropped_hisdb.setup('fit')
+    sampler = data_module_cropped_hisdb.get_hard_example_sampler(num_crops=len(data_module_cropped_hisdb.train),
+                                                                 hard_example_mining={})
+
+    samples = [data_module_cropped_hisdb.train[i] for i in [4, 1]]
+    img = torch.stack([img for img, _, _ in samples])
+    gt = torch.stack([gt for _, gt, _ in samples])
+    output = task.step(batch=(img, gt), input_idx=torch.tensor([4, 1]))
+    sampler.synchronize()
+
+    # the losses of the samples are the same as with a separate loss computation per sample
+    y_hat = output[OutputKeys.PREDICTION].detach()
+    expected = [CrossEntropyLoss()(y_hat[i:i + 1], gt[i:i + 1]).item() for i in range(2)]
+    assert np.allclose(sampler.losses[[4, 1]], expected, rtol=1e-5)
+    assert np.isnan(sampler.losses[0])
+    # the loss function of the task is unchanged
+    assert task.loss_fn['crossentropyloss'].reduction == 'mean'
+
+
 def test__create_conf_mat_test_error(monkeypatch, data_module_cropped_hisdb, model_backbone, model_header, tmp_path):
     # setup
     task = AbstractTask(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
@@ -322,6 +421,18 @@ def test_test_step(monkeypatch, model_backbone, model_header, data_module_croppe
     assert output[OutputKeys.PREDICTION].shape == torch.Size([1, 4, 256, 256])
 
 
+def test__init_test_outputs():
+    task = AbstractTask()
+    task._init_test_outputs(stitch_test_pages=True, patch_store='float16', num_output_writers=0,
+                            max_pending_outputs=8)
+    assert task.stitch_test_pages
+    assert task.patch_store == 'float16'
+    assert task.patch_store_writer is None
+    with pytest.raises(ValueError):
+        task._init_test_outputs(stitch_test_pages=False, patch_store='int8', num_output_writers=0,
+                                max_pending_outputs=8)
+
+
 def test_predict_step(monkeypatch, model_backbone, model_header, data_module_cropped_hisdb, capsys):
     task = AbstractTask(model=BackboneHeaderModel(backbone=model_backbone, header=model_header),
                         loss_fn=CrossEntropyLoss())
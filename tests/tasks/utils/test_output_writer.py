@@ -0,0 +1,106 @@
+import copy
+import threading
+
+import pytest
+
+from src.tasks.utils.output_writer import AsyncOutputWriter
+
+
+def _fail():
+    raise OSError('disk full')
+
+
+def test_submit_without_workers():
+    writer = AsyncOutputWriter(num_workers=0)
+    written = []
+    writer.submit(written.append, 1)
+    assert written == [1]
+    with pytest.raises(OSError):
+        writer.submit(_fail)
+
+
+def test_submit_flush():
+    writer = AsyncOutputWriter(num_workers=2, max_pending=3)
+    written = []
+    lock = threading.Lock()
+
+    def write(value):
+        with lock:
+            written.append(value)
+
+    for i in range(20):
+        writer.submit(write, i)
+    writer.flush()
+    assert sorted(written) == list(range(20))
+    assert writer.num_pending == 0
+    writer.close()
+
+
+def test_backpressure():
+    writer = AsyncOutputWriter(num_workers=1, max_pending=2)
+    release = threading.Event()
+    writer.submit(release.wait)
+    writer.submit(release.wait)
+    assert writer.num_pending == 2
+
+    # the third write blocks until one of the pending writes is done
+    submitted = threading.Event()
+    thread = threading.Thread(target=lambda: (writer.submit(lambda: None), submitted.set()))
+    thread.start()
+    assert not submitted.wait(timeout=0.2)
+    release.set()
+    assert submitted.wait(timeout=5)
+    thread.join()
+    writer.close()
+    assert writer.num_pending == 0
+
+
+def test_error_propagation():
+    writer = AsyncOutputWriter(num_workers=2)
+    writer.submit(_fail)
+    with pytest.raises(RuntimeError) as error:
+        writer.flush()
+    assert isinstance(error.value.__cause__, OSError)
+    # the error is raised once
+    writer.flush()
+
+    writer.submit(_fail)
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def test_error_raised_by_submit():
+    writer = AsyncOutputWriter(num_workers=1, max_pending=1)
+    writer.submit(_fail)
+    # the next submit waits for a free slot, so the failed write is done
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda: None)
+    writer.close()
+
+
+def test_close_and_reuse():
+    writer = AsyncOutputWriter(num_workers=1)
+    written = []
+    writer.submit(written.append, 1)
+    writer.close()
+    writer.submit(written.append, 2)
+    writer.close()
+    assert written == [1, 2]
+
+
+def test_deepcopy():
+    writer = AsyncOutputWriter(num_workers=1)
+    writer.submit(lambda: None)
+    writer_copy = copy.deepcopy(writer)
+    written = []
+    writer_copy.submit(written.append, 1)
+    writer_copy.close()
+    writer.close()
+    assert written == [1]
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        AsyncOutputWriter(num_workers=-1)
+    with pytest.raises(ValueError):
+        AsyncOutputWriter(max_pending=0)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src.datamodules.utils.output_tools import merge_patches
+from src.tasks.utils.page_stitching import PageStitcher
+
+# two pages: page 0 with four overlapping crops of 4 x 4 on a 6 x 5 (h x w) page, page 1 with a single crop
+PAGE_IDS = [0, 0, 0, 0, 1]
+COORDINATES = [(0, 0), (1, 0), (0, 2), (1, 2), (0, 0)]
+
+
+@pytest.fixture
+def crops():
+    rng = np.random.default_rng(0)
+    return rng.random((len(PAGE_IDS), 3, 4, 4)).astype(np.float32)
+
+
+def test_add_finishes_pages(crops):
+    stitcher = PageStitcher(page_ids=PAGE_IDS, coordinates=COORDINATES)
+    for index in range(3):
+        assert stitcher.add(index, crops[index], gt=np.full((4, 4), index)) is None
+    assert stitcher.num_pages_in_flight == 1
+
+    page_id, canvases = stitcher.add(3, crops[3], gt=np.full((4, 4), 3))
+    assert page_id == 0
+    assert stitcher.num_pages_in_flight == 0
+    assert canvases['prediction'].shape == (3, 6, 5)
+    assert canvases['gt'].shape == (6, 5)
+    assert canvases['gt'][5, 4] == 3
+    assert canvases['gt'][0, 0] == 0
+
+    expected = np.full((3, 6, 5), np.nan)
+    for index in range(4):
+        expected = merge_patches(crops[index], COORDINATES[index], expected)
+    assert np.allclose(canvases['prediction'], expected)
+
+    page_id, canvases = stitcher.add(4, crops[4], gt=np.zeros((4, 4)))
+    assert page_id == 1
+    assert canvases['prediction'].shape == (3, 4, 4)
+
+
+def test_add_ignores_duplicates(crops):
+    stitcher = PageStitcher(page_ids=PAGE_IDS, coordinates=COORDINATES, indices=[4, 4])
+    assert stitcher.add(4, crops[4]) is not None
+    assert stitcher.add(4, crops[4]) is None
+
+
+def test_is_stitched(crops):
+    # the crops 2 and 3 of page 0 are processed by another process
+    stitcher = PageStitcher(page_ids=PAGE_IDS, coordinates=COORDINATES, indices=[0, 1, 4])
+    assert not stitcher.is_stitched(0)
+    assert stitcher.is_stitched(4)
+    with pytest.raises(ValueError):
+        stitcher.add(0, crops[0])
+
+
+def test_is_stitched_unknown_coordinates():
+    stitcher = PageStitcher(page_ids=[0, 0, 1], coordinates=[(0, 0), (-1, -1), (0, 0)])
+    assert not stitcher.is_stitched(0)
+    assert stitcher.is_stitched(2)
@@ -1,7 +1,22 @@
 import os
+import re
 from distutils import dir_util
+from pathlib import Path
 
+import numpy as np
 import pytest
+import torch
+from torchvision.datasets.folder import pil_loader
+from torchvision.transforms import ToTensor
+
+from src.datamodules.DivaHisDB.utils.image_analytics import get_analytics as get_analytics_hisdb
+from src.datamodules.DivaHisDB.utils.single_transform import IntegerEncoding as IntegerEncodingHisDB
+from src.datamodules.RGB.datasets.cropped_dataset import CroppedDatasetRGB
+from src.datamodules.RGB.datasets.full_page_dataset import DatasetRGB
+from src.datamodules.RGB.utils.image_analytics import get_analytics as get_analytics_rgb
+from src.datamodules.RGB.utils.single_transform import IntegerEncoding as IntegerEncodingRGB
+from src.datamodules.utils.packed_shards import PackedShardWriter
+from src.datamodules.utils.tiled_store import TiledPageStoreWriter
 
 
 @pytest.fixture
@@ -35,3 +50,100 @@ def data_dir_cropped(tmp_path):
         dir_util.copy_tree(test_dir, str(tmp_path))
 
     return tmp_path
+
+
+def _write_packed_splits(data_dir: Path, analytics_gt: dict, target_transform, with_mask: bool):
+    """
+    Packs the cropped dummy dataset into shard files next to the image folders of each split.
+    """
+    for split in ['train', 'val', 'test']:
+        paths = CroppedDatasetRGB.get_gt_data_paths(data_dir / split, data_folder_name='data', gt_folder_name='gt')
+        width, height = pil_loader(paths[0][0]).size
+        writer = PackedShardWriter(output_path=data_dir / split, num_samples=len(paths), crop_size=(height, width),
+                                   shard_size=5, with_mask=with_mask)
+        for path_data, path_gt, page_name, crop_name in paths:
+            gt_img = pil_loader(path_gt)
+            gt = target_transform(ToTensor()(gt_img)).numpy().astype(np.int8)
+            x, y = re.match(r'.+_x(\d+)_y(\d+)', crop_name).groups()
+            writer.add(page_name=page_name, crop_name=crop_name, coordinates=(int(x), int(y)),
+                       img=np.asarray(pil_loader(path_data)), gt=gt,
+                       mask=np.asarray(gt_img)[:, :, 0] != 0 if with_mask else None)
+        writer.close(class_encodings=analytics_gt['class_encodings'])
+
+
+@pytest.fixture
+def data_dir_packed_rgb(data_dir_cropped):
+    """
+    Cropped dummy dataset with additional shard files (RGB encoding) and analytics files.
+    :param data_dir_cropped:
+    :return:
+    """
+    _, analytics_gt = get_analytics_rgb(input_path=data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                        train_folder_name='train',
+                                        get_img_gt_path_list_func=CroppedDatasetRGB.get_gt_data_paths)
+    class_encodings = torch.tensor(analytics_gt['class_encodings']) / 255
+    _write_packed_splits(data_dir=data_dir_cropped, analytics_gt=analytics_gt,
+                         target_transform=IntegerEncodingRGB(class_encodings=class_encodings), with_mask=False)
+    return data_dir_cropped
+
+
+@pytest.fixture
+def data_dir_packed_hisdb(data_dir_cropped):
+    """
+    Cropped dummy dataset with additional shard files (DivaHisDB encoding and boundary masks) and analytics files.
+    :param data_dir_cropped:
+    :return:
+    """
+    _, analytics_gt = get_analytics_hisdb(input_path=data_dir_cropped, data_folder_name='data', gt_folder_name='gt',
+                                          get_gt_data_paths_func=CroppedDatasetRGB.get_gt_data_paths)
+    _write_packed_splits(data_dir=data_dir_cropped, analytics_gt=analytics_gt,
+                         target_transform=IntegerEncodingHisDB(class_encodings=analytics_gt['class_encodings']),
+                         with_mask=True)
+    return data_dir_cropped
+
+
+def _write_tiled_splits(data_dir: Path, analytics_gt: dict, target_transform, with_mask: bool):
+    """
+    Writes the full pages of the dummy dataset into a tiled store next to the image folders of each split.
+    """
+    for split in ['train', 'val', 'test']:
+        paths = DatasetRGB.get_img_gt_path_list(data_dir / split, data_folder_name='data', gt_folder_name='gt')
+        writer = TiledPageStoreWriter(output_path=data_dir / split, tile_size=100, with_mask=with_mask)
+        for path_data, path_gt, page_name in paths:
+            gt_img = pil_loader(path_gt)
+            gt = target_transform(ToTensor()(gt_img)).numpy().astype(np.int8)
+            writer.add_page(page_name=page_name, img=np.asarray(pil_loader(path_data)), gt=gt,
+                            mask=np.asarray(gt_img)[:, :, 0] != 0 if with_mask else None)
+        writer.close(class_encodings=analytics_gt['class_encodings'],
+                     crop_defaults={'crop_size': 256, 'overlap': 0.5, 'leading_zeros_length': 4})
+
+
+@pytest.fixture
+def data_dir_tiled_rgb(data_dir):
+    """
+    Full page dummy dataset with an additional tiled store (RGB encoding) and analytics files.
+    :param data_dir:
+    :return:
+    """
+    _, analytics_gt = get_analytics_rgb(input_path=data_dir, data_folder_name='data', gt_folder_name='gt',
+                                        train_folder_name='train',
+                                        get_img_gt_path_list_func=DatasetRGB.get_img_gt_path_list)
+    class_encodings = torch.tensor(analytics_gt['class_encodings']) / 255
+    _write_tiled_splits(data_dir=data_dir, analytics_gt=analytics_gt,
+                        target_transform=IntegerEncodingRGB(class_encodings=class_encodings), with_mask=False)
+    return data_dir
+
+
+@pytest.fixture
+def data_dir_tiled_hisdb(data_dir):
+    """
+    Full page dummy dataset with an additional tiled store (DivaHisDB encoding and boundary masks) and analytics files.
+    :param data_dir:
+    :return:
+    """
+    _, analytics_gt = get_analytics_hisdb(input_path=data_dir, data_folder_name='data', gt_folder_name='gt',
+                                          get_gt_data_paths_func=DatasetRGB.get_img_gt_path_list)
+    _write_tiled_splits(data_dir=data_dir, analytics_gt=analytics_gt,
+                        target_transform=IntegerEncodingHisDB(class_encodings=analytics_gt['class_encodings']),
+                        with_mask=True)
+    return data_dir
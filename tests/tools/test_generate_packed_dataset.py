@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+from src.datamodules.DivaHisDB.datasets.tiled_cropped_dataset import TiledCroppedHisDBDataset
+from tests.test_data.dummy_data_hisdb.dummy_data import data_dir
+from tools.generate_packed_dataset import PackedDatasetGenerator
+
+TOOL_PATH = Path(__file__).parents[2] / 'tools' / 'generate_packed_dataset.py'
+
+
+def _run_tool(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, str(TOOL_PATH), *args], cwd=TOOL_PATH.parents[1],
+                          env={**os.environ, 'PYTHONPATH': str(TOOL_PATH.parents[1])}, capture_output=True, text=True)
+
+
+def test_tiled_output_format(data_dir, tmp_path):
+    output_path = tmp_path / 'tiled'
+    result = _run_tool('-i', str(data_dir), '-o', str(output_path), '-t', 'hisdb', '-tr', '64', '-v', '64',
+                       '-te', '64', '-f', 'tiled')
+    assert result.returncode == 0, result.stderr
+
+    assert (output_path / 'info_packed_dataset.txt').exists()
+    assert len(list(output_path.glob('analytics.*.json'))) == 2
+    for split in ['train', 'val', 'test']:
+        dataset = TiledCroppedHisDBDataset(path=output_path / split, is_test=True)
+        img, gt, mask, index = dataset[0]
+        assert img.shape == torch.Size([3, 64, 64])
+        assert gt.shape == mask.shape == torch.Size([64, 64])
+        assert index == 0
+
+
+def test_bit_packed_tiled_error(data_dir, tmp_path):
+    with pytest.raises(ValueError):
+        PackedDatasetGenerator(input_path=data_dir, output_path=tmp_path / 'tiled', dataset_type='hisdb',
+                               crop_size_train=64, crop_size_val=64, crop_size_test=64, output_format='tiled',
+                               bit_packed=True)
+
+    result = _run_tool('-i', str(data_dir), '-o', str(tmp_path / 'tiled'), '-t', 'hisdb', '-tr', '64', '-v', '64',
+                       '-te', '64', '-f', 'tiled', '--bit_packed')
+    assert result.returncode == 2
+    assert '--bit_packed is just supported for the output format "shards"' in result.stderr
+    assert not (tmp_path / 'tiled').exists()
@@ -0,0 +1,103 @@
+"""
+Measures the decode throughput of the image decode backends (see `src/datamodules/utils/decoders.py`) on the pages
+of a dataset, so the fastest backend for a given page size and file format can be chosen with the `decode_backend`
+parameter of the datamodules.
+
+Every backend decodes the same files (e.g. all the pages of a data or gt folder) `repetitions` times. The default
+loading without a backend (`pil_loader` / `pil_loader_gif` and the conversion into an array, which `ToTensor` does
+for every sample) is measured as reference. The report lists the pages and megapixels per second for every backend.
+"""
+
+import argparse
+import time
+from glob import glob
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from src.datamodules.utils.decoders import DECODE_BACKENDS, get_decoder, load_image
+
+MODES = ('RGB', 'P')
+
+
+def _measure(decode_func: Callable[[Path], object], file_paths: List[Path], repetitions: int) -> float:
+    # decode once before the measurement to warm up the file system cache
+    decode_func(file_paths[0])
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for file_path in file_paths:
+            decode_func(file_path)
+    return time.perf_counter() - start
+
+
+def benchmark_decoders(file_paths: List[Path], mode: str = 'RGB', repetitions: int = 3,
+                       backends: List[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Decodes the files with every backend and measures the throughput.
+
+    :param file_paths: files to decode
+    :type file_paths: List[Path]
+    :param mode: `RGB` or `P` (palette indices, e.g. for the gif ground truth of the indexed formats)
+    :type mode: str
+    :param repetitions: how many times every file is decoded by every backend
+    :type repetitions: int
+    :param backends: names of the backends to measure, all if None
+    :type backends: List[str]
+    :return: pages per second and megapixels per second of the reference loader and of every backend
+    :rtype: Dict[str, Dict[str, float]]
+    """
+    if len(file_paths) == 0:
+        raise ValueError('No files to decode')
+    if backends is None:
+        backends = list(DECODE_BACKENDS.keys())
+
+    num_pixels = sum(np.prod(load_image(file_path, decoder=None, mode=mode).size) for file_path in file_paths)
+
+    decode_funcs = {'pil_loader': lambda file_path: np.asarray(load_image(file_path, decoder=None, mode=mode))}
+    for backend in backends:
+        decoder = get_decoder(decode_backend=backend)
+        decode_funcs[backend] = lambda file_path, decoder=decoder: decoder.decode(file_path, mode=mode)
+
+    results = {}
+    for name, decode_func in decode_funcs.items():
+        seconds = _measure(decode_func=decode_func, file_paths=file_paths, repetitions=repetitions)
+        results[name] = {'pages_per_second': len(file_paths) * repetitions / seconds,
+                         'megapixels_per_second': num_pixels * repetitions / seconds / 1e6}
+    return results
+
+
+def main(input_paths: List[str], mode: str, repetitions: int, backends: List[str]):
+    file_paths = sorted({Path(p) for input_path in input_paths for p in glob(input_path) if Path(p).is_file()})
+    results = benchmark_decoders(file_paths=file_paths, mode=mode, repetitions=repetitions, backends=backends)
+
+    print(f'Decoded {len(file_paths)} files {repetitions} times (mode {mode})')
+    print(f'{"backend":<14}{"pages/s":>12}{"MPix/s":>12}')
+    for name, result in results.items():
+        print(f'{name:<14}{result["pages_per_second"]:>12.1f}{result["megapixels_per_second"]:>12.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_paths',
+                        help='Glob patterns of the files to decode (e.g. "dataset/train/data/*.jpg")',
+                        type=str,
+                        nargs='+',
+                        required=True)
+    parser.add_argument('-m', '--mode',
+                        help='RGB: decode the colors, P: decode the palette indices',
+                        type=str,
+                        choices=MODES,
+                        default='RGB')
+    parser.add_argument('-r', '--repetitions',
+                        help='How many times every file is decoded',
+                        type=int,
+                        default=3)
+    parser.add_argument('-b', '--backends',
+                        help='Backends to measure (default: all)',
+                        type=str,
+                        nargs='+',
+                        choices=list(DECODE_BACKENDS.keys()),
+                        default=None)
+    args = parser.parse_args()
+    main(**args.__dict__)
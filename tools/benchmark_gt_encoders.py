@@ -0,0 +1,206 @@
+"""
+Measures the ground truth encoders (`gt_to_int_encoding` and `gt_to_one_hot` of the RGB and the DivaHisDB format)
+on crops of ground truth pages, so the speedup of the packed color lookup over the previous encoders can be checked
+for different crop sizes.
+
+The previous implementations (a float equality compare per class and channel for RGB, a Python loop over every
+pixel for the DivaHisDB one-hot encoding) are kept in this file as reference. Every crop is encoded by the reference
+and by the lookup encoders (from the float tensor of `ToTensor` and from the uint8 tensor of `ToUint8Tensor`) and
+the results are checked for equality. The class encodings are computed from the given pages.
+"""
+
+import argparse
+import time
+from glob import glob
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+import torch
+from torch.nn.functional import one_hot
+from torchvision.datasets.folder import pil_loader
+from torchvision.transforms import ToTensor
+
+from src.datamodules.DivaHisDB.utils import functional as functional_hisdb
+from src.datamodules.RGB.utils import functional as functional_rgb
+from src.datamodules.utils.single_transforms import ToUint8Tensor
+
+DATASET_TYPES = ('rgb', 'hisdb')
+
+
+def reference_int_encoding_rgb(matrix: torch.Tensor, class_encodings: torch.Tensor) -> torch.Tensor:
+    integer_encoded = torch.full(size=matrix[0].shape, fill_value=-1, dtype=torch.long)
+    for index, encoding in enumerate(class_encodings):
+        mask = torch.logical_and(torch.logical_and(
+            torch.where(matrix[0] == encoding[0], True, False),
+            torch.where(matrix[1] == encoding[1], True, False)),
+            torch.where(matrix[2] == encoding[2], True, False))
+        integer_encoded[mask] = index
+    return integer_encoded
+
+
+def reference_one_hot_rgb(matrix: torch.Tensor, class_encodings: torch.Tensor) -> torch.Tensor:
+    integer_encoded = reference_int_encoding_rgb(matrix=matrix, class_encodings=class_encodings)
+    return one_hot(input=integer_encoded, num_classes=class_encodings.shape[0]).permute(2, 0, 1)
+
+
+def reference_int_encoding_hisdb(matrix: torch.Tensor, class_encodings: List[int]) -> torch.Tensor:
+    matrix = (matrix * 255)
+    img_blue = matrix[2, :, :]
+    border_mask = torch.where(matrix[0, :, :] != 0, True, False)
+    img_blue[border_mask] = 1
+    integer_encoded = torch.full(size=img_blue.shape, fill_value=-1, dtype=torch.long)
+    for index, encoding in enumerate(class_encodings):
+        mask = torch.where(img_blue == encoding, True, False)
+        integer_encoded[mask] = index
+    return integer_encoded
+
+
+def reference_one_hot_hisdb(matrix: torch.Tensor, class_encodings: List[int]) -> torch.Tensor:
+    np_array = (matrix * 255).numpy().astype(np.uint8)
+    im_np = np_array[2, :, :].astype(np.uint8)
+    border_mask = np_array[0, :, :].astype(np.uint8) != 0
+    im_np[border_mask] = 1
+    np.place(im_np, im_np == 0, 1)
+    replace_dict = {k: v for k, v in zip(class_encodings, np.eye(len(class_encodings), dtype=np.int8))}
+    one_hot_matrix = np.asanyarray(
+        [[replace_dict[im_np[i, j]] for j in range(im_np.shape[1])] for i in range(im_np.shape[0])]).astype(
+        np.uint8)
+    return torch.LongTensor(one_hot_matrix.transpose((2, 0, 1)))
+
+
+def _get_class_encodings(pages: List[np.ndarray], dataset_type: str):
+    if dataset_type == 'rgb':
+        colors = np.unique(np.concatenate([page.reshape(-1, 3) for page in pages]), axis=0)
+        return torch.as_tensor(colors, dtype=torch.float32) / 255
+    blue_values = set()
+    for page in pages:
+        blue = page[:, :, 2].copy()
+        blue[page[:, :, 0] != 0] = 1
+        blue[blue == 0] = 1
+        blue_values.update(np.unique(blue).tolist())
+    return sorted(blue_values)
+
+
+def _get_crops(pages: List[np.ndarray], crop_size: int, max_crops: int) -> List[np.ndarray]:
+    crops = []
+    for page in pages:
+        for y in range(0, page.shape[0] - crop_size + 1, crop_size):
+            for x in range(0, page.shape[1] - crop_size + 1, crop_size):
+                crops.append(page[y:y + crop_size, x:x + crop_size])
+    return crops[:max_crops]
+
+
+def _measure(func: Callable, inputs: List, repetitions: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for x in inputs:
+            func(x)
+    return (time.perf_counter() - start) / (repetitions * len(inputs))
+
+
+def benchmark_gt_encoders(pages: List[np.ndarray], dataset_type: str, crop_sizes: List[int], repetitions: int = 3,
+                          max_crops: int = 16, one_hot_reference: bool = True) -> Dict[int, Dict[str, float]]:
+    """
+    Encodes crops of the pages with the reference and the lookup encoders and measures the time per crop.
+
+    :param pages: ground truth pages (HxWx3 uint8)
+    :type pages: List[np.ndarray]
+    :param dataset_type: `rgb` or `hisdb`
+    :type dataset_type: str
+    :param crop_sizes: the crop sizes to measure
+    :type crop_sizes: List[int]
+    :param repetitions: how many times every crop is encoded
+    :type repetitions: int
+    :param max_crops: maximal number of crops per crop size
+    :type max_crops: int
+    :param one_hot_reference: measure the one-hot reference as well (slow for DivaHisDB)
+    :type one_hot_reference: bool
+    :return: milliseconds per crop of every encoder for every crop size
+    :rtype: Dict[int, Dict[str, float]]
+    """
+    class_encodings = _get_class_encodings(pages=pages, dataset_type=dataset_type)
+    if dataset_type == 'rgb':
+        functional, reference_int, reference_one_hot = functional_rgb, reference_int_encoding_rgb, reference_one_hot_rgb
+    else:
+        functional, reference_int, reference_one_hot = \
+            functional_hisdb, reference_int_encoding_hisdb, reference_one_hot_hisdb
+
+    results = {}
+    for crop_size in crop_sizes:
+        crops = _get_crops(pages=pages, crop_size=crop_size, max_crops=max_crops)
+        if len(crops) == 0:
+            continue
+        float_crops = [ToTensor()(crop) for crop in crops]
+        uint8_crops = [ToUint8Tensor()(crop) for crop in crops]
+
+        encoders = {
+            'int reference': (reference_int, float_crops),
+            'int lookup (float)': (functional.gt_to_int_encoding, float_crops),
+            'int lookup (uint8)': (functional.gt_to_int_encoding, uint8_crops),
+            'one-hot lookup (uint8)': (functional.gt_to_one_hot, uint8_crops),
+        }
+        if one_hot_reference:
+            encoders['one-hot reference'] = (reference_one_hot, float_crops)
+
+        for float_crop, uint8_crop in zip(float_crops, uint8_crops):
+            expected = reference_int(float_crop.clone(), class_encodings)
+            assert torch.equal(functional.gt_to_int_encoding(float_crop, class_encodings), expected)
+            assert torch.equal(functional.gt_to_int_encoding(uint8_crop, class_encodings), expected)
+
+        results[crop_size] = {
+            name: _measure(lambda x, encoder=encoder: encoder(x, class_encodings), inputs, repetitions) * 1000
+            for name, (encoder, inputs) in encoders.items()}
+    return results
+
+
+def main(input_paths: List[str], dataset_type: str, crop_sizes: List[int], repetitions: int, max_crops: int,
+         skip_one_hot_reference: bool):
+    file_paths = sorted({Path(p) for input_path in input_paths for p in glob(input_path) if Path(p).is_file()})
+    if len(file_paths) == 0:
+        raise ValueError('No ground truth files found')
+    pages = [np.array(pil_loader(str(file_path))) for file_path in file_paths]
+    results = benchmark_gt_encoders(pages=pages, dataset_type=dataset_type, crop_sizes=crop_sizes,
+                                    repetitions=repetitions, max_crops=max_crops,
+                                    one_hot_reference=not skip_one_hot_reference)
+
+    print(f'Encoded crops of {len(file_paths)} {dataset_type} pages {repetitions} times (ms per crop)')
+    for crop_size, result in results.items():
+        print(f'crop size {crop_size}')
+        for name, milliseconds in result.items():
+            # speedup against the reference of the same encoding
+            reference = result.get(f'{name.split()[0]} reference')
+            speedup = f'{reference / milliseconds:>8.1f}x' if reference is not None else ''
+            print(f'    {name:<24}{milliseconds:>10.3f} ms {speedup}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_paths',
+                        help='Glob patterns of the ground truth files (e.g. "dataset/train/gt/*.png")',
+                        type=str,
+                        nargs='+',
+                        required=True)
+    parser.add_argument('-t', '--dataset_type',
+                        help='Encoding of the ground truth (rgb or hisdb)',
+                        type=str,
+                        choices=DATASET_TYPES,
+                        required=True)
+    parser.add_argument('-c', '--crop_sizes',
+                        help='Crop sizes to measure',
+                        type=int,
+                        nargs='+',
+                        default=[128, 256, 512])
+    parser.add_argument('-r', '--repetitions',
+                        help='How many times every crop is encoded',
+                        type=int,
+                        default=3)
+    parser.add_argument('-m', '--max_crops',
+                        help='Maximal number of crops per crop size',
+                        type=int,
+                        default=16)
+    parser.add_argument('--skip_one_hot_reference',
+                        help='Do not measure the (slow) one-hot reference',
+                        action='store_true')
+    args = parser.parse_args()
+    main(**args.__dict__)
@@ -6,7 +6,6 @@ import argparse
 # Utils
 import itertools
 import logging
-import math
 from datetime import datetime
 from pathlib import Path
 
@@ -14,6 +13,8 @@ from torchvision.datasets.folder import has_file_allowed_extension, pil_loader
 from torchvision.transforms import functional as F
 from tqdm import tqdm
 
+from src.datamodules.utils.misc import get_crop_step_size, get_num_crops, convert_crop_index_to_position
+
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.gif')
 JPG_EXTENSIONS = ('.jpg', '.jpeg')
 
@@ -160,7 +161,7 @@ class CropGenerator:
         self.override_existing = override_existing
         self.progress_title = progress_title
 
-        self.step_size = int(self.crop_size * (1 - self.overlap))
+        self.step_size = get_crop_step_size(crop_size=self.crop_size, overlap=self.overlap)
 
         # List of tuples that contain the path to the gt and image that belong together
         self.img_paths = get_img_paths_uncropped(input_path)
@@ -236,8 +237,10 @@ class CropGenerator:
         for img_path, split_name in self.img_paths:
             data_img = pil_loader(img_path)
             img_names_sizes.append((split_name, img_path.name, data_img.size))
-            num_horiz_crops.append(math.ceil((data_img.size[0] - self.crop_size) / self.step_size + 1))
-            num_vert_crops.append(math.ceil((data_img.size[1] - self.crop_size) / self.step_size + 1))
+            num_horiz_crops.append(get_num_crops(img_size=data_img.size[0], crop_size=self.crop_size,
+                                                 step_size=self.step_size))
+            num_vert_crops.append(get_num_crops(img_size=data_img.size[1], crop_size=self.crop_size,
+                                                step_size=self.step_size))
 
         return img_names_sizes, num_horiz_crops, num_vert_crops
 
@@ -249,20 +252,18 @@ class CropGenerator:
 
     def _convert_crop_id_to_coordinates(self, img_index, hcrop_index, vcrop_index):
         # X coordinate
-        if hcrop_index == self.num_horiz_crops[img_index] - 1:
-            # We are at the end of a line
-            x_position = self.img_names_sizes[img_index][2][0] - self.crop_size
-        else:
-            x_position = self.step_size * hcrop_index
-            assert x_position < self.img_names_sizes[img_index][2][0] - self.crop_size
+        x_position = convert_crop_index_to_position(crop_index=hcrop_index,
+                                                    num_crops=self.num_horiz_crops[img_index],
+                                                    img_size=self.img_names_sizes[img_index][2][0],
+                                                    crop_size=self.crop_size,
+                                                    step_size=self.step_size)
 
         # Y coordinate
-        if vcrop_index == self.num_vert_crops[img_index] - 1:
-            # We are at the bottom end
-            y_position = self.img_names_sizes[img_index][2][1] - self.crop_size
-        else:
-            y_position = self.step_size * vcrop_index
-            assert y_position < self.img_names_sizes[img_index][2][1] - self.crop_size
+        y_position = convert_crop_index_to_position(crop_index=vcrop_index,
+                                                    num_crops=self.num_vert_crops[img_index],
+                                                    img_size=self.img_names_sizes[img_index][2][1],
+                                                    crop_size=self.crop_size,
+                                                    step_size=self.step_size)
 
         return img_index, x_position, y_position
 
@@ -0,0 +1,430 @@
+"""
+Pack a dataset of historic documents into shard files for the `packed` format of the cropped datamodules.
+
+The crops are computed with the :class:`CropGenerator` of `generate_cropped_dataset.py`, so the coordinates and the
+names of the crops are the same as in a cropped dataset. Instead of writing every crop into its own image file the
+crops, the integer encoded ground truth and (for DivaHisDB) the boundary mask are written into a few large shard files.
+The analytics files which the datamodules expect are computed during the packing as well.
+
+With the output format `tiled` the pages are not cropped at all. Every page is written once into a tiled page store
+(see `src/datamodules/utils/tiled_store.py`) and the crops are cut on demand by the tiled datasets. The crop sizes and
+the overlap given to this tool are then only the defaults of the virtual crops and the crops the analytics are
+computed from.
+
+With `--bit_packed` the crops of a binary dataset (e.g. binarized pages) are stored with 1 bit per pixel and so is the
+ground truth if the dataset has at most two classes (see `src/datamodules/utils/packed_shards.py`).
+
+The input has the same structure as for `generate_cropped_dataset.py` (train/val/test folders with a data and a gt
+folder inside).
+"""
+
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+from torchvision.datasets.folder import pil_loader
+from tqdm import tqdm
+
+from src.datamodules.DivaHisDB.utils.functional import gt_to_int_encoding as gt_to_int_encoding_hisdb
+from src.datamodules.RGB.utils.functional import gt_to_int_encoding as gt_to_int_encoding_rgb
+from src.datamodules.utils.packed_shards import PackedShardWriter
+from src.datamodules.utils.tiled_store import TiledPageStoreWriter
+from tools.generate_cropped_dataset import CropGenerator
+
+DATASET_TYPES = ('rgb', 'hisdb')
+OUTPUT_FORMATS = ('shards', 'tiled')
+
+
+def _pack_colors(gt: np.ndarray) -> np.ndarray:
+    gt = gt.astype(np.int32)
+    return (gt[..., 0] << 16) | (gt[..., 1] << 8) | gt[..., 2]
+
+
+class PackedDatasetGenerator:
+    """
+    Crops all splits of a dataset and writes them into packed shard files.
+
+    :param input_path: Path to the root folder of the dataset (contains train/val/test)
+    :type input_path: Path
+    :param output_path: Path to the output folder
+    :type output_path: Path
+    :param dataset_type: Type of the ground truth encoding (`rgb` or `hisdb`)
+    :type dataset_type: str
+    :param crop_size_train: Size of the crops in the training set
+    :type crop_size_train: int
+    :param crop_size_val: Size of the crops in the validation set
+    :type crop_size_val: int
+    :param crop_size_test: Size of the crops in the test set
+    :type crop_size_test: int
+    :param overlap: Overlap of the crops (between 0-1)
+    :type overlap: float
+    :param leading_zeros_length: Amount of leading zeros to encode the coordinates in the crop names
+    :type leading_zeros_length: int
+    :param data_folder_name: Name of the data folder in the splits
+    :type data_folder_name: str
+    :param gt_folder_name: Name of the ground truth folder in the splits
+    :type gt_folder_name: str
+    :param shard_size: Maximal number of crops per shard file
+    :type shard_size: int
+    :param output_format: `shards` to write the crops into shard files or `tiled` to write the pages into a tiled
+        page store
+    :type output_format: str
+    :param tile_size: Size of the tiles of the tiled page store
+    :type tile_size: int
+    :param bit_packed: If True, the crops (which have to be binary) and the ground truth with at most two classes are
+        stored with 1 bit per pixel (just for the output format `shards`)
+    :type bit_packed: bool
+    """
+
+    def __init__(self, input_path: Path, output_path: Path, dataset_type: str,
+                 crop_size_train: int, crop_size_val: int, crop_size_test: int, overlap: float = 0.5,
+                 leading_zeros_length: int = 4, data_folder_name: str = 'data', gt_folder_name: str = 'gt',
+                 shard_size: int = 4096, output_format: str = 'shards', tile_size: int = 256,
+                 bit_packed: bool = False):
+        if dataset_type not in DATASET_TYPES:
+            raise ValueError(f'Unknown dataset type "{dataset_type}" (supported: {", ".join(DATASET_TYPES)})')
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format "{output_format}" (supported: {", ".join(OUTPUT_FORMATS)})')
+        if bit_packed and output_format != 'shards':
+            raise ValueError(f'Bit-packing is just supported for the output format "shards" '
+                             f'(output_format={output_format})')
+
+        self.input_path = input_path
+        self.output_path = output_path
+        self.dataset_type = dataset_type
+        self.crop_sizes = {'train': crop_size_train, 'val': crop_size_val, 'test': crop_size_test}
+        self.overlap = overlap
+        self.leading_zeros_length = leading_zeros_length
+        self.data_folder_name = data_folder_name
+        self.gt_folder_name = gt_folder_name
+        self.shard_size = shard_size
+        self.output_format = output_format
+        self.tile_size = tile_size
+        self.bit_packed = bit_packed
+
+        self.generators = {split: CropGenerator(input_path=input_path / split,
+                                                output_path=output_path / split,
+                                                crop_size=crop_size,
+                                                overlap=overlap,
+                                                leading_zeros_length=leading_zeros_length,
+                                                progress_title=f'Packing "{split}"')
+                           for split, crop_size in self.crop_sizes.items()}
+
+    def write_shards(self):
+        info_list = ['Running PackedDatasetGenerator.write_shards():',
+                     f'- full_command:',
+                     f'python tools/generate_packed_dataset.py -i {self.input_path} -o {self.output_path} '
+                     f'-t {self.dataset_type} -tr {self.crop_sizes["train"]} -v {self.crop_sizes["val"]} '
+                     f'-te {self.crop_sizes["test"]} -ov {self.overlap} -l {self.leading_zeros_length} '
+                     f'-d {self.data_folder_name} -g {self.gt_folder_name} -s {self.shard_size} '
+                     f'-f {self.output_format} -ts {self.tile_size}{" --bit_packed" if self.bit_packed else ""}',
+                     f'',
+                     f'- start_time:       \t{datetime.now():%Y-%m-%d_%H-%M-%S}',
+                     f'- input_path:       \t{self.input_path}',
+                     f'- output_path:      \t{self.output_path}',
+                     f'- dataset_type:     \t{self.dataset_type}',
+                     f'- crop_size_train:  \t{self.crop_sizes["train"]}',
+                     f'- crop_size_val:    \t{self.crop_sizes["val"]}',
+                     f'- crop_size_test:   \t{self.crop_sizes["test"]}',
+                     f'- overlap:          \t{self.overlap}',
+                     f'- leading_zeros_len:\t{self.leading_zeros_length}',
+                     f'- shard_size:       \t{self.shard_size}',
+                     f'- output_format:    \t{self.output_format}',
+                     f'- tile_size:        \t{self.tile_size}',
+                     f'- bit_packed:       \t{self.bit_packed}',
+                     '']  # empty string to get linebreak at the end when using join
+
+        info_str = '\n'.join(info_list)
+        print(info_str)
+
+        # Write info_packed_dataset.txt
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        info_file = self.output_path / 'info_packed_dataset.txt'
+        with info_file.open('a') as f:
+            f.write(info_str)
+
+        class_encodings = self._get_class_encodings(generator=self.generators['train'])
+
+        print(f'Start packing:')
+        for split, generator in self.generators.items():
+            if self.output_format == 'tiled':
+                statistics = self._write_split_tiled(generator=generator, class_encodings=class_encodings,
+                                                     compute_statistics=split == 'train')
+            else:
+                statistics = self._write_split(generator=generator, class_encodings=class_encodings,
+                                               compute_statistics=split == 'train')
+            if statistics is not None:
+                self._write_analytics(statistics=statistics, class_encodings=class_encodings)
+
+        with info_file.open('a') as f:
+            f.write(f'- end_time:         \t{datetime.now():%Y-%m-%d_%H-%M-%S}\n\n')
+
+    def _get_page_pairs(self, generator: CropGenerator) -> List[Tuple[int, int]]:
+        """
+        Returns the indices (data, gt) of the pages of a crop generator which belong together.
+        """
+        gt_indices = {Path(name).stem: i for i, (split_name, name, _) in enumerate(generator.img_names_sizes)
+                      if split_name == self.gt_folder_name}
+
+        pairs = []
+        for i, (split_name, name, size) in enumerate(generator.img_names_sizes):
+            if split_name != self.data_folder_name:
+                continue
+            stem = Path(name).stem
+            if stem not in gt_indices:
+                raise FileNotFoundError(f'No ground truth found for the page {name}')
+            if generator.img_names_sizes[gt_indices[stem]][2] != size:
+                raise ValueError(f'The page {name} and its ground truth have a different size')
+            pairs.append((i, gt_indices[stem]))
+
+        return pairs
+
+    def _get_class_encodings(self, generator: CropGenerator) -> List:
+        """
+        Collects the class encodings of the training pages. The crops cover the full page, so these are the same
+        encodings the datamodules compute from the cropped training set.
+        """
+        encodings = set()
+        for _, gt_index in self._get_page_pairs(generator=generator):
+            gt = np.asarray(pil_loader(generator.img_paths[gt_index][0]))
+            if self.dataset_type == 'rgb':
+                encodings.update(np.unique(_pack_colors(gt)).tolist())
+            else:
+                encodings.update(np.unique(gt[:, :, 2]).tolist())
+
+        if self.dataset_type == 'rgb':
+            return [[c >> 16, (c >> 8) & 0xFF, c & 0xFF] for c in sorted(encodings)]
+        return sorted(encodings)
+
+    def _encode_page(self, gt: np.ndarray, class_encodings: List) -> np.ndarray:
+        """
+        Integer encodes a ground truth page in the same way as the `IntegerEncoding` of the dataset type does.
+        Pixels with an unknown color are encoded with -1.
+        """
+        if len(class_encodings) > np.iinfo(np.int8).max:
+            raise ValueError(f'The packed format supports at most {np.iinfo(np.int8).max} classes')
+
+        gt_tensor = torch.from_numpy(gt).permute(2, 0, 1)
+        if self.dataset_type == 'rgb':
+            encoded = gt_to_int_encoding_rgb(gt_tensor, class_encodings=torch.as_tensor(class_encodings))
+        else:
+            encoded = gt_to_int_encoding_hisdb(gt_tensor, class_encodings=class_encodings)
+        return encoded.numpy().astype(np.int8)
+
+    def _write_split(self, generator: CropGenerator, class_encodings: List, compute_statistics: bool) -> Dict:
+        """
+        Writes the shards of one split. If `compute_statistics` is set, the statistics for the analytics files are
+        accumulated over the crops.
+        """
+        pairs = self._get_page_pairs(generator=generator)
+        data_indices = {data_index for data_index, _ in pairs}
+        crops_per_page = {data_index: [] for data_index in data_indices}
+        for img_index, x, y in generator.crop_list:
+            if img_index in data_indices:
+                crops_per_page[img_index].append((x, y))
+
+        writer = PackedShardWriter(output_path=generator.output_path,
+                                   num_samples=sum(len(crops) for crops in crops_per_page.values()),
+                                   crop_size=(generator.crop_size, generator.crop_size),
+                                   shard_size=self.shard_size,
+                                   with_mask=self.dataset_type == 'hisdb',
+                                   bit_packed_data=self.bit_packed,
+                                   bit_packed_gt=self.bit_packed and len(class_encodings) <= 2)
+
+        statistics = {'mean_sum': np.zeros(3), 'sum': np.zeros(3, dtype=object), 'sum_sq': np.zeros(3, dtype=object),
+                      'num_pixels': 0, 'num_crops': 0, 'class_counter': {}} if compute_statistics else None
+
+        for data_index, gt_index in tqdm(pairs, desc=generator.progress_title):
+            page_name = Path(generator.img_names_sizes[data_index][1]).stem
+            data_page = np.asarray(pil_loader(generator.img_paths[data_index][0]))
+            gt_page = np.asarray(pil_loader(generator.img_paths[gt_index][0]))
+            gt_encoded = self._encode_page(gt=gt_page, class_encodings=class_encodings)
+            mask_page = gt_page[:, :, 0] != 0
+
+            for x, y in crops_per_page[data_index]:
+                window = (slice(y, y + generator.crop_size), slice(x, x + generator.crop_size))
+                crop_name = f'{page_name}_x{x:0{self.leading_zeros_length}d}_y{y:0{self.leading_zeros_length}d}'
+                writer.add(page_name=page_name, crop_name=crop_name, coordinates=(x, y),
+                           img=data_page[window], gt=gt_encoded[window],
+                           mask=mask_page[window] if self.dataset_type == 'hisdb' else None)
+
+                if statistics is not None:
+                    self._update_statistics(statistics=statistics, img=data_page[window], gt=gt_page[window])
+
+        writer.close(class_encodings=class_encodings)
+
+        return statistics
+
+    def _write_split_tiled(self, generator: CropGenerator, class_encodings: List, compute_statistics: bool) -> Dict:
+        """
+        Writes the pages of one split into a tiled page store. If `compute_statistics` is set, the statistics for
+        the analytics files are accumulated over the crops of the crop generator.
+        """
+        pairs = self._get_page_pairs(generator=generator)
+        crops_per_page = {data_index: [] for data_index, _ in pairs}
+        for img_index, x, y in generator.crop_list:
+            if img_index in crops_per_page:
+                crops_per_page[img_index].append((x, y))
+
+        writer = TiledPageStoreWriter(output_path=generator.output_path, tile_size=self.tile_size,
+                                      with_mask=self.dataset_type == 'hisdb')
+
+        statistics = {'mean_sum': np.zeros(3), 'sum': np.zeros(3, dtype=object), 'sum_sq': np.zeros(3, dtype=object),
+                      'num_pixels': 0, 'num_crops': 0, 'class_counter': {}} if compute_statistics else None
+
+        for data_index, gt_index in tqdm(pairs, desc=generator.progress_title):
+            page_name = Path(generator.img_names_sizes[data_index][1]).stem
+            data_page = np.asarray(pil_loader(generator.img_paths[data_index][0]))
+            gt_page = np.asarray(pil_loader(generator.img_paths[gt_index][0]))
+            writer.add_page(page_name=page_name, img=data_page,
+                            gt=self._encode_page(gt=gt_page, class_encodings=class_encodings),
+                            mask=gt_page[:, :, 0] != 0 if self.dataset_type == 'hisdb' else None)
+
+            if statistics is not None:
+                for x, y in crops_per_page[data_index]:
+                    window = (slice(y, y + generator.crop_size), slice(x, x + generator.crop_size))
+                    self._update_statistics(statistics=statistics, img=data_page[window], gt=gt_page[window])
+
+        writer.close(class_encodings=class_encodings,
+                     crop_defaults={'crop_size': generator.crop_size,
+                                    'overlap': self.overlap,
+                                    'leading_zeros_length': self.leading_zeros_length})
+
+        return statistics
+
+    def _update_statistics(self, statistics: Dict, img: np.ndarray, gt: np.ndarray):
+        pixels = img.reshape(-1, 3)
+        statistics['mean_sum'] += pixels.mean(axis=0) / 255.0
+        statistics['sum'] += pixels.sum(axis=0, dtype=np.int64).astype(object)
+        statistics['sum_sq'] += np.square(pixels, dtype=np.int64).sum(axis=0).astype(object)
+        statistics['num_pixels'] += pixels.shape[0]
+        statistics['num_crops'] += 1
+
+        if self.dataset_type == 'rgb':
+            labels, counts = np.unique(_pack_colors(gt), return_counts=True)
+        else:
+            labels, counts = np.unique(gt[:, :, 2], return_counts=True)
+        for label, count in zip(labels.tolist(), counts.tolist()):
+            statistics['class_counter'][label] = statistics['class_counter'].get(label, 0) + count
+
+    def _write_analytics(self, statistics: Dict, class_encodings: List):
+        """
+        Writes the analytics files with the same content and names the datamodules would compute
+        from the cropped training set.
+        """
+        num_pixels = statistics['num_pixels']
+        mean = statistics['mean_sum'] / statistics['num_crops']
+        sum_sq = np.array([float(v) for v in statistics['sum_sq']]) / 255.0 ** 2
+        sum_ = np.array([float(v) for v in statistics['sum']]) / 255.0
+        std = np.sqrt((sum_sq - 2 * mean * sum_) / num_pixels + np.square(mean))
+
+        num_samples_per_class = np.asarray([statistics['class_counter'][k]
+                                            for k in sorted(statistics['class_counter'].keys())])
+
+        if self.dataset_type == 'rgb':
+            analytics_data = {'mean': mean.tolist(),
+                              'std': std.tolist(),
+                              'width': self.crop_sizes['train'],
+                              'height': self.crop_sizes['train']}
+            analytics_gt = {'class_weights': (1 / num_samples_per_class).tolist(),
+                            'class_encodings': class_encodings}
+            analytics_path_data = self.output_path / f'analytics.data.{self.data_folder_name}.train.json'
+            analytics_path_gt = self.output_path / f'analytics.gt.{self.gt_folder_name}.train.json'
+        else:
+            analytics_data = {'mean': mean.tolist(),
+                              'std': std.tolist()}
+            analytics_gt = {'class_weights': ((1 / num_samples_per_class) /
+                                              (1 / num_samples_per_class).sum()).tolist(),
+                            'class_encodings': class_encodings}
+            analytics_path_data = self.output_path / f'analytics.data.{self.data_folder_name}.json'
+            analytics_path_gt = self.output_path / f'analytics.gt.hisDB.{self.gt_folder_name}.json'
+
+        for analytics, analytics_path in [(analytics_data, analytics_path_data), (analytics_gt, analytics_path_gt)]:
+            with analytics_path.open(mode='w') as f:
+                json.dump(obj=analytics, fp=f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_path',
+                        help='Path to the root folder of the dataset (contains train/val/test)',
+                        type=Path,
+                        required=True)
+    parser.add_argument('-o', '--output_path',
+                        help='Path to the output folder',
+                        type=Path,
+                        required=True)
+    parser.add_argument('-t', '--dataset_type',
+                        help='Encoding of the ground truth (rgb or hisdb)',
+                        type=str,
+                        choices=DATASET_TYPES,
+                        required=True)
+    parser.add_argument('-tr', '--crop_size_train',
+                        help='Size of the crops in the training set',
+                        type=int,
+                        required=True)
+    parser.add_argument('-v', '--crop_size_val',
+                        help='Size of the crops in the validation set',
+                        type=int,
+                        required=True)
+    parser.add_argument('-te', '--crop_size_test',
+                        help='Size of the crops in the test set',
+                        type=int,
+                        required=True)
+    parser.add_argument('-ov', '--overlap',
+                        help='Overlap of the different crops (between 0-1)',
+                        type=float,
+                        default=0.5)
+    parser.add_argument('-l', '--leading_zeros_length',
+                        help='amount of leading zeros to encode the coordinates',
+                        type=int,
+                        default=4)
+    parser.add_argument('-d', '--data_folder_name',
+                        help='Name of the data folder in the splits',
+                        type=str,
+                        default='data')
+    parser.add_argument('-g', '--gt_folder_name',
+                        help='Name of the ground truth folder in the splits',
+                        type=str,
+                        default='gt')
+    parser.add_argument('-s', '--shard_size',
+                        help='Maximal number of crops per shard file',
+                        type=int,
+                        default=4096)
+    parser.add_argument('-f', '--output_format',
+                        help='shards: write the crops into shard files, '
+                             'tiled: write the pages into a tiled page store (virtual crops)',
+                        type=str,
+                        choices=OUTPUT_FORMATS,
+                        default='shards')
+    parser.add_argument('-ts', '--tile_size',
+                        help='Size of the tiles of the tiled page store',
+                        type=int,
+                        default=256)
+    parser.add_argument('--bit_packed',
+                        help='Store the crops of a binary dataset (and its gt with at most two classes) with 1 bit '
+                             'per pixel',
+                        action='store_true')
+    args = parser.parse_args()
+    if args.bit_packed and args.output_format != 'shards':
+        parser.error(f'--bit_packed is just supported for the output format "shards" (got "{args.output_format}")')
+    dataset_generator = PackedDatasetGenerator(**args.__dict__)
+    dataset_generator.write_shards()
+
+    # example call arguments
+    # -i
+    # /dataset/DIVA-HisDB/segmentation/CB55
+    # -o
+    # /net/research-hisdoc/datasets/semantic_segmentation/datasets_packed/CB55
+    # -t
+    # hisdb
+    # -tr
+    # 300
+    # -v
+    # 300
+    # -te
+    # 256
@@ -1,26 +1,112 @@
+"""
+Writes the pixels per class (and optionally the mean and std of the data) of a split of a dataset into a json file.
+
+The statistics of every file are taken from the statistics index of the dataset (see
+`src/datamodules/utils/statistics_index.py`), the same index the datamodules use for their analytics. Only the files
+which are not yet indexed (or have been modified) are read, so the statistics of further splits or of a dataset which
+has already been trained on are available without a scan of the images.
+"""
+
+import argparse
 import json
 from pathlib import Path
+from typing import Any, Dict, List
 
-from PIL import Image
-import numpy as np
+from src.datamodules.DivaHisDB.utils.image_analytics import get_class_counts_hisdb
+from src.datamodules.IndexedFormats.utils.image_analytics import get_class_counts_indexed
+from src.datamodules.RGB.utils.image_analytics import get_class_counts_rgb
+from src.datamodules.utils.statistics_index import compute_image_statistics_indexed
 
-if __name__ == '__main__':
-    root_path = Path("/net/research-hisdoc/datasets/semantic_segmentation/datasets/CB55-splits/AB1_3class")
-    test_gt_path = root_path / "test" / "gt"
+GT_FORMATS = {'indexed': get_class_counts_indexed,
+              'rgb': get_class_counts_rgb,
+              'hisdb': get_class_counts_hisdb}
+
+
+def get_dataset_statistics(root_path: Path, split: str = 'test', gt_folder_name: str = 'gt',
+                           data_folder_name: str = None, gt_format: str = 'indexed',
+                           workers: int = 8) -> Dict[str, Any]:
+    """
+    Computes the statistics of the gt files (and of the data files) of a split from the statistics index.
 
-    class_occurrences = []
+    :param root_path: root folder of the dataset
+    :type root_path: Path
+    :param split: name of the split folder
+    :type split: str
+    :param gt_folder_name: name of the gt folder in the split
+    :type gt_folder_name: str
+    :param data_folder_name: name of the data folder in the split, the data statistics are skipped if None
+    :type data_folder_name: str
+    :param gt_format: format of the gt (`indexed`, `rgb` or `hisdb`)
+    :type gt_format: str
+    :param workers: number of worker processes to read the files which are not yet indexed
+    :type workers: int
+    :return: the pixels per class (classes in the order of their keys) and the mean and std of the data
+    :rtype: Dict[str, Any]
+    """
+    if gt_format not in GT_FORMATS:
+        raise ValueError(f'Unknown gt format {gt_format} (available: {list(GT_FORMATS)})')
 
-    for img in test_gt_path.iterdir():
-        img = Image.open(img)
-        img_array = np.asarray(img)
-        if len(class_occurrences) == 0:
-            class_occurrences = np.bincount(img_array.flatten())
-        else:
-            class_occurrences += np.bincount(img_array.flatten())
+    file_names_gt = sorted(p for p in (root_path / split / gt_folder_name).iterdir() if p.is_file())
+    file_names_data = None
+    if data_folder_name is not None:
+        file_names_data = sorted(p for p in (root_path / split / data_folder_name).iterdir() if p.is_file())
+        if len(file_names_data) != len(file_names_gt):
+            raise ValueError(f'The number of data ({len(file_names_data)}) and gt ({len(file_names_gt)}) files differ')
 
-    stats = {"pxl_per_class": class_occurrences.tolist(),
-             "relative_per_class": (class_occurrences / class_occurrences.sum()).tolist(),
-             "amount_of_pxls": class_occurrences.sum().tolist()}
+    statistics = compute_image_statistics_indexed(root=root_path, file_names_data=file_names_data,
+                                                  file_names_gt=file_names_gt, gt_format=gt_format,
+                                                  get_class_counts_func=GT_FORMATS[gt_format], workers=workers)
+
+    classes: List[Any] = sorted(statistics.class_counts.keys())
+    pxl_per_class = [statistics.class_counts[c] for c in classes]
+    amount_of_pxls = sum(pxl_per_class)
+    stats = {'classes': classes,
+             'pxl_per_class': pxl_per_class,
+             'relative_per_class': [c / amount_of_pxls for c in pxl_per_class],
+             'amount_of_pxls': amount_of_pxls}
+    if data_folder_name is not None:
+        stats['mean'] = statistics.mean.tolist()
+        stats['std'] = statistics.std.tolist()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--root_path',
+                        help='Path to the root of the dataset',
+                        type=Path,
+                        required=True)
+    parser.add_argument('-s', '--split',
+                        help='Name of the split folder',
+                        type=str,
+                        default='test')
+    parser.add_argument('-g', '--gt_folder_name',
+                        help='Name of the gt folder in the split',
+                        type=str,
+                        default='gt')
+    parser.add_argument('-d', '--data_folder_name',
+                        help='Name of the data folder in the split (adds the mean and std of the data)',
+                        type=str,
+                        default=None)
+    parser.add_argument('-f', '--gt_format',
+                        help='Format of the gt',
+                        type=str,
+                        choices=list(GT_FORMATS),
+                        default='indexed')
+    parser.add_argument('-j', '--workers',
+                        help='Number of worker processes to read the files which are not yet indexed',
+                        type=int,
+                        default=8)
+    parser.add_argument('-o', '--output_path',
+                        help='Path to the json file (default: stats.json in the root of the dataset)',
+                        type=Path,
+                        default=None)
+    args = parser.parse_args()
 
-    with (root_path / 'stats.json').open('w') as f:
-        json.dump(stats, f)
+    dataset_stats = get_dataset_statistics(root_path=args.root_path, split=args.split,
+                                           gt_folder_name=args.gt_folder_name,
+                                           data_folder_name=args.data_folder_name, gt_format=args.gt_format,
+                                           workers=args.workers)
+    output_path = args.output_path if args.output_path is not None else args.root_path / 'stats.json'
+    with output_path.open('w') as f:
+        json.dump(dataset_stats, f)
@@ -7,15 +7,17 @@ from dataclasses import dataclass
 from datetime import datetime
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
+from typing import Optional
 
 import numpy as np
 from PIL import Image
 from tqdm import tqdm
 
-from src.datamodules.DivaHisDB.datamodule_cropped import DivaHisDBDataModuleCropped
 from src.datamodules.DivaHisDB.datasets.cropped_dataset import CroppedHisDBDataset
+from src.datamodules.DivaHisDB.utils.image_analytics import read_analytics_gt
 from src.datamodules.DivaHisDB.utils.output_tools import save_output_page_image
 from src.datamodules.utils.output_tools import merge_patches
+from src.datamodules.utils.patch_store import PatchStoreReader
 from tools.generate_cropped_dataset import pil_loader
 from tools.viz import visualize
 
@@ -27,7 +29,7 @@ class CropData:
     offset_y: int
     height: int
     width: int
-    pred_path: Path
+    pred_path: Optional[Path]
     img_path: Path
     gt_path: Path
 
@@ -45,10 +47,10 @@ class CroppedOutputMerger:
         self.data_folder_name = data_folder_name
         self.gt_folder_name = gt_folder_name
 
-        data_module = DivaHisDBDataModuleCropped(data_dir=str(datamodule_path), data_folder_name=self.data_folder_name,
-                                                 gt_folder_name=self.gt_folder_name)
-        self.num_classes = data_module.num_classes
-        self.class_encodings = data_module.class_encodings
+        # the class encodings are read from the analytics file, no image of the dataset is opened
+        analytics_gt = read_analytics_gt(input_path=datamodule_path, gt_folder_name=self.gt_folder_name)
+        self.class_encodings = analytics_gt['class_encodings']
+        self.num_classes = len(self.class_encodings)
 
         img_paths_per_page = CroppedHisDBDataset.get_gt_data_paths(directory=datamodule_path / 'test',
                                                                    data_folder_name=self.data_folder_name,
@@ -74,10 +76,21 @@ class CroppedOutputMerger:
         for img_name in self.dataset_dict.keys():
             self.dataset_dict[img_name] = sorted(self.dataset_dict[img_name], key=lambda v: (v[4], v[3]))
 
-        self.img_name_list = sorted([str(n.name) for n in prediction_path.iterdir() if n.is_dir()])
+        # the predictions are either in a patch store (`patch_store` of the cropped tasks) or one .npy file per crop
+        self.patch_store = PatchStoreReader(prediction_path) if PatchStoreReader.exists(prediction_path) else None
+        if self.patch_store is not None:
+            self.img_name_list = self.patch_store.page_names
+        else:
+            self.img_name_list = sorted([str(n.name) for n in prediction_path.iterdir() if n.is_dir()])
+
+        # the pages which are stitched during the test (`stitch_test_pages`) have no patches, they are already in the
+        # pred folder of the output
+        stitched_img_names = set()
+        if (output_path / 'pred').is_dir():
+            stitched_img_names = {p.stem for p in (output_path / 'pred').glob('*.png')} - set(self.img_name_list)
 
-        # check if all images from the dataset are found in the prediction output
-        assert sorted(dataset_img_name_list) == sorted(self.img_name_list)
+        # check if all images of the dataset are in the prediction output (exactly, if no page was stitched)
+        assert sorted(set(self.img_name_list) | stitched_img_names) == dataset_img_name_list
 
         self.num_pages = len(self.img_name_list)
         if self.num_pages >= num_threads:
@@ -150,21 +163,25 @@ class CroppedOutputMerger:
     def merge_page(self, img_name: str, lock, position):
         page_info_str = f'[{str(position + 1).rjust(int(math.log10(self.num_pages)) + 1)}/{self.num_pages}] {img_name}'
 
-        preds_folder = self.prediction_path / img_name
-        coordinates = re.compile(r'.+_x(\d+)_y(\d+)\.npy$')
-
-        if not preds_folder.is_dir():
-            print(f'Skipping {preds_folder}. Not a directory!')
-            return
-
-        preds_list = []
-        for pred_path in preds_folder.glob(f'{img_name}*.npy'):
-            m = coordinates.match(pred_path.name)
-            if m is None:
-                continue
-            x = int(m.group(1))
-            y = int(m.group(2))
-            preds_list.append((x, y, pred_path))
+        if self.patch_store is not None:
+            preds_list = [(x, y, Path(crop_name), shape)
+                          for crop_name, x, y, shape in self.patch_store.get_crops(img_name)]
+        else:
+            preds_folder = self.prediction_path / img_name
+            coordinates = re.compile(r'.+_x(\d+)_y(\d+)\.npy$')
+
+            if not preds_folder.is_dir():
+                print(f'Skipping {preds_folder}. Not a directory!')
+                return
+
+            preds_list = []
+            for pred_path in preds_folder.glob(f'{img_name}*.npy'):
+                m = coordinates.match(pred_path.name)
+                if m is None:
+                    continue
+                x = int(m.group(1))
+                y = int(m.group(2))
+                preds_list.append((x, y, pred_path, None))
         preds_list = sorted(preds_list, key=lambda v: (v[1], v[0]))
 
         img_gt_list = self.dataset_dict[img_name]
@@ -186,25 +203,27 @@ class CroppedOutputMerger:
         crop_height = -1
 
         if self.load_only_first_crop_for_size:
-            pred_path = preds_list[0][2]
-            pred = np.load(str(pred_path))
-            crop_width = pred.shape[1]
-            crop_height = pred.shape[2]
+            _, _, pred_path, pred_shape = preds_list[0]
+            pred_shape = pred_shape or np.load(str(pred_path)).shape
+            crop_width = pred_shape[-2]
+            crop_height = pred_shape[-1]
 
-        for (x, y, pred_path), (img_path, gt_path, crop_name, x_data, y_data) in zip(preds_list, img_gt_list):
+        for (x, y, pred_path, pred_shape), (img_path, gt_path, crop_name, x_data, y_data) in zip(preds_list,
+                                                                                                 img_gt_list):
             assert (x, y) == (x_data, y_data)
             assert pred_path.name.startswith(crop_name)
             assert img_path.name.startswith(crop_name)
             assert gt_path.name.startswith(crop_name)
 
             if not self.load_only_first_crop_for_size:
-                pred = np.load(str(pred_path))
-                crop_width = pred.shape[1]
-                crop_height = pred.shape[2]
+                pred_shape = pred_shape or np.load(str(pred_path)).shape
+                crop_width = pred_shape[-2]
+                crop_height = pred_shape[-1]
 
             crop_data_list.append(
                 CropData(name=crop_name, offset_x=x, offset_y=y, width=crop_width, height=crop_height,
-                         img_path=img_path, gt_path=gt_path, pred_path=pred_path))  # , pred=pred))
+                         img_path=img_path, gt_path=gt_path,
+                         pred_path=pred_path if self.patch_store is None else None))  # , pred=pred))
 
             pbar1.update()
 
@@ -215,9 +234,13 @@ class CroppedOutputMerger:
         canvas_width = crop_data_list[-1].width + crop_data_list[-1].offset_x
         canvas_height = crop_data_list[-1].height + crop_data_list[-1].offset_y
 
-        pred_canvas_size = (self.num_classes, canvas_height, canvas_width)
-        pred_canvas = np.empty(pred_canvas_size)
-        pred_canvas.fill(np.nan)
+        if self.patch_store is not None and self.patch_store.storage == 'argmax':
+            # the class indices of overlapping crops are pasted, -1 marks the pixels without prediction
+            pred_canvas = np.full((canvas_height, canvas_width), -1, dtype=np.int64)
+        else:
+            pred_canvas_size = (self.num_classes, canvas_height, canvas_width)
+            pred_canvas = np.empty(pred_canvas_size)
+            pred_canvas.fill(np.nan)
 
         img_canvas = Image.new(mode='RGB', size=(canvas_width, canvas_height))
         gt_canvas = Image.new(mode='RGB', size=(canvas_width, canvas_height))
@@ -230,14 +253,12 @@ class CroppedOutputMerger:
                          desc=f'{page_info_str}: Merging crops')
 
         for crop_data in crop_data_list:
-            # Add the pred to the pred_canvas
-            pred = np.load(str(crop_data.pred_path))
-
-            # make sure all crops have same size
-            assert crop_width == pred.shape[1]
-            assert crop_height == pred.shape[2]
-
-            pred_canvas = merge_patches(pred, (crop_data.offset_x, crop_data.offset_y), pred_canvas)
+            if self.patch_store is None:
+                # Add the pred to the pred_canvas
+                pred = np.load(str(crop_data.pred_path))
+                pred_canvas = self._merge_pred(pred_canvas=pred_canvas, pred=pred, offset_x=crop_data.offset_x,
+                                               offset_y=crop_data.offset_y, crop_width=crop_width,
+                                               crop_height=crop_height)
 
             img_crop = pil_loader(crop_data.img_path)
             img_canvas.paste(img_crop, (crop_data.offset_x, crop_data.offset_y))
@@ -247,6 +268,12 @@ class CroppedOutputMerger:
 
             pbar2.update()
 
+        if self.patch_store is not None:
+            # the patches of the page are read sequentially in the order they were written
+            for _, x, y, pred in self.patch_store.read_page(img_name):
+                pred_canvas = self._merge_pred(pred_canvas=pred_canvas, pred=pred, offset_x=x, offset_y=y,
+                                               crop_width=crop_width, crop_height=crop_height)
+
         with lock:
             pbar2.refresh()
 
@@ -288,10 +315,11 @@ class CroppedOutputMerger:
             elif i == 3:
                 pbar3.set_description(f'{page_info_str}: Saving merged image files ' + '(pred)'.ljust(10))
                 # Save prediction only when complete
-                if not np.isnan(np.sum(pred_canvas)):
+                if self._is_complete(pred_canvas):
                     # Save the final image (image_name, output_image, output_folder, class_encoding)
                     save_output_page_image(image_name=f'{img_name}.png', output_image=pred_canvas,
-                                           output_folder=outdir_pred, class_encoding=self.class_encodings)
+                                           output_folder=outdir_pred, class_encoding=self.class_encodings,
+                                           perform_argmax=pred_canvas.ndim == 3)
                 else:
                     print(f'WARNING: Test image {img_name} was not written! It still contains NaN values.')
                     break  # so last step is not
@@ -309,6 +337,25 @@ class CroppedOutputMerger:
         # The progress bars will be close in order in main thread
         return pbar1, pbar2, pbar3
 
+    @staticmethod
+    def _merge_pred(pred_canvas: np.ndarray, pred: np.ndarray, offset_x: int, offset_y: int, crop_width: int,
+                    crop_height: int) -> np.ndarray:
+        # make sure all crops have same size
+        assert crop_width == pred.shape[-2]
+        assert crop_height == pred.shape[-1]
+
+        if pred.ndim == 2:
+            # class indices of the argmax patch store
+            pred_canvas[offset_y:offset_y + pred.shape[0], offset_x:offset_x + pred.shape[1]] = pred
+            return pred_canvas
+        return merge_patches(pred, (offset_x, offset_y), pred_canvas)
+
+    @staticmethod
+    def _is_complete(pred_canvas: np.ndarray) -> bool:
+        if pred_canvas.ndim == 2:
+            return bool(pred_canvas.min() >= 0)
+        return not np.isnan(np.sum(pred_canvas))
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
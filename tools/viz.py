@@ -1,83 +1,100 @@
 import argparse
-import matplotlib
-import matplotlib.cm
-import numpy as np
 import os
+from glob import glob
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import List
+
+import numpy as np
 
 from PIL import Image
 
+from src.datamodules.utils.output_tools import save_paletted_image
+
+# blue channel value, name and visualization colour (RGB) of the DivaHisDB classes
+CLASS_ENCODINGS = [(1, 'Background', (0, 0, 0)),
+                   (2, 'Comment', (255, 0, 0)),
+                   (4, 'Decoration', (255, 255, 0)),
+                   (6, 'Comment + Decoration', (125, 125, 125)),
+                   (8, 'Main Text', (255, 0, 255)),
+                   (10, 'Main Text + Comment', (0, 0, 255)),
+                   (12, 'Main Text + Decoration', (0, 255, 255))]
+LEGEND_FILENAME = "output_visualizations_colour_legend.png"
+
+
+def _get_lookup_table(class_encodings) -> np.ndarray:
+    # blue channel value -> index of the colour in the palette, unknown values get the last colour (black)
+    lookup_table = np.full(256, fill_value=len(class_encodings), dtype=np.uint8)
+    for index, (blue_value, _, _) in enumerate(class_encodings):
+        lookup_table[blue_value] = index
+    return lookup_table
 
-def visualize(img, out):
-    read_img = np.asarray(Image.open(img))
-    # class_encodings = [(1, 'Background'), (2, 'Comment'), (4, 'Decoration'), (6, 'Comment + Decoration'),
-    #                    (8, 'Main Text'), (10, 'Main Text + Comment'), (12, 'Main Text + Decoration')]
-    class_encodings = [(1, 'Background', (0, 0, 0)),
-                       (2, 'Comment', (255, 0, 0)),
-                       (4, 'Decoration', (255, 255, 0)),
-                       (6, 'Comment + Decoration', (125, 125, 125)),
-                       (8, 'Main Text', (255, 0, 255)),
-                       (10, 'Main Text + Comment', (0, 0, 255)),
-                       (12, 'Main Text + Decoration', (0, 255, 255))]
 
-    dest_filename = out  # os.path.join('images', os.path.basename(img)[:-4], 'viz_' + os.path.basename(img))
+def _get_palette(class_encodings) -> np.ndarray:
+    return np.asarray([c[2] for c in class_encodings] + [(0, 0, 0)], dtype=np.uint8)
+
+
+def visualize(img, out, write_legend=True):
+    """
+    Colours the classes of a DivaHisDB ground truth (or prediction) image and saves it as paletted image.
+
+    :param img: path to the gt image
+    :type img: str
+    :param out: path to the output image
+    :type out: str
+    :param write_legend: write the colour legend into the folder of the output image
+    :type write_legend: bool
+    """
+    read_img = np.asarray(Image.open(img).convert('RGB'))
+
+    dest_filename = out
     if not os.path.exists(os.path.dirname(dest_filename)):
         os.makedirs(os.path.dirname(dest_filename))
 
-    img_la = np.zeros(read_img.shape)
-
-    # Extract just blue channel
-    # out_blue = read_img[:, :, 2] #[2140:2145, 1570:1575]
-    gt_blue = np.copy(read_img[:, :, 2]) #[2140:2145, 1570:1575]
-
-    # Get boundary pixels and adjust the gt_image for the border pixel -> set to background (1)
-    boundary_mask = read_img[:, :, 0].astype(np.uint8) == 128
-    gt_blue[boundary_mask] = 1
-
-    # subtract the boundary pixel from the gt
-    boundary_pixel = read_img[:, :, 0].astype(np.uint8) == 128
-    gt_blue[boundary_pixel] = 1
-
-    # Colours are in RGB
-    cmap = matplotlib.cm.get_cmap('Spectral')
-    # colors = [cmap(i / len(class_encodings), bytes=True)[:3] for i in range(len(class_encodings))]
-    colors = [c[2] for c in class_encodings]
-
-    # Get the mask for each colour
-    masks = {color: (gt_blue == i[0]) > 0 for color, i in zip(colors, class_encodings)}
-
-    # colour the pixels according to the masks
-    for c, mask in masks.items():
-        img_la[mask] = c
-
-
-    # img = np.copy(read_img)
-    # blue = read_img[:, :, 2]  # Extract just blue channel
-    #
-    # boundary_pixel = gt_image[:, :, 0].astype(np.uint8) == 128
-    # gt_blue[boundary_pixel] = 1
-    #
-    # # Get boundary pixels and adjust the gt_image for the border pixel -> set to background (1)
-    # boundary_mask = gt[:, :, 0].astype(np.uint8) == 128
-    #
-    # # Colours are in RGB
-    # cmap = matplotlib.cm.get_cmap('Spectral')
-    # colors = [cmap(i / len(class_encodings), bytes=True)[:3] for i in range(len(class_encodings))]
-    #
-    # # Get the mask for each colour
-    # masks = {color: (blue == i) > 0 for color, i in zip(colors, class_encodings)}
-    #
-    # # Color the image with relative colors
-    # for color, mask in masks.items():
-    #     img[mask] = color
-    #
-    # Make and save the class color encoding
-    color_encoding = {str(i[1]): color for color, i in zip(colors, class_encodings)}
-
-    make_colour_legend_image(os.path.join(os.path.dirname(dest_filename), "output_visualizations_colour_legend.png"),
-                             color_encoding)
+    # Extract just blue channel and set the boundary pixels to background (1)
+    boundary_mask = read_img[:, :, 0] == 128
+    gt_blue = np.where(boundary_mask, 1, read_img[:, :, 2]).astype(np.uint8)
+
+    # Look up the colour of every pixel (unknown values are black)
+    colour_indices = np.take(_get_lookup_table(CLASS_ENCODINGS), gt_blue)
+
+    if write_legend:
+        make_colour_legend_image(os.path.join(os.path.dirname(dest_filename), LEGEND_FILENAME),
+                                 {str(i[1]): i[2] for i in CLASS_ENCODINGS})
 
     # Write image to output folder
-    Image.fromarray(img_la.astype(np.uint8)).save(dest_filename)
+    save_paletted_image(class_indices=colour_indices, palette=_get_palette(CLASS_ENCODINGS), file_path=dest_filename)
+
+
+def visualize_batch(input_paths: List[str], output_folder: str, num_workers: int = 4) -> List[Path]:
+    """
+    Visualizes all the images matching the glob patterns into the output folder (same file names). The colour legend
+    is written once into the output folder.
+
+    :param input_paths: glob patterns of the gt images (e.g. "dataset/test/gt/*.png")
+    :type input_paths: List[str]
+    :param output_folder: path to the output folder
+    :type output_folder: str
+    :param num_workers: number of threads
+    :type num_workers: int
+    :return: paths of the written images
+    :rtype: List[Path]
+    """
+    file_paths = sorted({Path(p) for input_path in input_paths for p in glob(input_path) if Path(p).is_file()})
+    if len(file_paths) == 0:
+        raise ValueError('No images found')
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    out_paths = [output_folder / f'{file_path.stem}.png' for file_path in file_paths]
+    if len(set(out_paths)) != len(out_paths):
+        raise ValueError('The input images have to have different file names')
+
+    with ThreadPool(processes=num_workers) as pool:
+        pool.starmap(visualize, [(str(file_path), str(out_path), False)
+                                 for file_path, out_path in zip(file_paths, out_paths)])
+
+    make_colour_legend_image(str(output_folder / LEGEND_FILENAME), {str(i[1]): i[2] for i in CLASS_ENCODINGS})
+    return out_paths
 
 
 def make_colour_legend_image(img_name, colour_encoding):
@@ -98,12 +115,25 @@ def make_colour_legend_image(img_name, colour_encoding):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--img',
-                        help='Path to the gt image',
+                        help='Path to the gt image (batch mode: glob patterns of the gt images)',
                         type=str,
+                        nargs='+',
                         required=True)
     parser.add_argument('-o', '--out',
-                        help='Path to output image',
+                        help='Path to output image (batch mode: path to the output folder)',
                         type=str,
                         required=True)
+    parser.add_argument('-b', '--batch',
+                        help='Visualize all the images matching the patterns into the output folder',
+                        action='store_true')
+    parser.add_argument('-j', '--num_workers',
+                        help='Number of threads in batch mode',
+                        type=int,
+                        default=4)
     args = parser.parse_args()
-    visualize(**args.__dict__)
+    if args.batch:
+        visualize_batch(input_paths=args.img, output_folder=args.out, num_workers=args.num_workers)
+    elif len(args.img) == 1:
+        visualize(img=args.img[0], out=args.out)
+    else:
+        parser.error('Multiple images need the batch mode (--batch)')